@@ -9,16 +9,18 @@ from __future__ import annotations
 
 from typing import TYPE_CHECKING
 
+from homeassistant.const import Platform
+
 if TYPE_CHECKING:
-    from homeassistant.const import Platform
     from homeassistant.core import HomeAssistant
 
     from .data import HASSWebProxyConfigEntry
 
 from .proxy import async_setup_entry as async_proxy_setup_entry
 from .proxy import async_unload_entry as async_proxy_unload_entry
+from .store import DynamicProxiedURLStore
 
-PLATFORMS: list[Platform] = []
+PLATFORMS: list[Platform] = [Platform.SENSOR]
 
 
 # https://developers.home-assistant.io/docs/config_entries_index/#setting-up-an-entry
@@ -27,11 +29,12 @@ async def async_setup_entry(
     entry: HASSWebProxyConfigEntry,
 ) -> bool:
     """Set up this integration."""
+    # The proxy is set up first, as the platforms use its runtime data.
+    await async_proxy_setup_entry(hass, entry)
+
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
     entry.async_on_unload(entry.add_update_listener(async_reload_entry))
 
-    await async_proxy_setup_entry(hass, entry)
-
     return True
 
 
@@ -44,6 +47,14 @@ async def async_unload_entry(
     return await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
 
 
+async def async_remove_entry(
+    hass: HomeAssistant,
+    entry: HASSWebProxyConfigEntry,
+) -> None:
+    """Remove the saved data of a removed entry."""
+    await DynamicProxiedURLStore(hass, entry.entry_id).async_remove()
+
+
 async def async_reload_entry(
     hass: HomeAssistant,
     entry: HASSWebProxyConfigEntry,
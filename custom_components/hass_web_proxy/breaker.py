@@ -0,0 +1,139 @@
+"""Per-host upstream circuit breaker for HASS Web Proxy."""
+
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, cast
+
+import aiohttp
+
+from .const import LOGGER
+
+if TYPE_CHECKING:
+    from types import SimpleNamespace
+
+    from yarl import URL
+
+
+def get_host_key(url: URL) -> str:
+    """Get the host (and port) that a circuit is kept for."""
+    return f"{url.host}:{url.port}"
+
+
+@dataclass
+class _Circuit:
+    """The recent failures of a single host."""
+
+    failures: int = 0
+
+    # When the circuit was opened (if open), and when a probe request was allowed
+    # through once it became half-open.
+    opened: float | None = None
+    probed: float | None = None
+
+
+class CircuitBreaker:
+    """
+    Fails requests to hosts that are down fast, rather than waiting to time out.
+
+    After `failure_threshold` consecutive connection failures or timeouts, a
+    host's circuit is opened and requests to it are rejected for `cooldown`
+    seconds. The circuit is then half-open: a single probe request is allowed
+    through, which closes the circuit if it succeeds or reopens it if it fails.
+    """
+
+    def __init__(self, failure_threshold: int, cooldown: float) -> None:
+        """Initialize the circuit breaker."""
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        # Only hosts with failures since their last success are kept.
+        self._circuits: dict[str, _Circuit] = {}
+        self.rejected = 0
+
+    def allow(self, host: str) -> bool:
+        """Determine whether a request to a host may be made."""
+        circuit = self._circuits.get(host)
+        if circuit is None or circuit.opened is None:
+            return True
+
+        now = time.monotonic()
+        if now - circuit.opened >= self.cooldown and (
+            # Another probe is allowed if the last never finished (e.g. was
+            # cancelled) within the cooldown.
+            circuit.probed is None or now - circuit.probed >= self.cooldown
+        ):
+            circuit.probed = now
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self, host: str) -> None:
+        """Record a successful request to a host, closing its circuit."""
+        if self._circuits.pop(host, None) is not None:
+            LOGGER.debug(f"Upstream '{host}' has recovered")
+
+    def record_failure(self, host: str) -> None:
+        """Record a connection failure or timeout, opening the circuit if due."""
+        circuit = self._circuits.setdefault(host, _Circuit())
+        circuit.failures += 1
+        if circuit.opened is None and circuit.failures < self.failure_threshold:
+            return
+
+        if circuit.opened is None:
+            LOGGER.warning(
+                f"Upstream '{host}' failed {circuit.failures} times in a row, failing"
+                f" requests to it for {self.cooldown} seconds"
+            )
+        circuit.opened = time.monotonic()
+        circuit.probed = None
+
+    def create_trace_config(self) -> aiohttp.TraceConfig:
+        """Create a client trace config that records upstream successes/failures."""
+        trace_config = aiohttp.TraceConfig()
+
+        async def _on_request_end(
+            _session: aiohttp.ClientSession,
+            _context: SimpleNamespace,
+            params: aiohttp.TraceRequestEndParams,
+        ) -> None:
+            self.record_success(get_host_key(params.url))
+
+        async def _on_request_exception(
+            _session: aiohttp.ClientSession,
+            _context: SimpleNamespace,
+            params: aiohttp.TraceRequestExceptionParams,
+        ) -> None:
+            if isinstance(
+                params.exception, (aiohttp.ClientConnectorError, TimeoutError)
+            ):
+                self.record_failure(get_host_key(params.url))
+
+        # The signals are mistyped by aiohttp 3.10 with aiosignal 1.4, so are
+        # not type checked (the callbacks are typed as aiohttp documents).
+        signals = cast("Any", trace_config)
+        signals.on_request_end.append(_on_request_end)
+        signals.on_request_exception.append(_on_request_exception)
+        return trace_config
+
+    def _get_state(self, circuit: _Circuit, now: float) -> str:
+        """Get the state of a circuit."""
+        if circuit.opened is None:
+            return "closed"
+        if now - circuit.opened < self.cooldown:
+            return "open"
+        return "half_open"
+
+    def get_stats(self) -> dict[str, Any]:
+        """Get the state of the circuit of each host with recent failures."""
+        now = time.monotonic()
+        return {
+            "hosts": {
+                host: {
+                    "state": self._get_state(circuit, now),
+                    "failures": circuit.failures,
+                }
+                for host, circuit in self._circuits.items()
+            },
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,358 @@
+"""In-memory response cache for HASS Web Proxy."""
+
+from __future__ import annotations
+
+import email.utils
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from http import HTTPStatus
+from typing import TYPE_CHECKING, Any
+
+from aiohttp import hdrs, web
+from multidict import CIMultiDict
+from yarl import URL
+
+if TYPE_CHECKING:
+    from collections.abc import Mapping
+
+    from .upstream import BufferedResponse
+
+# Responses with these content types are never buffered or cached.
+STREAMING_CONTENT_TYPES: frozenset[str] = frozenset(
+    {
+        "multipart/x-mixed-replace",
+        "text/event-stream",
+    }
+)
+
+# Headers of a cached response that are repeated in a 304 Not Modified response.
+_NOT_MODIFIED_HEADERS: frozenset[str] = frozenset(
+    {
+        hdrs.CACHE_CONTROL.lower(),
+        hdrs.CONTENT_LOCATION.lower(),
+        hdrs.DATE.lower(),
+        hdrs.ETAG.lower(),
+        hdrs.EXPIRES.lower(),
+        hdrs.LAST_MODIFIED.lower(),
+        hdrs.VARY.lower(),
+    }
+)
+
+
+def normalize_url(url: str) -> str:
+    """Normalize a target URL for use as a cache key."""
+    try:
+        return str(URL(url).with_fragment(None))
+    except ValueError:
+        return url
+
+
+def _parse_cache_control(value: str | None) -> dict[str, str | None]:
+    """Parse a Cache-Control header into a dict of directives."""
+    directives: dict[str, str | None] = {}
+    for directive in (value or "").split(","):
+        key, sep, arg = directive.strip().partition("=")
+        if key:
+            directives[key.lower()] = arg.strip('"') if sep else None
+    return directives
+
+
+def _parse_http_date(value: str | None) -> float | None:
+    """Parse an HTTP date into a timestamp."""
+    if not value:
+        return None
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def is_request_cacheable(headers: Mapping[str, str]) -> bool:
+    """Determine whether a client request may be answered from the cache."""
+    if hdrs.RANGE in headers:
+        return False
+    directives = _parse_cache_control(headers.get(hdrs.CACHE_CONTROL))
+    return "no-store" not in directives and "no-cache" not in directives
+
+
+def is_response_storable(
+    status: int, headers: Mapping[str, str], ttl_override: int | None = None
+) -> bool:
+    """Determine whether a response may be stored at all (fresh or not)."""
+    if status != HTTPStatus.OK or ttl_override == 0:
+        return False
+
+    content_type = headers.get(hdrs.CONTENT_TYPE, "").split(";")[0].strip().lower()
+    if (
+        content_type in STREAMING_CONTENT_TYPES
+        or hdrs.SET_COOKIE in headers
+        or headers.get(hdrs.VARY, "").strip().lower() not in ("", "accept-encoding")
+    ):
+        return False
+
+    directives = _parse_cache_control(headers.get(hdrs.CACHE_CONTROL))
+    return "no-store" not in directives and "private" not in directives
+
+
+def get_cache_ttl(
+    status: int, headers: Mapping[str, str], ttl_override: int | None = None
+) -> float:
+    """
+    Get the number of seconds a response may be cached for.
+
+    A positive `ttl_override` replaces the lifetime from the response headers,
+    and an override of 0 disables caching.
+    """
+    if not is_response_storable(status, headers, ttl_override):
+        return 0
+
+    directives = _parse_cache_control(headers.get(hdrs.CACHE_CONTROL))
+    if ttl_override:
+        return ttl_override
+    if "no-cache" in directives:
+        return 0
+    if (max_age := _get_max_age(directives)) is not None:
+        return max_age
+    return _get_expires_ttl(headers)
+
+
+def _get_max_age(directives: Mapping[str, str | None]) -> float | None:
+    """Get the lifetime of a response from its max-age directives, if any."""
+    for directive in ("s-maxage", "max-age"):
+        if directive in directives:
+            try:
+                return max(0, int(directives[directive] or ""))
+            except ValueError:
+                return 0
+    return None
+
+
+def _get_expires_ttl(headers: Mapping[str, str]) -> float:
+    """Get the lifetime of a response from its Expires header, if any."""
+    expires = _parse_http_date(headers.get(hdrs.EXPIRES))
+    if expires is None:
+        return 0
+    date = _parse_http_date(headers.get(hdrs.DATE)) or time.time()
+    return max(0, expires - date)
+
+
+def get_stale_ttl(headers: Mapping[str, str], default: float = 0) -> float:
+    """
+    Get the number of seconds a response may be served stale once it expires.
+
+    This is the `stale-while-revalidate` lifetime from the response headers, or
+    `default` if there is none.
+    """
+    directives = _parse_cache_control(headers.get(hdrs.CACHE_CONTROL))
+    if "stale-while-revalidate" not in directives:
+        return default
+    try:
+        return max(0, int(directives["stale-while-revalidate"] or ""))
+    except ValueError:
+        return 0
+
+
+def get_validators(headers: Mapping[str, str]) -> dict[str, str]:
+    """Get the conditional request headers that revalidate a response."""
+    validators: dict[str, str] = {}
+    if etag := headers.get(hdrs.ETAG):
+        validators[hdrs.IF_NONE_MATCH] = etag
+    if last_modified := headers.get(hdrs.LAST_MODIFIED):
+        validators[hdrs.IF_MODIFIED_SINCE] = last_modified
+    return validators
+
+
+def is_not_modified(
+    request_headers: Mapping[str, str], response_headers: Mapping[str, str]
+) -> bool:
+    """Determine whether a client's conditional request matches a response."""
+    if (if_none_match := request_headers.get(hdrs.IF_NONE_MATCH)) is not None:
+        if (etag := response_headers.get(hdrs.ETAG)) is None:
+            return False
+        # The weak comparison applies to GET requests.
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or etag.removeprefix("W/") in tags
+
+    modified_since = _parse_http_date(request_headers.get(hdrs.IF_MODIFIED_SINCE))
+    last_modified = _parse_http_date(response_headers.get(hdrs.LAST_MODIFIED))
+    return (
+        modified_since is not None
+        and last_modified is not None
+        and last_modified <= modified_since
+    )
+
+
+@dataclass
+class CachedResponse:
+    """A cached upstream response."""
+
+    response: BufferedResponse
+    stored: float
+    expires: float
+    stale_until: float
+    revalidating: bool = False
+
+    @property
+    def size(self) -> int:
+        """Get the approximate memory used by the response."""
+        return len(self.response.body) + sum(
+            len(key) + len(value) for key, value in self.response.headers.items()
+        )
+
+    @property
+    def validators(self) -> dict[str, str]:
+        """Get the conditional request headers that revalidate the response."""
+        return get_validators(self.response.headers)
+
+    def is_fresh(self, now: float | None = None) -> bool:
+        """Determine whether the response is still fresh."""
+        return (time.time() if now is None else now) < self.expires
+
+    def is_usable_stale(self, now: float | None = None) -> bool:
+        """Determine whether the response may be served while it is revalidated."""
+        return (time.time() if now is None else now) < self.stale_until
+
+    def to_web_response(self, request_headers: Mapping[str, str]) -> web.Response:
+        """Create a client response, which is 304 if the client's copy matches."""
+        if is_not_modified(request_headers, self.response.headers):
+            response = web.Response(
+                status=HTTPStatus.NOT_MODIFIED,
+                headers=CIMultiDict(
+                    (key, value)
+                    for key, value in self.response.headers.items()
+                    if key.lower() in _NOT_MODIFIED_HEADERS
+                ),
+            )
+        else:
+            response = self.response.to_web_response()
+        response.headers[hdrs.AGE] = str(int(time.time() - self.stored))
+        return response
+
+
+class ResponseCache:
+    """A byte-bounded LRU cache of upstream responses."""
+
+    def __init__(
+        self, max_size: int, max_entry_size: int, stale_ttl: float = 0
+    ) -> None:
+        """Initialize the cache."""
+        self.max_size = max_size
+        self.max_entry_size = min(max_entry_size, max_size)
+        self.stale_ttl = stale_ttl
+        self._entries: OrderedDict[str, CachedResponse] = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        """Get the number of cached responses."""
+        return len(self._entries)
+
+    def get(self, key: str) -> CachedResponse | None:
+        """
+        Get a cached response.
+
+        Besides fresh responses, this gets stale responses that may be served while
+        they are revalidated, or that can be revalidated before being served.
+        """
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        if entry.is_fresh(now):
+            self.hits += 1
+        elif entry.is_usable_stale(now):
+            self.stale_hits += 1
+        elif entry.validators:
+            self.misses += 1
+        else:
+            self.remove(key)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(
+        self, key: str, response: BufferedResponse, ttl: float, stale_ttl: float = 0
+    ) -> bool:
+        """Cache a response, evicting the least recently used as necessary."""
+        now = time.time()
+        entry = CachedResponse(
+            response=response,
+            stored=now,
+            expires=now + ttl,
+            stale_until=now + ttl + stale_ttl,
+        )
+        if (
+            ttl <= 0 and stale_ttl <= 0 and not entry.validators
+        ) or entry.size > self.max_entry_size:
+            return False
+
+        self.remove(key)
+        self._entries[key] = entry
+        self._size += entry.size
+
+        while self._size > self.max_size:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= evicted.size
+            self.evictions += 1
+        return True
+
+    def update(
+        self, key: str, response: BufferedResponse, ttl_override: int | None = None
+    ) -> CachedResponse | None:
+        """
+        Cache an upstream response, and get the cached response (if any).
+
+        A 304 Not Modified response refreshes the cached response it revalidated.
+        """
+        if response.status == HTTPStatus.NOT_MODIFIED:
+            if (entry := self._entries.get(key)) is None:
+                return None
+            headers = entry.response.headers.copy()
+            headers.update(
+                (header, value)
+                for header, value in response.headers.items()
+                if header.lower() != hdrs.CONTENT_LENGTH.lower()
+            )
+            response = replace(entry.response, headers=headers)
+            self.revalidated += 1
+
+        if not is_response_storable(response.status, response.headers, ttl_override):
+            self.remove(key)
+            return None
+
+        if not self.put(
+            key,
+            response,
+            get_cache_ttl(response.status, response.headers, ttl_override),
+            get_stale_ttl(response.headers, self.stale_ttl),
+        ):
+            self.remove(key)
+            return None
+        return self._entries[key]
+
+    def remove(self, key: str) -> None:
+        """Remove a response from the cache, if present."""
+        if (entry := self._entries.pop(key, None)) is not None:
+            self._size -= entry.size
+
+    def get_stats(self) -> dict[str, Any]:
+        """Get statistics on the cache."""
+        return {
+            "entries": len(self._entries),
+            "size": self._size,
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,175 @@
+"""Single-flight coalescing of identical concurrent upstream requests."""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any
+
+from aiohttp import hdrs, web
+
+from .cache import normalize_url
+from .upstream import async_fetch
+
+if TYPE_CHECKING:
+    import ssl
+    from collections.abc import Callable, Mapping
+    from contextlib import AbstractAsyncContextManager
+
+    import aiohttp
+
+    from .metrics import ProxyMetrics
+    from .upstream import BufferedResponse, UpstreamReservation
+
+# Request headers that may change the upstream response, so requests are only
+# coalesced if they agree on all of them.
+_KEY_HEADERS: tuple[str, ...] = (
+    hdrs.ACCEPT,
+    hdrs.COOKIE,
+    hdrs.IF_MODIFIED_SINCE,
+    hdrs.IF_NONE_MATCH,
+    hdrs.IF_RANGE,
+    hdrs.RANGE,
+)
+
+type _FlightKey = tuple[
+    str, int, tuple[str | None, ...], tuple[tuple[str, str], ...] | None
+]
+
+
+@dataclass(eq=False)
+class _Flight:
+    """An upstream request in progress."""
+
+    done: asyncio.Event = field(default_factory=asyncio.Event)
+    response: BufferedResponse | None = None
+    failed: bool = False
+
+
+def _reserve(
+    reserve: UpstreamReservation | None,
+) -> AbstractAsyncContextManager[aiohttp.ClientTimeout | None]:
+    """Reserve an upstream request, if there is a reservation to make."""
+    return reserve() if reserve is not None else contextlib.nullcontext()
+
+
+class RequestCoalescer:
+    """Share one upstream request between identical concurrent GETs."""
+
+    def __init__(self, max_body_size: int) -> None:
+        """Initialize the coalescer."""
+        self.max_body_size = max_body_size
+        self._flights: dict[_FlightKey, _Flight] = {}
+        self.requests = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        """Get the number of upstream requests in progress."""
+        return len(self._flights)
+
+    def get_stats(self) -> dict[str, Any]:
+        """Get statistics on coalesced requests."""
+        return {
+            "in_flight": len(self._flights),
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+        }
+
+    def _land(
+        self,
+        key: _FlightKey,
+        flight: _Flight,
+        response: BufferedResponse | None,
+        *,
+        failed: bool = False,
+    ) -> None:
+        """Release the requests waiting on a flight, and forget it."""
+        if flight.done.is_set():
+            return
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        flight.response = response
+        flight.failed = failed
+        flight.done.set()
+
+    async def async_fetch(  # noqa: PLR0913
+        self,
+        request: web.Request,
+        session: aiohttp.ClientSession,
+        url: str,
+        ssl_context: ssl.SSLContext | None,
+        *,
+        max_buffer_size: int = 0,
+        on_complete: Callable[[BufferedResponse | None], None] | None = None,
+        validators: Mapping[str, str] | None = None,
+        reserve: UpstreamReservation | None = None,
+        metrics: ProxyMetrics | None = None,
+    ) -> web.StreamResponse:
+        """
+        Proxy a GET request, sharing the response with identical requests.
+
+        The first request goes upstream, and identical requests that arrive before
+        it completes receive a copy of its response (and their `on_complete` is
+        called with it). If the response is too large to share, or is a stream,
+        the waiting requests go upstream themselves. Only requests that go upstream
+        do so within `reserve`, if given (so requests that share a response do not
+        take up a slot of the host's concurrency limit, for instance).
+        """
+        key = (
+            normalize_url(url),
+            id(ssl_context),
+            tuple(request.headers.get(header) for header in _KEY_HEADERS),
+            tuple(sorted(validators.items())) if validators is not None else None,
+        )
+        max_buffer_size = max(max_buffer_size, self.max_body_size)
+
+        if (flight := self._flights.get(key)) is not None:
+            self.coalesced += 1
+            await flight.done.wait()
+            if flight.failed:
+                raise web.HTTPBadGateway
+            if flight.response is not None:
+                if on_complete:
+                    on_complete(flight.response)
+                return flight.response.to_web_response()
+            async with _reserve(reserve) as timeout:
+                return await async_fetch(
+                    request,
+                    session,
+                    url,
+                    ssl_context,
+                    max_buffer_size=max_buffer_size,
+                    on_complete=on_complete,
+                    validators=validators,
+                    client_timeout=timeout,
+                    metrics=metrics,
+                )
+
+        flight = self._flights[key] = _Flight()
+        self.requests += 1
+
+        def _complete(buffered: BufferedResponse | None) -> None:
+            self._land(key, flight, buffered)
+            if on_complete:
+                on_complete(buffered)
+
+        try:
+            async with _reserve(reserve) as timeout:
+                return await async_fetch(
+                    request,
+                    session,
+                    url,
+                    ssl_context,
+                    max_buffer_size=max_buffer_size,
+                    on_complete=_complete,
+                    validators=validators,
+                    client_timeout=timeout,
+                    metrics=metrics,
+                )
+        except web.HTTPBadGateway:
+            self._land(key, flight, None, failed=True)
+            raise
+        finally:
+            # Release any waiters if this request was cancelled.
+            self._land(key, flight, None)
@@ -8,13 +8,36 @@ from homeassistant.core import callback
 from homeassistant.helpers import selector
 
 from .const import (
+    CONF_CIRCUIT_BREAKER_COOLDOWN,
+    CONF_CIRCUIT_BREAKER_THRESHOLD,
+    CONF_CONNECTION_LIMIT,
+    CONF_CONNECTION_LIMIT_PER_HOST,
+    CONF_DNS_CACHE_TTL,
+    CONF_DNS_NEGATIVE_CACHE_TTL,
     CONF_DYNAMIC_URLS,
+    CONF_DYNAMIC_URLS_EVICTION,
+    CONF_DYNAMIC_URLS_EVICTION_LEAST_RECENTLY_USED,
+    CONF_DYNAMIC_URLS_EVICTION_OLDEST,
+    CONF_DYNAMIC_URLS_MAX,
+    CONF_HAPPY_EYEBALLS_DELAY,
+    CONF_KEEPALIVE_TIMEOUT,
+    CONF_PREWARM_CONNECTIONS,
+    CONF_REQUEST_COALESCING_MAX_SIZE,
+    CONF_REQUEST_LIMIT_PER_HOST,
+    CONF_REQUEST_QUEUE_SIZE,
+    CONF_REQUEST_QUEUE_TIMEOUT,
+    CONF_RESPONSE_CACHE_MAX_ENTRY_SIZE,
+    CONF_RESPONSE_CACHE_SIZE,
+    CONF_RESPONSE_CACHE_STALE_WHILE_REVALIDATE,
+    CONF_SEGMENT_CACHE_SIZE,
+    CONF_SEGMENT_CACHE_URL_PATTERNS,
     CONF_SSL_CIPHERS,
     CONF_SSL_CIPHERS_DEFAULT,
     CONF_SSL_CIPHERS_INSECURE,
     CONF_SSL_CIPHERS_INTERMEDIATE,
     CONF_SSL_CIPHERS_MODERN,
     CONF_SSL_VERIFICATION,
+    CONF_URL_PATTERN_OPTIONS,
     CONF_URL_PATTERNS,
     DEFAULT_OPTIONS,
     DOMAIN,
@@ -30,6 +53,9 @@ OPTIONS_SCHEMA = vol.Schema(
                 multiple=True,
             ),
         ),
+        vol.Optional(
+            CONF_URL_PATTERN_OPTIONS,
+        ): selector.ObjectSelector(selector.ObjectSelectorConfig()),
         vol.Optional(
             CONF_SSL_VERIFICATION,
         ): selector.BooleanSelector(selector.BooleanSelectorConfig()),
@@ -50,6 +76,186 @@ OPTIONS_SCHEMA = vol.Schema(
         vol.Optional(
             CONF_DYNAMIC_URLS,
         ): selector.BooleanSelector(selector.BooleanSelectorConfig()),
+        vol.Optional(
+            CONF_DYNAMIC_URLS_MAX,
+        ): selector.NumberSelector(
+            selector.NumberSelectorConfig(
+                min=0, max=1000000, mode=selector.NumberSelectorMode.BOX
+            )
+        ),
+        vol.Optional(
+            CONF_DYNAMIC_URLS_EVICTION,
+        ): selector.SelectSelector(
+            selector.SelectSelectorConfig(
+                options=[
+                    CONF_DYNAMIC_URLS_EVICTION_LEAST_RECENTLY_USED,
+                    CONF_DYNAMIC_URLS_EVICTION_OLDEST,
+                ],
+                mode=selector.SelectSelectorMode.DROPDOWN,
+                translation_key=CONF_DYNAMIC_URLS_EVICTION,
+            )
+        ),
+        vol.Optional(
+            CONF_RESPONSE_CACHE_SIZE,
+        ): selector.NumberSelector(
+            selector.NumberSelectorConfig(
+                min=0,
+                max=1024,
+                unit_of_measurement="MiB",
+                mode=selector.NumberSelectorMode.BOX,
+            )
+        ),
+        vol.Optional(
+            CONF_RESPONSE_CACHE_MAX_ENTRY_SIZE,
+        ): selector.NumberSelector(
+            selector.NumberSelectorConfig(
+                min=1,
+                max=1024 * 1024,
+                unit_of_measurement="KiB",
+                mode=selector.NumberSelectorMode.BOX,
+            )
+        ),
+        vol.Optional(
+            CONF_RESPONSE_CACHE_STALE_WHILE_REVALIDATE,
+        ): selector.NumberSelector(
+            selector.NumberSelectorConfig(
+                min=0,
+                max=86400,
+                unit_of_measurement="seconds",
+                mode=selector.NumberSelectorMode.BOX,
+            )
+        ),
+        vol.Optional(
+            CONF_SEGMENT_CACHE_SIZE,
+        ): selector.NumberSelector(
+            selector.NumberSelectorConfig(
+                min=0,
+                max=1024 * 1024,
+                unit_of_measurement="MiB",
+                mode=selector.NumberSelectorMode.BOX,
+            )
+        ),
+        vol.Optional(
+            CONF_SEGMENT_CACHE_URL_PATTERNS,
+        ): selector.TextSelector(
+            selector.TextSelectorConfig(
+                type=selector.TextSelectorType.TEXT,
+                multiple=True,
+            ),
+        ),
+        vol.Optional(
+            CONF_REQUEST_COALESCING_MAX_SIZE,
+        ): selector.NumberSelector(
+            selector.NumberSelectorConfig(
+                min=0,
+                max=1024 * 1024,
+                unit_of_measurement="KiB",
+                mode=selector.NumberSelectorMode.BOX,
+            )
+        ),
+        vol.Optional(
+            CONF_REQUEST_LIMIT_PER_HOST,
+        ): selector.NumberSelector(
+            selector.NumberSelectorConfig(
+                min=0, max=1000, mode=selector.NumberSelectorMode.BOX
+            )
+        ),
+        vol.Optional(
+            CONF_REQUEST_QUEUE_SIZE,
+        ): selector.NumberSelector(
+            selector.NumberSelectorConfig(
+                min=0, max=10000, mode=selector.NumberSelectorMode.BOX
+            )
+        ),
+        vol.Optional(
+            CONF_REQUEST_QUEUE_TIMEOUT,
+        ): selector.NumberSelector(
+            selector.NumberSelectorConfig(
+                min=0,
+                max=3600,
+                unit_of_measurement="seconds",
+                mode=selector.NumberSelectorMode.BOX,
+            )
+        ),
+        vol.Optional(
+            CONF_CIRCUIT_BREAKER_THRESHOLD,
+        ): selector.NumberSelector(
+            selector.NumberSelectorConfig(
+                min=0, max=100, mode=selector.NumberSelectorMode.BOX
+            )
+        ),
+        vol.Optional(
+            CONF_CIRCUIT_BREAKER_COOLDOWN,
+        ): selector.NumberSelector(
+            selector.NumberSelectorConfig(
+                min=1,
+                max=3600,
+                unit_of_measurement="seconds",
+                mode=selector.NumberSelectorMode.BOX,
+            )
+        ),
+        vol.Optional(
+            CONF_CONNECTION_LIMIT,
+        ): selector.NumberSelector(
+            selector.NumberSelectorConfig(
+                min=1, max=1000, mode=selector.NumberSelectorMode.BOX
+            )
+        ),
+        vol.Optional(
+            CONF_CONNECTION_LIMIT_PER_HOST,
+        ): selector.NumberSelector(
+            selector.NumberSelectorConfig(
+                min=0, max=1000, mode=selector.NumberSelectorMode.BOX
+            )
+        ),
+        vol.Optional(
+            CONF_KEEPALIVE_TIMEOUT,
+        ): selector.NumberSelector(
+            selector.NumberSelectorConfig(
+                min=0,
+                max=3600,
+                unit_of_measurement="seconds",
+                mode=selector.NumberSelectorMode.BOX,
+            )
+        ),
+        vol.Optional(
+            CONF_PREWARM_CONNECTIONS,
+        ): selector.NumberSelector(
+            selector.NumberSelectorConfig(
+                min=0, max=100, mode=selector.NumberSelectorMode.BOX
+            )
+        ),
+        vol.Optional(
+            CONF_DNS_CACHE_TTL,
+        ): selector.NumberSelector(
+            selector.NumberSelectorConfig(
+                min=0,
+                max=86400,
+                unit_of_measurement="seconds",
+                mode=selector.NumberSelectorMode.BOX,
+            )
+        ),
+        vol.Optional(
+            CONF_DNS_NEGATIVE_CACHE_TTL,
+        ): selector.NumberSelector(
+            selector.NumberSelectorConfig(
+                min=0,
+                max=3600,
+                unit_of_measurement="seconds",
+                mode=selector.NumberSelectorMode.BOX,
+            )
+        ),
+        vol.Optional(
+            CONF_HAPPY_EYEBALLS_DELAY,
+        ): selector.NumberSelector(
+            selector.NumberSelectorConfig(
+                min=0,
+                max=10,
+                step=0.05,
+                unit_of_measurement="seconds",
+                mode=selector.NumberSelectorMode.BOX,
+            )
+        ),
     },
 )
 
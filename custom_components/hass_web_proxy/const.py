@@ -8,6 +8,7 @@ DOMAIN: Final = "hass_web_proxy"
 LOGGER: Logger = getLogger(__package__)
 
 CONF_SSL_VERIFICATION: Final = "ssl_verification"
+CONF_STREAM_FANOUT: Final = "stream_fanout"
 CONF_SSL_CIPHERS: Final = "ssl_ciphers"
 
 CONF_SSL_CIPHERS_INSECURE: Final = "insecure"
@@ -15,18 +16,96 @@ CONF_SSL_CIPHERS_MODERN: Final = "modern"
 CONF_SSL_CIPHERS_INTERMEDIATE: Final = "intermediate"
 CONF_SSL_CIPHERS_DEFAULT: Final = "default"
 
+SSL_CIPHERS: Final = (
+    CONF_SSL_CIPHERS_DEFAULT,
+    CONF_SSL_CIPHERS_MODERN,
+    CONF_SSL_CIPHERS_INTERMEDIATE,
+    CONF_SSL_CIPHERS_INSECURE,
+)
+
 type HASSWebProxySSLCiphers = Literal["insecure", "modern", "intermediate", "default"]
 
+CONF_DYNAMIC_URLS_EVICTION_LEAST_RECENTLY_USED: Final = "least_recently_used"
+CONF_DYNAMIC_URLS_EVICTION_OLDEST: Final = "oldest"
+
 CONF_ALLOW_UNAUTHENTICATED = "allow_unauthenticated"
+CONF_CACHE_TTL: Final = "cache_ttl"
+CONF_CIRCUIT_BREAKER_COOLDOWN: Final = "circuit_breaker_cooldown"
+CONF_CIRCUIT_BREAKER_THRESHOLD: Final = "circuit_breaker_threshold"
+CONF_CONNECT_TIMEOUT: Final = "connect_timeout"
+CONF_CONNECTION_LIMIT: Final = "connection_limit"
+CONF_CONNECTION_LIMIT_PER_HOST: Final = "connection_limit_per_host"
+CONF_DNS_CACHE_TTL: Final = "dns_cache_ttl"
+CONF_DNS_NEGATIVE_CACHE_TTL: Final = "dns_negative_cache_ttl"
 CONF_DYNAMIC_URLS: Final = "dynamic_urls"
+CONF_DYNAMIC_URLS_EVICTION: Final = "dynamic_urls_eviction"
+CONF_DYNAMIC_URLS_MAX: Final = "dynamic_urls_max"
+CONF_HAPPY_EYEBALLS_DELAY: Final = "happy_eyeballs_delay"
+CONF_KEEPALIVE_TIMEOUT: Final = "keepalive_timeout"
 CONF_OPEN_LIMIT: Final = "open_limit"
+CONF_PREWARM_CONNECTIONS: Final = "prewarm_connections"
+CONF_PROXIED_URLS: Final = "proxied_urls"
+CONF_RATE_LIMIT: Final = "rate_limit"
+CONF_RATE_LIMIT_BURST: Final = "rate_limit_burst"
+CONF_READ_TIMEOUT: Final = "read_timeout"
+CONF_REQUEST_COALESCING_MAX_SIZE: Final = "request_coalescing_max_size"
+CONF_REQUEST_LIMIT_PER_HOST: Final = "request_limit_per_host"
+CONF_REQUEST_QUEUE_SIZE: Final = "request_queue_size"
+CONF_REQUEST_QUEUE_TIMEOUT: Final = "request_queue_timeout"
+CONF_RESPONSE_CACHE_MAX_ENTRY_SIZE: Final = "response_cache_max_entry_size"
+CONF_RESPONSE_CACHE_SIZE: Final = "response_cache_size"
+CONF_RESPONSE_CACHE_STALE_WHILE_REVALIDATE: Final = (
+    "response_cache_stale_while_revalidate"
+)
+CONF_SAMPLE_RATE: Final = "sample_rate"
+CONF_SEGMENT_CACHE_SIZE: Final = "segment_cache_size"
+CONF_SEGMENT_CACHE_URL_PATTERNS: Final = "segment_cache_url_patterns"
+CONF_SIGNED: Final = "signed"
+CONF_SIGNING_KEY: Final = "signing_key"
+CONF_TAG: Final = "tag"
 CONF_TTL: Final = "ttl"
 CONF_URL_ID: Final = "url_id"
+CONF_URL_ID_PREFIX: Final = "url_id_prefix"
+CONF_URL_IDS: Final = "url_ids"
 CONF_URL_PATTERN: Final = "url_pattern"
+CONF_URL_PATTERN_OPTIONS: Final = "url_pattern_options"
 CONF_URL_PATTERNS: Final = "url_patterns"
+CONF_WEBSOCKET_COMPRESSION: Final = "websocket_compression"
+CONF_WEBSOCKET_FANOUT: Final = "websocket_fanout"
 
 SERVICE_CREATE_PROXIED_URL: Final = "create_proxied_url"
+SERVICE_CREATE_PROXIED_URLS: Final = "create_proxied_urls"
 SERVICE_DELETE_PROXIED_URL: Final = "delete_proxied_url"
+SERVICE_DELETE_PROXIED_URLS: Final = "delete_proxied_urls"
+SERVICE_GET_STATS: Final = "get_stats"
+SERVICE_REVOKE_SIGNED_URLS: Final = "revoke_signed_urls"
+SERVICE_SET_REQUEST_TRACING: Final = "set_request_tracing"
+
+EVENT_REQUEST_TRACE: Final = f"{DOMAIN}_request_trace"
+
+# The token of a signed proxied URL, in service responses and proxy requests.
+ATTR_TOKEN: Final = "token"  # noqa: S105 (not a secret)
+ATTR_TOKENS: Final = "tokens"
+
+DEFAULT_CIRCUIT_BREAKER_COOLDOWN: Final = 30
+DEFAULT_CIRCUIT_BREAKER_THRESHOLD: Final = 0
+DEFAULT_CONNECTION_LIMIT: Final = 100
+DEFAULT_CONNECTION_LIMIT_PER_HOST: Final = 0
+DEFAULT_DNS_CACHE_TTL: Final = 10
+DEFAULT_DNS_NEGATIVE_CACHE_TTL: Final = 5
+DEFAULT_DYNAMIC_URLS_EVICTION: Final = CONF_DYNAMIC_URLS_EVICTION_LEAST_RECENTLY_USED
+DEFAULT_DYNAMIC_URLS_MAX: Final = 0
+DEFAULT_HAPPY_EYEBALLS_DELAY: Final = 0.25
+DEFAULT_KEEPALIVE_TIMEOUT: Final = 15
+DEFAULT_PREWARM_CONNECTIONS: Final = 0
+DEFAULT_REQUEST_COALESCING_MAX_SIZE: Final = 0
+DEFAULT_REQUEST_LIMIT_PER_HOST: Final = 0
+DEFAULT_REQUEST_QUEUE_SIZE: Final = 10
+DEFAULT_REQUEST_QUEUE_TIMEOUT: Final = 10
+DEFAULT_RESPONSE_CACHE_MAX_ENTRY_SIZE: Final = 1024
+DEFAULT_RESPONSE_CACHE_SIZE: Final = 0
+DEFAULT_RESPONSE_CACHE_STALE_WHILE_REVALIDATE: Final = 0
+DEFAULT_SEGMENT_CACHE_SIZE: Final = 0
 
 DEFAULT_OPTIONS: dict[str, str | bool | list[str]] = {
     CONF_SSL_VERIFICATION: True,
@@ -2,13 +2,47 @@
 
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import TYPE_CHECKING
+import dataclasses
+import heapq
+import itertools
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Final
+
+from .const import LOGGER
+from .matcher import URLPatternIndex, compile_url_pattern
+from .metrics import ProxyMetrics
 
 if TYPE_CHECKING:
+    import ssl
+    from collections import OrderedDict
+    from collections.abc import Iterable
+
+    import aiohttp
+    from hass_web_proxy_lib import ProxiedURL
     from homeassistant.config_entries import ConfigEntry
     from homeassistant.loader import Integration
 
+    from .breaker import CircuitBreaker
+    from .cache import ResponseCache
+    from .coalesce import RequestCoalescer
+    from .dns import CachingResolver
+    from .fanout import StreamFanout
+    from .limiter import ConcurrencyLimiter
+    from .matcher import CompiledURLPattern
+    from .prewarm import ConnectionPrewarmer
+    from .ratelimit import RateLimiter
+    from .segments import SegmentCache
+    from .signing import URLSigner
+    from .store import DynamicProxiedURLStore
+    from .trace import RequestTracer
+    from .websocket import WebSocketFanout
+
+
+# The fields of a dynamic proxied URL that are created at runtime, so are never
+# saved or signed.
+_RUNTIME_FIELDS: Final = frozenset({"ssl_context", "rate_limiter"})
+
 
 @dataclass
 class DynamicProxiedURL:
@@ -20,6 +54,67 @@ class DynamicProxiedURL:
     open_limit: int
     expiration: int
     allow_unauthenticated: bool
+    stream_fanout: bool = False
+    cache_ttl: int | None = None
+
+    # An arbitrary tag, so that related proxied URLs can be deleted together.
+    tag: str | None = None
+
+    # Whether the URL is matched by a signed token, rather than by its pattern.
+    signed: bool = False
+
+    # The requests per second (and burst) allowed from each client, if limited.
+    rate_limit: float | None = None
+    rate_limit_burst: int | None = None
+
+    # Upstream timeouts (in seconds), overriding those of the session.
+    connect_timeout: float | None = None
+    read_timeout: float | None = None
+
+    # Whether websockets are compressed.
+    websocket_compression: bool = False
+
+    # Whether (read-only) websockets are shared between clients.
+    websocket_fanout: bool = False
+
+    # The shared SSL context for this URL, resolved once at creation time.
+    ssl_context: ssl.SSLContext | None = field(default=None, repr=False)
+
+    # The rate limiter for this URL, created at creation time (and so forgotten
+    # along with it).
+    rate_limiter: RateLimiter | None = field(default=None, repr=False, compare=False)
+
+    def as_dict(self) -> dict[str, Any]:
+        """Get the proxied URL as a dict, without what is resolved at runtime."""
+        return {
+            name: getattr(self, name)
+            for name in (item.name for item in dataclasses.fields(self))
+            if name not in _RUNTIME_FIELDS
+        }
+
+
+@dataclass
+class StaticProxiedURL:
+    """A statically configured proxied URL pattern."""
+
+    url_pattern: str
+    stream_fanout: bool = False
+    cache_ttl: int | None = None
+    connect_timeout: float | None = None
+    read_timeout: float | None = None
+    websocket_compression: bool = False
+    websocket_fanout: bool = False
+    ssl_context: ssl.SSLContext | None = field(default=None, repr=False)
+    rate_limiter: RateLimiter | None = field(default=None, repr=False)
+
+
+@dataclass
+class ProxiedURLMatch:
+    """A request URL matched against a dynamic or static proxied URL."""
+
+    proxied_url: ProxiedURL
+    target: DynamicProxiedURL | StaticProxiedURL
+    url_id: str | None = None
 
 
 type HASSWebProxyConfigEntry = ConfigEntry[HASSWebProxyData]
@@ -30,4 +125,179 @@ class HASSWebProxyData:
     """Data for the HASS Web Proxy integration."""
 
     integration: Integration
-    dynamic_proxied_urls: dict[str, DynamicProxiedURL]
+
+    # Dynamic proxied URLs, from the least to the most recently used (or, if
+    # `evict_least_recently_used` is False, from the oldest to the newest).
+    dynamic_proxied_urls: OrderedDict[str, DynamicProxiedURL]
+    session: aiohttp.ClientSession
+    stream_fanout: StreamFanout
+    websocket_fanout: WebSocketFanout
+    ssl_contexts: dict[tuple[bool, str], ssl.SSLContext] = field(
+        default_factory=dict, repr=False
+    )
+    response_cache: ResponseCache | None = None
+    request_coalescer: RequestCoalescer | None = None
+    concurrency_limiter: ConcurrencyLimiter | None = None
+    circuit_breaker: CircuitBreaker | None = None
+    dns_resolver: CachingResolver | None = None
+    connection_prewarmer: ConnectionPrewarmer | None = None
+    segment_cache: SegmentCache | None = None
+    request_tracer: RequestTracer | None = None
+    url_signer: URLSigner | None = None
+    dynamic_url_store: DynamicProxiedURLStore | None = None
+    metrics: ProxyMetrics = field(default_factory=ProxyMetrics)
+
+    # The most dynamic proxied URLs that are kept (0 for no limit), beyond which
+    # the first of `dynamic_proxied_urls` are evicted.
+    max_dynamic_proxied_urls: int = 0
+    evict_least_recently_used: bool = True
+
+    dynamic_url_index: URLPatternIndex[DynamicProxiedURL] = field(
+        default_factory=URLPatternIndex
+    )
+    static_url_index: URLPatternIndex[StaticProxiedURL] = field(
+        default_factory=URLPatternIndex
+    )
+
+    # A min-heap of (expiration, sequence, url_id, proxied_url). Entries that have
+    # since been deleted or replaced are left in place and skipped when popped.
+    _expirations: list[tuple[float, int, str, DynamicProxiedURL]] = field(
+        default_factory=list, repr=False
+    )
+    _expiration_sequence: itertools.count[int] = field(
+        default_factory=itertools.count, repr=False
+    )
+
+    def add_dynamic_proxied_url(
+        self, url_id: str, proxied_url: DynamicProxiedURL
+    ) -> None:
+        """
+        Add (or replace) a dynamic proxied URL.
+
+        Raises `urlmatch.BadMatchPattern` if the URL pattern is invalid.
+        """
+        self.add_dynamic_proxied_urls(
+            [(url_id, proxied_url, compile_url_pattern(proxied_url.url_pattern))]
+        )
+
+    def add_dynamic_proxied_urls(
+        self,
+        proxied_urls: Iterable[
+            tuple[str, DynamicProxiedURL, CompiledURLPattern | None]
+        ],
+    ) -> None:
+        """
+        Add (or replace) dynamic proxied URLs, with their compiled patterns.
+
+        URLs without a compiled pattern (i.e. signed URLs, which are only
+        registered to count their opens) are never matched by their pattern.
+        """
+        for url_id, proxied_url, compiled in proxied_urls:
+            if compiled is None:
+                self.dynamic_url_index.remove(url_id)
+            else:
+                self.dynamic_url_index.add(url_id, compiled, proxied_url)
+            if self.connection_prewarmer is not None:
+                self.connection_prewarmer.async_add(
+                    proxied_url.url_pattern, proxied_url.ssl_context
+                )
+            if (replaced := self.dynamic_proxied_urls.get(url_id)) is not None:
+                self._release_connection(replaced)
+            self.dynamic_proxied_urls[url_id] = proxied_url
+            self.dynamic_proxied_urls.move_to_end(url_id)
+            self._schedule_save()
+
+            if proxied_url.expiration:
+                heapq.heappush(
+                    self._expirations,
+                    (
+                        proxied_url.expiration,
+                        next(self._expiration_sequence),
+                        url_id,
+                        proxied_url,
+                    ),
+                )
+        self._evict_dynamic_proxied_urls()
+        self._compact_expirations()
+
+    def remove_dynamic_proxied_url(self, url_id: str) -> None:
+        """Remove a dynamic proxied URL."""
+        self.dynamic_url_index.remove(url_id)
+        self._release_connection(self.dynamic_proxied_urls.pop(url_id))
+        self._schedule_save()
+
+    def open_dynamic_proxied_url(
+        self, url_id: str, proxied_url: DynamicProxiedURL
+    ) -> None:
+        """Record a dynamic proxied URL being used, removing it at its open limit."""
+        if self.evict_least_recently_used:
+            self.dynamic_proxied_urls.move_to_end(url_id)
+        if not proxied_url.open_limit:
+            return
+        proxied_url.open_limit -= 1
+        if proxied_url.open_limit == 0:
+            self.remove_dynamic_proxied_url(url_id)
+        else:
+            self._schedule_save()
+
+    def _evict_dynamic_proxied_urls(self) -> None:
+        """Evict the first dynamic proxied URLs, while there are too many."""
+        if not self.max_dynamic_proxied_urls:
+            return
+
+        while len(self.dynamic_proxied_urls) > self.max_dynamic_proxied_urls:
+            url_id, proxied_url = self.dynamic_proxied_urls.popitem(last=False)
+            self.dynamic_url_index.remove(url_id)
+            self._release_connection(proxied_url)
+            self.metrics.dynamic_url_evictions += 1
+            LOGGER.debug(f"Evicted dynamically proxied URL '{url_id}'")
+
+    def _release_connection(self, proxied_url: DynamicProxiedURL) -> None:
+        """Stop keeping the host of a removed dynamic proxied URL warm for it."""
+        if self.connection_prewarmer is not None:
+            self.connection_prewarmer.async_remove(proxied_url.url_pattern)
+
+    def _schedule_save(self) -> None:
+        """Schedule the dynamic proxied URLs to be saved, if they are persisted."""
+        if self.dynamic_url_store is not None:
+            self.dynamic_url_store.async_schedule_save(self.dynamic_proxied_urls)
+
+    def find_dynamic_url_ids(
+        self, url_id_prefix: str | None = None, tag: str | None = None
+    ) -> list[str]:
+        """Find the ids of the dynamic proxied URLs with an id prefix and/or tag."""
+        return [
+            url_id
+            for url_id, proxied_url in self.dynamic_proxied_urls.items()
+            if (url_id_prefix is None or url_id.startswith(url_id_prefix))
+            and (tag is None or proxied_url.tag == tag)
+        ]
+
+    def remove_expired_dynamic_proxied_urls(self) -> None:
+        """
+        Remove expired dynamic proxied URLs.
+
+        This only checks the earliest expiration unless it has passed, so is cheap
+        enough to call on every request.
+        """
+        expirations = self._expirations
+        if not expirations or expirations[0][0] >= time.time():
+            return
+
+        now = time.time()
+        while expirations and expirations[0][0] < now:
+            _, _, url_id, proxied_url = heapq.heappop(expirations)
+            if self.dynamic_proxied_urls.get(url_id) is proxied_url:
+                self.remove_dynamic_proxied_url(url_id)
+
+    def _compact_expirations(self) -> None:
+        """Drop stale expirations once they outnumber the live ones."""
+        if len(self._expirations) <= 2 * len(self.dynamic_proxied_urls) + 16:
+            return
+
+        self._expirations = [
+            item
+            for item in self._expirations
+            if self.dynamic_proxied_urls.get(item[2]) is item[3]
+        ]
+        heapq.heapify(self._expirations)
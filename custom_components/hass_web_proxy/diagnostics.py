@@ -0,0 +1,67 @@
+"""Diagnostics support for HASS Web Proxy."""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any
+
+from homeassistant.components.diagnostics import async_redact_data
+
+from .const import (
+    CONF_SEGMENT_CACHE_URL_PATTERNS,
+    CONF_URL_PATTERN_OPTIONS,
+    CONF_URL_PATTERNS,
+)
+from .session import get_connection_pool_usage
+
+if TYPE_CHECKING:
+    from homeassistant.core import HomeAssistant
+
+    from .data import HASSWebProxyConfigEntry
+
+# URL patterns may contain credentials (or tokens in their query strings).
+TO_REDACT = {
+    CONF_SEGMENT_CACHE_URL_PATTERNS,
+    CONF_URL_PATTERN_OPTIONS,
+    CONF_URL_PATTERNS,
+}
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant,  # noqa: ARG001
+    entry: HASSWebProxyConfigEntry,
+) -> dict[str, Any]:
+    """Return diagnostics for a config entry."""
+    data = entry.runtime_data
+    return {
+        "options": async_redact_data(entry.options, TO_REDACT),
+        "dynamic_proxied_urls": len(data.dynamic_proxied_urls),
+        "connection_pool": get_connection_pool_usage(data.session),
+        "stream_fanout": data.stream_fanout.get_stats(),
+        "websocket_fanout": data.websocket_fanout.get_stats(),
+        "response_cache": (
+            data.response_cache.get_stats() if data.response_cache else None
+        ),
+        "segment_cache": (
+            data.segment_cache.get_stats() if data.segment_cache else None
+        ),
+        "request_coalescing": (
+            data.request_coalescer.get_stats() if data.request_coalescer else None
+        ),
+        "concurrency_limits": (
+            data.concurrency_limiter.get_stats() if data.concurrency_limiter else None
+        ),
+        "circuit_breaker": (
+            data.circuit_breaker.get_stats() if data.circuit_breaker else None
+        ),
+        "dns_cache": data.dns_resolver.get_stats() if data.dns_resolver else None,
+        "connection_prewarming": (
+            data.connection_prewarmer.get_stats() if data.connection_prewarmer else None
+        ),
+        "request_tracing": (
+            data.request_tracer.get_stats() if data.request_tracer else None
+        ),
+        "url_signing": data.url_signer.get_stats() if data.url_signer else None,
+        "dynamic_url_store": (
+            data.dynamic_url_store.get_stats() if data.dynamic_url_store else None
+        ),
+    }
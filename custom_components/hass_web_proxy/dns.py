@@ -0,0 +1,165 @@
+"""Upstream DNS resolution cache for HASS Web Proxy."""
+
+from __future__ import annotations
+
+import asyncio
+import socket
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Final
+
+import aiodns
+from aiohttp.abc import AbstractResolver, ResolveResult
+from aiohttp.resolver import ThreadedResolver
+
+from .const import LOGGER
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+
+# The number of lookups that are cached. Wildcard URL patterns may match many
+# hosts, so expired lookups (then the oldest) are forgotten beyond this.
+MAX_CACHED_LOOKUPS: Final = 1024
+
+_NUMERIC_FLAGS: Final = socket.AI_NUMERICHOST | socket.AI_NUMERICSERV
+
+
+@dataclass
+class _Lookup:
+    """The addresses of a host (or the error looking it up), until it expires."""
+
+    expires: float
+    addresses: list[ResolveResult]
+    error: str | None = None
+
+
+class CachingResolver(AbstractResolver):
+    """
+    Resolves upstream hosts asynchronously, caching the results.
+
+    Hosts are resolved with c-ares, rather than blocking an executor thread, and
+    cached for the TTL of their records (at most `max_ttl`). Failed lookups are
+    cached for `negative_ttl`. Names that c-ares cannot resolve (e.g. mDNS
+    `.local` names) fall back to the system resolver, and are cached for
+    `max_ttl`. Concurrent lookups of the same host share a single query.
+    """
+
+    def __init__(self, max_ttl: float, negative_ttl: float) -> None:
+        """Initialize the resolver."""
+        self.max_ttl = max_ttl
+        self.negative_ttl = negative_ttl
+        # Created on first use, as it must be created within the event loop.
+        self._resolver: aiodns.DNSResolver | None = None
+        self._fallback = ThreadedResolver()
+        self._lookups: dict[tuple[str, int, int], _Lookup] = {}
+        self._pending: dict[tuple[str, int, int], asyncio.Future[_Lookup]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+
+    async def resolve(
+        self, host: str, port: int = 0, family: socket.AddressFamily = socket.AF_INET
+    ) -> list[ResolveResult]:
+        """Resolve a host, from the cache if it has not expired."""
+        key = (host, port, family)
+        lookup = self._lookups.get(key)
+        if lookup is not None and lookup.expires > time.monotonic():
+            if lookup.error is None:
+                self.hits += 1
+            else:
+                self.negative_hits += 1
+        else:
+            if (pending := self._pending.get(key)) is None:
+                self.misses += 1
+                pending = self._pending[key] = asyncio.ensure_future(
+                    self._async_lookup(host, port, family)
+                )
+                pending.add_done_callback(lambda _: self._add_lookup(key))
+            else:
+                self.hits += 1
+            # Other lookups of the host are unaffected if this one is cancelled.
+            lookup = await asyncio.shield(pending)
+
+        if lookup.error is not None:
+            raise OSError(None, lookup.error)
+        return lookup.addresses
+
+    async def _async_lookup(
+        self, host: str, port: int, family: socket.AddressFamily
+    ) -> _Lookup:
+        """Look up a host, with c-ares or else the system resolver."""
+        try:
+            addresses, ttl = await self._async_query(host, port, family)
+        except aiodns.error.DNSError:
+            try:
+                addresses = await self._fallback.resolve(host, port, family)
+            except OSError as exc:
+                LOGGER.debug(f"DNS lookup of '{host}' failed: {exc}")
+                return _Lookup(
+                    expires=time.monotonic() + self.negative_ttl,
+                    addresses=[],
+                    error=f"DNS lookup of '{host}' failed: {exc}",
+                )
+            ttl = self.max_ttl
+        return _Lookup(
+            expires=time.monotonic() + min(ttl, self.max_ttl), addresses=addresses
+        )
+
+    async def _async_query(
+        self, host: str, port: int, family: socket.AddressFamily
+    ) -> tuple[list[ResolveResult], float]:
+        """Query the addresses of a host, and the shortest TTL of its records."""
+        if self._resolver is None:
+            self._resolver = aiodns.DNSResolver()
+        result = await self._resolver.getaddrinfo(
+            host, family=family, port=port, type=socket.SOCK_STREAM
+        )
+        if not result.nodes:
+            raise aiodns.error.DNSError(None, f"No addresses for '{host}'")
+        return [
+            ResolveResult(
+                hostname=host,
+                host=_get_address(node.addr),
+                port=node.addr[1],
+                family=node.family,
+                proto=0,
+                flags=_NUMERIC_FLAGS,
+            )
+            for node in result.nodes
+        ], min(node.ttl for node in result.nodes)
+
+    def _add_lookup(self, key: tuple[str, int, int]) -> None:
+        """Cache a finished lookup, forgetting others if there are too many."""
+        pending = self._pending.pop(key)
+        if pending.cancelled() or pending.exception() is not None:
+            return
+        self._lookups.pop(key, None)
+        if len(self._lookups) >= MAX_CACHED_LOOKUPS:
+            now = time.monotonic()
+            for other_key, lookup in list(self._lookups.items()):
+                if lookup.expires <= now:
+                    del self._lookups[other_key]
+            if len(self._lookups) >= MAX_CACHED_LOOKUPS:
+                del self._lookups[next(iter(self._lookups))]
+        self._lookups[key] = pending.result()
+
+    async def close(self) -> None:
+        """Cancel any lookups in progress."""
+        if self._resolver is not None:
+            self._resolver.cancel()
+        await self._fallback.close()
+
+    def get_stats(self) -> dict[str, Any]:
+        """Get the number of cached lookups, and of cache hits and misses."""
+        return {
+            "lookups": len(self._lookups),
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+        }
+
+
+def _get_address(addr: Sequence[Any]) -> str:
+    """Get the IP address of a c-ares address (which is bytes before pycares 5)."""
+    address = addr[0]
+    return address.decode() if isinstance(address, bytes) else address
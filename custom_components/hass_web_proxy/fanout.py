@@ -0,0 +1,356 @@
+"""Shared upstream fan-out for long-lived HTTP streams (e.g. MJPEG)."""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Final
+
+import aiohttp
+from aiohttp import hdrs, web
+
+from .const import LOGGER
+from .upstream import (
+    count_bytes_in,
+    get_client_response_headers,
+    get_upstream_request_headers,
+)
+
+if TYPE_CHECKING:
+    import ssl
+
+    from homeassistant.core import HomeAssistant
+    from multidict import CIMultiDict
+
+    from .data import HASSWebProxyConfigEntry
+    from .metrics import ProxyMetrics
+    from .upstream import UpstreamReservation
+
+# The number of parts (frames) buffered per client before frames are dropped
+# (multipart streams) or the client is disconnected (other streams).
+STREAM_FANOUT_QUEUE_SIZE: Final = 32
+
+# The largest multipart part that will be buffered while looking for the next
+# boundary, beyond which the buffer is flushed as-is.
+MAX_PART_SIZE: Final = 8 * 1024 * 1024
+
+UPSTREAM_TIMEOUT: Final = aiohttp.ClientTimeout(total=None, sock_connect=30)
+
+# Request headers that would make the response specific to a client (a byte range
+# of, or no, body), so are not used for a shared stream.
+_SKIP_SHARED_STREAM_HEADERS: Final = (
+    hdrs.RANGE,
+    hdrs.IF_RANGE,
+    hdrs.IF_MATCH,
+    hdrs.IF_NONE_MATCH,
+    hdrs.IF_MODIFIED_SINCE,
+    hdrs.IF_UNMODIFIED_SINCE,
+)
+
+
+def _get_stream_timeout(timeout: aiohttp.ClientTimeout | None) -> aiohttp.ClientTimeout:
+    """Get the timeouts of a shared stream, which lasts while it has clients."""
+    if timeout is None:
+        return UPSTREAM_TIMEOUT
+    return aiohttp.ClientTimeout(
+        total=None, sock_connect=timeout.sock_connect, sock_read=timeout.sock_read
+    )
+
+
+def _get_shared_stream_headers(request: web.Request) -> CIMultiDict[str]:
+    """Get the headers of the request for a shared stream, from its first client."""
+    headers = get_upstream_request_headers(request, include_cookies=False)
+    if hdrs.RANGE in headers:
+        # The body is then no longer asked for unencoded.
+        headers.popall(hdrs.ACCEPT_ENCODING, None)
+    for header in _SKIP_SHARED_STREAM_HEADERS:
+        headers.popall(header, None)
+    return headers
+
+
+def get_multipart_boundary(content_type: str | None) -> bytes | None:
+    """Get the boundary delimiter of a multipart content type, if any."""
+    if not content_type:
+        return None
+
+    mimetype, *params = content_type.split(";")
+    if not mimetype.strip().lower().startswith("multipart/"):
+        return None
+
+    for param in params:
+        key, _, value = param.strip().partition("=")
+        if key.strip().lower() == "boundary" and (value := value.strip().strip('"')):
+            # Some cameras include the leading dashes in the boundary parameter.
+            delimiter = value if value.startswith("--") else f"--{value}"
+            return delimiter.encode()
+    return None
+
+
+class MultipartSplitter:
+    """Split a multipart byte stream into whole parts."""
+
+    def __init__(self, delimiter: bytes, max_part_size: int = MAX_PART_SIZE) -> None:
+        """Initialize the splitter."""
+        self._delimiter = delimiter
+        self._max_part_size = max_part_size
+        self._buffer = bytearray()
+        self._scan_from = 0
+
+    def feed(self, data: bytes) -> list[bytes]:
+        """Add data, and get any parts that are now complete."""
+        buffer = self._buffer
+        buffer += data
+        parts: list[bytes] = []
+
+        while True:
+            # A part starts at one delimiter and ends just before the next, so
+            # search for the next delimiter after the start of the buffer.
+            index = buffer.find(self._delimiter, max(self._scan_from, 1))
+            if index == -1:
+                break
+            parts.append(bytes(buffer[:index]))
+            del buffer[:index]
+            self._scan_from = 0
+
+        if len(buffer) > self._max_part_size:
+            parts.append(bytes(buffer))
+            buffer.clear()
+
+        # Only rescan the tail that might contain the start of a delimiter.
+        self._scan_from = max(0, len(buffer) - len(self._delimiter) + 1)
+        return parts
+
+    def flush(self) -> bytes:
+        """Get any remaining buffered data."""
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        self._scan_from = 0
+        return data
+
+
+@dataclass
+class _StreamHead:
+    """The status and headers of a shared upstream response."""
+
+    status: int
+    headers: CIMultiDict[str]
+
+
+@dataclass(eq=False)
+class _Subscriber:
+    """A client attached to a shared stream."""
+
+    queue: asyncio.Queue[bytes | None] = field(
+        default_factory=lambda: asyncio.Queue(STREAM_FANOUT_QUEUE_SIZE)
+    )
+    dropped: int = 0
+
+
+class _SharedStream:
+    """A single upstream response shared by multiple clients."""
+
+    def __init__(
+        self,
+        url: str,
+        ssl_context: ssl.SSLContext | None,
+        headers: CIMultiDict[str],
+    ) -> None:
+        """Initialize the shared stream."""
+        self.url = url
+        self.closed = False
+        self.head: asyncio.Future[_StreamHead] = (
+            asyncio.get_running_loop().create_future()
+        )
+        self.subscribers: set[_Subscriber] = set()
+        self.task: asyncio.Task[None] | None = None
+        self._ssl_context = ssl_context
+        self._headers = headers
+
+    async def async_read(
+        self,
+        session: aiohttp.ClientSession,
+        reserve: UpstreamReservation,
+        metrics: ProxyMetrics,
+    ) -> None:
+        """Read the upstream response and publish it to all subscribers."""
+        try:
+            async with (
+                reserve() as timeout,
+                session.get(
+                    self.url,
+                    headers=self._headers,
+                    ssl=self._ssl_context or True,
+                    allow_redirects=False,
+                    timeout=_get_stream_timeout(timeout),
+                ) as response,
+            ):
+                # Clients may join part way through, so the length never applies.
+                headers = get_client_response_headers(response.headers)
+                headers.popall(hdrs.CONTENT_LENGTH, None)
+                self.head.set_result(
+                    _StreamHead(status=response.status, headers=headers)
+                )
+
+                delimiter = get_multipart_boundary(
+                    response.headers.get(hdrs.CONTENT_TYPE)
+                )
+                splitter = MultipartSplitter(delimiter) if delimiter else None
+
+                async for chunk in response.content.iter_any():
+                    count_bytes_in(metrics, chunk)
+                    if splitter:
+                        for part in splitter.feed(chunk):
+                            self._publish(part, droppable=True)
+                    else:
+                        self._publish(chunk, droppable=False)
+
+                if splitter and (remaining := splitter.flush()):
+                    self._publish(remaining, droppable=True)
+        except (aiohttp.ClientError, TimeoutError, web.HTTPException) as exc:
+            LOGGER.debug(f"Shared upstream stream '{self.url}' failed: {exc}")
+            if not self.head.done():
+                self.head.set_exception(exc)
+        finally:
+            self.closed = True
+            if not self.head.done():
+                self.head.cancel()
+            for subscriber in list(self.subscribers):
+                self._end(subscriber)
+
+    def _publish(self, data: bytes, *, droppable: bool) -> None:
+        """Publish data to all subscribers."""
+        for subscriber in list(self.subscribers):
+            try:
+                subscriber.queue.put_nowait(data)
+            except asyncio.QueueFull:
+                if droppable:
+                    subscriber.dropped += 1
+                else:
+                    LOGGER.debug(
+                        f"Disconnecting slow client from shared stream '{self.url}'"
+                    )
+                    self._end(subscriber)
+
+    def _end(self, subscriber: _Subscriber) -> None:
+        """End the stream for a subscriber."""
+        self.subscribers.discard(subscriber)
+
+        # Make room for the end-of-stream marker, if necessary.
+        if subscriber.queue.full():
+            subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(None)
+
+
+class StreamFanout:
+    """Share upstream streams between clients requesting the same URL."""
+
+    def __init__(self, hass: HomeAssistant, entry: HASSWebProxyConfigEntry) -> None:
+        """Initialize the stream fan-out."""
+        self._hass = hass
+        self._entry = entry
+        self._streams: dict[tuple[str, int], _SharedStream] = {}
+
+    def get_stats(self) -> dict[str, Any]:
+        """Get statistics on the shared streams."""
+        return {
+            "streams": len(self._streams),
+            "clients": sum(
+                len(stream.subscribers) for stream in self._streams.values()
+            ),
+            "dropped": sum(
+                subscriber.dropped
+                for stream in self._streams.values()
+                for subscriber in stream.subscribers
+            ),
+        }
+
+    def _subscribe(
+        self,
+        session: aiohttp.ClientSession,
+        request: web.Request,
+        url: str,
+        ssl_context: ssl.SSLContext | None,
+        reserve: UpstreamReservation,
+    ) -> tuple[_SharedStream, _Subscriber]:
+        """Attach to the shared stream for a URL, opening it if necessary."""
+        key = (url, id(ssl_context))
+        stream = self._streams.get(key)
+
+        if stream is None or stream.closed:
+            # Only the first client's headers are used, without its cookies.
+            stream = _SharedStream(
+                url, ssl_context, _get_shared_stream_headers(request)
+            )
+            self._streams[key] = stream
+            stream.task = self._entry.async_create_background_task(
+                self._hass,
+                self._async_run(key, stream, session, reserve),
+                name=f"hass_web_proxy shared stream {url}",
+            )
+
+        subscriber = _Subscriber()
+        stream.subscribers.add(subscriber)
+        return stream, subscriber
+
+    async def _async_run(
+        self,
+        key: tuple[str, int],
+        stream: _SharedStream,
+        session: aiohttp.ClientSession,
+        reserve: UpstreamReservation,
+    ) -> None:
+        """Run a shared stream, and forget it once finished."""
+        try:
+            await stream.async_read(session, reserve, self._entry.runtime_data.metrics)
+        finally:
+            if self._streams.get(key) is stream:
+                del self._streams[key]
+
+    def _unsubscribe(self, stream: _SharedStream, subscriber: _Subscriber) -> None:
+        """Detach from a shared stream, closing it if it has no more clients."""
+        stream.subscribers.discard(subscriber)
+        if not stream.subscribers and not stream.closed:
+            stream.closed = True
+            if stream.task:
+                stream.task.cancel()
+
+    async def async_handle(
+        self,
+        request: web.Request,
+        session: aiohttp.ClientSession,
+        url: str,
+        ssl_context: ssl.SSLContext | None,
+        reserve: UpstreamReservation,
+    ) -> web.StreamResponse:
+        """
+        Respond to a client request from a shared upstream stream.
+
+        The upstream request of a new shared stream is made within `reserve`, so
+        that it is subject to the host's concurrency limit, circuit breaker and
+        timeouts (and clients get any error response it raises).
+        """
+        stream, subscriber = self._subscribe(
+            session, request, url, ssl_context, reserve
+        )
+
+        try:
+            try:
+                head = await asyncio.shield(stream.head)
+            except web.HTTPException as exc:
+                # Each client gets its own response.
+                raise type(exc)(headers=exc.headers) from None
+            except (aiohttp.ClientError, TimeoutError, asyncio.CancelledError):
+                if (task := asyncio.current_task()) and task.cancelling():
+                    raise
+                raise web.HTTPBadGateway from None
+
+            response = web.StreamResponse(status=head.status, headers=head.headers)
+            with contextlib.suppress(ConnectionResetError):
+                await response.prepare(request)
+                while (data := await subscriber.queue.get()) is not None:
+                    await response.write(data)
+        finally:
+            self._unsubscribe(stream, subscriber)
+
+        return response
@@ -0,0 +1,125 @@
+"""Per-host upstream concurrency limits for HASS Web Proxy."""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import math
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any
+
+from .metrics import Histogram
+
+
+class ConcurrencyLimitError(Exception):
+    """A request was not admitted, as the queue was full or it waited too long."""
+
+
+@dataclass(eq=False)
+class _HostState:
+    """The requests in progress and queued for a single host."""
+
+    active: int = 0
+    waiters: deque[asyncio.Future[None]] = field(default_factory=deque)
+
+
+class ConcurrencyLimiter:
+    """
+    Limits the number of concurrent upstream requests to each host.
+
+    Requests beyond the limit wait in a bounded first-in, first-out queue, and a
+    finished request hands its slot directly to the next in the queue.
+    """
+
+    def __init__(self, limit: int, queue_size: int, queue_timeout: float) -> None:
+        """Initialize the limiter."""
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self._hosts: dict[str, _HostState] = {}
+        self.rejected = 0
+        self.timeouts = 0
+        self.wait_time = Histogram()
+
+    @property
+    def retry_after(self) -> int:
+        """Get the number of seconds a rejected client should wait to retry."""
+        return max(1, math.ceil(self.queue_timeout))
+
+    async def async_acquire(self, host: str) -> None:
+        """
+        Wait for a free slot for a host (which must then be released).
+
+        Raises `ConcurrencyLimitError` if the queue is full, or the wait times out.
+        """
+        state = self._hosts.setdefault(host, _HostState())
+        if state.active < self.limit and not state.waiters:
+            state.active += 1
+            self.wait_time.observe(0)
+            return
+
+        if len(state.waiters) >= self.queue_size:
+            self.rejected += 1
+            raise ConcurrencyLimitError
+
+        waiter: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        state.waiters.append(waiter)
+        started = time.perf_counter()
+        try:
+            async with asyncio.timeout(self.queue_timeout):
+                await waiter
+        except BaseException as exc:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the wait ended, so pass it on.
+                self.release(host)
+            else:
+                # A cancelled waiter may already have been skipped by a release.
+                with contextlib.suppress(ValueError):
+                    state.waiters.remove(waiter)
+                self._cleanup(host, state)
+            if isinstance(exc, TimeoutError):
+                self.timeouts += 1
+                raise ConcurrencyLimitError from exc
+            raise
+        self.wait_time.observe(time.perf_counter() - started)
+
+    def try_acquire(self, host: str) -> bool:
+        """Take a free slot for a host (which must then be released), if any."""
+        state = self._hosts.setdefault(host, _HostState())
+        if state.active < self.limit and not state.waiters:
+            state.active += 1
+            return True
+        self._cleanup(host, state)
+        return False
+
+    def release(self, host: str) -> None:
+        """Release a slot for a host, handing it to the next queued request."""
+        state = self._hosts[host]
+        while state.waiters:
+            waiter = state.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        state.active -= 1
+        self._cleanup(host, state)
+
+    def _cleanup(self, host: str, state: _HostState) -> None:
+        """Forget a host once it has no requests in progress or queued."""
+        if not state.active and not state.waiters and self._hosts.get(host) is state:
+            del self._hosts[host]
+
+    def get_stats(self) -> dict[str, Any]:
+        """Get the requests in progress and queued, and the time spent queued."""
+        return {
+            "active": sum(state.active for state in self._hosts.values()),
+            "queued": sum(len(state.waiters) for state in self._hosts.values()),
+            "hosts": {
+                host: {"active": state.active, "queued": len(state.waiters)}
+                for host, state in self._hosts.items()
+            },
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "wait_time": self.wait_time.as_dict(),
+        }
@@ -0,0 +1,267 @@
+"""URL pattern matching index for HASS Web Proxy."""
+
+from __future__ import annotations
+
+import itertools
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+
+from urlmatch.urlmatch import parse_match_pattern
+
+_SCHEME_RE = re.compile(r"^(?P<scheme>[^:/]+)://")
+
+
+@dataclass(frozen=True)
+class URLPatternHost:
+    """The part of a URL pattern alternative that is used to index it."""
+
+    # The lower-cased literal scheme, or None if any scheme may match.
+    scheme: str | None
+
+    # The lower-cased literal host (or host suffix for `*.` patterns), or None if
+    # the host cannot be indexed and must always be checked.
+    host: str | None
+    host_is_suffix: bool = False
+
+
+@dataclass(frozen=True)
+class CompiledURLPattern:
+    """A URL pattern that has been compiled once, at creation time."""
+
+    pattern: str
+    regex: re.Pattern[str]
+
+    # The distinct hosts of the comma-separated alternatives in the pattern.
+    hosts: tuple[URLPatternHost, ...]
+
+    def matches(self, url: str) -> bool:
+        """Determine whether a URL matches this pattern."""
+        return bool(self.regex.search(url))
+
+
+def _get_url_pattern_host(pattern: str) -> URLPatternHost:
+    """Get the host of a single URL pattern alternative."""
+    scheme: str | None = None
+    host: str | None = None
+    host_is_suffix = False
+
+    if scheme_match := _SCHEME_RE.match(pattern):
+        if scheme_match["scheme"] != "*":
+            scheme = scheme_match["scheme"].lower()
+
+        authority = pattern[scheme_match.end() :].split("/", 1)[0]
+
+        # Patterns with credentials, or wildcards anywhere other than a leading
+        # `*.`, are left unindexed and are always checked.
+        if "@" not in authority:
+            if authority.startswith("*.") and "*" not in authority[2:]:
+                host = authority[2:].lower()
+                host_is_suffix = True
+            elif authority and "*" not in authority:
+                host = authority.lower()
+
+    return URLPatternHost(scheme=scheme, host=host, host_is_suffix=host_is_suffix)
+
+
+def compile_url_pattern(pattern: str) -> CompiledURLPattern:
+    """
+    Compile a URL pattern.
+
+    As with `urlmatch.urlmatch`, a pattern may contain several comma-separated
+    alternatives, any of which may match.
+
+    Raises `urlmatch.BadMatchPattern` if the pattern is invalid.
+    """
+    alternatives = [alternative.strip() for alternative in pattern.split(",")]
+    regex = re.compile(
+        "|".join(
+            parse_match_pattern(alternative, path_required=False)
+            for alternative in alternatives
+        )
+    )
+
+    return CompiledURLPattern(
+        pattern=pattern,
+        regex=regex,
+        hosts=tuple(dict.fromkeys(map(_get_url_pattern_host, alternatives))),
+    )
+
+
+@dataclass
+class _HostBucket:
+    """Index entries for a single scheme."""
+
+    literal: dict[str, set[str]] = field(default_factory=dict)
+    literal_lengths: Counter[int] = field(default_factory=Counter)
+    suffix: dict[str, set[str]] = field(default_factory=dict)
+    suffix_lengths: Counter[int] = field(default_factory=Counter)
+    any_host: set[str] = field(default_factory=set)
+
+    def add(self, key: str, host: URLPatternHost) -> None:
+        """Add an entry to the bucket."""
+        if host.host is None:
+            self.any_host.add(key)
+        elif host.host_is_suffix:
+            self.suffix.setdefault(host.host, set()).add(key)
+            self.suffix_lengths[len(host.host)] += 1
+        else:
+            self.literal.setdefault(host.host, set()).add(key)
+            self.literal_lengths[len(host.host)] += 1
+
+    def remove(self, key: str, host: URLPatternHost) -> None:
+        """Remove an entry from the bucket."""
+        if host.host is None:
+            self.any_host.discard(key)
+            return
+
+        if host.host_is_suffix:
+            hosts, lengths = self.suffix, self.suffix_lengths
+        else:
+            hosts, lengths = self.literal, self.literal_lengths
+
+        keys = hosts[host.host]
+        keys.discard(key)
+        if not keys:
+            del hosts[host.host]
+
+        lengths[len(host.host)] -= 1
+        if not lengths[len(host.host)]:
+            del lengths[len(host.host)]
+
+    def is_empty(self) -> bool:
+        """Determine whether the bucket has no entries."""
+        return not (self.literal or self.suffix or self.any_host)
+
+    def get_candidates(self, hosts: list[str], candidates: set[str]) -> None:
+        """Add the keys of all entries that could match any of the hosts."""
+        candidates.update(self.any_host)
+
+        for host in hosts:
+            # Literal hosts are looked up by prefix, and host suffixes at every
+            # label boundary, so that the candidates are always a superset of
+            # what the compiled regular expression would match.
+            for length in self.literal_lengths:
+                candidates.update(self.literal.get(host[:length], ()))
+
+            if not self.suffix:
+                continue
+            for start in itertools.chain(
+                (0,), (i + 1 for i, char in enumerate(host) if char == ".")
+            ):
+                for length in self.suffix_lengths:
+                    candidates.update(self.suffix.get(host[start : start + length], ()))
+
+
+@dataclass
+class _IndexEntry[T]:
+    """An entry in the URL pattern index."""
+
+    sequence: int
+    compiled: CompiledURLPattern
+    value: T
+
+
+class URLPatternIndex[T]:
+    """
+    An index of URL patterns.
+
+    Patterns are compiled once when they are added, and bucketed by scheme and
+    literal host (or host suffix), such that most patterns can be skipped
+    without running any regular expression. Matches are returned in the order
+    the patterns were first added.
+    """
+
+    def __init__(self) -> None:
+        """Initialize the index."""
+        self._entries: dict[str, _IndexEntry[T]] = {}
+        self._buckets: dict[str | None, _HostBucket] = {}
+        self._sequence = itertools.count()
+
+    def __len__(self) -> int:
+        """Get the number of patterns in the index."""
+        return len(self._entries)
+
+    def __contains__(self, key: object) -> bool:
+        """Determine whether a key is in the index."""
+        return key in self._entries
+
+    def add(self, key: str, pattern: str | CompiledURLPattern, value: T) -> None:
+        """
+        Add (or replace) a pattern in the index.
+
+        Raises `urlmatch.BadMatchPattern` if the pattern is invalid, in which case
+        the index is left unchanged.
+        """
+        compiled = (
+            pattern
+            if isinstance(pattern, CompiledURLPattern)
+            else compile_url_pattern(pattern)
+        )
+
+        existing = self._entries.get(key)
+        if existing:
+            # Replacing an entry keeps its original position, as a dict would.
+            self._remove_from_buckets(key, existing.compiled)
+            sequence = existing.sequence
+        else:
+            sequence = next(self._sequence)
+
+        self._entries[key] = _IndexEntry(
+            sequence=sequence, compiled=compiled, value=value
+        )
+        for host in compiled.hosts:
+            self._buckets.setdefault(host.scheme, _HostBucket()).add(key, host)
+
+    def remove(self, key: str) -> None:
+        """Remove a pattern from the index, if present."""
+        entry = self._entries.pop(key, None)
+        if entry:
+            self._remove_from_buckets(key, entry.compiled)
+
+    def clear(self) -> None:
+        """Remove all patterns from the index."""
+        self._entries.clear()
+        self._buckets.clear()
+
+    def _remove_from_buckets(self, key: str, compiled: CompiledURLPattern) -> None:
+        """Remove an entry from the buckets of each of its hosts."""
+        for host in compiled.hosts:
+            bucket = self._buckets[host.scheme]
+            bucket.remove(key, host)
+            if bucket.is_empty():
+                del self._buckets[host.scheme]
+
+    def match_key(self, key: str, url: str) -> T | None:
+        """Get the value of a key, if its pattern matches the URL."""
+        entry = self._entries.get(key)
+        if entry is None or not entry.compiled.matches(url):
+            return None
+        return entry.value
+
+    def match(self, url: str) -> tuple[str, T] | None:
+        """Get the first (key, value) whose pattern matches the URL."""
+        if not self._entries:
+            return None
+
+        scheme_match = _SCHEME_RE.match(url)
+        if not scheme_match:
+            return None
+
+        remainder = url[scheme_match.end() :].lower()
+        hosts = [remainder.split("/", 1)[0]]
+
+        # URLs may contain credentials before the host.
+        if "@" in hosts[0]:
+            hosts.append(hosts[0].split("@", 1)[1])
+
+        candidates: set[str] = set()
+        for scheme in (scheme_match["scheme"].lower(), None):
+            if bucket := self._buckets.get(scheme):
+                bucket.get_candidates(hosts, candidates)
+
+        for key in sorted(candidates, key=lambda key: self._entries[key].sequence):
+            entry = self._entries[key]
+            if entry.compiled.matches(url):
+                return key, entry.value
+        return None
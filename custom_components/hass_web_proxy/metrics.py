@@ -0,0 +1,223 @@
+"""Request metrics for HASS Web Proxy."""
+
+from __future__ import annotations
+
+import bisect
+import contextlib
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Final, cast
+
+import aiohttp
+
+from .prewarm import is_prewarm_request
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from types import SimpleNamespace
+
+    from aiohttp import web
+
+    from .data import ProxiedURLMatch
+
+# Upper bounds (in seconds) of the latency histogram buckets.
+LATENCY_BUCKETS: Final = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+# The number of patterns, URL ids and error classes that counts are kept for, as
+# dynamic URL ids in particular are often single use. The least recently seen are
+# forgotten first.
+MAX_TRACKED_KEYS: Final = 256
+
+
+class Histogram:
+    """A histogram of observed values, in fixed buckets."""
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        """Initialize the histogram."""
+        self.buckets = buckets
+        # The final count is for values beyond the last bucket.
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        """Add an observed value."""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, quantile: float) -> float | None:
+        """
+        Estimate a quantile as the upper bound of the bucket it falls in.
+
+        Values beyond the last bucket are estimated as the last bound.
+        """
+        if not self.count:
+            return None
+        rank = quantile * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts, strict=False):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return self.buckets[-1]
+
+    def as_dict(self) -> dict[str, Any]:
+        """Get the histogram as a dict, with cumulative bucket counts."""
+        cumulative = 0
+        buckets: dict[str, int] = {}
+        for bound, count in zip(self.buckets, self.counts, strict=False):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        buckets["+Inf"] = self.count
+        return {"count": self.count, "sum": self.sum, "buckets": buckets}
+
+
+def _increment(counter: OrderedDict[str, int], key: str) -> None:
+    """Increment a bounded counter."""
+    counter[key] = counter.get(key, 0) + 1
+    counter.move_to_end(key)
+    if len(counter) > MAX_TRACKED_KEYS:
+        counter.popitem(last=False)
+
+
+class ProxyMetrics:
+    """Counts, latencies and transfer sizes of proxied requests."""
+
+    def __init__(self) -> None:
+        """Initialize the metrics."""
+        self.requests = 0
+        self.unmatched_requests = 0
+        self.pattern_requests: OrderedDict[str, int] = OrderedDict()
+        self.url_id_requests: OrderedDict[str, int] = OrderedDict()
+        self.errors: OrderedDict[str, int] = OrderedDict()
+        self.match_latency = Histogram()
+        self.upstream_ttfb = Histogram()
+        self.total_latency = Histogram()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.active_streams = 0
+        self.active_websockets = 0
+        self.dynamic_url_evictions = 0
+        self.rate_limited = 0
+
+    @property
+    def error_count(self) -> int:
+        """Get the total number of errors (of the tracked classes)."""
+        return sum(self.errors.values())
+
+    def record_match(self, match: ProxiedURLMatch | None, latency: float) -> None:
+        """Record a request being matched (None if it matched no proxied URL)."""
+        self.requests += 1
+        self.match_latency.observe(latency)
+        if match is None:
+            self.unmatched_requests += 1
+            return
+        _increment(self.pattern_requests, match.target.url_pattern)
+        if match.url_id is not None:
+            _increment(self.url_id_requests, match.url_id)
+
+    def record_response(self, response: web.StreamResponse) -> None:
+        """Record the size of a (finished, if streamed) response to a client."""
+        # Responses returned by a view are only sent once it has returned.
+        self.bytes_out += (
+            response.body_length
+            if response.prepared
+            else (response.content_length or 0)
+        )
+
+    def record_error(self, exc: BaseException) -> None:
+        """Record an error, by its class."""
+        _increment(self.errors, type(exc).__name__)
+
+    @contextlib.contextmanager
+    def track_stream(self, *, websocket: bool = False) -> Iterator[None]:
+        """Track an active HTTP stream or websocket, and its total latency."""
+        started = time.perf_counter()
+        if websocket:
+            self.active_websockets += 1
+        else:
+            self.active_streams += 1
+        try:
+            yield
+        except Exception as exc:
+            self.record_error(exc)
+            raise
+        finally:
+            if websocket:
+                self.active_websockets -= 1
+            else:
+                self.active_streams -= 1
+                self.total_latency.observe(time.perf_counter() - started)
+
+    def create_trace_config(self) -> aiohttp.TraceConfig:
+        """Create a client trace config that records upstream requests."""
+        trace_config = aiohttp.TraceConfig()
+
+        async def _on_request_start(
+            _session: aiohttp.ClientSession,
+            context: SimpleNamespace,
+            _params: aiohttp.TraceRequestStartParams,
+        ) -> None:
+            context.started = time.perf_counter()
+
+        async def _on_request_end(
+            _session: aiohttp.ClientSession,
+            context: SimpleNamespace,
+            _params: aiohttp.TraceRequestEndParams,
+        ) -> None:
+            if is_prewarm_request(context):
+                return
+            # The end of the request is when the response headers are received.
+            self.upstream_ttfb.observe(time.perf_counter() - context.started)
+
+        async def _on_request_exception(
+            _session: aiohttp.ClientSession,
+            context: SimpleNamespace,
+            params: aiohttp.TraceRequestExceptionParams,
+        ) -> None:
+            if not is_prewarm_request(context):
+                self.record_error(params.exception)
+
+        # The signals are mistyped by aiohttp 3.10 with aiosignal 1.4, so are
+        # not type checked (the callbacks are typed as aiohttp documents).
+        signals = cast("Any", trace_config)
+        signals.on_request_start.append(_on_request_start)
+        signals.on_request_end.append(_on_request_end)
+        signals.on_request_exception.append(_on_request_exception)
+        return trace_config
+
+    def get_stats(self) -> dict[str, Any]:
+        """Get all the metrics."""
+        return {
+            "requests": self.requests,
+            "unmatched_requests": self.unmatched_requests,
+            "pattern_requests": dict(self.pattern_requests),
+            "url_id_requests": dict(self.url_id_requests),
+            "errors": dict(self.errors),
+            "match_latency": self.match_latency.as_dict(),
+            "upstream_ttfb": self.upstream_ttfb.as_dict(),
+            "total_latency": self.total_latency.as_dict(),
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "active_streams": self.active_streams,
+            "active_websockets": self.active_websockets,
+            "dynamic_url_evictions": self.dynamic_url_evictions,
+            "rate_limited": self.rate_limited,
+        }
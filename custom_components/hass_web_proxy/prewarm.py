@@ -0,0 +1,179 @@
+"""Upstream connection pre-warming for HASS Web Proxy."""
+
+from __future__ import annotations
+
+import asyncio
+import datetime
+from collections import Counter, OrderedDict
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any, Final
+
+import aiohttp
+from homeassistant.core import callback
+from homeassistant.helpers.event import async_track_time_interval
+from yarl import URL
+
+from .breaker import get_host_key
+from .const import LOGGER
+
+if TYPE_CHECKING:
+    import ssl
+    from types import SimpleNamespace
+
+    from homeassistant.core import HomeAssistant
+
+    from .data import HASSWebProxyConfigEntry
+
+# The trace context of pre-warming requests, which are not proxied requests so
+# are left out of metrics.
+PREWARM_TRACE_CONTEXT: Final = MappingProxyType({"prewarm": True})
+
+PREWARM_TIMEOUT: Final = aiohttp.ClientTimeout(total=10)
+
+
+def is_prewarm_request(context: SimpleNamespace) -> bool:
+    """Determine whether a traced request is a pre-warming request."""
+    return getattr(context, "trace_request_ctx", None) is PREWARM_TRACE_CONTEXT
+
+
+def get_prewarm_origin(url_pattern: str) -> URL | None:
+    """Get the origin of a URL pattern, if its scheme, host and port are literal."""
+    try:
+        url = URL(url_pattern)
+    except ValueError:
+        return None
+    if url.scheme not in ("http", "https") or not url.host or "*" in url.host:
+        return None
+    return url.origin()
+
+
+class ConnectionPrewarmer:
+    """
+    Opens pooled keep-alive connections to upstream hosts ahead of requests.
+
+    A connection is opened (with a HEAD request for the root of the host) when a
+    host is added, and then refreshed well within the keep-alive timeout, so that
+    the first proxied request does not wait for DNS, TCP and TLS. Only the
+    `max_hosts` most recently added hosts are kept warm, and hosts are forgotten
+    once they cannot be reached, or no proxied URL uses them any more.
+
+    Warm-ups are subject to the host's circuit breaker, and only take a free slot
+    of its concurrency limit (never queueing behind proxied requests).
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        entry: HASSWebProxyConfigEntry,
+        session: aiohttp.ClientSession,
+        max_hosts: int,
+    ) -> None:
+        """Initialize the pre-warmer."""
+        self._hass = hass
+        self._entry = entry
+        self._session = session
+        self.max_hosts = max_hosts
+        self._origins: OrderedDict[URL, ssl.SSLContext | None] = OrderedDict()
+        # The number of proxied URLs using each host.
+        self._references: Counter[URL] = Counter()
+        self.warmed = 0
+        self.failures = 0
+
+    @callback
+    def async_start(self, keepalive_timeout: float) -> None:
+        """Start refreshing warm connections before they are closed as idle."""
+        if not keepalive_timeout:
+            return
+        self._entry.async_on_unload(
+            async_track_time_interval(
+                self._hass,
+                self._async_schedule_refresh,
+                datetime.timedelta(seconds=keepalive_timeout / 2),
+                cancel_on_shutdown=True,
+            )
+        )
+
+    @callback
+    def async_add(self, url_pattern: str, ssl_context: ssl.SSLContext | None) -> None:
+        """Keep the host of a URL pattern warm, if it is literal."""
+        if (origin := get_prewarm_origin(url_pattern)) is None:
+            return
+
+        self._references[origin] += 1
+        new = origin not in self._origins
+        self._origins[origin] = ssl_context
+        self._origins.move_to_end(origin)
+        while len(self._origins) > self.max_hosts:
+            self._origins.popitem(last=False)
+
+        if new:
+            # Not started eagerly, so hosts evicted by later additions are skipped.
+            self._entry.async_create_background_task(
+                self._hass,
+                self._async_warm(origin),
+                f"Pre-warm {origin}",
+                eager_start=False,
+            )
+
+    @callback
+    def async_remove(self, url_pattern: str) -> None:
+        """Stop keeping the host of a URL pattern warm, once no others use it."""
+        if (origin := get_prewarm_origin(url_pattern)) is None:
+            return
+
+        self._references[origin] -= 1
+        if self._references[origin] <= 0:
+            del self._references[origin]
+            self._origins.pop(origin, None)
+
+    @callback
+    def _async_schedule_refresh(self, _now: datetime.datetime) -> None:
+        """Refresh the connections to all warm hosts."""
+        self._entry.async_create_background_task(
+            self._hass, self.async_refresh(), "Refresh pre-warmed connections"
+        )
+
+    async def async_refresh(self) -> None:
+        """Refresh the connections to all warm hosts."""
+        await asyncio.gather(*(self._async_warm(origin) for origin in self._origins))
+
+    async def _async_warm(self, origin: URL) -> None:
+        """Open (or keep alive) a pooled connection to a host."""
+        if origin not in self._origins:
+            return
+
+        data = self._entry.runtime_data
+        host = get_host_key(origin)
+        circuit_breaker = data.circuit_breaker
+        if circuit_breaker is not None and not circuit_breaker.allow(host):
+            return
+        limiter = data.concurrency_limiter
+        if limiter is not None and not limiter.try_acquire(host):
+            return
+
+        try:
+            async with self._session.head(
+                origin,
+                ssl=self._origins[origin] or True,
+                allow_redirects=False,
+                timeout=PREWARM_TIMEOUT,
+                trace_request_ctx=PREWARM_TRACE_CONTEXT,
+            ) as response:
+                await response.read()
+        except (aiohttp.ClientError, TimeoutError) as exc:
+            LOGGER.debug(f"Could not pre-warm a connection to '{origin}': {exc}")
+            self.failures += 1
+            self._origins.pop(origin, None)
+            return
+        finally:
+            if limiter is not None:
+                limiter.release(host)
+        self.warmed += 1
+
+    def get_stats(self) -> dict[str, Any]:
+        """Get the warm hosts, and the number of connections warmed."""
+        return {
+            "hosts": [str(origin) for origin in self._origins],
+            "warmed": self.warmed,
+            "failures": self.failures,
+        }
@@ -2,13 +2,21 @@
 
 from __future__ import annotations
 
+import contextlib
+import functools
+import logging
 import time
 import urllib.parse
 import uuid
-from typing import TYPE_CHECKING, Any
+from collections import OrderedDict
+from http import HTTPStatus
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Final, cast
 
+import aiohttp
 import urlmatch
 import voluptuous as vol
+from aiohttp import hdrs, web
 from hass_web_proxy_lib import (
     LOGGER,
     HASSWebProxyLibNotFoundRequestError,
@@ -16,49 +24,154 @@ from hass_web_proxy_lib import (
     ProxyView,
     WebsocketProxyView,
 )
+from homeassistant.components.http import KEY_AUTHENTICATED
 from homeassistant.core import ServiceResponse, SupportsResponse, callback
 from homeassistant.exceptions import ServiceValidationError
 from homeassistant.helpers import config_validation as cv
-from homeassistant.helpers.aiohttp_client import async_get_clientsession
 from homeassistant.loader import async_get_loaded_integration
 from homeassistant.util.ssl import (
     SSLCipherList,
     client_context,
     client_context_no_verify,
 )
+from yarl import URL
 
+from .breaker import CircuitBreaker, get_host_key
+from .cache import (
+    ResponseCache,
+    is_request_cacheable,
+    normalize_url,
+)
+from .coalesce import RequestCoalescer
 from .const import (
+    ATTR_TOKEN,
+    ATTR_TOKENS,
     CONF_ALLOW_UNAUTHENTICATED,
+    CONF_CACHE_TTL,
+    CONF_CIRCUIT_BREAKER_COOLDOWN,
+    CONF_CIRCUIT_BREAKER_THRESHOLD,
+    CONF_CONNECT_TIMEOUT,
+    CONF_DNS_CACHE_TTL,
+    CONF_DNS_NEGATIVE_CACHE_TTL,
     CONF_DYNAMIC_URLS,
+    CONF_DYNAMIC_URLS_EVICTION,
+    CONF_DYNAMIC_URLS_EVICTION_OLDEST,
+    CONF_DYNAMIC_URLS_MAX,
+    CONF_KEEPALIVE_TIMEOUT,
     CONF_OPEN_LIMIT,
+    CONF_PREWARM_CONNECTIONS,
+    CONF_PROXIED_URLS,
+    CONF_RATE_LIMIT,
+    CONF_RATE_LIMIT_BURST,
+    CONF_READ_TIMEOUT,
+    CONF_REQUEST_COALESCING_MAX_SIZE,
+    CONF_REQUEST_LIMIT_PER_HOST,
+    CONF_REQUEST_QUEUE_SIZE,
+    CONF_REQUEST_QUEUE_TIMEOUT,
+    CONF_RESPONSE_CACHE_MAX_ENTRY_SIZE,
+    CONF_RESPONSE_CACHE_SIZE,
+    CONF_RESPONSE_CACHE_STALE_WHILE_REVALIDATE,
+    CONF_SAMPLE_RATE,
+    CONF_SEGMENT_CACHE_SIZE,
+    CONF_SEGMENT_CACHE_URL_PATTERNS,
+    CONF_SIGNED,
+    CONF_SIGNING_KEY,
     CONF_SSL_CIPHERS,
     CONF_SSL_CIPHERS_DEFAULT,
     CONF_SSL_CIPHERS_INSECURE,
     CONF_SSL_CIPHERS_INTERMEDIATE,
     CONF_SSL_CIPHERS_MODERN,
     CONF_SSL_VERIFICATION,
+    CONF_STREAM_FANOUT,
+    CONF_TAG,
     CONF_TTL,
     CONF_URL_ID,
+    CONF_URL_ID_PREFIX,
+    CONF_URL_IDS,
     CONF_URL_PATTERN,
+    CONF_URL_PATTERN_OPTIONS,
+    CONF_URL_PATTERNS,
+    CONF_WEBSOCKET_COMPRESSION,
+    CONF_WEBSOCKET_FANOUT,
+    DEFAULT_CIRCUIT_BREAKER_COOLDOWN,
+    DEFAULT_CIRCUIT_BREAKER_THRESHOLD,
+    DEFAULT_DNS_CACHE_TTL,
+    DEFAULT_DNS_NEGATIVE_CACHE_TTL,
+    DEFAULT_DYNAMIC_URLS_EVICTION,
+    DEFAULT_DYNAMIC_URLS_MAX,
+    DEFAULT_KEEPALIVE_TIMEOUT,
+    DEFAULT_PREWARM_CONNECTIONS,
+    DEFAULT_REQUEST_COALESCING_MAX_SIZE,
+    DEFAULT_REQUEST_LIMIT_PER_HOST,
+    DEFAULT_REQUEST_QUEUE_SIZE,
+    DEFAULT_REQUEST_QUEUE_TIMEOUT,
+    DEFAULT_RESPONSE_CACHE_MAX_ENTRY_SIZE,
+    DEFAULT_RESPONSE_CACHE_SIZE,
+    DEFAULT_RESPONSE_CACHE_STALE_WHILE_REVALIDATE,
+    DEFAULT_SEGMENT_CACHE_SIZE,
     DOMAIN,
     SERVICE_CREATE_PROXIED_URL,
+    SERVICE_CREATE_PROXIED_URLS,
     SERVICE_DELETE_PROXIED_URL,
+    SERVICE_DELETE_PROXIED_URLS,
+    SERVICE_GET_STATS,
+    SERVICE_REVOKE_SIGNED_URLS,
+    SERVICE_SET_REQUEST_TRACING,
+    SSL_CIPHERS,
 )
 from .data import (
     DynamicProxiedURL,
     HASSWebProxyConfigEntry,
     HASSWebProxyData,
+    ProxiedURLMatch,
+    StaticProxiedURL,
+)
+from .dns import CachingResolver
+from .fanout import StreamFanout
+from .limiter import ConcurrencyLimiter, ConcurrencyLimitError
+from .matcher import compile_url_pattern
+from .metrics import ProxyMetrics
+from .prewarm import ConnectionPrewarmer
+from .ratelimit import create_rate_limiter
+from .segments import SegmentCache
+from .session import async_create_proxy_session
+from .signing import URLSigner, create_signing_key
+from .store import DynamicProxiedURLStore
+from .trace import RequestTracer
+from .upstream import (
+    async_fetch,
+    async_fetch_buffered,
+    get_upstream_request_headers,
+    get_upstream_timeout,
 )
+from .websocket import WebSocketFanout, async_relay_websocket
 
 if TYPE_CHECKING:
     import ssl
+    from collections.abc import AsyncIterator, Callable, Mapping
     from types import MappingProxyType
 
-    import aiohttp
-    from aiohttp import web
     from homeassistant.core import HomeAssistant, ServiceCall
+    from homeassistant.helpers.typing import VolSchemaType
+    from homeassistant.util.json import JsonObjectType
+
+    from .cache import CachedResponse
+    from .matcher import CompiledURLPattern
+    from .trace import RequestTrace
+    from .upstream import BufferedResponse
+
+    # An action, with its handler (which is passed the entry it belongs to), schema
+    # and whether it responds.
+    type _Service = tuple[
+        str,
+        Callable[[HASSWebProxyConfigEntry, ServiceCall], ServiceResponse],
+        VolSchemaType | None,
+        SupportsResponse,
+    ]
 
 
+_POSITIVE_FLOAT = vol.All(vol.Coerce(float), vol.Range(min=0, min_included=False))
+
 CREATE_PROXIED_URL_SCHEMA = vol.Schema(
     {
         vol.Required(CONF_URL_PATTERN): cv.string,
@@ -74,13 +187,69 @@ CREATE_PROXIED_URL_SCHEMA = vol.Schema(
         vol.Optional(CONF_OPEN_LIMIT, default=1): cv.positive_int,
         vol.Optional(CONF_TTL, default=60): cv.positive_int,
         vol.Optional(CONF_ALLOW_UNAUTHENTICATED, default=False): cv.boolean,
+        vol.Optional(CONF_STREAM_FANOUT, default=False): cv.boolean,
+        vol.Optional(CONF_CACHE_TTL): cv.positive_int,
+        vol.Optional(CONF_TAG): cv.string,
+        vol.Optional(CONF_SIGNED, default=False): cv.boolean,
+        vol.Optional(CONF_RATE_LIMIT): _POSITIVE_FLOAT,
+        vol.Optional(CONF_RATE_LIMIT_BURST): vol.All(vol.Coerce(int), vol.Range(min=1)),
+        vol.Optional(CONF_CONNECT_TIMEOUT): _POSITIVE_FLOAT,
+        vol.Optional(CONF_READ_TIMEOUT): _POSITIVE_FLOAT,
+        vol.Optional(CONF_WEBSOCKET_COMPRESSION, default=False): cv.boolean,
+        vol.Optional(CONF_WEBSOCKET_FANOUT, default=False): cv.boolean,
+    },
+    required=True,
+)
+
+CREATE_PROXIED_URLS_SCHEMA = vol.Schema(
+    {
+        vol.Required(CONF_PROXIED_URLS): vol.All(
+            cv.ensure_list, [CREATE_PROXIED_URL_SCHEMA]
+        ),
+        vol.Optional(CONF_TAG): cv.string,
     },
     required=True,
 )
 
+URL_PATTERN_OPTIONS_SCHEMA = vol.Schema(
+    {
+        vol.Optional(CONF_STREAM_FANOUT, default=False): cv.boolean,
+        vol.Optional(CONF_CACHE_TTL): cv.positive_int,
+        vol.Optional(CONF_RATE_LIMIT): _POSITIVE_FLOAT,
+        vol.Optional(CONF_RATE_LIMIT_BURST): vol.All(vol.Coerce(int), vol.Range(min=1)),
+        vol.Optional(CONF_CONNECT_TIMEOUT): _POSITIVE_FLOAT,
+        vol.Optional(CONF_READ_TIMEOUT): _POSITIVE_FLOAT,
+        vol.Optional(CONF_WEBSOCKET_COMPRESSION, default=False): cv.boolean,
+        vol.Optional(CONF_WEBSOCKET_FANOUT, default=False): cv.boolean,
+    },
+)
+
+# The request key under which an already matched proxied URL is stored.
+KEY_PROXIED_URL_MATCH: Final = "hass_web_proxy_match"
+
 DELETE_PROXIED_URL_SCHEMA = vol.Schema(
     {
-        vol.Required("url_id"): cv.string,
+        vol.Required(CONF_URL_ID): cv.string,
+    },
+    required=True,
+)
+
+DELETE_PROXIED_URLS_SCHEMA = vol.All(
+    vol.Schema(
+        {
+            vol.Optional(CONF_URL_IDS): vol.All(cv.ensure_list, [cv.string]),
+            vol.Optional(CONF_URL_ID_PREFIX): cv.string,
+            vol.Optional(CONF_TAG): cv.string,
+        },
+    ),
+    cv.has_at_least_one_key(CONF_URL_IDS, CONF_URL_ID_PREFIX, CONF_TAG),
+)
+
+SET_REQUEST_TRACING_SCHEMA = vol.Schema(
+    {
+        vol.Required(CONF_SAMPLE_RATE): vol.All(
+            vol.Coerce(float), vol.Range(min=0, max=1)
+        ),
     },
     required=True,
 )
@@ -91,72 +260,570 @@ async def async_setup_entry(
     hass: HomeAssistant, entry: HASSWebProxyConfigEntry
 ) -> None:
     """Set up the HASS web proxy entry."""
-    session = async_get_clientsession(hass)
+    metrics = ProxyMetrics()
+    circuit_breaker = _create_circuit_breaker(entry)
+    dns_resolver = _create_dns_resolver(entry)
+    request_tracer = RequestTracer(hass)
+    session = async_create_proxy_session(
+        hass, entry, metrics, circuit_breaker, dns_resolver, request_tracer
+    )
     hass.http.register_view(V0WSProxyView(hass, session))
     hass.http.register_view(V0ProxyView(hass, session))
 
     entry.runtime_data = HASSWebProxyData(
         integration=async_get_loaded_integration(hass, entry.domain),
-        dynamic_proxied_urls={},
+        dynamic_proxied_urls=OrderedDict(),
+        session=session,
+        stream_fanout=StreamFanout(hass, entry),
+        websocket_fanout=WebSocketFanout(hass, entry),
+        ssl_contexts=await hass.async_add_executor_job(_create_ssl_contexts),
+        response_cache=_create_response_cache(entry),
+        request_coalescer=_create_request_coalescer(entry),
+        concurrency_limiter=_create_concurrency_limiter(entry),
+        circuit_breaker=circuit_breaker,
+        dns_resolver=dns_resolver,
+        connection_prewarmer=_create_connection_prewarmer(hass, entry, session),
+        segment_cache=await _async_create_segment_cache(hass, entry),
+        request_tracer=request_tracer,
+        url_signer=URLSigner(_get_signing_key(hass, entry)),
+        metrics=metrics,
+        max_dynamic_proxied_urls=int(
+            entry.options.get(CONF_DYNAMIC_URLS_MAX, DEFAULT_DYNAMIC_URLS_MAX)
+        ),
+        evict_least_recently_used=(
+            entry.options.get(CONF_DYNAMIC_URLS_EVICTION, DEFAULT_DYNAMIC_URLS_EVICTION)
+            != CONF_DYNAMIC_URLS_EVICTION_OLDEST
+        ),
+    )
+    if entry.options.get(CONF_DYNAMIC_URLS):
+        await _async_load_dynamic_proxied_urls(hass, entry)
+    _index_static_url_patterns(entry)
+
+    for service, handler, schema, supports_response in _get_services(hass, entry):
+        hass.services.async_register(
+            DOMAIN,
+            service,
+            functools.partial(handler, entry),
+            schema,
+            supports_response=supports_response,
+        )
+
+
+@callback
+async def async_unload_entry(
+    hass: HomeAssistant, entry: HASSWebProxyConfigEntry
+) -> None:
+    """Unload the proxy entry."""
+    for service, *_ in _get_services(hass, entry):
+        hass.services.async_remove(DOMAIN, service)
+
+    if entry.runtime_data.dynamic_url_store is not None:
+        await entry.runtime_data.dynamic_url_store.async_flush()
+    await entry.runtime_data.session.close()
+    # The session's connector does not own (so does not close) the resolver.
+    if entry.runtime_data.dns_resolver is not None:
+        await entry.runtime_data.dns_resolver.close()
+
+
+def _index_static_url_patterns(entry: HASSWebProxyConfigEntry) -> None:
+    """Index the statically configured URL patterns."""
+    static_ssl_context = _get_ssl_context(
+        entry.runtime_data.ssl_contexts,
+        ssl_verification=entry.options.get(CONF_SSL_VERIFICATION, True),
+        ssl_ciphers=entry.options.get(CONF_SSL_CIPHERS),
+    )
+    url_pattern_options = entry.options.get(CONF_URL_PATTERN_OPTIONS) or {}
+    prewarmer = entry.runtime_data.connection_prewarmer
+    for url_pattern in entry.options.get(CONF_URL_PATTERNS, []):
+        try:
+            pattern_options = URL_PATTERN_OPTIONS_SCHEMA(
+                url_pattern_options.get(url_pattern) or {}
+            )
+        except vol.Invalid as exc:
+            LOGGER.warning(f"Ignoring invalid options for '{url_pattern}': {exc}")
+            pattern_options = URL_PATTERN_OPTIONS_SCHEMA({})
+
+        try:
+            entry.runtime_data.static_url_index.add(
+                url_pattern,
+                url_pattern,
+                StaticProxiedURL(
+                    url_pattern=url_pattern,
+                    stream_fanout=pattern_options[CONF_STREAM_FANOUT],
+                    cache_ttl=pattern_options.get(CONF_CACHE_TTL),
+                    connect_timeout=pattern_options.get(CONF_CONNECT_TIMEOUT),
+                    read_timeout=pattern_options.get(CONF_READ_TIMEOUT),
+                    websocket_compression=pattern_options[CONF_WEBSOCKET_COMPRESSION],
+                    websocket_fanout=pattern_options[CONF_WEBSOCKET_FANOUT],
+                    ssl_context=static_ssl_context,
+                    rate_limiter=create_rate_limiter(
+                        pattern_options.get(CONF_RATE_LIMIT),
+                        pattern_options.get(CONF_RATE_LIMIT_BURST),
+                    ),
+                ),
+            )
+        except urlmatch.BadMatchPattern:
+            LOGGER.warning(f"Ignoring invalid URL pattern '{url_pattern}'")
+        else:
+            if prewarmer is not None:
+                prewarmer.async_add(url_pattern, static_ssl_context)
+
+
+def _get_services(
+    hass: HomeAssistant, entry: HASSWebProxyConfigEntry
+) -> list[_Service]:
+    """Get the actions provided for an entry, with their handlers and schemas."""
+    services: list[_Service] = [
+        (
+            SERVICE_SET_REQUEST_TRACING,
+            _set_request_tracing,
+            SET_REQUEST_TRACING_SCHEMA,
+            SupportsResponse.NONE,
+        ),
+        (SERVICE_GET_STATS, _get_stats, None, SupportsResponse.ONLY),
+    ]
+    if entry.options.get(CONF_DYNAMIC_URLS):
+        services += [
+            (
+                SERVICE_CREATE_PROXIED_URL,
+                _create_proxied_url,
+                CREATE_PROXIED_URL_SCHEMA,
+                SupportsResponse.OPTIONAL,
+            ),
+            (
+                SERVICE_DELETE_PROXIED_URL,
+                _delete_proxied_url,
+                DELETE_PROXIED_URL_SCHEMA,
+                SupportsResponse.NONE,
+            ),
+            (
+                SERVICE_CREATE_PROXIED_URLS,
+                _create_proxied_urls,
+                CREATE_PROXIED_URLS_SCHEMA,
+                SupportsResponse.OPTIONAL,
+            ),
+            (
+                SERVICE_DELETE_PROXIED_URLS,
+                _delete_proxied_urls,
+                DELETE_PROXIED_URLS_SCHEMA,
+                SupportsResponse.OPTIONAL,
+            ),
+            (
+                SERVICE_REVOKE_SIGNED_URLS,
+                functools.partial(_revoke_signed_urls, hass),
+                None,
+                SupportsResponse.NONE,
+            ),
+        ]
+    return services
+
+
+def _compile_dynamic_proxied_url(
+    entry: HASSWebProxyConfigEntry, data: Mapping[str, Any], tag: str | None = None
+) -> tuple[str, DynamicProxiedURL, CompiledURLPattern]:
+    """Create a dynamic proxied URL (and compile its pattern) from call data."""
+    url_id = data.get(CONF_URL_ID) or str(uuid.uuid4())
+    ttl = data[CONF_TTL]
+    if data[CONF_SIGNED] and not ttl:
+        # Signed URLs cannot be deleted, so must expire.
+        raise ServiceValidationError(
+            translation_domain=DOMAIN,
+            translation_key="signed_url_ttl_required",
+        )
+    try:
+        compiled = compile_url_pattern(data[CONF_URL_PATTERN])
+    except urlmatch.BadMatchPattern as exc:
+        raise ServiceValidationError(
+            translation_domain=DOMAIN,
+            translation_key="invalid_url_pattern",
+            translation_placeholders={"url_pattern": data[CONF_URL_PATTERN]},
+        ) from exc
+
+    proxied_url = DynamicProxiedURL(
+        url_pattern=data[CONF_URL_PATTERN],
+        ssl_verification=data[CONF_SSL_VERIFICATION],
+        ssl_ciphers=data[CONF_SSL_CIPHERS],
+        open_limit=data[CONF_OPEN_LIMIT],
+        expiration=time.time() + ttl if ttl else 0,
+        allow_unauthenticated=data[CONF_ALLOW_UNAUTHENTICATED],
+        stream_fanout=data[CONF_STREAM_FANOUT],
+        cache_ttl=data.get(CONF_CACHE_TTL),
+        tag=data.get(CONF_TAG, tag),
+        signed=data[CONF_SIGNED],
+        rate_limit=data.get(CONF_RATE_LIMIT),
+        rate_limit_burst=data.get(CONF_RATE_LIMIT_BURST),
+        connect_timeout=data.get(CONF_CONNECT_TIMEOUT),
+        read_timeout=data.get(CONF_READ_TIMEOUT),
+        websocket_compression=data[CONF_WEBSOCKET_COMPRESSION],
+        websocket_fanout=data[CONF_WEBSOCKET_FANOUT],
+        ssl_context=_get_ssl_context(
+            entry.runtime_data.ssl_contexts,
+            ssl_verification=data[CONF_SSL_VERIFICATION],
+            ssl_ciphers=data[CONF_SSL_CIPHERS],
+        ),
+        rate_limiter=create_rate_limiter(
+            data.get(CONF_RATE_LIMIT), data.get(CONF_RATE_LIMIT_BURST)
+        ),
     )
+    return url_id, proxied_url, compiled
+
+
+def _add_dynamic_proxied_urls(
+    entry: HASSWebProxyConfigEntry,
+    proxied_urls: list[tuple[str, DynamicProxiedURL, CompiledURLPattern]],
+) -> JsonObjectType:
+    """Add dynamic proxied URLs, getting the tokens of those that are signed."""
+    url_signer = entry.runtime_data.url_signer
+    # Returned in action responses, so typed as JSON.
+    tokens: JsonObjectType = {}
+    registered: list[tuple[str, DynamicProxiedURL, CompiledURLPattern | None]] = []
+    for url_id, proxied_url, compiled in proxied_urls:
+        if url_signer is None or not proxied_url.signed:
+            registered.append((url_id, proxied_url, compiled))
+            continue
 
-    def create_proxied_url(call: ServiceCall) -> ServiceResponse:
-        """Create a proxied URL."""
-        url_id = call.data.get("url_id") or str(uuid.uuid4())
-        ttl = call.data["ttl"]
-
-        entry.runtime_data.dynamic_proxied_urls[url_id] = DynamicProxiedURL(
-            url_pattern=call.data["url_pattern"],
-            ssl_verification=call.data["ssl_verification"],
-            ssl_ciphers=call.data["ssl_ciphers"],
-            open_limit=call.data["open_limit"],
-            expiration=time.time() + ttl if ttl else 0,
-            allow_unauthenticated=call.data["allow_unauthenticated"],
+        tokens[url_id] = url_signer.sign(url_id, proxied_url)
+        # Signed URLs are matched by their token alone, so are only registered
+        # if the number of times they are opened must be counted.
+        if proxied_url.open_limit:
+            registered.append((url_id, proxied_url, None))
+
+    # A batch beyond the maximum would evict (some of) itself, so is rejected.
+    max_dynamic_proxied_urls = entry.runtime_data.max_dynamic_proxied_urls
+    if max_dynamic_proxied_urls and len(registered) > max_dynamic_proxied_urls:
+        raise ServiceValidationError(
+            translation_domain=DOMAIN,
+            translation_key="too_many_proxied_urls",
+            translation_placeholders={"max": str(max_dynamic_proxied_urls)},
         )
 
+    entry.runtime_data.remove_expired_dynamic_proxied_urls()
+    entry.runtime_data.add_dynamic_proxied_urls(registered)
+    return tokens
+
+
+@callback
+def _create_proxied_url(
+    entry: HASSWebProxyConfigEntry, call: ServiceCall
+) -> ServiceResponse:
+    """Create a proxied URL."""
+    url_id, proxied_url, compiled = _compile_dynamic_proxied_url(entry, call.data)
+    tokens = _add_dynamic_proxied_urls(entry, [(url_id, proxied_url, compiled)])
+
+    if LOGGER.isEnabledFor(logging.DEBUG):
         LOGGER.debug(f"Created dynamically proxied URL '{url_id}': {call.data}")
 
-        return {"url_id": url_id}
+    if url_id in tokens:
+        return {CONF_URL_ID: url_id, ATTR_TOKEN: tokens[url_id]}
+    return {CONF_URL_ID: url_id}
+
+
+@callback
+def _create_proxied_urls(
+    entry: HASSWebProxyConfigEntry, call: ServiceCall
+) -> ServiceResponse:
+    """Create many proxied URLs at once (or none, if any is invalid)."""
+    proxied_urls = [
+        _compile_dynamic_proxied_url(entry, data, call.data.get(CONF_TAG))
+        for data in call.data[CONF_PROXIED_URLS]
+    ]
+
+    tokens = _add_dynamic_proxied_urls(entry, proxied_urls)
+
+    if LOGGER.isEnabledFor(logging.DEBUG):
+        LOGGER.debug(f"Created {len(proxied_urls)} dynamically proxied URLs")
 
-    def delete_proxied_url(call: ServiceCall) -> None:
-        """Delete a proxied URL."""
-        url_id = call.data["url_id"]
-        dynamic_proxied_urls = entry.runtime_data.dynamic_proxied_urls
+    return {
+        CONF_URL_IDS: [url_id for url_id, _, _ in proxied_urls],
+        ATTR_TOKENS: tokens,
+    }
 
+
+def _check_url_ids_exist(entry: HASSWebProxyConfigEntry, url_ids: list[str]) -> None:
+    """Check that dynamic proxied URLs exist."""
+    dynamic_proxied_urls = entry.runtime_data.dynamic_proxied_urls
+    for url_id in url_ids:
         if url_id not in dynamic_proxied_urls:
             raise ServiceValidationError(
                 translation_domain=DOMAIN,
                 translation_key="url_id_not_found",
                 translation_placeholders={"url_id": url_id},
             )
-        del entry.runtime_data.dynamic_proxied_urls[url_id]
 
-        LOGGER.debug(f"Deleted dynamically proxied URL '{url_id}'")
 
-    if entry.options.get(CONF_DYNAMIC_URLS):
-        hass.services.async_register(
-            DOMAIN,
-            SERVICE_CREATE_PROXIED_URL,
-            create_proxied_url,
-            CREATE_PROXIED_URL_SCHEMA,
-            supports_response=SupportsResponse.OPTIONAL,
-        )
-        hass.services.async_register(
-            DOMAIN,
-            SERVICE_DELETE_PROXIED_URL,
-            delete_proxied_url,
-            DELETE_PROXIED_URL_SCHEMA,
+@callback
+def _delete_proxied_url(entry: HASSWebProxyConfigEntry, call: ServiceCall) -> None:
+    """Delete a proxied URL."""
+    url_id = call.data[CONF_URL_ID]
+    _check_url_ids_exist(entry, [url_id])
+    entry.runtime_data.remove_dynamic_proxied_url(url_id)
+
+    LOGGER.debug(f"Deleted dynamically proxied URL '{url_id}'")
+
+
+@callback
+def _delete_proxied_urls(
+    entry: HASSWebProxyConfigEntry, call: ServiceCall
+) -> ServiceResponse:
+    """Delete proxied URLs by id, and/or by id prefix and tag."""
+    url_ids = dict.fromkeys(call.data.get(CONF_URL_IDS, []))
+    _check_url_ids_exist(entry, list(url_ids))
+    if CONF_URL_ID_PREFIX in call.data or CONF_TAG in call.data:
+        url_ids.update(
+            dict.fromkeys(
+                entry.runtime_data.find_dynamic_url_ids(
+                    url_id_prefix=call.data.get(CONF_URL_ID_PREFIX),
+                    tag=call.data.get(CONF_TAG),
+                )
+            )
         )
 
+    for url_id in url_ids:
+        entry.runtime_data.remove_dynamic_proxied_url(url_id)
+
+    LOGGER.debug(f"Deleted {len(url_ids)} dynamically proxied URLs")
+    return {CONF_URL_IDS: list(url_ids)}
+
 
 @callback
-async def async_unload_entry(
+def _revoke_signed_urls(
+    hass: HomeAssistant, entry: HASSWebProxyConfigEntry, _call: ServiceCall
+) -> None:
+    """Revoke all signed URLs, by signing with a new key from now on."""
+    data = entry.runtime_data
+    for url_id, proxied_url in list(data.dynamic_proxied_urls.items()):
+        if proxied_url.signed:
+            data.remove_dynamic_proxied_url(url_id)
+
+    signing_key = create_signing_key()
+    data.url_signer = URLSigner(signing_key)
+    # Kept in the entry (which is then reloaded), so revocation survives restarts.
+    hass.config_entries.async_update_entry(
+        entry, data={**entry.data, CONF_SIGNING_KEY: signing_key}
+    )
+
+    LOGGER.debug("Revoked all signed URLs")
+
+
+@callback
+def _set_request_tracing(entry: HASSWebProxyConfigEntry, call: ServiceCall) -> None:
+    """Set the fraction of requests that are traced."""
+    tracer = entry.runtime_data.request_tracer
+    if tracer is not None:
+        tracer.sample_rate = call.data[CONF_SAMPLE_RATE]
+
+
+@callback
+def _get_stats(entry: HASSWebProxyConfigEntry, _call: ServiceCall) -> ServiceResponse:
+    """Get the proxy metrics."""
+    return entry.runtime_data.metrics.get_stats()
+
+
+async def _async_load_dynamic_proxied_urls(
     hass: HomeAssistant, entry: HASSWebProxyConfigEntry
 ) -> None:
-    """Unload the proxy entry."""
-    if entry.options.get(CONF_DYNAMIC_URLS):
-        hass.services.async_remove(DOMAIN, SERVICE_CREATE_PROXIED_URL)
-        hass.services.async_remove(DOMAIN, SERVICE_DELETE_PROXIED_URL)
+    """Load the saved dynamic proxied URLs, and save them from now on."""
+    data = entry.runtime_data
+    store = DynamicProxiedURLStore(hass, entry.entry_id)
+
+    proxied_urls: list[tuple[str, DynamicProxiedURL, CompiledURLPattern | None]] = []
+    for url_id, proxied_url in await store.async_load():
+        try:
+            compiled = compile_url_pattern(proxied_url.url_pattern)
+        except urlmatch.BadMatchPattern:
+            LOGGER.warning(f"Ignoring invalid stored URL pattern '{url_id}'")
+            continue
+        proxied_url.ssl_context = _get_ssl_context(
+            data.ssl_contexts,
+            ssl_verification=proxied_url.ssl_verification,
+            ssl_ciphers=proxied_url.ssl_ciphers,
+        )
+        proxied_url.rate_limiter = create_rate_limiter(
+            proxied_url.rate_limit, proxied_url.rate_limit_burst
+        )
+        # Signed URLs are only registered to count their opens.
+        proxied_urls.append(
+            (url_id, proxied_url, None if proxied_url.signed else compiled)
+        )
+
+    data.add_dynamic_proxied_urls(proxied_urls)
+    data.dynamic_url_store = store
+
+
+def _get_signing_key(hass: HomeAssistant, entry: HASSWebProxyConfigEntry) -> str:
+    """Get the key that signed URLs are signed with, creating it the first time."""
+    # The key is kept in the entry, so that signed URLs survive restarts.
+    if CONF_SIGNING_KEY not in entry.data:
+        hass.config_entries.async_update_entry(
+            entry, data={**entry.data, CONF_SIGNING_KEY: create_signing_key()}
+        )
+    return str(entry.data[CONF_SIGNING_KEY])
+
+
+def _create_response_cache(entry: HASSWebProxyConfigEntry) -> ResponseCache | None:
+    """Create the response cache, if enabled."""
+    size = float(
+        entry.options.get(CONF_RESPONSE_CACHE_SIZE, DEFAULT_RESPONSE_CACHE_SIZE)
+    )
+    if not size:
+        return None
+
+    max_entry_size = float(
+        entry.options.get(
+            CONF_RESPONSE_CACHE_MAX_ENTRY_SIZE, DEFAULT_RESPONSE_CACHE_MAX_ENTRY_SIZE
+        )
+    )
+    stale_ttl = float(
+        entry.options.get(
+            CONF_RESPONSE_CACHE_STALE_WHILE_REVALIDATE,
+            DEFAULT_RESPONSE_CACHE_STALE_WHILE_REVALIDATE,
+        )
+    )
+    return ResponseCache(
+        max_size=int(size * 1024 * 1024),
+        max_entry_size=int(max_entry_size * 1024),
+        stale_ttl=stale_ttl,
+    )
+
+
+async def _async_create_segment_cache(
+    hass: HomeAssistant, entry: HASSWebProxyConfigEntry
+) -> SegmentCache | None:
+    """Create the media segment cache, if enabled."""
+    size = float(entry.options.get(CONF_SEGMENT_CACHE_SIZE, DEFAULT_SEGMENT_CACHE_SIZE))
+    if not size:
+        return None
+
+    segment_cache = SegmentCache(
+        hass,
+        Path(hass.config.path(DOMAIN, "segments")),
+        max_size=int(size * 1024 * 1024),
+        url_patterns=entry.options.get(CONF_SEGMENT_CACHE_URL_PATTERNS, []),
+    )
+    await hass.async_add_executor_job(segment_cache.load)
+    return segment_cache
+
+
+def _create_request_coalescer(
+    entry: HASSWebProxyConfigEntry,
+) -> RequestCoalescer | None:
+    """Create the request coalescer, if enabled."""
+    max_size = float(
+        entry.options.get(
+            CONF_REQUEST_COALESCING_MAX_SIZE, DEFAULT_REQUEST_COALESCING_MAX_SIZE
+        )
+    )
+    if not max_size:
+        return None
+    return RequestCoalescer(max_body_size=int(max_size * 1024))
+
+
+def _create_concurrency_limiter(
+    entry: HASSWebProxyConfigEntry,
+) -> ConcurrencyLimiter | None:
+    """Create the per-host upstream concurrency limiter, if enabled."""
+    limit = int(
+        entry.options.get(CONF_REQUEST_LIMIT_PER_HOST, DEFAULT_REQUEST_LIMIT_PER_HOST)
+    )
+    if not limit:
+        return None
+    return ConcurrencyLimiter(
+        limit=limit,
+        queue_size=int(
+            entry.options.get(CONF_REQUEST_QUEUE_SIZE, DEFAULT_REQUEST_QUEUE_SIZE)
+        ),
+        queue_timeout=float(
+            entry.options.get(CONF_REQUEST_QUEUE_TIMEOUT, DEFAULT_REQUEST_QUEUE_TIMEOUT)
+        ),
+    )
+
+
+def _create_dns_resolver(entry: HASSWebProxyConfigEntry) -> CachingResolver:
+    """Create the resolver (and DNS cache) of upstream hosts."""
+    return CachingResolver(
+        max_ttl=float(entry.options.get(CONF_DNS_CACHE_TTL, DEFAULT_DNS_CACHE_TTL)),
+        negative_ttl=float(
+            entry.options.get(
+                CONF_DNS_NEGATIVE_CACHE_TTL, DEFAULT_DNS_NEGATIVE_CACHE_TTL
+            )
+        ),
+    )
+
+
+def _create_connection_prewarmer(
+    hass: HomeAssistant,
+    entry: HASSWebProxyConfigEntry,
+    session: aiohttp.ClientSession,
+) -> ConnectionPrewarmer | None:
+    """Create the upstream connection pre-warmer, if enabled."""
+    max_hosts = int(
+        entry.options.get(CONF_PREWARM_CONNECTIONS, DEFAULT_PREWARM_CONNECTIONS)
+    )
+    if not max_hosts:
+        return None
+    prewarmer = ConnectionPrewarmer(hass, entry, session, max_hosts)
+    prewarmer.async_start(
+        float(entry.options.get(CONF_KEEPALIVE_TIMEOUT, DEFAULT_KEEPALIVE_TIMEOUT))
+    )
+    return prewarmer
+
+
+def _create_circuit_breaker(entry: HASSWebProxyConfigEntry) -> CircuitBreaker | None:
+    """Create the upstream circuit breaker, if enabled."""
+    threshold = int(
+        entry.options.get(
+            CONF_CIRCUIT_BREAKER_THRESHOLD, DEFAULT_CIRCUIT_BREAKER_THRESHOLD
+        )
+    )
+    if not threshold:
+        return None
+    return CircuitBreaker(
+        failure_threshold=threshold,
+        cooldown=float(
+            entry.options.get(
+                CONF_CIRCUIT_BREAKER_COOLDOWN, DEFAULT_CIRCUIT_BREAKER_COOLDOWN
+            )
+        ),
+    )
+
+
+def _proxy_ssl_cipher_to_ha_ssl_cipher(ssl_ciphers: str | None) -> SSLCipherList:
+    """Convert a proxy SSL cipher to a HA SSL cipher."""
+    if ssl_ciphers == CONF_SSL_CIPHERS_INSECURE:
+        return SSLCipherList.INSECURE
+    if ssl_ciphers == CONF_SSL_CIPHERS_MODERN:
+        return SSLCipherList.MODERN
+    if ssl_ciphers == CONF_SSL_CIPHERS_INTERMEDIATE:
+        return SSLCipherList.INTERMEDIATE
+    return SSLCipherList.PYTHON_DEFAULT
+
+
+def _create_ssl_contexts() -> dict[tuple[bool, str], ssl.SSLContext]:
+    """
+    Create an SSL context for every (verification, cipher) combination.
+
+    A single context object is shared by all requests with the same settings, as
+    aiohttp only reuses pooled connections for an identical SSL context.
+    """
+    return {
+        (ssl_verification, ssl_ciphers): (
+            client_context if ssl_verification else client_context_no_verify
+        )(_proxy_ssl_cipher_to_ha_ssl_cipher(ssl_ciphers))
+        for ssl_verification in (True, False)
+        for ssl_ciphers in SSL_CIPHERS
+    }
+
+
+def _get_ssl_context(
+    ssl_contexts: dict[tuple[bool, str], ssl.SSLContext],
+    *,
+    ssl_verification: bool,
+    ssl_ciphers: str | None,
+) -> ssl.SSLContext:
+    """Get the shared SSL context for the given settings."""
+    if ssl_ciphers not in SSL_CIPHERS:
+        ssl_ciphers = CONF_SSL_CIPHERS_DEFAULT
+    return ssl_contexts[(bool(ssl_verification), ssl_ciphers)]
 
 
 class BaseProxy:
@@ -170,6 +837,20 @@ class BaseProxy:
         """Get the config entry."""
         return self._hass.config_entries.async_entries(DOMAIN)[0]
 
+    @property
+    def _websession(self) -> aiohttp.ClientSession:
+        """
+        Get the upstream session.
+
+        Views outlive entry reloads, so always use the current entry's session
+        rather than the one the view was created with.
+        """
+        return self._get_config_entry().runtime_data.session
+
+    @_websession.setter
+    def _websession(self, _websession: aiohttp.ClientSession) -> None:
+        """Ignore the session stored by the base view (see the getter)."""
+
     def get_dynamic_proxied_urls(self) -> dict[str, DynamicProxiedURL]:
         """Get the dynamic proxied URLs."""
         return self._get_config_entry().runtime_data.dynamic_proxied_urls
@@ -180,80 +861,151 @@ class BaseProxy:
 
     def _cleanup_expired_urls(self) -> None:
         """Cleanup expired URLs."""
-        proxied_urls = self.get_dynamic_proxied_urls()
-        for url_id, proxied_url in list(proxied_urls.items()):
-            if proxied_url.expiration and proxied_url.expiration < time.time():
-                del proxied_urls[url_id]
+        self._get_config_entry().runtime_data.remove_expired_dynamic_proxied_urls()
 
-    def _get_proxied_url(self, request: web.Request, **_kwargs: Any) -> ProxiedURL:
-        """Get the URL to proxy."""
-        LOGGER.debug(
-            f"Received proxy request '{request.query}',"
-            f" dynamic proxied URLs: {self.get_dynamic_proxied_urls()},"
-            f" static options: {self._get_options()}."
-        )
+    def _match_proxied_url(self, request: web.Request) -> ProxiedURLMatch:
+        """Match the request against the proxied URLs, recording the result."""
+        metrics = self._get_config_entry().runtime_data.metrics
+        started = time.perf_counter()
+        try:
+            match = self._find_proxied_url(request)
+        except HASSWebProxyLibNotFoundRequestError:
+            metrics.record_match(None, time.perf_counter() - started)
+            raise
+        metrics.record_match(match, time.perf_counter() - started)
+        return match
+
+    def _find_proxied_url(self, request: web.Request) -> ProxiedURLMatch:
+        """Match the request against the dynamic and static proxied URLs."""
+        # This is on every request, so only build the message if it will be logged.
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            LOGGER.debug(
+                f"Received proxy request '{request.query}',"
+                f" dynamic proxied URLs: {len(self.get_dynamic_proxied_urls())}"
+            )
 
         if "url" not in request.query:
             raise HASSWebProxyLibNotFoundRequestError
 
-        options = self._get_options()
         url_to_proxy = urllib.parse.unquote(request.query["url"])
 
+        data = self._get_config_entry().runtime_data
+        if (
+            token := request.query.get(ATTR_TOKEN)
+        ) is not None and self._get_options().get(CONF_DYNAMIC_URLS):
+            return self._match_signed_proxied_url(request, data, url_to_proxy, token)
+
         self._cleanup_expired_urls()
 
-        proxied_urls = self.get_dynamic_proxied_urls()
-        for [url_id, proxied_url] in proxied_urls.items():
-            if urlmatch.urlmatch(
-                proxied_url.url_pattern,
-                url_to_proxy,
-                path_required=False,
-            ):
-                if proxied_url.open_limit:
-                    proxied_url.open_limit -= 1
-                    if proxied_url.open_limit == 0:
-                        del proxied_urls[url_id]
-
-                return ProxiedURL(
-                    url=url_to_proxy,
-                    allow_unauthenticated=proxied_url.allow_unauthenticated,
-                    ssl_context=self._get_ssl_context(proxied_url.ssl_ciphers)
-                    if proxied_url.ssl_verification
-                    else self._get_ssl_context_no_verify(proxied_url.ssl_ciphers),
-                )
+        # Clients that know the id of their proxied URL need only its pattern checked.
+        if (url_id := request.query.get(CONF_URL_ID)) is not None:
+            proxied_url = data.dynamic_url_index.match_key(url_id, url_to_proxy)
+            if proxied_url is None:
+                raise HASSWebProxyLibNotFoundRequestError
+            return self._open_dynamic_proxied_url(
+                request, data, url_id, proxied_url, url_to_proxy
+            )
 
-        for url_pattern in self._get_options().get("url_patterns", []):
-            if urlmatch.urlmatch(url_pattern, url_to_proxy, path_required=False):
-                ssl_cipher = str(options.get(CONF_SSL_CIPHERS))
-                ssl_verification = options.get(CONF_SSL_VERIFICATION, True)
+        if dynamic_match := data.dynamic_url_index.match(url_to_proxy):
+            return self._open_dynamic_proxied_url(
+                request, data, *dynamic_match, url_to_proxy
+            )
 
-                return ProxiedURL(
+        if static_match := data.static_url_index.match(url_to_proxy):
+            self._check_rate_limit(request, data, static_match[1])
+            return ProxiedURLMatch(
+                proxied_url=ProxiedURL(
                     url=url_to_proxy,
-                    ssl_context=self._get_ssl_context(ssl_cipher)
-                    if ssl_verification
-                    else self._get_ssl_context_no_verify(ssl_cipher),
-                )
+                    ssl_context=static_match[1].ssl_context,
+                ),
+                target=static_match[1],
+            )
 
         raise HASSWebProxyLibNotFoundRequestError
 
-    def _get_ssl_context_no_verify(self, ssl_cipher: str) -> ssl.SSLContext:
-        """Get an SSL context."""
-        return client_context_no_verify(
-            self._proxy_ssl_cipher_to_ha_ssl_cipher(ssl_cipher)
+    def _check_rate_limit(
+        self,
+        request: web.Request,
+        data: HASSWebProxyData,
+        target: DynamicProxiedURL | StaticProxiedURL,
+    ) -> None:
+        """Reject the request if its client is over the rate limit of its target."""
+        rate_limiter = target.rate_limiter
+        if rate_limiter is not None and not rate_limiter.allow(request.remote or ""):
+            data.metrics.rate_limited += 1
+            raise web.HTTPTooManyRequests(
+                headers={hdrs.RETRY_AFTER: str(rate_limiter.retry_after)}
+            )
+
+    def _open_dynamic_proxied_url(
+        self,
+        request: web.Request,
+        data: HASSWebProxyData,
+        url_id: str,
+        proxied_url: DynamicProxiedURL,
+        url_to_proxy: str,
+    ) -> ProxiedURLMatch:
+        """Open a matched dynamic proxied URL, counting it against its open limit."""
+        self._check_rate_limit(request, data, proxied_url)
+        data.open_dynamic_proxied_url(url_id, proxied_url)
+
+        return ProxiedURLMatch(
+            proxied_url=ProxiedURL(
+                url=url_to_proxy,
+                allow_unauthenticated=proxied_url.allow_unauthenticated,
+                ssl_context=proxied_url.ssl_context,
+            ),
+            target=proxied_url,
+            url_id=url_id,
         )
 
-    def _get_ssl_context(self, ssl_ciphers: str) -> ssl.SSLContext:
-        """Get an SSL context."""
-        return client_context(self._proxy_ssl_cipher_to_ha_ssl_cipher(ssl_ciphers))
+    def _match_signed_proxied_url(
+        self,
+        request: web.Request,
+        data: HASSWebProxyData,
+        url_to_proxy: str,
+        token: str,
+    ) -> ProxiedURLMatch:
+        """Match the request against the proxied URL signed in its token."""
+        signed = data.url_signer.verify(token) if data.url_signer else None
+        if signed is None or not signed.compiled.matches(url_to_proxy):
+            raise HASSWebProxyLibNotFoundRequestError
+
+        proxied_url = signed.proxied_url
+        if proxied_url.ssl_context is None:
+            # Resolved once per verified token, as it is remembered by the signer.
+            proxied_url.ssl_context = _get_ssl_context(
+                data.ssl_contexts,
+                ssl_verification=proxied_url.ssl_verification,
+                ssl_ciphers=proxied_url.ssl_ciphers,
+            )
+            proxied_url.rate_limiter = create_rate_limiter(
+                proxied_url.rate_limit, proxied_url.rate_limit_burst
+            )
+        self._check_rate_limit(request, data, proxied_url)
+
+        if proxied_url.open_limit:
+            # Only signed URLs with an open limit are registered, to count opens.
+            registered = data.dynamic_proxied_urls.get(signed.url_id)
+            if registered is None or not registered.signed:
+                raise HASSWebProxyLibNotFoundRequestError
+            data.open_dynamic_proxied_url(signed.url_id, registered)
 
-    def _proxy_ssl_cipher_to_ha_ssl_cipher(self, ssl_ciphers: str) -> SSLCipherList:
-        """Convert a proxy SSL cipher to a HA SSL cipher."""
-        if ssl_ciphers == CONF_SSL_CIPHERS_INSECURE:
-            return SSLCipherList.INSECURE
-        if ssl_ciphers == CONF_SSL_CIPHERS_MODERN:
-            return SSLCipherList.MODERN
-        if ssl_ciphers == CONF_SSL_CIPHERS_INTERMEDIATE:
-            return SSLCipherList.INTERMEDIATE
-        return SSLCipherList.PYTHON_DEFAULT
+        return ProxiedURLMatch(
+            proxied_url=ProxiedURL(
+                url=url_to_proxy,
+                allow_unauthenticated=proxied_url.allow_unauthenticated,
+                ssl_context=proxied_url.ssl_context,
+            ),
+            target=proxied_url,
+            url_id=signed.url_id,
+        )
+
+    def _get_proxied_url(self, request: web.Request, **_kwargs: Any) -> ProxiedURL:
+        """Get the URL to proxy."""
+        # The views only defer to the base view once the request is matched.
+        match = cast("ProxiedURLMatch", request[KEY_PROXIED_URL_MATCH])
+        return match.proxied_url
 
 
 class HTTPProxyView(BaseProxy, ProxyView):
@@ -265,6 +1017,279 @@ class HTTPProxyView(BaseProxy, ProxyView):
         super().__init__(hass)
         ProxyView.__init__(self, websession)
 
+    async def get(
+        self, request: web.Request, **kwargs: Any
+    ) -> web.Response | web.StreamResponse | web.WebSocketResponse:
+        """Proxy a GET request (recording metrics, and tracing it if sampled)."""
+        data = self._get_config_entry().runtime_data
+        tracer = data.request_tracer
+        trace = tracer.sample() if tracer is not None else None
+
+        status: int | None = None
+        try:
+            with contextlib.ExitStack() as stack:
+                stack.enter_context(data.metrics.track_stream())
+                if tracer is not None and trace is not None:
+                    stack.enter_context(tracer.activate(trace))
+                response = await self._async_get(request, trace, **kwargs)
+                if response.prepared:
+                    # Streamed responses are only sized once finished.
+                    with contextlib.suppress(ConnectionResetError):
+                        await response.write_eof()
+            data.metrics.record_response(response)
+            status = response.status
+        except web.HTTPException as exc:
+            status = exc.status
+            raise
+        finally:
+            if tracer is not None and trace is not None:
+                trace.finish(status)
+                tracer.record(trace)
+        return response
+
+    async def _async_get(
+        self, request: web.Request, trace: RequestTrace | None, **kwargs: Any
+    ) -> web.Response | web.StreamResponse | web.WebSocketResponse:
+        """Proxy a GET request."""
+        try:
+            match = self._match_proxied_url(request)
+        except HASSWebProxyLibNotFoundRequestError:
+            if trace is not None:
+                trace.set_match(None)
+            # As the base view would, without matching (and recording) it again.
+            return web.Response(status=HTTPStatus.NOT_FOUND)
+
+        if trace is not None:
+            trace.set_match(match)
+        request[KEY_PROXIED_URL_MATCH] = match
+        proxied_url = match.proxied_url
+
+        if not proxied_url.allow_unauthenticated and not request[KEY_AUTHENTICATED]:
+            return await super().get(request, **kwargs)
+
+        data = self._get_config_entry().runtime_data
+        if match.target.stream_fanout:
+            return await data.stream_fanout.async_handle(
+                request,
+                data.session,
+                proxied_url.url,
+                proxied_url.ssl_context,
+                functools.partial(self._async_reserve_upstream, match),
+            )
+
+        if (
+            data.segment_cache is not None
+            and (
+                response := await self._async_get_segment(
+                    request, match, data.segment_cache
+                )
+            )
+            is not None
+        ):
+            return response
+
+        cache = data.response_cache
+        if match.target.cache_ttl == 0 or not is_request_cacheable(request.headers):
+            cache = None
+        if (
+            cache is None
+            and data.request_coalescer is None
+            and hdrs.RANGE not in request.headers
+            # The base view always uses the session's timeouts.
+            and match.target.connect_timeout is None
+            and match.target.read_timeout is None
+        ):
+            async with self._async_reserve_upstream(match):
+                response = await super().get(request, **kwargs)
+            # The base view reads the upstream body itself, passing its length on
+            # (if known), so only bodies of a known length are counted.
+            data.metrics.bytes_in += response.content_length or 0
+            return response
+
+        return await self._async_fetch(request, match, cache, data.request_coalescer)
+
+    async def _async_get_segment(
+        self, request: web.Request, match: ProxiedURLMatch, segment_cache: SegmentCache
+    ) -> web.StreamResponse | None:
+        """Respond from, or via, the media segment cache (if the URL matches)."""
+        url = match.proxied_url.url
+        if not segment_cache.matches(url):
+            return None
+        if (response := await segment_cache.async_get(request, url)) is not None:
+            return response
+        async with self._async_reserve_upstream(match) as timeout:
+            return await segment_cache.async_fetch(
+                request,
+                self._websession,
+                url,
+                match.proxied_url.ssl_context,
+                client_timeout=timeout,
+                metrics=self._get_config_entry().runtime_data.metrics,
+            )
+
+    @contextlib.asynccontextmanager
+    async def _async_reserve_upstream(
+        self, match: ProxiedURLMatch
+    ) -> AsyncIterator[aiohttp.ClientTimeout | None]:
+        """
+        Reserve an upstream request for a matched URL, getting its timeouts.
+
+        Responds 502 Bad Gateway if the circuit of the URL's host is open, or 503
+        Service Unavailable if the host's request queue is full (or the request
+        waited too long).
+        """
+        data = self._get_config_entry().runtime_data
+        timeout = get_upstream_timeout(
+            self._websession, match.target.connect_timeout, match.target.read_timeout
+        )
+        limiter = data.concurrency_limiter
+        circuit_breaker = data.circuit_breaker
+        if limiter is None and circuit_breaker is None:
+            yield timeout
+            return
+
+        host = get_host_key(URL(match.proxied_url.url))
+        if circuit_breaker is not None and not circuit_breaker.allow(host):
+            raise web.HTTPBadGateway
+        if limiter is not None:
+            try:
+                await limiter.async_acquire(host)
+            except ConcurrencyLimitError as exc:
+                raise web.HTTPServiceUnavailable(
+                    headers={hdrs.RETRY_AFTER: str(limiter.retry_after)}
+                ) from exc
+        try:
+            yield timeout
+        finally:
+            if limiter is not None:
+                limiter.release(host)
+
+    async def _async_fetch(
+        self,
+        request: web.Request,
+        match: ProxiedURLMatch,
+        cache: ResponseCache | None,
+        coalescer: RequestCoalescer | None,
+    ) -> web.StreamResponse:
+        """
+        Fetch a response via the response cache and/or request coalescer.
+
+        Stale cached responses are revalidated upstream (in the background, within
+        their stale-while-revalidate window), and clients with a current copy of a
+        cached response get a 304 Not Modified. Byte range requests are also fetched
+        here (even if neither is enabled), so that Range/If-Range are forwarded and
+        partial responses returned as-is.
+        """
+        url = match.proxied_url.url
+        ssl_context = match.proxied_url.ssl_context
+        metrics = self._get_config_entry().runtime_data.metrics
+        max_buffer_size = 0
+        on_complete: Callable[[BufferedResponse | None], None] | None = None
+        validators: dict[str, str] | None = None
+        stored: CachedResponse | None = None
+
+        if cache is not None:
+            key = normalize_url(url)
+            if (cached := cache.get(key)) is not None:
+                if cached.is_fresh():
+                    return cached.to_web_response(request.headers)
+                if cached.is_usable_stale():
+                    self._revalidate_in_background(request, match, cache, key, cached)
+                    return cached.to_web_response(request.headers)
+
+            # Fetch a complete response to cache (or revalidate the cached one), and
+            # answer any conditional request from the client once it is cached.
+            validators = cached.validators if cached is not None else {}
+
+            def _store(buffered: BufferedResponse | None) -> None:
+                nonlocal stored
+                if buffered is None:
+                    cache.remove(key)
+                else:
+                    stored = cache.update(key, buffered, match.target.cache_ttl)
+
+            max_buffer_size = cache.max_entry_size
+            on_complete = _store
+
+        reserve = functools.partial(self._async_reserve_upstream, match)
+        if coalescer is not None:
+            # Only requests that go upstream are reserved, not those coalesced.
+            response = await coalescer.async_fetch(
+                request,
+                self._websession,
+                url,
+                ssl_context,
+                max_buffer_size=max_buffer_size,
+                on_complete=on_complete,
+                validators=validators,
+                reserve=reserve,
+                metrics=metrics,
+            )
+        else:
+            async with reserve() as timeout:
+                response = await async_fetch(
+                    request,
+                    self._websession,
+                    url,
+                    ssl_context,
+                    max_buffer_size=max_buffer_size,
+                    on_complete=on_complete,
+                    validators=validators,
+                    client_timeout=timeout,
+                    metrics=metrics,
+                )
+        if stored is not None:
+            return stored.to_web_response(request.headers)
+        if validators and response.status == HTTPStatus.NOT_MODIFIED:
+            # The cached response was evicted while being revalidated, so the 304
+            # (which answers the cache's validators, not the client's) is refetched.
+            return await self._async_fetch(request, match, cache, coalescer)
+        return response
+
+    def _revalidate_in_background(
+        self,
+        request: web.Request,
+        match: ProxiedURLMatch,
+        cache: ResponseCache,
+        key: str,
+        cached: CachedResponse,
+    ) -> None:
+        """Revalidate a stale cached response, unless already in progress."""
+        if cached.revalidating:
+            return
+        cached.revalidating = True
+
+        url = match.proxied_url.url
+        headers = get_upstream_request_headers(request, validators=cached.validators)
+        metrics = self._get_config_entry().runtime_data.metrics
+
+        async def _async_revalidate() -> None:
+            try:
+                # Revalidations count against the host's limits like any request.
+                async with self._async_reserve_upstream(match) as timeout:
+                    buffered = await async_fetch_buffered(
+                        self._websession,
+                        match.proxied_url,
+                        headers,
+                        max_buffer_size=cache.max_entry_size,
+                        client_timeout=timeout,
+                        metrics=metrics,
+                    )
+            except (aiohttp.ClientError, TimeoutError, web.HTTPException) as exc:
+                LOGGER.debug(f"Revalidation of '{url}' failed: {exc}")
+                return
+            finally:
+                cached.revalidating = False
+
+            if buffered is None:
+                cache.remove(key)
+            else:
+                cache.update(key, buffered, match.target.cache_ttl)
+
+        self._get_config_entry().async_create_background_task(
+            self._hass, _async_revalidate(), name=f"hass_web_proxy revalidate {url}"
+        )
+
 
 class WSProxyView(BaseProxy, WebsocketProxyView):
     """A Websocket proxy endpoint."""
@@ -275,6 +1300,50 @@ class WSProxyView(BaseProxy, WebsocketProxyView):
         super().__init__(hass)
         WebsocketProxyView.__init__(self, websession)
 
+    async def get(
+        self, request: web.Request, **kwargs: Any
+    ) -> web.Response | web.StreamResponse | web.WebSocketResponse:
+        """Proxy a websocket connection (recording metrics)."""
+        metrics = self._get_config_entry().runtime_data.metrics
+        with metrics.track_stream(websocket=True):
+            return await self._async_get(request, **kwargs)
+
+    async def _async_get(
+        self, request: web.Request, **kwargs: Any
+    ) -> web.Response | web.StreamResponse | web.WebSocketResponse:
+        """Proxy a websocket connection."""
+        try:
+            match = self._match_proxied_url(request)
+        except HASSWebProxyLibNotFoundRequestError:
+            # As the base view would, without matching (and recording) it again.
+            return web.Response(status=HTTPStatus.NOT_FOUND)
+
+        request[KEY_PROXIED_URL_MATCH] = match
+        proxied_url = match.proxied_url
+
+        if not proxied_url.allow_unauthenticated and not request[KEY_AUTHENTICATED]:
+            return await super().get(request, **kwargs)
+
+        target = match.target
+        if target.websocket_fanout:
+            data = self._get_config_entry().runtime_data
+            return await data.websocket_fanout.async_handle(
+                request,
+                data.session,
+                proxied_url,
+                compress=target.websocket_compression,
+            )
+
+        # Websockets are relayed by the integration, rather than the base view, so
+        # that the relayed data is counted.
+        return await async_relay_websocket(
+            request,
+            self._websession,
+            proxied_url,
+            compress=target.websocket_compression,
+            metrics=self._get_config_entry().runtime_data.metrics,
+        )
+
 
 class V0ProxyView(HTTPProxyView):
     """A v0 proxy endpoint."""
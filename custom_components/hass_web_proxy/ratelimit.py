@@ -0,0 +1,81 @@
+"""Token-bucket rate limits for HASS Web Proxy."""
+
+from __future__ import annotations
+
+import math
+import time
+from typing import Final
+
+# The number of clients that buckets are kept for, per proxied URL. Buckets that
+# have refilled are forgotten first, as they are the same as a new bucket.
+MAX_TRACKED_CLIENTS: Final = 256
+
+
+class _Bucket:
+    """The tokens of a single client."""
+
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float) -> None:
+        """Initialize the bucket."""
+        self.tokens = tokens
+        self.updated = updated
+
+
+class RateLimiter:
+    """
+    Token-bucket rate limits for each client of a proxied URL.
+
+    Each client may make `burst` requests at once, then `rate` requests per second.
+    """
+
+    def __init__(self, rate: float, burst: int | None = None) -> None:
+        """Initialize the rate limiter."""
+        self.rate = rate
+        self.burst = burst or max(1, math.ceil(rate))
+        self._buckets: dict[str, _Bucket] = {}
+        self.rejected = 0
+
+    def __len__(self) -> int:
+        """Get the number of clients with buckets."""
+        return len(self._buckets)
+
+    @property
+    def retry_after(self) -> int:
+        """Get the number of seconds a rejected client should wait to retry."""
+        return max(1, math.ceil(1 / self.rate))
+
+    def allow(self, client: str) -> bool:
+        """Take a token for a request from a client, if it has one."""
+        now = time.monotonic()
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            if len(self._buckets) >= MAX_TRACKED_CLIENTS:
+                self._prune(now)
+            bucket = self._buckets[client] = _Bucket(self.burst, now)
+        else:
+            bucket.tokens = min(
+                self.burst, bucket.tokens + (now - bucket.updated) * self.rate
+            )
+            bucket.updated = now
+
+        if bucket.tokens < 1:
+            self.rejected += 1
+            return False
+        bucket.tokens -= 1
+        return True
+
+    def _prune(self, now: float) -> None:
+        """Forget refilled buckets, or the oldest if none have refilled."""
+        for client, bucket in list(self._buckets.items()):
+            if bucket.tokens + (now - bucket.updated) * self.rate >= self.burst:
+                del self._buckets[client]
+        if len(self._buckets) >= MAX_TRACKED_CLIENTS:
+            del self._buckets[next(iter(self._buckets))]
+
+
+def create_rate_limiter(
+    rate: float | None, burst: int | None = None
+) -> RateLimiter | None:
+    """Create a rate limiter, if there is a rate."""
+    return RateLimiter(rate, burst) if rate else None
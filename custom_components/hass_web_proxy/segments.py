@@ -0,0 +1,623 @@
+"""Disk-backed cache of immutable media segments (e.g. HLS/DASH) and clips."""
+
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import json
+import os
+import re
+import tempfile
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Final
+
+import aiohttp
+import urlmatch
+from aiohttp import hdrs, web
+
+from .cache import STREAMING_CONTENT_TYPES, normalize_url
+from .const import LOGGER
+from .matcher import URLPatternIndex
+from .upstream import (
+    READ_CHUNK_SIZE,
+    count_bytes_in,
+    get_client_response_headers,
+    get_upstream_request_headers,
+)
+
+if TYPE_CHECKING:
+    import ssl
+
+    from homeassistant.core import HomeAssistant
+
+    from .metrics import ProxyMetrics
+
+# Upstream response headers that are stored, and served, with a segment.
+_STORED_HEADERS: tuple[str, ...] = (
+    hdrs.CACHE_CONTROL,
+    hdrs.CONTENT_TYPE,
+    hdrs.ETAG,
+    hdrs.LAST_MODIFIED,
+)
+
+# Complete segments, and partial content (byte ranges written into a sparse file
+# at their offsets).
+_SEGMENT_SUFFIX: Final = ".seg"
+_PARTIAL_SUFFIX: Final = ".part"
+_METADATA_SUFFIX: Final = ".json"
+_TEMP_SUFFIX: Final = ".tmp"
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+_CONTENT_RANGE_RE = re.compile(r"^bytes (\d+)-(\d+)/(\d+)$")
+
+
+def get_segment_key(url: str) -> str:
+    """Get the (filename-safe) cache key for a segment URL."""
+    return hashlib.sha256(normalize_url(url).encode()).hexdigest()
+
+
+def parse_range(value: str, length: int) -> tuple[int, int] | None:
+    """
+    Parse a single byte range request into [start, end) offsets.
+
+    Returns None for multiple ranges, or a range that cannot be satisfied.
+    """
+    match = _RANGE_RE.match(value.strip())
+    if not match or not any(match.groups()):
+        return None
+
+    first, last = match.groups()
+    if not first:
+        start, end = max(0, length - int(last)), length
+    else:
+        start, end = int(first), min(length, int(last) + 1) if last else length
+    return (start, end) if start < end else None
+
+
+def parse_content_range(value: str | None) -> tuple[int, int, int] | None:
+    """Parse a Content-Range header into [start, end) offsets and the length."""
+    match = _CONTENT_RANGE_RE.match((value or "").strip())
+    if not match:
+        return None
+    first, last, length = (int(group) for group in match.groups())
+    return (first, last + 1, length) if first <= last < length else None
+
+
+def add_range(
+    ranges: list[tuple[int, int]], start: int, end: int
+) -> list[tuple[int, int]]:
+    """Add a range to sorted, disjoint ranges, merging any that overlap or touch."""
+    merged: list[tuple[int, int]] = []
+    for range_start, range_end in sorted([*ranges, (start, end)]):
+        if merged and range_start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], range_end))
+        else:
+            merged.append((range_start, range_end))
+    return merged
+
+
+def _get_stored_headers(upstream: aiohttp.ClientResponse) -> dict[str, str]:
+    """Get the upstream response headers to store with a segment."""
+    return {
+        header: upstream.headers[header]
+        for header in _STORED_HEADERS
+        if header in upstream.headers
+    }
+
+
+def _get_validators(headers: dict[str, str]) -> tuple[str | None, str | None]:
+    """Get the headers that identify a version of a resource."""
+    return headers.get(hdrs.ETAG), headers.get(hdrs.LAST_MODIFIED)
+
+
+def _write_atomically(path: Path, data: str) -> None:
+    """Write a file such that it is never seen partially written."""
+    temp_path = path.with_suffix(_TEMP_SUFFIX)
+    temp_path.write_text(data)
+    temp_path.replace(path)
+
+
+@dataclass
+class _SegmentMetadata:
+    """The stored headers of a segment, and the byte ranges of partial content."""
+
+    headers: dict[str, str]
+    length: int | None = None
+    ranges: list[tuple[int, int]] = field(default_factory=list)
+
+    @classmethod
+    def from_json(cls, data: str) -> _SegmentMetadata:
+        """Load metadata from JSON."""
+        value = json.loads(data)
+        return cls(
+            headers=value["headers"],
+            length=value.get("length"),
+            ranges=[(start, end) for start, end in value.get("ranges", [])],
+        )
+
+    def to_json(self, *, partial: bool) -> str:
+        """Dump metadata to JSON."""
+        if not partial:
+            return json.dumps({"headers": self.headers})
+        return json.dumps(
+            {"headers": self.headers, "length": self.length, "ranges": self.ranges}
+        )
+
+    @property
+    def cached_size(self) -> int:
+        """Get the number of bytes of partial content that are cached."""
+        return sum(end - start for start, end in self.ranges)
+
+    def covers(self, start: int, end: int) -> bool:
+        """Determine whether a byte range is cached."""
+        return any(
+            range_start <= start and end <= range_end
+            for range_start, range_end in self.ranges
+        )
+
+
+@dataclass
+class _Segment:
+    """A cached segment."""
+
+    size: int
+    partial: bool = False
+
+    # Loaded from disk on first use, so that the index can be built quickly.
+    metadata: _SegmentMetadata | None = None
+
+
+class _SegmentWriter:
+    """Write a segment to a temporary file, then move it into place."""
+
+    def __init__(self, directory: Path) -> None:
+        """Initialize the writer, and open the temporary file."""
+        self._file = tempfile.NamedTemporaryFile(  # noqa: SIM115
+            dir=directory, suffix=_TEMP_SUFFIX, delete=False
+        )
+        self.is_open = True
+        self.size = 0
+
+    def write(self, data: bytes) -> None:
+        """Write data to the temporary file."""
+        self._file.write(data)
+        self.size += len(data)
+
+    def commit(self, segment_path: Path, metadata: str) -> None:
+        """Move the completed segment into place."""
+        self._file.close()
+        _write_atomically(segment_path.with_suffix(_METADATA_SUFFIX), metadata)
+        Path(self._file.name).replace(segment_path)
+        segment_path.with_suffix(_PARTIAL_SUFFIX).unlink(missing_ok=True)
+        self.is_open = False
+
+    def discard(self) -> None:
+        """Remove the temporary file."""
+        if not self.is_open:
+            return
+        self._file.close()
+        Path(self._file.name).unlink(missing_ok=True)
+        self.is_open = False
+
+
+class _RangeWriter:
+    """Write a byte range into a sparse file of partial content."""
+
+    def __init__(self, path: Path, start: int, length: int) -> None:
+        """Initialize the writer, and open the (possibly new) file."""
+        self._file = path.open("r+b" if path.exists() else "w+b")
+        if os.fstat(self._file.fileno()).st_size != length:
+            self._file.truncate(length)
+        self._file.seek(start)
+        self.start = start
+        self.length = length
+        self.size = 0
+
+    def write(self, data: bytes) -> None:
+        """Write data at the current offset (but never beyond the end)."""
+        data = data[: self.length - self.start - self.size]
+        self._file.write(data)
+        self.size += len(data)
+
+    def close(self) -> bool:
+        """Close the file, and get whether it is still in the cache."""
+        linked = os.fstat(self._file.fileno()).st_nlink > 0
+        self._file.close()
+        return linked
+
+
+class SegmentCache:
+    """A byte-bounded LRU cache of media segments, stored on disk."""
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        directory: Path,
+        max_size: int,
+        url_patterns: list[str],
+    ) -> None:
+        """Initialize the segment cache."""
+        self._hass = hass
+        self.directory = directory
+        self.max_size = max_size
+        self._entries: OrderedDict[str, _Segment] = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._url_patterns: URLPatternIndex[None] = URLPatternIndex()
+        for url_pattern in url_patterns:
+            try:
+                self._url_patterns.add(url_pattern, url_pattern, None)
+            except urlmatch.BadMatchPattern:
+                LOGGER.warning(f"Ignoring invalid segment URL pattern '{url_pattern}'")
+
+    def __len__(self) -> int:
+        """Get the number of cached segments."""
+        return len(self._entries)
+
+    def matches(self, url: str) -> bool:
+        """Determine whether a URL is a cacheable segment."""
+        return self._url_patterns.match(url) is not None
+
+    def get_stats(self) -> dict[str, Any]:
+        """Get statistics on the cache."""
+        return {
+            "entries": len(self._entries),
+            "partial_entries": sum(
+                1 for segment in self._entries.values() if segment.partial
+            ),
+            "size": self._size,
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _get_path(self, key: str, *, partial: bool = False) -> Path:
+        """Get the path of a segment, or of partial content."""
+        suffix = _PARTIAL_SUFFIX if partial else _SEGMENT_SUFFIX
+        return self.directory / f"{key}{suffix}"
+
+    def _get_metadata_path(self, key: str) -> Path:
+        """Get the path of the metadata of a segment."""
+        return self.directory / f"{key}{_METADATA_SUFFIX}"
+
+    def load(self) -> None:
+        """
+        Build the index from the segments on disk.
+
+        Only file metadata is read. Use is only tracked in memory (as updating the
+        modification times of segments would change their ETag and Last-Modified),
+        so the segments written longest ago are taken to be least recently used.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        segments: dict[str, tuple[float, int, bool]] = {}
+        names: set[str] = set()
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                name = entry.name
+                if name.endswith(_TEMP_SUFFIX):
+                    # Left behind by an interrupted write.
+                    Path(entry.path).unlink(missing_ok=True)
+                    continue
+                names.add(name)
+
+                partial = name.endswith(_PARTIAL_SUFFIX)
+                if not partial and not name.endswith(_SEGMENT_SUFFIX):
+                    continue
+
+                # Partial content is sparse, so count the space it really uses.
+                stat = entry.stat()
+                size = stat.st_blocks * 512 if partial else stat.st_size
+                key = name.removesuffix(_PARTIAL_SUFFIX).removesuffix(_SEGMENT_SUFFIX)
+                if key not in segments or segments[key][2]:
+                    segments[key] = (stat.st_mtime, size, partial)
+
+        for key, (_, size, partial) in sorted(
+            segments.items(), key=lambda item: item[1][0]
+        ):
+            if f"{key}{_METADATA_SUFFIX}" not in names:
+                self._remove_files(key)
+                continue
+            if not partial:
+                # Any partial content has been superseded by the complete segment.
+                self._get_path(key, partial=True).unlink(missing_ok=True)
+            self._entries[key] = _Segment(size=size, partial=partial)
+            self._size += size
+
+        # Remove the metadata of segments that were never completely written.
+        for name in names:
+            key = name.removesuffix(_METADATA_SUFFIX)
+            if name.endswith(_METADATA_SUFFIX) and key not in self._entries:
+                self._remove_files(key)
+
+        self._remove_evicted(self._evict())
+
+    def _remove_files(self, key: str) -> None:
+        """Remove the files of a segment."""
+        self._get_path(key).unlink(missing_ok=True)
+        self._get_path(key, partial=True).unlink(missing_ok=True)
+        self._get_metadata_path(key).unlink(missing_ok=True)
+
+    def _read_metadata(self, key: str) -> _SegmentMetadata | None:
+        """Read the metadata of a segment."""
+        try:
+            return _SegmentMetadata.from_json(self._get_metadata_path(key).read_text())
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _write_metadata(self, key: str, metadata: _SegmentMetadata) -> None:
+        """Write the metadata of partial content."""
+        _write_atomically(self._get_metadata_path(key), metadata.to_json(partial=True))
+
+    def _promote(self, key: str, metadata: _SegmentMetadata) -> None:
+        """Turn completely cached partial content into a segment."""
+        _write_atomically(self._get_metadata_path(key), metadata.to_json(partial=False))
+        self._get_path(key, partial=True).replace(self._get_path(key))
+
+    def _evict(self) -> list[str]:
+        """Evict the least recently used segments until within the size limit."""
+        evicted: list[str] = []
+        while self._size > self.max_size:
+            key, segment = self._entries.popitem(last=False)
+            self._size -= segment.size
+            self.evictions += 1
+            evicted.append(key)
+        return evicted
+
+    def _remove_evicted(self, keys: list[str]) -> None:
+        """Remove the files of evicted segments."""
+        for key in keys:
+            self._remove_files(key)
+
+    def _resize(self, segment: _Segment, size: int) -> None:
+        """Update the size of a segment."""
+        self._size += size - segment.size
+        segment.size = size
+
+    def _pop(self, key: str) -> None:
+        """Remove a segment from the index."""
+        if (segment := self._entries.pop(key, None)) is not None:
+            self._size -= segment.size
+
+    async def _async_discard(self, key: str) -> None:
+        """Remove a segment from the cache."""
+        self._pop(key)
+        # Awaited, so that the files are gone before the segment is fetched again.
+        await self._hass.async_add_executor_job(self._remove_files, key)
+
+    async def _async_load_metadata(
+        self, key: str, segment: _Segment
+    ) -> _SegmentMetadata | None:
+        """Get the metadata of a segment, loading it if necessary."""
+        if segment.metadata is not None:
+            return segment.metadata
+
+        metadata = await self._hass.async_add_executor_job(self._read_metadata, key)
+        if self._entries.get(key) is not segment:
+            return None
+        if metadata is None:
+            LOGGER.debug(f"Discarding unreadable cached segment '{key}'")
+            await self._async_discard(key)
+            return None
+
+        segment.metadata = metadata
+        if segment.partial:
+            self._resize(segment, metadata.cached_size)
+        return metadata
+
+    async def async_get(
+        self, request: web.Request, url: str
+    ) -> web.FileResponse | None:
+        """Get a response for a cached segment, or a cached byte range of one."""
+        key = get_segment_key(url)
+        segment = self._entries.get(key)
+        metadata = await self._async_load_metadata(key, segment) if segment else None
+        if segment is None or metadata is None:
+            self.misses += 1
+            return None
+
+        if segment.partial:
+            # Only byte ranges that are entirely cached can be served, and never a
+            # complete response (as If-Range may require).
+            byte_range = (
+                parse_range(request.headers.get(hdrs.RANGE, ""), metadata.length or 0)
+                if hdrs.IF_RANGE not in request.headers
+                else None
+            )
+            if byte_range is None or not metadata.covers(*byte_range):
+                self.misses += 1
+                return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return web.FileResponse(
+            self._get_path(key, partial=segment.partial), headers=metadata.headers
+        )
+
+    def _is_cacheable(
+        self, response: aiohttp.ClientResponse, length: int | None
+    ) -> bool:
+        """Determine whether an upstream response may be cached."""
+        return (
+            response.content_type not in STREAMING_CONTENT_TYPES
+            and hdrs.SET_COOKIE not in response.headers
+            and "no-store" not in response.headers.get(hdrs.CACHE_CONTROL, "")
+            and (length is None or length <= self.max_size)
+        )
+
+    async def async_fetch(  # noqa: PLR0913
+        self,
+        request: web.Request,
+        session: aiohttp.ClientSession,
+        url: str,
+        ssl_context: ssl.SSLContext | None,
+        *,
+        client_timeout: aiohttp.ClientTimeout | None = None,
+        metrics: ProxyMetrics | None = None,
+    ) -> web.StreamResponse:
+        """Proxy a segment, or a byte range of one, caching it as it is streamed."""
+        try:
+            async with session.get(
+                url,
+                headers=get_upstream_request_headers(request),
+                ssl=ssl_context or True,
+                allow_redirects=False,
+                timeout=client_timeout or session.timeout,
+            ) as upstream:
+                if upstream.status == HTTPStatus.PARTIAL_CONTENT:
+                    return await self._async_stream_range(
+                        request, url, upstream, metrics
+                    )
+                return await self._async_stream(request, url, upstream, metrics)
+        except (aiohttp.ClientError, TimeoutError) as exc:
+            LOGGER.debug(f"Upstream request to '{url}' failed: {exc}")
+            raise web.HTTPBadGateway from None
+
+    async def _async_stream(
+        self,
+        request: web.Request,
+        url: str,
+        upstream: aiohttp.ClientResponse,
+        metrics: ProxyMetrics | None,
+    ) -> web.StreamResponse:
+        """Stream a response to the client, writing complete segments to the cache."""
+        writer: _SegmentWriter | None = None
+        if upstream.status == HTTPStatus.OK and self._is_cacheable(
+            upstream, upstream.content_length
+        ):
+            writer = await self._hass.async_add_executor_job(
+                _SegmentWriter, self.directory
+            )
+
+        response = web.StreamResponse(
+            status=upstream.status,
+            headers=get_client_response_headers(upstream.headers),
+        )
+        try:
+            with contextlib.suppress(ConnectionResetError):
+                await response.prepare(request)
+                async for chunk in upstream.content.iter_chunked(READ_CHUNK_SIZE):
+                    count_bytes_in(metrics, chunk)
+                    if writer and writer.is_open:
+                        await self._async_write(url, writer, chunk)
+                    await response.write(chunk)
+
+                if writer and writer.is_open:
+                    await self._async_commit(url, upstream, writer)
+        finally:
+            if writer:
+                await self._hass.async_add_executor_job(writer.discard)
+        return response
+
+    async def _async_write(self, url: str, writer: _SegmentWriter, data: bytes) -> None:
+        """Write part of a segment, or stop caching it if it is too large."""
+        if writer.size + len(data) <= self.max_size:
+            await self._hass.async_add_executor_job(writer.write, data)
+        else:
+            LOGGER.debug(f"Not caching oversized segment '{url}'")
+            await self._hass.async_add_executor_job(writer.discard)
+
+    async def _async_commit(
+        self, url: str, upstream: aiohttp.ClientResponse, writer: _SegmentWriter
+    ) -> None:
+        """Add a completely written segment to the cache."""
+        key = get_segment_key(url)
+        metadata = _SegmentMetadata(headers=_get_stored_headers(upstream))
+        await self._hass.async_add_executor_job(
+            writer.commit, self._get_path(key), metadata.to_json(partial=False)
+        )
+
+        self._pop(key)
+        self._entries[key] = _Segment(size=writer.size, metadata=metadata)
+        self._size += writer.size
+
+        if evicted := self._evict():
+            await self._hass.async_add_executor_job(self._remove_evicted, evicted)
+
+    async def _async_stream_range(
+        self,
+        request: web.Request,
+        url: str,
+        upstream: aiohttp.ClientResponse,
+        metrics: ProxyMetrics | None,
+    ) -> web.StreamResponse:
+        """Stream a partial response to the client, writing it to the cache."""
+        key = get_segment_key(url)
+        writer: _RangeWriter | None = None
+        segment = self._entries.get(key)
+        content_range = parse_content_range(upstream.headers.get(hdrs.CONTENT_RANGE))
+        if (
+            content_range
+            and (segment is None or segment.partial)
+            and self._is_cacheable(upstream, content_range[2])
+        ):
+            start, _, length = content_range
+            writer = await self._hass.async_add_executor_job(
+                _RangeWriter, self._get_path(key, partial=True), start, length
+            )
+
+        response = web.StreamResponse(
+            status=upstream.status,
+            headers=get_client_response_headers(upstream.headers),
+        )
+        try:
+            with contextlib.suppress(ConnectionResetError):
+                await response.prepare(request)
+                async for chunk in upstream.content.iter_chunked(READ_CHUNK_SIZE):
+                    count_bytes_in(metrics, chunk)
+                    if writer:
+                        await self._hass.async_add_executor_job(writer.write, chunk)
+                    await response.write(chunk)
+        finally:
+            # Whatever was received is cached, even if the client went away.
+            if writer is not None:
+                cached = await self._hass.async_add_executor_job(writer.close)
+                if cached:
+                    await self._async_add_range(key, upstream, writer)
+        return response
+
+    async def _async_add_range(
+        self, key: str, upstream: aiohttp.ClientResponse, writer: _RangeWriter
+    ) -> None:
+        """Add a written byte range to the cached partial content."""
+        headers = _get_stored_headers(upstream)
+        metadata: _SegmentMetadata | None = None
+        if (segment := self._entries.get(key)) is not None:
+            metadata = await self._async_load_metadata(key, segment)
+            if metadata is None or not segment.partial:
+                # Discarded, or completed by another request meanwhile.
+                return
+        else:
+            segment = self._entries[key] = _Segment(size=0, partial=True)
+
+        if (
+            metadata is None
+            or metadata.length != writer.length
+            or _get_validators(metadata.headers) != _get_validators(headers)
+        ):
+            # Any previously cached ranges are of a different version.
+            metadata = segment.metadata = _SegmentMetadata(
+                headers=headers, length=writer.length
+            )
+
+        metadata.ranges = add_range(
+            metadata.ranges, writer.start, writer.start + writer.size
+        )
+        self._entries.move_to_end(key)
+        self._resize(segment, metadata.cached_size)
+
+        if metadata.covers(0, writer.length):
+            await self._hass.async_add_executor_job(self._promote, key, metadata)
+            segment.partial = False
+        else:
+            await self._hass.async_add_executor_job(self._write_metadata, key, metadata)
+
+        if evicted := self._evict():
+            await self._hass.async_add_executor_job(self._remove_evicted, evicted)
@@ -0,0 +1,173 @@
+"""Sensors for HASS Web Proxy metrics."""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+
+from homeassistant.components.sensor import (
+    SensorDeviceClass,
+    SensorEntity,
+    SensorEntityDescription,
+    SensorStateClass,
+)
+from homeassistant.const import UnitOfInformation, UnitOfTime
+from homeassistant.helpers.device_registry import DeviceEntryType, DeviceInfo
+
+from .const import DOMAIN
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from homeassistant.core import HomeAssistant
+    from homeassistant.helpers.entity_platform import AddEntitiesCallback
+
+    from .data import HASSWebProxyConfigEntry
+    from .metrics import Histogram, ProxyMetrics
+
+# The number of most requested patterns (and errors) included as attributes.
+MAX_ATTRIBUTE_ITEMS = 10
+
+
+def _get_p95_ms(histogram: Histogram) -> float | None:
+    """Get the (estimated) 95th percentile of a latency histogram, in ms."""
+    quantile = histogram.quantile(0.95)
+    return None if quantile is None else quantile * 1000
+
+
+def _get_top(counts: dict[str, int]) -> dict[str, int]:
+    """Get the largest counts."""
+    return dict(
+        sorted(counts.items(), key=lambda item: item[1], reverse=True)[
+            :MAX_ATTRIBUTE_ITEMS
+        ]
+    )
+
+
+@dataclass(frozen=True, kw_only=True)
+class HASSWebProxySensorEntityDescription(SensorEntityDescription):
+    """A description of a HASS Web Proxy metrics sensor."""
+
+    value_fn: Callable[[ProxyMetrics], float | None]
+    attributes_fn: Callable[[ProxyMetrics], dict[str, Any]] | None = None
+
+
+SENSORS: tuple[HASSWebProxySensorEntityDescription, ...] = (
+    HASSWebProxySensorEntityDescription(
+        key="requests",
+        translation_key="requests",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda metrics: metrics.requests,
+        attributes_fn=lambda metrics: {
+            "patterns": _get_top(metrics.pattern_requests),
+            "url_ids": _get_top(metrics.url_id_requests),
+        },
+    ),
+    HASSWebProxySensorEntityDescription(
+        key="errors",
+        translation_key="errors",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda metrics: metrics.error_count,
+        attributes_fn=lambda metrics: {"classes": _get_top(metrics.errors)},
+    ),
+    HASSWebProxySensorEntityDescription(
+        key="active_streams",
+        translation_key="active_streams",
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda metrics: metrics.active_streams,
+    ),
+    HASSWebProxySensorEntityDescription(
+        key="active_websockets",
+        translation_key="active_websockets",
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda metrics: metrics.active_websockets,
+    ),
+    HASSWebProxySensorEntityDescription(
+        key="bytes_in",
+        translation_key="bytes_in",
+        device_class=SensorDeviceClass.DATA_SIZE,
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        native_unit_of_measurement=UnitOfInformation.BYTES,
+        suggested_unit_of_measurement=UnitOfInformation.MEGABYTES,
+        value_fn=lambda metrics: metrics.bytes_in,
+    ),
+    HASSWebProxySensorEntityDescription(
+        key="bytes_out",
+        translation_key="bytes_out",
+        device_class=SensorDeviceClass.DATA_SIZE,
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        native_unit_of_measurement=UnitOfInformation.BYTES,
+        suggested_unit_of_measurement=UnitOfInformation.MEGABYTES,
+        value_fn=lambda metrics: metrics.bytes_out,
+    ),
+    HASSWebProxySensorEntityDescription(
+        key="match_latency",
+        translation_key="match_latency",
+        device_class=SensorDeviceClass.DURATION,
+        state_class=SensorStateClass.MEASUREMENT,
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        value_fn=lambda metrics: _get_p95_ms(metrics.match_latency),
+    ),
+    HASSWebProxySensorEntityDescription(
+        key="upstream_ttfb",
+        translation_key="upstream_ttfb",
+        device_class=SensorDeviceClass.DURATION,
+        state_class=SensorStateClass.MEASUREMENT,
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        value_fn=lambda metrics: _get_p95_ms(metrics.upstream_ttfb),
+    ),
+    HASSWebProxySensorEntityDescription(
+        key="total_latency",
+        translation_key="total_latency",
+        device_class=SensorDeviceClass.DURATION,
+        state_class=SensorStateClass.MEASUREMENT,
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        value_fn=lambda metrics: _get_p95_ms(metrics.total_latency),
+    ),
+)
+
+
+async def async_setup_entry(
+    _hass: HomeAssistant,
+    entry: HASSWebProxyConfigEntry,
+    async_add_entities: AddEntitiesCallback,
+) -> None:
+    """Set up the metrics sensors."""
+    async_add_entities(
+        HASSWebProxySensor(entry, description) for description in SENSORS
+    )
+
+
+class HASSWebProxySensor(SensorEntity):
+    """A sensor of a proxy metric, polled from the entry's metrics."""
+
+    entity_description: HASSWebProxySensorEntityDescription
+    _attr_has_entity_name = True
+    _unrecorded_attributes = frozenset({"patterns", "url_ids", "classes"})
+
+    def __init__(
+        self,
+        entry: HASSWebProxyConfigEntry,
+        description: HASSWebProxySensorEntityDescription,
+    ) -> None:
+        """Initialize the sensor."""
+        self.entity_description = description
+        self._entry = entry
+        self._attr_unique_id = f"{entry.entry_id}_{description.key}"
+        self._attr_device_info = DeviceInfo(
+            identifiers={(DOMAIN, entry.entry_id)},
+            name=entry.title,
+            entry_type=DeviceEntryType.SERVICE,
+        )
+
+    @property
+    def native_value(self) -> float | None:
+        """Get the current value of the metric."""
+        return self.entity_description.value_fn(self._entry.runtime_data.metrics)
+
+    @property
+    def extra_state_attributes(self) -> dict[str, Any] | None:
+        """Get the breakdown of the metric, if any."""
+        if self.entity_description.attributes_fn is None:
+            return None
+        return self.entity_description.attributes_fn(self._entry.runtime_data.metrics)
@@ -0,0 +1,110 @@
+"""Upstream connection pool for HASS Web Proxy."""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any
+
+import aiohttp
+from homeassistant.const import EVENT_HOMEASSISTANT_CLOSE
+from homeassistant.core import callback
+
+from .const import (
+    CONF_CONNECTION_LIMIT,
+    CONF_CONNECTION_LIMIT_PER_HOST,
+    CONF_DNS_CACHE_TTL,
+    CONF_HAPPY_EYEBALLS_DELAY,
+    CONF_KEEPALIVE_TIMEOUT,
+    DEFAULT_CONNECTION_LIMIT,
+    DEFAULT_CONNECTION_LIMIT_PER_HOST,
+    DEFAULT_DNS_CACHE_TTL,
+    DEFAULT_HAPPY_EYEBALLS_DELAY,
+    DEFAULT_KEEPALIVE_TIMEOUT,
+)
+
+if TYPE_CHECKING:
+    from homeassistant.core import Event, HomeAssistant
+
+    from .breaker import CircuitBreaker
+    from .data import HASSWebProxyConfigEntry
+    from .dns import CachingResolver
+    from .metrics import ProxyMetrics
+    from .trace import RequestTracer
+
+
+@callback
+def async_create_proxy_session(  # noqa: PLR0913
+    hass: HomeAssistant,
+    entry: HASSWebProxyConfigEntry,
+    metrics: ProxyMetrics | None = None,
+    circuit_breaker: CircuitBreaker | None = None,
+    resolver: CachingResolver | None = None,
+    request_tracer: RequestTracer | None = None,
+) -> aiohttp.ClientSession:
+    """
+    Create the upstream session dedicated to the proxy.
+
+    The session is closed when Home Assistant closes, or (by the caller) when the
+    entry is unloaded. Upstream requests are recorded in `metrics`,
+    `circuit_breaker` and `request_tracer`, if given. Hosts are resolved (and
+    cached) by `resolver` if given, or else by aiohttp.
+    """
+    options = entry.options
+    happy_eyeballs_delay = float(
+        options.get(CONF_HAPPY_EYEBALLS_DELAY, DEFAULT_HAPPY_EYEBALLS_DELAY)
+    )
+    connector = aiohttp.TCPConnector(
+        limit=int(options.get(CONF_CONNECTION_LIMIT, DEFAULT_CONNECTION_LIMIT)),
+        limit_per_host=int(
+            options.get(
+                CONF_CONNECTION_LIMIT_PER_HOST, DEFAULT_CONNECTION_LIMIT_PER_HOST
+            )
+        ),
+        keepalive_timeout=float(
+            options.get(CONF_KEEPALIVE_TIMEOUT, DEFAULT_KEEPALIVE_TIMEOUT)
+        ),
+        ttl_dns_cache=int(options.get(CONF_DNS_CACHE_TTL, DEFAULT_DNS_CACHE_TTL)),
+        use_dns_cache=resolver is None,
+        resolver=resolver,
+        happy_eyeballs_delay=happy_eyeballs_delay or None,
+    )
+    trace_configs: list[aiohttp.TraceConfig] = []
+    if metrics is not None:
+        trace_configs.append(metrics.create_trace_config())
+    if circuit_breaker is not None:
+        trace_configs.append(circuit_breaker.create_trace_config())
+    if request_tracer is not None:
+        trace_configs.append(request_tracer.create_trace_config())
+    session = aiohttp.ClientSession(
+        connector=connector, trace_configs=trace_configs or None
+    )
+
+    async def _async_close_session(_event: Event) -> None:
+        """Close the session when Home Assistant closes."""
+        await session.close()
+
+    entry.async_on_unload(
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_CLOSE, _async_close_session)
+    )
+    return session
+
+
+def get_connection_pool_usage(session: aiohttp.ClientSession) -> dict[str, Any]:
+    """Get the current usage of a session's connection pool."""
+    connector = session.connector
+    if not isinstance(connector, aiohttp.TCPConnector):
+        return {}
+
+    # aiohttp does not expose pool usage publicly.
+    acquired_per_host = {
+        f"{key.host}:{key.port}": len(acquired)
+        for key, acquired in connector._acquired_per_host.items()  # noqa: SLF001
+        if acquired
+    }
+    return {
+        "closed": connector.closed,
+        "limit": connector.limit,
+        "limit_per_host": connector.limit_per_host,
+        "active": len(connector._acquired),  # noqa: SLF001
+        "idle": sum(len(conns) for conns in connector._conns.values()),  # noqa: SLF001
+        "active_per_host": acquired_per_host,
+    }
@@ -0,0 +1,123 @@
+"""Signed (stateless) proxied URLs for HASS Web Proxy."""
+
+from __future__ import annotations
+
+import base64
+import hmac
+import json
+import secrets
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Final
+
+from .data import DynamicProxiedURL
+from .matcher import CompiledURLPattern, compile_url_pattern
+
+# The number of verified tokens that are remembered, so that repeated requests for
+# the same token are not decoded (and their pattern compiled) again.
+MAX_VERIFIED_TOKENS: Final = 1024
+
+
+def create_signing_key() -> str:
+    """Create a random key to sign tokens with."""
+    return secrets.token_hex(32)
+
+
+def _encode(data: bytes) -> str:
+    """Encode bytes as unpadded URL-safe base64."""
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _decode(data: str) -> bytes:
+    """Decode unpadded URL-safe base64 (raising ValueError if invalid)."""
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+@dataclass
+class SignedProxiedURL:
+    """A proxied URL decoded from a verified token."""
+
+    url_id: str
+    proxied_url: DynamicProxiedURL
+    compiled: CompiledURLPattern
+
+
+class URLSigner:
+    """
+    Signs proxied URLs into tokens, and verifies them.
+
+    A token holds the URL pattern, expiration and options of a proxied URL,
+    signed with a HMAC so that it can be trusted without any server-side state.
+    Tokens are only valid until they expire (those without an expiration never
+    are), or until the key is replaced.
+    """
+
+    def __init__(self, key: str, max_verified: int = MAX_VERIFIED_TOKENS) -> None:
+        """Initialize the signer."""
+        self._key = key.encode()
+        self._max_verified = max_verified
+        self._verified: OrderedDict[str, SignedProxiedURL] = OrderedDict()
+
+    def _get_signature(self, payload: bytes) -> bytes:
+        """Get the signature of a payload."""
+        return hmac.digest(self._key, payload, "sha256")
+
+    def sign(self, url_id: str, proxied_url: DynamicProxiedURL) -> str:
+        """Sign a proxied URL into a token."""
+        payload = json.dumps(
+            {
+                "url_id": url_id,
+                **proxied_url.as_dict(),
+            },
+            separators=(",", ":"),
+        ).encode()
+        return f"{_encode(payload)}.{_encode(self._get_signature(payload))}"
+
+    def verify(self, token: str) -> SignedProxiedURL | None:
+        """Get the proxied URL of a token, or None if it is invalid or expired."""
+        signed = self._verified.get(token)
+        if signed is None:
+            signed = self._decode(token)
+            if signed is None:
+                return None
+            self._verified[token] = signed
+            if len(self._verified) > self._max_verified:
+                self._verified.popitem(last=False)
+        else:
+            self._verified.move_to_end(token)
+
+        expiration = signed.proxied_url.expiration
+        if not expiration or expiration < time.time():
+            self._verified.pop(token, None)
+            return None
+        return signed
+
+    def _decode(self, token: str) -> SignedProxiedURL | None:
+        """Decode a token, if its signature is valid."""
+        try:
+            encoded_payload, encoded_signature = token.split(".")
+            payload = _decode(encoded_payload)
+            signature = _decode(encoded_signature)
+        except ValueError:
+            return None
+        if not hmac.compare_digest(signature, self._get_signature(payload)):
+            return None
+
+        # The payload was signed by this signer, so can be trusted (though its
+        # fields may be those of another version).
+        fields = json.loads(payload)
+        url_id = fields.pop("url_id")
+        try:
+            proxied_url = DynamicProxiedURL(**fields)
+        except TypeError:
+            return None
+        return SignedProxiedURL(
+            url_id=url_id,
+            proxied_url=proxied_url,
+            compiled=compile_url_pattern(proxied_url.url_pattern),
+        )
+
+    def get_stats(self) -> dict[str, int]:
+        """Get the number of remembered verified tokens."""
+        return {"verified_tokens": len(self._verified)}
@@ -0,0 +1,86 @@
+"""Persistence of dynamic proxied URLs for HASS Web Proxy."""
+
+from __future__ import annotations
+
+import time
+from typing import TYPE_CHECKING, Any, Final
+
+from homeassistant.core import callback
+from homeassistant.helpers.storage import Store
+
+from .const import DOMAIN, LOGGER
+from .data import DynamicProxiedURL
+
+if TYPE_CHECKING:
+    from homeassistant.core import HomeAssistant
+
+STORAGE_VERSION: Final = 1
+
+# Changes within this many seconds of the first unsaved change are saved together,
+# so that busy proxied URLs (e.g. counting opens) do not write on every request.
+SAVE_DELAY: Final = 10
+
+
+class DynamicProxiedURLStore:
+    """Saves and loads the dynamic proxied URLs, so that they survive restarts."""
+
+    def __init__(self, hass: HomeAssistant, entry_id: str) -> None:
+        """Initialize the store."""
+        self._store: Store[dict[str, Any]] = Store(
+            hass, STORAGE_VERSION, f"{DOMAIN}.{entry_id}"
+        )
+        self._proxied_urls: dict[str, DynamicProxiedURL] = {}
+        self._save_pending = False
+        self.saves = 0
+
+    async def async_load(self) -> list[tuple[str, DynamicProxiedURL]]:
+        """Load the dynamic proxied URLs, without those that have expired."""
+        stored = await self._store.async_load()
+        if not stored:
+            return []
+
+        now = time.time()
+        proxied_urls = []
+        for url_id, fields in stored["proxied_urls"].items():
+            try:
+                proxied_url = DynamicProxiedURL(**fields)
+            except TypeError:
+                LOGGER.warning(f"Ignoring invalid stored proxied URL '{url_id}'")
+                continue
+            if not proxied_url.expiration or proxied_url.expiration >= now:
+                proxied_urls.append((url_id, proxied_url))
+        return proxied_urls
+
+    @callback
+    def async_schedule_save(self, proxied_urls: dict[str, DynamicProxiedURL]) -> None:
+        """Schedule the dynamic proxied URLs to be saved (with any later changes)."""
+        self._proxied_urls = proxied_urls
+        if self._save_pending:
+            return
+        self._save_pending = True
+        self._store.async_delay_save(self._get_data, SAVE_DELAY)
+
+    async def async_flush(self) -> None:
+        """Save any pending changes now (e.g. before the entry is unloaded)."""
+        if self._save_pending:
+            await self._store.async_save(self._get_data())
+
+    def _get_data(self) -> dict[str, Any]:
+        """Get the data to save, as the proxied URLs are when it is saved."""
+        self._save_pending = False
+        self.saves += 1
+        return {
+            "proxied_urls": {
+                url_id: proxied_url.as_dict()
+                for url_id, proxied_url in self._proxied_urls.items()
+            }
+        }
+
+    async def async_remove(self) -> None:
+        """Remove the saved dynamic proxied URLs."""
+        self._save_pending = False
+        await self._store.async_remove()
+
+    def get_stats(self) -> dict[str, Any]:
+        """Get the number of saves, and whether one is pending."""
+        return {"saves": self.saves, "save_pending": self._save_pending}
@@ -0,0 +1,147 @@
+"""Sampled per-request tracing for HASS Web Proxy."""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import random
+import time
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import TYPE_CHECKING, Any, cast
+
+import aiohttp
+from yarl import URL
+
+from .const import EVENT_REQUEST_TRACE, LOGGER
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from types import SimpleNamespace
+
+    from homeassistant.core import HomeAssistant
+
+    from .data import ProxiedURLMatch
+
+# The trace of the sampled proxy request being handled, and the task handling it
+# (as background tasks, e.g. revalidations and shared streams, copy the context).
+_current_trace: ContextVar[tuple[RequestTrace, asyncio.Task[Any] | None] | None] = (
+    ContextVar("hass_web_proxy_request_trace", default=None)
+)
+
+
+@dataclass
+class RequestTrace:
+    """
+    The timings of a single sampled proxy request.
+
+    `upstream_time` is the time spent on the request's own upstream requests,
+    until their response headers were received, or None if it made none (e.g. it
+    was served from a cache or a shared stream).
+    """
+
+    host: str | None = None
+    match_source: str | None = None
+    url_id: str | None = None
+    match_time: float | None = None
+    upstream_time: float | None = None
+    status: int | None = None
+    _started: float = field(default_factory=time.perf_counter, repr=False)
+
+    def set_match(self, match: ProxiedURLMatch | None) -> None:
+        """Record the result of matching the request (None if unmatched)."""
+        self.match_time = time.perf_counter() - self._started
+        if match is not None:
+            self.host = URL(match.proxied_url.url).host
+            self.match_source = "dynamic" if match.url_id is not None else "static"
+            self.url_id = match.url_id
+
+    def add_upstream_time(self, duration: float) -> None:
+        """Record the time of an upstream request."""
+        self.upstream_time = (self.upstream_time or 0) + duration
+
+    def finish(self, status: int | None) -> None:
+        """Record the end of the request."""
+        self.status = status
+
+    def as_dict(self) -> dict[str, Any]:
+        """Get the trace as a dict."""
+        return {
+            key: value for key, value in asdict(self).items() if not key.startswith("_")
+        }
+
+
+class RequestTracer:
+    """Trace a sample of proxy requests, which can be enabled at runtime."""
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        """Initialize the tracer (disabled)."""
+        self._hass = hass
+        self.sample_rate = 0.0
+        self.traced = 0
+
+    def get_stats(self) -> dict[str, Any]:
+        """Get statistics on traced requests."""
+        return {"sample_rate": self.sample_rate, "traced": self.traced}
+
+    def sample(self) -> RequestTrace | None:
+        """Start a trace, if this request is sampled."""
+        if not self.sample_rate or random.random() >= self.sample_rate:  # noqa: S311
+            return None
+        return RequestTrace()
+
+    @contextlib.contextmanager
+    def activate(self, trace: RequestTrace) -> Iterator[None]:
+        """Time the upstream requests made by the current task in a trace."""
+        token = _current_trace.set((trace, asyncio.current_task()))
+        try:
+            yield
+        finally:
+            _current_trace.reset(token)
+
+    def create_trace_config(self) -> aiohttp.TraceConfig:
+        """Create a client trace config that times the upstream requests traced."""
+        trace_config = aiohttp.TraceConfig()
+
+        async def _on_request_start(
+            _session: aiohttp.ClientSession,
+            context: SimpleNamespace,
+            _params: aiohttp.TraceRequestStartParams,
+        ) -> None:
+            current = _current_trace.get()
+            context.request_trace = (
+                current[0]
+                if current is not None and current[1] is asyncio.current_task()
+                else None
+            )
+            context.started = time.perf_counter()
+
+        async def _on_request_end(
+            _session: aiohttp.ClientSession,
+            context: SimpleNamespace,
+            _params: (
+                aiohttp.TraceRequestEndParams | aiohttp.TraceRequestExceptionParams
+            ),
+        ) -> None:
+            # The end of the request is when the response headers are received.
+            if context.request_trace is not None:
+                context.request_trace.add_upstream_time(
+                    time.perf_counter() - context.started
+                )
+
+        # The signals are mistyped by aiohttp 3.10 with aiosignal 1.4, so are
+        # not type checked (the callbacks are typed as aiohttp documents).
+        signals = cast("Any", trace_config)
+        signals.on_request_start.append(_on_request_start)
+        signals.on_request_end.append(_on_request_end)
+        signals.on_request_exception.append(_on_request_end)
+        return trace_config
+
+    def record(self, trace: RequestTrace) -> None:
+        """Publish a finished trace as an event (and log it)."""
+        self.traced += 1
+        data = trace.as_dict()
+        self._hass.bus.async_fire(EVENT_REQUEST_TRACE, data)
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            LOGGER.debug(f"Proxy request trace: {data}")
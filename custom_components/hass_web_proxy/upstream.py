@@ -0,0 +1,285 @@
+"""Upstream request helpers for HASS Web Proxy."""
+
+from __future__ import annotations
+
+import contextlib
+from dataclasses import dataclass
+from ipaddress import ip_address
+from typing import TYPE_CHECKING, Final
+
+import aiohttp
+from aiohttp import hdrs, web
+from multidict import CIMultiDict
+
+from .cache import STREAMING_CONTENT_TYPES
+from .const import LOGGER
+
+if TYPE_CHECKING:
+    import ssl
+    from collections.abc import Callable, Mapping
+    from contextlib import AbstractAsyncContextManager
+
+    from hass_web_proxy_lib import ProxiedURL
+
+    from .metrics import ProxyMetrics
+
+    # Reserves an upstream request (e.g. a slot of the host's concurrency limit),
+    # getting its timeouts (or None for the defaults).
+    type UpstreamReservation = Callable[
+        [], AbstractAsyncContextManager[aiohttp.ClientTimeout | None]
+    ]
+
+READ_CHUNK_SIZE: Final = 64 * 1024
+
+# Headers that apply to a single connection and must not be forwarded
+# (https://www.rfc-editor.org/rfc/rfc9110#section-7.6.1).
+HOP_BY_HOP_HEADERS: frozenset[str] = frozenset(
+    {
+        hdrs.CONNECTION.lower(),
+        hdrs.KEEP_ALIVE.lower(),
+        hdrs.PROXY_AUTHENTICATE.lower(),
+        hdrs.PROXY_AUTHORIZATION.lower(),
+        hdrs.TE.lower(),
+        hdrs.TRAILER.lower(),
+        hdrs.TRANSFER_ENCODING.lower(),
+        hdrs.UPGRADE.lower(),
+    }
+)
+
+# Request headers that are never forwarded upstream. The Home Assistant
+# credentials in particular must not leak to the proxied target.
+_SKIP_REQUEST_HEADERS: frozenset[str] = HOP_BY_HOP_HEADERS | frozenset(
+    {
+        hdrs.AUTHORIZATION.lower(),
+        hdrs.CONTENT_LENGTH.lower(),
+        hdrs.HOST.lower(),
+        hdrs.ACCEPT_ENCODING.lower(),
+    }
+)
+
+# Response headers that are not passed back, as the body is re-framed (and
+# decompressed) by the proxy, or as Home Assistant sets its own CORS headers (and
+# aiohttp_cors asserts that they are not already present).
+_SKIP_RESPONSE_HEADERS: frozenset[str] = HOP_BY_HOP_HEADERS | frozenset(
+    {
+        hdrs.CONTENT_ENCODING.lower(),
+        hdrs.ACCESS_CONTROL_ALLOW_ORIGIN.lower(),
+        hdrs.ACCESS_CONTROL_ALLOW_CREDENTIALS.lower(),
+        hdrs.ACCESS_CONTROL_EXPOSE_HEADERS.lower(),
+    }
+)
+
+
+def get_upstream_request_headers(
+    request: web.BaseRequest,
+    *,
+    include_cookies: bool = True,
+    validators: Mapping[str, str] | None = None,
+) -> CIMultiDict[str]:
+    """
+    Get the headers to send upstream for a client request.
+
+    As with the library's proxy views, the `X-Forwarded-*` headers are set (with
+    the client's address appended to any `X-Forwarded-For`). If `validators` is
+    given, it replaces any conditional headers from the client.
+    """
+    upstream_headers = CIMultiDict(
+        (key, value)
+        for key, value in request.headers.items()
+        if key.lower() not in _SKIP_REQUEST_HEADERS
+        and (include_cookies or key.lower() != hdrs.COOKIE.lower())
+    )
+
+    if request.transport and (peername := request.transport.get_extra_info("peername")):
+        connected_ip = str(ip_address(peername[0]))
+        forwarded_for = request.headers.get(hdrs.X_FORWARDED_FOR)
+        upstream_headers[hdrs.X_FORWARDED_FOR] = (
+            f"{forwarded_for}, {connected_ip}" if forwarded_for else connected_ip
+        )
+    upstream_headers[hdrs.X_FORWARDED_HOST] = (
+        request.headers.get(hdrs.X_FORWARDED_HOST) or request.host
+    )
+    upstream_headers[hdrs.X_FORWARDED_PROTO] = (
+        request.headers.get(hdrs.X_FORWARDED_PROTO) or request.url.scheme
+    )
+
+    if validators is not None:
+        upstream_headers.popall(hdrs.IF_NONE_MATCH, None)
+        upstream_headers.popall(hdrs.IF_MODIFIED_SINCE, None)
+        upstream_headers.update(validators)
+    if hdrs.RANGE in upstream_headers:
+        # Byte ranges are offsets into the body as sent, so ask for it unencoded
+        # to keep them valid after decompression.
+        upstream_headers[hdrs.ACCEPT_ENCODING] = "identity"
+    return upstream_headers
+
+
+def get_client_response_headers(headers: Mapping[str, str]) -> CIMultiDict[str]:
+    """Get the headers to send to the client for an upstream response."""
+    # The length only still applies if the body was not decompressed.
+    skip = _SKIP_RESPONSE_HEADERS
+    if hdrs.CONTENT_ENCODING in headers:
+        skip |= {hdrs.CONTENT_LENGTH.lower()}
+    return CIMultiDict(
+        (key, value) for key, value in headers.items() if key.lower() not in skip
+    )
+
+
+@dataclass
+class BufferedResponse:
+    """An upstream response that has been read in full."""
+
+    status: int
+    headers: CIMultiDict[str]
+    body: bytes
+
+    def to_web_response(self) -> web.Response:
+        """Create a client response."""
+        return web.Response(
+            status=self.status, headers=self.headers.copy(), body=self.body
+        )
+
+
+def get_upstream_timeout(
+    session: aiohttp.ClientSession,
+    connect_timeout: float | None,
+    read_timeout: float | None,
+) -> aiohttp.ClientTimeout | None:
+    """Get the timeouts of a proxied URL, or None to use the session's."""
+    if connect_timeout is None and read_timeout is None:
+        return None
+
+    default = session.timeout
+    if connect_timeout is None:
+        connect_timeout = default.sock_connect
+    if read_timeout is None:
+        return aiohttp.ClientTimeout(
+            total=default.total,
+            sock_connect=connect_timeout,
+            sock_read=default.sock_read,
+        )
+    # A read timeout bounds upstreams that stall, so streams may then last for as
+    # long as they keep sending.
+    return aiohttp.ClientTimeout(
+        total=None, sock_connect=connect_timeout, sock_read=read_timeout
+    )
+
+
+def count_bytes_in(metrics: ProxyMetrics | None, chunk: bytes) -> None:
+    """Count a chunk of an upstream response body in `metrics`, if given."""
+    # aiohttp only traces response bodies that are read in full, whereas proxied
+    # bodies are mostly streamed, so they are counted as they are read instead.
+    if metrics is not None:
+        metrics.bytes_in += len(chunk)
+
+
+def _is_streaming(response: aiohttp.ClientResponse) -> bool:
+    """Determine whether an upstream response is an unbounded stream."""
+    return response.content_type in STREAMING_CONTENT_TYPES
+
+
+async def async_fetch(  # noqa: PLR0913
+    request: web.Request,
+    session: aiohttp.ClientSession,
+    url: str,
+    ssl_context: ssl.SSLContext | None,
+    *,
+    max_buffer_size: int,
+    on_complete: Callable[[BufferedResponse | None], None] | None = None,
+    validators: Mapping[str, str] | None = None,
+    client_timeout: aiohttp.ClientTimeout | None = None,
+    metrics: ProxyMetrics | None = None,
+) -> web.StreamResponse:
+    """
+    Proxy a GET request, buffering the response body if it is small enough.
+
+    `on_complete` is called once the response is known: with the buffered
+    response, or with None if it is streamed (too large or unbounded). It is not
+    called if the upstream request fails. `validators` replace the conditional
+    headers of the client request, and `client_timeout` the session's timeouts.
+    The body bytes received are counted in `metrics`, if given.
+    """
+    try:
+        async with session.get(
+            url,
+            headers=get_upstream_request_headers(request, validators=validators),
+            ssl=ssl_context or True,
+            allow_redirects=False,
+            timeout=client_timeout or session.timeout,
+        ) as upstream:
+            headers = get_client_response_headers(upstream.headers)
+            chunks: list[bytes] = []
+            size = 0
+
+            if not _is_streaming(upstream) and (
+                upstream.content_length is None
+                or upstream.content_length <= max_buffer_size
+            ):
+                async for chunk in upstream.content.iter_chunked(READ_CHUNK_SIZE):
+                    count_bytes_in(metrics, chunk)
+                    chunks.append(chunk)
+                    size += len(chunk)
+                    if size > max_buffer_size:
+                        break
+                else:
+                    buffered = BufferedResponse(
+                        status=upstream.status, headers=headers, body=b"".join(chunks)
+                    )
+                    if on_complete:
+                        on_complete(buffered)
+                    return buffered.to_web_response()
+
+            if on_complete:
+                on_complete(None)
+
+            # Stream the response, starting with anything already read.
+            response = web.StreamResponse(status=upstream.status, headers=headers)
+            with contextlib.suppress(ConnectionResetError):
+                await response.prepare(request)
+                for chunk in chunks:
+                    await response.write(chunk)
+                async for chunk in upstream.content.iter_chunked(READ_CHUNK_SIZE):
+                    count_bytes_in(metrics, chunk)
+                    await response.write(chunk)
+            return response
+    except (aiohttp.ClientError, TimeoutError) as exc:
+        LOGGER.debug(f"Upstream request to '{url}' failed: {exc}")
+        raise web.HTTPBadGateway from None
+
+
+async def async_fetch_buffered(  # noqa: PLR0913
+    session: aiohttp.ClientSession,
+    proxied_url: ProxiedURL,
+    headers: Mapping[str, str],
+    *,
+    max_buffer_size: int,
+    client_timeout: aiohttp.ClientTimeout | None = None,
+    metrics: ProxyMetrics | None = None,
+) -> BufferedResponse | None:
+    """
+    Fetch a response in full, without a client to respond to.
+
+    None is returned if the response is too large to buffer (or unbounded), and
+    upstream failures are raised.
+    """
+    async with session.get(
+        proxied_url.url,
+        headers=headers,
+        ssl=proxied_url.ssl_context or True,
+        allow_redirects=False,
+        timeout=client_timeout or session.timeout,
+    ) as upstream:
+        if _is_streaming(upstream) or (upstream.content_length or 0) > max_buffer_size:
+            return None
+
+        body = bytearray()
+        async for chunk in upstream.content.iter_chunked(READ_CHUNK_SIZE):
+            count_bytes_in(metrics, chunk)
+            body += chunk
+            if len(body) > max_buffer_size:
+                return None
+        return BufferedResponse(
+            status=upstream.status,
+            headers=get_client_response_headers(upstream.headers),
+            body=bytes(body),
+        )
@@ -0,0 +1,418 @@
+"""Websocket relaying (with compression and fan-out) for HASS Web Proxy."""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Final
+
+import aiohttp
+from aiohttp import WSCloseCode, WSMsgType, hdrs, web
+
+from .const import LOGGER
+from .upstream import get_upstream_request_headers
+
+if TYPE_CHECKING:
+    from hass_web_proxy_lib import ProxiedURL
+    from homeassistant.core import HomeAssistant
+    from multidict import CIMultiDict
+
+    from .data import HASSWebProxyConfigEntry
+    from .metrics import ProxyMetrics
+
+# The window bits offered for permessage-deflate on the upstream connection.
+UPSTREAM_COMPRESS_WBITS: Final = 15
+
+# The number of messages buffered per client of a shared websocket, beyond which
+# the oldest are dropped.
+WEBSOCKET_FANOUT_QUEUE_SIZE: Final = 64
+
+# The number of seconds a shared websocket is kept open after its last client
+# leaves, for clients that reconnect (e.g. on a dashboard reload).
+WEBSOCKET_FANOUT_GRACE_PERIOD: Final = 10
+
+# The handshake headers of the client, which are made anew for the upstream.
+_SKIP_HANDSHAKE_HEADERS: Final = frozenset(
+    {
+        hdrs.SEC_WEBSOCKET_EXTENSIONS.lower(),
+        hdrs.SEC_WEBSOCKET_KEY.lower(),
+        hdrs.SEC_WEBSOCKET_PROTOCOL.lower(),
+        hdrs.SEC_WEBSOCKET_VERSION.lower(),
+    }
+)
+
+type _WebSocket = web.WebSocketResponse | aiohttp.ClientWebSocketResponse
+
+# Shared websockets are keyed by URL, SSL context, protocols and compression.
+type _SharedWebSocketKey = tuple[str, int, tuple[str, ...], bool]
+
+# The types of message relayed between websockets (until any other, i.e. close).
+_RELAYED_MESSAGE_TYPES: Final = frozenset(
+    {WSMsgType.TEXT, WSMsgType.BINARY, WSMsgType.PING, WSMsgType.PONG}
+)
+
+
+def _get_protocols(request: web.Request) -> list[str]:
+    """Get the subprotocols requested by a websocket client."""
+    return [
+        protocol.strip()
+        for protocol in request.headers.get(hdrs.SEC_WEBSOCKET_PROTOCOL, "").split(",")
+        if protocol.strip()
+    ]
+
+
+def _get_upstream_handshake_headers(
+    request: web.Request, *, include_cookies: bool = True
+) -> CIMultiDict[str]:
+    """Get the headers of a client's websocket handshake to send upstream."""
+    headers = get_upstream_request_headers(request, include_cookies=include_cookies)
+    for header in _SKIP_HANDSHAKE_HEADERS:
+        headers.popall(header, None)
+    return headers
+
+
+def _get_message_size(message: aiohttp.WSMessage) -> int:
+    """Get the payload size of a text or binary message (or 0 for others)."""
+    if message.type is WSMsgType.BINARY:
+        return len(message.data)
+    if message.type is WSMsgType.TEXT:
+        data: str = message.data
+        # The (UTF-8) length of ASCII text, the most common, is known without
+        # encoding it.
+        return len(data) if data.isascii() else len(data.encode())
+    return 0
+
+
+async def _async_send(ws: _WebSocket, message: aiohttp.WSMessage) -> None:
+    """Send a (text, binary, ping or pong) message to a websocket."""
+    if message.type is WSMsgType.TEXT:
+        await ws.send_str(message.data)
+    elif message.type is WSMsgType.BINARY:
+        # Payloads are passed on as they were received, without copying.
+        await ws.send_bytes(message.data)
+    elif message.type is WSMsgType.PING:
+        await ws.ping(message.data)
+    else:
+        await ws.pong(message.data)
+
+
+async def _async_forward(
+    ws_from: _WebSocket, ws_to: _WebSocket, metrics: ProxyMetrics | None = None
+) -> None:
+    """
+    Forward the messages of one websocket to another, until it closes.
+
+    The payloads are counted in `metrics` (as received from upstream and sent to
+    the client), if given.
+    """
+    while (message := await ws_from.receive()).type in _RELAYED_MESSAGE_TYPES:
+        await _async_send(ws_to, message)
+        if metrics is not None:
+            size = _get_message_size(message)
+            metrics.bytes_in += size
+            metrics.bytes_out += size
+    await ws_to.close(code=ws_from.close_code or WSCloseCode.OK)
+
+
+async def async_relay_websocket(
+    request: web.Request,
+    session: aiohttp.ClientSession,
+    proxied_url: ProxiedURL,
+    *,
+    compress: bool,
+    metrics: ProxyMetrics,
+) -> web.WebSocketResponse:
+    """
+    Relay a websocket between the client and upstream.
+
+    If `compress`, permessage-deflate is negotiated on both connections (where the
+    client and upstream support it). The payloads relayed to the client are
+    counted in `metrics`.
+    """
+    protocols = _get_protocols(request)
+    headers = _get_upstream_handshake_headers(request)
+
+    url = proxied_url.url
+    try:
+        ws_to_target = await session.ws_connect(
+            url,
+            headers=headers,
+            protocols=protocols,
+            autoclose=False,
+            autoping=False,
+            compress=UPSTREAM_COMPRESS_WBITS if compress else 0,
+            ssl=proxied_url.ssl_context or True,
+        )
+    except (aiohttp.ClientError, TimeoutError) as exc:
+        LOGGER.debug(f"Upstream websocket connection to '{url}' failed: {exc}")
+        raise web.HTTPBadGateway from None
+
+    try:
+        ws_to_user = web.WebSocketResponse(
+            protocols=[ws_to_target.protocol] if ws_to_target.protocol else (),
+            autoclose=False,
+            autoping=False,
+            compress=compress,
+        )
+        await ws_to_user.prepare(request)
+
+        tasks = [
+            asyncio.create_task(_async_forward(ws_to_target, ws_to_user, metrics)),
+            asyncio.create_task(_async_forward(ws_to_user, ws_to_target)),
+        ]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            for task in tasks:
+                with contextlib.suppress(
+                    asyncio.CancelledError, aiohttp.ClientError, ConnectionResetError
+                ):
+                    await task
+    finally:
+        await ws_to_target.close()
+    return ws_to_user
+
+
+@dataclass(eq=False)
+class _WebSocketSubscriber:
+    """A client attached to a shared websocket."""
+
+    queue: asyncio.Queue[aiohttp.WSMessage | None] = field(
+        default_factory=lambda: asyncio.Queue(WEBSOCKET_FANOUT_QUEUE_SIZE)
+    )
+    dropped: int = 0
+
+
+class _SharedWebSocket:
+    """A single upstream websocket shared by multiple clients."""
+
+    def __init__(
+        self,
+        proxied_url: ProxiedURL,
+        headers: CIMultiDict[str],
+        protocols: list[str],
+        *,
+        compress: bool,
+    ) -> None:
+        """Initialize the shared websocket."""
+        self.url = proxied_url.url
+        self.closed = False
+        self.close_code: int | None = None
+        self.protocol: asyncio.Future[str | None] = (
+            asyncio.get_running_loop().create_future()
+        )
+        self.subscribers: set[_WebSocketSubscriber] = set()
+        self.task: asyncio.Task[None] | None = None
+        self.grace_handle: asyncio.TimerHandle | None = None
+        self._ssl_context = proxied_url.ssl_context
+        self._headers = headers
+        self._protocols = protocols
+        self._compress = compress
+
+    async def async_read(
+        self, session: aiohttp.ClientSession, metrics: ProxyMetrics
+    ) -> None:
+        """Read the upstream websocket and publish it to all subscribers."""
+        try:
+            async with session.ws_connect(
+                self.url,
+                headers=self._headers,
+                protocols=self._protocols,
+                compress=UPSTREAM_COMPRESS_WBITS if self._compress else 0,
+                ssl=self._ssl_context or True,
+            ) as ws:
+                self.protocol.set_result(ws.protocol)
+                async for message in ws:
+                    if message.type in (WSMsgType.TEXT, WSMsgType.BINARY):
+                        metrics.bytes_in += _get_message_size(message)
+                        self._publish(message)
+                self.close_code = ws.close_code
+        except (aiohttp.ClientError, TimeoutError) as exc:
+            LOGGER.debug(f"Shared upstream websocket '{self.url}' failed: {exc}")
+            if not self.protocol.done():
+                self.protocol.set_exception(exc)
+        finally:
+            self.closed = True
+            if not self.protocol.done():
+                self.protocol.cancel()
+            for subscriber in list(self.subscribers):
+                self.end(subscriber)
+
+    def _publish(self, message: aiohttp.WSMessage) -> None:
+        """Publish a message to all subscribers, dropping the oldest if full."""
+        for subscriber in self.subscribers:
+            if subscriber.queue.full():
+                subscriber.queue.get_nowait()
+                subscriber.dropped += 1
+            subscriber.queue.put_nowait(message)
+
+    def end(self, subscriber: _WebSocketSubscriber) -> None:
+        """End the websocket for a subscriber."""
+        self.subscribers.discard(subscriber)
+
+        # Make room for the end-of-stream marker, if necessary.
+        if subscriber.queue.full():
+            subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(None)
+
+
+class WebSocketFanout:
+    """
+    Share upstream websockets between clients connecting to the same URL.
+
+    Shared websockets are read-only: messages from clients are not sent upstream.
+    """
+
+    def __init__(self, hass: HomeAssistant, entry: HASSWebProxyConfigEntry) -> None:
+        """Initialize the websocket fan-out."""
+        self._hass = hass
+        self._entry = entry
+        self._websockets: dict[_SharedWebSocketKey, _SharedWebSocket] = {}
+
+    def get_stats(self) -> dict[str, Any]:
+        """Get statistics on the shared websockets."""
+        return {
+            "websockets": len(self._websockets),
+            "clients": sum(
+                len(shared.subscribers) for shared in self._websockets.values()
+            ),
+            "dropped": sum(
+                subscriber.dropped
+                for shared in self._websockets.values()
+                for subscriber in shared.subscribers
+            ),
+        }
+
+    def _subscribe(
+        self,
+        session: aiohttp.ClientSession,
+        request: web.Request,
+        proxied_url: ProxiedURL,
+        *,
+        compress: bool,
+    ) -> tuple[_SharedWebSocket, _WebSocketSubscriber]:
+        """Attach to the shared websocket for a URL, opening it if necessary."""
+        url = proxied_url.url
+        protocols = _get_protocols(request)
+        key = (url, id(proxied_url.ssl_context), tuple(protocols), compress)
+        shared = self._websockets.get(key)
+
+        if shared is None or shared.closed:
+            # Only the first client's headers are used, without its cookies.
+            shared = _SharedWebSocket(
+                proxied_url,
+                _get_upstream_handshake_headers(request, include_cookies=False),
+                protocols,
+                compress=compress,
+            )
+            self._websockets[key] = shared
+            shared.task = self._entry.async_create_background_task(
+                self._hass,
+                self._async_run(key, shared, session),
+                name=f"hass_web_proxy shared websocket {url}",
+            )
+        elif shared.grace_handle is not None:
+            shared.grace_handle.cancel()
+            shared.grace_handle = None
+
+        subscriber = _WebSocketSubscriber()
+        shared.subscribers.add(subscriber)
+        return shared, subscriber
+
+    async def _async_run(
+        self,
+        key: _SharedWebSocketKey,
+        shared: _SharedWebSocket,
+        session: aiohttp.ClientSession,
+    ) -> None:
+        """Run a shared websocket, and forget it once finished."""
+        try:
+            await shared.async_read(session, self._entry.runtime_data.metrics)
+        finally:
+            if shared.grace_handle is not None:
+                shared.grace_handle.cancel()
+                shared.grace_handle = None
+            if self._websockets.get(key) is shared:
+                del self._websockets[key]
+
+    def _unsubscribe(
+        self, shared: _SharedWebSocket, subscriber: _WebSocketSubscriber
+    ) -> None:
+        """Detach from a shared websocket, closing it later if it has no clients."""
+        shared.subscribers.discard(subscriber)
+        if not shared.subscribers and not shared.closed and not shared.grace_handle:
+            shared.grace_handle = asyncio.get_running_loop().call_later(
+                WEBSOCKET_FANOUT_GRACE_PERIOD, self._close, shared
+            )
+
+    def _close(self, shared: _SharedWebSocket) -> None:
+        """Close a shared websocket (that no clients rejoined)."""
+        shared.grace_handle = None
+        shared.closed = True
+        if shared.task:
+            shared.task.cancel()
+
+    async def async_handle(
+        self,
+        request: web.Request,
+        session: aiohttp.ClientSession,
+        proxied_url: ProxiedURL,
+        *,
+        compress: bool,
+    ) -> web.WebSocketResponse:
+        """
+        Connect a client to a shared upstream websocket.
+
+        If `compress`, permessage-deflate is negotiated on both connections (where
+        supported).
+        """
+        shared, subscriber = self._subscribe(
+            session, request, proxied_url, compress=compress
+        )
+
+        try:
+            try:
+                protocol = await asyncio.shield(shared.protocol)
+            except (aiohttp.ClientError, TimeoutError, asyncio.CancelledError):
+                if (task := asyncio.current_task()) and task.cancelling():
+                    raise
+                raise web.HTTPBadGateway from None
+
+            # Closes are answered once the queued messages are sent (see below).
+            ws = web.WebSocketResponse(
+                protocols=[protocol] if protocol else (),
+                autoclose=False,
+                compress=compress,
+            )
+            await ws.prepare(request)
+            receiver = asyncio.create_task(self._async_receive(ws, shared, subscriber))
+            metrics = self._entry.runtime_data.metrics
+            try:
+                with contextlib.suppress(ConnectionResetError):
+                    while (message := await subscriber.queue.get()) is not None:
+                        await _async_send(ws, message)
+                        metrics.bytes_out += _get_message_size(message)
+                await ws.close(code=shared.close_code or WSCloseCode.OK)
+            finally:
+                receiver.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await receiver
+        finally:
+            self._unsubscribe(shared, subscriber)
+
+        return ws
+
+    async def _async_receive(
+        self,
+        ws: web.WebSocketResponse,
+        shared: _SharedWebSocket,
+        subscriber: _WebSocketSubscriber,
+    ) -> None:
+        """Ignore the messages of a client, ending its websocket once it closes."""
+        async for _message in ws:
+            pass
+        self._unsubscribe(shared, subscriber)
+        shared.end(subscriber)
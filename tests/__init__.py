@@ -1,8 +1,9 @@
 """Tests for the HASS Web Proxy integration."""
 
 from types import MappingProxyType
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
+from aiohttp import web
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import HomeAssistant
 from pytest_homeassistant_custom_component.common import (
@@ -11,6 +12,9 @@ from pytest_homeassistant_custom_component.common import (
 
 from custom_components.hass_web_proxy.const import DOMAIN
 
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable
+
 TEST_CONFIG_ENTRY_ID = "74565bd414754616000674c87bdc876d"
 TEST_TITLE = "Home Assistant Web Proxy"
 
@@ -44,3 +48,32 @@ async def setup_mock_hass_web_proxy_config_entry(
     await hass.async_block_till_done()
 
     return config_entry
+
+
+class UpstreamServer:
+    """A local upstream server with handlers that can be changed by tests."""
+
+    def __init__(self) -> None:
+        """Initialize the server."""
+        self.handlers: dict[
+            str, Callable[[web.Request], Awaitable[web.StreamResponse]]
+        ] = {}
+        self.requests: list[web.Request] = []
+        self.app = web.Application()
+        self.app.router.add_route("*", "/{path:.*}", self._handle)
+        self.base_url = ""
+
+    async def _handle(self, request: web.Request) -> web.StreamResponse:
+        """Dispatch a request to the handler for its path."""
+        self.requests.append(request)
+        if (handler := self.handlers.get(request.path)) is None:
+            raise web.HTTPNotFound
+        return await handler(request)
+
+    def make_url(self, path: str) -> str:
+        """Get the URL of a path on the server."""
+        return f"{self.base_url}{path}"
+
+    def get_request_count(self, path: str) -> int:
+        """Get the number of requests received for a path."""
+        return sum(1 for request in self.requests if request.path == path)
@@ -0,0 +1,99 @@
+"""Helpers for the HASS Web Proxy benchmarks."""
+
+from __future__ import annotations
+
+import json
+import platform
+import subprocess
+import time
+from pathlib import Path
+from typing import Any
+
+# The percentiles reported for every benchmark.
+PERCENTILES = (50, 90, 99)
+
+
+def _get_percentile(ordered: list[float], percentile: float) -> float:
+    """Get a percentile of sorted values (by the nearest rank)."""
+    rank = max(1, round(percentile / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def _get_commit() -> str | None:
+    """Get the current git commit, if any."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],  # noqa: S607
+            capture_output=True,
+            check=True,
+            text=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize(
+    durations: list[float], elapsed: float | None = None, **extra: Any
+) -> dict[str, Any]:
+    """
+    Summarize the durations (in seconds) of the operations of a benchmark.
+
+    Throughput is over `elapsed` if given (e.g. when operations are concurrent),
+    otherwise over the sum of the durations.
+    """
+    ordered = sorted(durations)
+    elapsed = sum(ordered) if elapsed is None else elapsed
+    summary: dict[str, Any] = {
+        "count": len(ordered),
+        "ops_per_sec": len(ordered) / elapsed if elapsed else None,
+        "mean_ms": sum(ordered) / len(ordered) * 1000,
+        "min_ms": ordered[0] * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+    for percentile in PERCENTILES:
+        summary[f"p{percentile}_ms"] = _get_percentile(ordered, percentile) * 1000
+    summary.update(extra)
+    return summary
+
+
+class BenchmarkResults:
+    """Results of a benchmark run, written as JSON to compare between commits."""
+
+    def __init__(self) -> None:
+        """Initialize the results."""
+        self.results: dict[str, dict[str, Any]] = {}
+
+    def add(self, name: str, summary: dict[str, Any]) -> None:
+        """Add the summary of a benchmark."""
+        self.results[name] = summary
+
+    def as_dict(self) -> dict[str, Any]:
+        """Get the results, with details of where they were run."""
+        return {
+            "commit": _get_commit(),
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "benchmarks": self.results,
+        }
+
+    def write(self, path: Path) -> None:
+        """Write the results to a file."""
+        path.write_text(json.dumps(self.as_dict(), indent=2, sort_keys=True) + "\n")
+
+    def compare(self, path: Path) -> list[str]:
+        """Compare the throughput against earlier results, one line per benchmark."""
+        baseline = json.loads(path.read_text())["benchmarks"]
+        lines = []
+        for name, summary in sorted(self.results.items()):
+            previous = baseline.get(name, {}).get("ops_per_sec")
+            current = summary["ops_per_sec"]
+            if not previous or not current:
+                lines.append(f"{name}: {current} ops/s (no baseline)")
+                continue
+            lines.append(
+                f"{name}: {current:.1f} ops/s vs {previous:.1f} ops/s"
+                f" ({(current / previous - 1) * 100:+.1f}%)"
+            )
+        return lines
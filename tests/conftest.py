@@ -1,14 +1,74 @@
 """Global fixtures for HASS Web Proxy integration."""
 
+import datetime
+import ipaddress
+import ssl
+from collections.abc import AsyncGenerator
+from pathlib import Path
 from typing import Any
 
 import pytest
+from aiohttp.test_utils import TestServer
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+from tests import UpstreamServer
+from tests.benchmark import BenchmarkResults
 
 pytest_plugins = [
     "pytest_homeassistant_custom_component",
     "hass_web_proxy_lib.tests.utils",
 ]
 
+# Benchmark results, shared by all the benchmarks of a run.
+_BENCHMARK_RESULTS = BenchmarkResults()
+
+
+def pytest_addoption(parser: pytest.Parser) -> None:
+    """Add the benchmark options."""
+    group = parser.getgroup("benchmark")
+    group.addoption(
+        "--benchmark",
+        action="store_true",
+        help="Run the benchmarks (skipped otherwise).",
+    )
+    group.addoption(
+        "--benchmark-output",
+        type=Path,
+        help="Write the benchmark results as JSON to this file.",
+    )
+    group.addoption(
+        "--benchmark-compare",
+        type=Path,
+        help="Compare the benchmark results against an earlier JSON output.",
+    )
+
+
+def pytest_collection_modifyitems(
+    config: pytest.Config, items: list[pytest.Item]
+) -> None:
+    """Skip the benchmarks unless requested."""
+    if config.getoption("--benchmark"):
+        return
+    skip = pytest.mark.skip(reason="benchmarks are only run with --benchmark")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
+
+
+def pytest_terminal_summary(terminalreporter: Any, config: pytest.Config) -> None:
+    """Write (and compare) the benchmark results."""
+    if not _BENCHMARK_RESULTS.results:
+        return
+    if (output := config.getoption("--benchmark-output")) is not None:
+        _BENCHMARK_RESULTS.write(output)
+    if (baseline := config.getoption("--benchmark-compare")) is not None:
+        terminalreporter.section("benchmark comparison")
+        for line in _BENCHMARK_RESULTS.compare(baseline):
+            terminalreporter.write_line(line)
+
 
 @pytest.fixture(autouse=True)
 def hass_web_proxy_integration_fixture(
@@ -18,3 +78,71 @@ def hass_web_proxy_integration_fixture(
     hass: Any,
 ) -> None:
     """Automatically use an ordered combination of fixtures."""
+
+
+@pytest.fixture
+async def upstream_server() -> AsyncGenerator[UpstreamServer]:
+    """Run a local upstream server."""
+    upstream = UpstreamServer()
+    async with TestServer(upstream.app) as server:
+        upstream.base_url = str(server.make_url("")).rstrip("/")
+        yield upstream
+
+
+@pytest.fixture
+def upstream_ssl_context(tmp_path: Path) -> ssl.SSLContext:
+    """Get a server SSL context, with a self-signed certificate for 127.0.0.1."""
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "127.0.0.1")])
+    now = datetime.datetime.now(datetime.UTC)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now)
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(
+            x509.SubjectAlternativeName(
+                [x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]
+            ),
+            critical=False,
+        )
+        .sign(key, hashes.SHA256())
+    )
+    certificate_path = tmp_path / "certificate.pem"
+    certificate_path.write_bytes(certificate.public_bytes(serialization.Encoding.PEM))
+    key_path = tmp_path / "key.pem"
+    key_path.write_bytes(
+        key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+    )
+
+    ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    ssl_context.load_cert_chain(certificate_path, key_path)
+    return ssl_context
+
+
+@pytest.fixture
+async def https_upstream_server(
+    upstream_ssl_context: ssl.SSLContext,
+) -> AsyncGenerator[UpstreamServer]:
+    """Run a local upstream server over HTTPS."""
+    upstream = UpstreamServer()
+    server = TestServer(upstream.app)
+    await server.start_server(ssl=upstream_ssl_context)
+    try:
+        upstream.base_url = str(server.make_url("")).rstrip("/")
+        yield upstream
+    finally:
+        await server.close()
+
+
+@pytest.fixture
+def benchmark_results() -> BenchmarkResults:
+    """Get the results that benchmarks are added to."""
+    return _BENCHMARK_RESULTS
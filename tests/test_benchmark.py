@@ -0,0 +1,398 @@
+"""
+Benchmarks of the HASS Web Proxy.
+
+These are skipped unless pytest is run with `--benchmark` (see `scripts/benchmark`).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+import urllib.parse
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import make_mocked_request
+
+from custom_components.hass_web_proxy.const import (
+    CONF_DYNAMIC_URLS,
+    CONF_OPEN_LIMIT,
+    CONF_PROXIED_URLS,
+    CONF_TTL,
+    CONF_URL_ID,
+    CONF_URL_PATTERN,
+    CONF_URL_PATTERN_OPTIONS,
+    CONF_URL_PATTERNS,
+    CONF_WEBSOCKET_COMPRESSION,
+    DOMAIN,
+    SERVICE_CREATE_PROXIED_URL,
+    SERVICE_CREATE_PROXIED_URLS,
+    SERVICE_DELETE_PROXIED_URL,
+)
+from custom_components.hass_web_proxy.proxy import V0ProxyView
+from tests import (
+    UpstreamServer,
+    create_mock_hass_web_proxy_config_entry,
+    setup_mock_hass_web_proxy_config_entry,
+)
+from tests.benchmark import BenchmarkResults, summarize
+
+if TYPE_CHECKING:
+    from homeassistant.core import HomeAssistant
+
+pytestmark = pytest.mark.benchmark
+
+URL_COUNTS = (10, 100, 1000, 10000)
+MATCH_ITERATIONS = 5000
+CHURN_URL_COUNT = 1000
+
+SMALL_BODY = b"x" * 1024
+SMALL_BODY_REQUESTS = 1000
+LARGE_BODY_CHUNK = b"x" * 65536
+LARGE_BODY_CHUNKS = 256
+LARGE_BODY_REQUESTS = 20
+CONCURRENCY = 10
+WEBSOCKET_MESSAGES = 2000
+WEBSOCKET_STREAM_MESSAGE = '{"event": "motion", "camera": "front_door", "score": 0.9}'
+WEBSOCKET_STREAM_MESSAGES = 20000
+# The URL pattern options websocket streams are benchmarked with, by name.
+WEBSOCKET_STREAM_OPTIONS: dict[str, dict[str, Any]] = {
+    "default": {},
+    "compressed": {CONF_WEBSOCKET_COMPRESSION: True},
+}
+
+
+def _get_proxy_path(url: str, *, websocket: bool = False) -> str:
+    """Get the proxy path for a URL."""
+    view = "ws" if websocket else ""
+    return f"/api/hass_web_proxy/v0/{view}?url={urllib.parse.quote_plus(url)}"
+
+
+def _get_url_pattern(index: int, *, shared_host: bool) -> str:
+    """Get a URL pattern, on a host shared with the others or on its own."""
+    if shared_host:
+        return f"http://cameras.local/camera{index}/*"
+    return f"http://camera{index}.local/*"
+
+
+def _get_url(index: int, *, shared_host: bool) -> str:
+    """Get a URL that matches a pattern of `_get_url_pattern`."""
+    return _get_url_pattern(index, shared_host=shared_host).replace("*", "stream")
+
+
+def _get_proxied_url_data(url_id: str, url_pattern: str) -> dict[str, Any]:
+    """
+    Get the data of a dynamic proxied URL that can be opened any number of times.
+
+    The URL never expires, as the default TTL can pass while a benchmark creates
+    many of them.
+    """
+    return {
+        CONF_URL_PATTERN: url_pattern,
+        CONF_URL_ID: url_id,
+        CONF_OPEN_LIMIT: 0,
+        CONF_TTL: 0,
+    }
+
+
+async def _async_create_proxied_url(
+    hass: HomeAssistant, url_id: str, url_pattern: str
+) -> None:
+    """Create a dynamic proxied URL (see `_get_proxied_url_data`)."""
+    await hass.services.async_call(
+        DOMAIN,
+        SERVICE_CREATE_PROXIED_URL,
+        _get_proxied_url_data(url_id, url_pattern),
+        blocking=True,
+    )
+
+
+async def _async_gather_timed(
+    count: int, request: Any, concurrency: int = CONCURRENCY
+) -> tuple[list[float], float]:
+    """Make requests concurrently, returning their durations and the total."""
+    semaphore = asyncio.Semaphore(concurrency)
+    durations: list[float] = []
+
+    async def _async_timed(index: int) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            await request(index)
+            durations.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(_async_timed(index) for index in range(count)))
+    return durations, time.perf_counter() - started
+
+
+@pytest.mark.parametrize("count", URL_COUNTS)
+@pytest.mark.parametrize("source", ["dynamic", "static"])
+@pytest.mark.parametrize("shared_host", [False, True])
+async def test_benchmark_match(
+    hass: HomeAssistant,
+    benchmark_results: BenchmarkResults,
+    count: int,
+    source: str,
+    *,
+    shared_host: bool,
+) -> None:
+    """Benchmark matching requests against many proxied URLs."""
+    url_patterns = [
+        _get_url_pattern(index, shared_host=shared_host) for index in range(count)
+    ]
+    config_entry = create_mock_hass_web_proxy_config_entry(
+        hass,
+        MappingProxyType(
+            {
+                CONF_DYNAMIC_URLS: True,
+                CONF_URL_PATTERNS: url_patterns if source == "static" else [],
+            }
+        ),
+    )
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+    if source == "dynamic":
+        await hass.services.async_call(
+            DOMAIN,
+            SERVICE_CREATE_PROXIED_URLS,
+            {
+                CONF_PROXIED_URLS: [
+                    _get_proxied_url_data(f"url-{index}", url_pattern)
+                    for index, url_pattern in enumerate(url_patterns)
+                ]
+            },
+            blocking=True,
+        )
+
+    view = V0ProxyView(hass, config_entry.runtime_data.session)
+    # Match URLs spread across all the patterns.
+    urls = [
+        _get_url(index * count // MATCH_ITERATIONS, shared_host=shared_host)
+        for index in range(MATCH_ITERATIONS)
+    ]
+    requests = [make_mocked_request("GET", _get_proxy_path(url)) for url in urls]
+
+    durations = []
+    matches = []
+    for request in requests:
+        started = time.perf_counter()
+        matches.append(view._match_proxied_url(request))  # noqa: SLF001
+        durations.append(time.perf_counter() - started)
+    assert [match.proxied_url.url for match in matches] == urls
+
+    host = "shared_host" if shared_host else "distinct_hosts"
+    benchmark_results.add(f"match[{source}-{host}-{count}]", summarize(durations))
+
+
+async def test_benchmark_churn(
+    hass: HomeAssistant, benchmark_results: BenchmarkResults
+) -> None:
+    """Benchmark creating and deleting dynamic proxied URLs."""
+    await setup_mock_hass_web_proxy_config_entry(
+        hass,
+        create_mock_hass_web_proxy_config_entry(
+            hass, MappingProxyType({CONF_DYNAMIC_URLS: True})
+        ),
+    )
+
+    create_durations = []
+    for index in range(CHURN_URL_COUNT):
+        started = time.perf_counter()
+        await _async_create_proxied_url(
+            hass, f"url-{index}", _get_url_pattern(index, shared_host=False)
+        )
+        create_durations.append(time.perf_counter() - started)
+
+    delete_durations = []
+    for index in range(CHURN_URL_COUNT):
+        started = time.perf_counter()
+        await hass.services.async_call(
+            DOMAIN,
+            SERVICE_DELETE_PROXIED_URL,
+            {CONF_URL_ID: f"url-{index}"},
+            blocking=True,
+        )
+        delete_durations.append(time.perf_counter() - started)
+
+    benchmark_results.add("churn[create]", summarize(create_durations))
+    benchmark_results.add("churn[delete]", summarize(delete_durations))
+
+
+async def test_benchmark_http(
+    hass: HomeAssistant,
+    hass_client: Any,
+    upstream_server: UpstreamServer,
+    benchmark_results: BenchmarkResults,
+) -> None:
+    """Benchmark proxying small and large (streamed) HTTP responses."""
+
+    async def _small(_request: web.Request) -> web.Response:
+        return web.Response(body=SMALL_BODY)
+
+    async def _large(request: web.Request) -> web.StreamResponse:
+        response = web.StreamResponse()
+        await response.prepare(request)
+        for _ in range(LARGE_BODY_CHUNKS):
+            await response.write(LARGE_BODY_CHUNK)
+        await response.write_eof()
+        return response
+
+    upstream_server.handlers["/small"] = _small
+    upstream_server.handlers["/large"] = _large
+    config_entry = await setup_mock_hass_web_proxy_config_entry(
+        hass,
+        create_mock_hass_web_proxy_config_entry(
+            hass,
+            MappingProxyType({CONF_URL_PATTERNS: [upstream_server.make_url("/*")]}),
+        ),
+    )
+    authenticated_hass_client = await hass_client()
+
+    async def _request_small(index: int) -> None:
+        # A distinct URL per request, so no request is served from another.
+        resp = await authenticated_hass_client.get(
+            _get_proxy_path(upstream_server.make_url(f"/small?index={index}"))
+        )
+        assert await resp.read() == SMALL_BODY
+
+    async def _request_large(_index: int) -> None:
+        resp = await authenticated_hass_client.get(
+            _get_proxy_path(upstream_server.make_url("/large"))
+        )
+        size = 0
+        async for chunk in resp.content.iter_any():
+            size += len(chunk)
+        assert size == len(LARGE_BODY_CHUNK) * LARGE_BODY_CHUNKS
+
+    durations, elapsed = await _async_gather_timed(SMALL_BODY_REQUESTS, _request_small)
+    benchmark_results.add("http[small]", summarize(durations, elapsed))
+
+    durations, elapsed = await _async_gather_timed(LARGE_BODY_REQUESTS, _request_large)
+    benchmark_results.add(
+        "http[large]",
+        summarize(
+            durations,
+            elapsed,
+            mb_per_sec=LARGE_BODY_REQUESTS
+            * len(LARGE_BODY_CHUNK)
+            * LARGE_BODY_CHUNKS
+            / elapsed
+            / 1e6,
+        ),
+    )
+
+    # Close the client and upstream sessions (and their pooled connections).
+    await authenticated_hass_client.close()
+    assert await hass.config_entries.async_unload(config_entry.entry_id)
+
+
+async def test_benchmark_websocket(
+    hass: HomeAssistant,
+    hass_client: Any,
+    upstream_server: UpstreamServer,
+    benchmark_results: BenchmarkResults,
+) -> None:
+    """Benchmark round trips of websocket messages through the proxy."""
+
+    async def _echo(request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        async for message in ws:
+            await ws.send_str(message.data)
+        return ws
+
+    upstream_server.handlers["/ws"] = _echo
+    await setup_mock_hass_web_proxy_config_entry(
+        hass,
+        create_mock_hass_web_proxy_config_entry(
+            hass,
+            MappingProxyType({CONF_URL_PATTERNS: [upstream_server.make_url("/*")]}),
+        ),
+    )
+    authenticated_hass_client = await hass_client()
+
+    async with authenticated_hass_client.ws_connect(
+        _get_proxy_path(upstream_server.make_url("/ws"), websocket=True)
+    ) as ws:
+        durations = []
+        started = time.perf_counter()
+        for index in range(WEBSOCKET_MESSAGES):
+            sent = time.perf_counter()
+            await ws.send_str(str(index))
+            message = await ws.receive()
+            durations.append(time.perf_counter() - sent)
+            assert message.type == aiohttp.WSMsgType.TEXT
+        elapsed = time.perf_counter() - started
+
+    benchmark_results.add("websocket[echo]", summarize(durations, elapsed))
+
+
+@pytest.mark.parametrize("name", list(WEBSOCKET_STREAM_OPTIONS))
+async def test_benchmark_websocket_throughput(
+    hass: HomeAssistant,
+    hass_client: Any,
+    upstream_server: UpstreamServer,
+    benchmark_results: BenchmarkResults,
+    name: str,
+) -> None:
+    """Benchmark streams of small websocket messages through the proxy."""
+    pattern_options = WEBSOCKET_STREAM_OPTIONS[name]
+
+    async def _echo(request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        async for message in ws:
+            await ws.send_str(message.data)
+        return ws
+
+    upstream_server.handlers["/ws"] = _echo
+    url = upstream_server.make_url("/ws")
+    await setup_mock_hass_web_proxy_config_entry(
+        hass,
+        create_mock_hass_web_proxy_config_entry(
+            hass,
+            MappingProxyType(
+                {
+                    CONF_URL_PATTERNS: [url],
+                    CONF_URL_PATTERN_OPTIONS: {url: pattern_options},
+                }
+            ),
+        ),
+    )
+    authenticated_hass_client = await hass_client()
+    compress = 15 if pattern_options.get(CONF_WEBSOCKET_COMPRESSION) else 0
+
+    async with authenticated_hass_client.ws_connect(
+        _get_proxy_path(url, websocket=True), compress=compress
+    ) as ws:
+        sent: list[float] = []
+
+        async def _async_send() -> None:
+            # Messages are sent without waiting for their echoes, as a feed would.
+            for _ in range(WEBSOCKET_STREAM_MESSAGES):
+                sent.append(time.perf_counter())
+                await ws.send_str(WEBSOCKET_STREAM_MESSAGE)
+
+        durations = []
+        started = time.perf_counter()
+        send_task = asyncio.create_task(_async_send())
+        for index in range(WEBSOCKET_STREAM_MESSAGES):
+            message = await ws.receive()
+            durations.append(time.perf_counter() - sent[index])
+            assert message.type == aiohttp.WSMsgType.TEXT
+        elapsed = time.perf_counter() - started
+        await send_task
+
+    benchmark_results.add(
+        f"websocket_throughput[{name}]",
+        summarize(
+            durations,
+            elapsed,
+            mb_per_sec=WEBSOCKET_STREAM_MESSAGES
+            * len(WEBSOCKET_STREAM_MESSAGE)
+            / elapsed
+            / 1e6,
+        ),
+    )
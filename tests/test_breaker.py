@@ -0,0 +1,185 @@
+"""Test the HASS Web Proxy circuit breaker and upstream timeouts."""
+
+from __future__ import annotations
+
+import asyncio
+import datetime
+import urllib.parse
+from http import HTTPStatus
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any
+from unittest.mock import Mock
+
+import aiohttp
+import pytest
+from aiohttp import web
+from yarl import URL
+
+from custom_components.hass_web_proxy.breaker import CircuitBreaker, get_host_key
+from custom_components.hass_web_proxy.const import (
+    CONF_CIRCUIT_BREAKER_COOLDOWN,
+    CONF_CIRCUIT_BREAKER_THRESHOLD,
+    CONF_CONNECT_TIMEOUT,
+    CONF_DYNAMIC_URLS,
+    CONF_READ_TIMEOUT,
+    CONF_URL_ID,
+    CONF_URL_PATTERN,
+    CONF_URL_PATTERN_OPTIONS,
+    CONF_URL_PATTERNS,
+    DOMAIN,
+    SERVICE_CREATE_PROXIED_URL,
+)
+from custom_components.hass_web_proxy.upstream import get_upstream_timeout
+from tests import (
+    UpstreamServer,
+    create_mock_hass_web_proxy_config_entry,
+    setup_mock_hass_web_proxy_config_entry,
+)
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from homeassistant.core import HomeAssistant
+
+
+def test_get_host_key() -> None:
+    """Test that circuits are kept per host and port."""
+    assert get_host_key(URL("http://camera/stream")) == "camera:80"
+    assert get_host_key(URL("https://camera:8443/")) == "camera:8443"
+
+
+@pytest.mark.freeze_time
+def test_circuit_breaker(freezer: Any) -> None:
+    """Test that a circuit opens, then lets a single probe through."""
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=30)
+
+    breaker.record_failure("camera:80")
+    assert breaker.allow("camera:80")
+    assert breaker.get_stats()["hosts"] == {
+        "camera:80": {"state": "closed", "failures": 1}
+    }
+
+    breaker.record_failure("camera:80")
+    assert not breaker.allow("camera:80")
+    assert breaker.allow("other:80")
+    assert breaker.get_stats()["hosts"]["camera:80"]["state"] == "open"
+
+    freezer.tick(datetime.timedelta(seconds=30))
+    assert breaker.get_stats()["hosts"]["camera:80"]["state"] == "half_open"
+    assert breaker.allow("camera:80")
+    assert not breaker.allow("camera:80")
+
+    # A failed probe reopens the circuit.
+    breaker.record_failure("camera:80")
+    assert not breaker.allow("camera:80")
+
+    # A probe that never finishes is retried after another cooldown.
+    freezer.tick(datetime.timedelta(seconds=30))
+    assert breaker.allow("camera:80")
+    freezer.tick(datetime.timedelta(seconds=30))
+    assert breaker.allow("camera:80")
+
+    # A successful probe closes the circuit.
+    breaker.record_success("camera:80")
+    breaker.record_success("other:80")
+    assert breaker.allow("camera:80")
+    assert breaker.get_stats() == {"hosts": {}, "rejected": 3}
+
+
+def test_get_upstream_timeout() -> None:
+    """Test that per-URL timeouts override the session's."""
+    session = Mock(
+        timeout=aiohttp.ClientTimeout(total=30, sock_connect=5, sock_read=10)
+    )
+    assert get_upstream_timeout(session, None, None) is None
+    assert get_upstream_timeout(session, 1, None) == aiohttp.ClientTimeout(
+        total=30, sock_connect=1, sock_read=10
+    )
+    assert get_upstream_timeout(session, None, 2) == aiohttp.ClientTimeout(
+        total=None, sock_connect=5, sock_read=2
+    )
+
+
+async def test_proxy_view_circuit_breaker(
+    hass: HomeAssistant,
+    hass_client: Any,
+    unused_tcp_port_factory: Callable[[], int],
+) -> None:
+    """Test that requests to an unreachable host fail fast once its circuit opens."""
+    unreachable_url = f"http://127.0.0.1:{unused_tcp_port_factory()}/unreachable"
+    config_entry = create_mock_hass_web_proxy_config_entry(
+        hass,
+        MappingProxyType(
+            {
+                CONF_URL_PATTERNS: [unreachable_url],
+                CONF_CIRCUIT_BREAKER_THRESHOLD: 1,
+                CONF_CIRCUIT_BREAKER_COOLDOWN: 60,
+            }
+        ),
+    )
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+    breaker = config_entry.runtime_data.circuit_breaker
+    assert breaker is not None
+
+    client = await hass_client()
+    url = f"/api/hass_web_proxy/v0/?url={urllib.parse.quote_plus(unreachable_url)}"
+    for _ in range(2):
+        resp = await client.get(url)
+        assert resp.status == HTTPStatus.BAD_GATEWAY
+
+    stats = breaker.get_stats()
+    assert stats["hosts"][get_host_key(URL(unreachable_url))]["state"] == "open"
+    assert stats["rejected"] == 1
+
+
+async def test_proxy_view_timeouts(
+    hass: HomeAssistant,
+    hass_client: Any,
+    upstream_server: UpstreamServer,
+) -> None:
+    """Test that per-URL timeouts are applied to upstream requests."""
+
+    async def _slow(_request: web.Request) -> web.Response:
+        await asyncio.sleep(1)
+        return web.Response(body=b"slow")
+
+    async def _ok(_request: web.Request) -> web.Response:
+        return web.Response(body=b"ok")
+
+    upstream_server.handlers["/slow"] = _slow
+    upstream_server.handlers["/ok"] = _ok
+    ok_url = upstream_server.make_url("/ok")
+    config_entry = create_mock_hass_web_proxy_config_entry(
+        hass,
+        MappingProxyType(
+            {
+                CONF_DYNAMIC_URLS: True,
+                CONF_URL_PATTERNS: [ok_url],
+                CONF_URL_PATTERN_OPTIONS: {ok_url: {CONF_CONNECT_TIMEOUT: 5}},
+            }
+        ),
+    )
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+    await hass.services.async_call(
+        DOMAIN,
+        SERVICE_CREATE_PROXIED_URL,
+        {
+            CONF_URL_PATTERN: upstream_server.make_url("/slow"),
+            CONF_URL_ID: "slow",
+            CONF_READ_TIMEOUT: 0.05,
+        },
+        blocking=True,
+    )
+
+    client = await hass_client()
+    resp = await client.get(
+        f"/api/hass_web_proxy/v0/?url={urllib.parse.quote_plus(ok_url)}"
+    )
+    assert resp.status == HTTPStatus.OK
+    assert await resp.read() == b"ok"
+
+    slow_url = upstream_server.make_url("/slow")
+    resp = await client.get(
+        f"/api/hass_web_proxy/v0/?url={urllib.parse.quote_plus(slow_url)}"
+    )
+    assert resp.status == HTTPStatus.BAD_GATEWAY
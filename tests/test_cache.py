@@ -0,0 +1,748 @@
+"""Test the HASS Web Proxy response cache."""
+
+from __future__ import annotations
+
+import asyncio
+import datetime
+import urllib.parse
+from http import HTTPStatus
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any
+
+import pytest
+from aiohttp import hdrs, web
+from multidict import CIMultiDict
+
+from custom_components.hass_web_proxy.cache import (
+    ResponseCache,
+    get_cache_ttl,
+    get_stale_ttl,
+    get_validators,
+    is_not_modified,
+    is_request_cacheable,
+    normalize_url,
+)
+from custom_components.hass_web_proxy.const import (
+    CONF_CACHE_TTL,
+    CONF_REQUEST_LIMIT_PER_HOST,
+    CONF_REQUEST_QUEUE_SIZE,
+    CONF_RESPONSE_CACHE_MAX_ENTRY_SIZE,
+    CONF_RESPONSE_CACHE_SIZE,
+    CONF_RESPONSE_CACHE_STALE_WHILE_REVALIDATE,
+    CONF_URL_PATTERN_OPTIONS,
+    CONF_URL_PATTERNS,
+)
+from custom_components.hass_web_proxy.upstream import BufferedResponse
+from tests import (
+    UpstreamServer,
+    create_mock_hass_web_proxy_config_entry,
+    setup_mock_hass_web_proxy_config_entry,
+)
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable
+
+    from homeassistant.core import HomeAssistant
+
+# The number of times each URL is requested.
+REQUEST_COUNT = 3
+
+
+ETAG = '"v1"'
+
+
+def _create_response(
+    body: bytes = b"body",
+    headers: dict[str, str] | None = None,
+    status: int = HTTPStatus.OK,
+) -> BufferedResponse:
+    """Create a buffered response."""
+    return BufferedResponse(
+        status=status, headers=CIMultiDict(headers or {}), body=body
+    )
+
+
+def test_normalize_url() -> None:
+    """Test normalizing a URL."""
+    assert normalize_url("HTTP://Cam.Example.com/a#fragment") == (
+        "http://cam.example.com/a"
+    )
+    assert normalize_url("http://[invalid") == "http://[invalid"
+
+
+@pytest.mark.parametrize(
+    ("headers", "expected"),
+    [
+        ({}, True),
+        ({hdrs.CACHE_CONTROL: "max-age=0"}, True),
+        ({hdrs.CACHE_CONTROL: "no-cache"}, False),
+        ({hdrs.CACHE_CONTROL: "no-store"}, False),
+        ({hdrs.RANGE: "bytes=0-10"}, False),
+    ],
+)
+def test_is_request_cacheable(*, headers: dict[str, str], expected: bool) -> None:
+    """Test whether requests may be answered from the cache."""
+    assert is_request_cacheable(headers) == expected
+
+
+@pytest.mark.parametrize(
+    ("status", "headers", "ttl_override", "expected"),
+    [
+        (HTTPStatus.OK, {}, None, 0),
+        (HTTPStatus.NOT_FOUND, {hdrs.CACHE_CONTROL: "max-age=60"}, None, 0),
+        (HTTPStatus.OK, {hdrs.CACHE_CONTROL: "max-age=60"}, None, 60),
+        (HTTPStatus.OK, {hdrs.CACHE_CONTROL: "max-age=60, s-maxage=30"}, None, 30),
+        (HTTPStatus.OK, {hdrs.CACHE_CONTROL: "max-age=invalid"}, None, 0),
+        (HTTPStatus.OK, {hdrs.CACHE_CONTROL: "max-age=60"}, 0, 0),
+        (HTTPStatus.OK, {}, 10, 10),
+        (HTTPStatus.OK, {hdrs.CACHE_CONTROL: "no-cache"}, None, 0),
+        (HTTPStatus.OK, {hdrs.CACHE_CONTROL: "no-cache"}, 10, 10),
+        (HTTPStatus.OK, {hdrs.CACHE_CONTROL: "no-store"}, 10, 0),
+        (HTTPStatus.OK, {hdrs.CACHE_CONTROL: "private, max-age=60"}, None, 0),
+        (
+            HTTPStatus.OK,
+            {hdrs.SET_COOKIE: "a=b", hdrs.CACHE_CONTROL: "max-age=60"},
+            None,
+            0,
+        ),
+        (
+            HTTPStatus.OK,
+            {hdrs.VARY: "Cookie", hdrs.CACHE_CONTROL: "max-age=60"},
+            None,
+            0,
+        ),
+        (
+            HTTPStatus.OK,
+            {hdrs.VARY: "Accept-Encoding", hdrs.CACHE_CONTROL: "max-age=60"},
+            None,
+            60,
+        ),
+        (
+            HTTPStatus.OK,
+            {hdrs.CONTENT_TYPE: "multipart/x-mixed-replace; boundary=a"},
+            10,
+            0,
+        ),
+        (
+            HTTPStatus.OK,
+            {
+                hdrs.DATE: "Wed, 21 Oct 2015 07:28:00 GMT",
+                hdrs.EXPIRES: "Wed, 21 Oct 2015 07:29:00 GMT",
+            },
+            None,
+            60,
+        ),
+        (HTTPStatus.OK, {hdrs.EXPIRES: "invalid"}, None, 0),
+    ],
+)
+def test_get_cache_ttl(
+    status: int,
+    headers: dict[str, str],
+    ttl_override: int | None,
+    expected: float,
+) -> None:
+    """Test getting the lifetime of a response."""
+    assert get_cache_ttl(status, headers, ttl_override) == expected
+
+
+@pytest.mark.parametrize(
+    ("headers", "default", "expected"),
+    [
+        ({}, 0, 0),
+        ({}, 30, 30),
+        ({hdrs.CACHE_CONTROL: "max-age=10, stale-while-revalidate=60"}, 30, 60),
+        ({hdrs.CACHE_CONTROL: "stale-while-revalidate=invalid"}, 30, 0),
+    ],
+)
+def test_get_stale_ttl(headers: dict[str, str], default: int, expected: int) -> None:
+    """Test getting how long a response may be served stale."""
+    assert get_stale_ttl(headers, default) == expected
+
+
+@pytest.mark.parametrize(
+    ("request_headers", "response_headers", "expected"),
+    [
+        ({}, {hdrs.ETAG: ETAG}, False),
+        ({hdrs.IF_NONE_MATCH: ETAG}, {hdrs.ETAG: ETAG}, True),
+        ({hdrs.IF_NONE_MATCH: f'"v0", W/{ETAG}'}, {hdrs.ETAG: ETAG}, True),
+        ({hdrs.IF_NONE_MATCH: "*"}, {hdrs.ETAG: ETAG}, True),
+        ({hdrs.IF_NONE_MATCH: '"v0"'}, {hdrs.ETAG: ETAG}, False),
+        ({hdrs.IF_NONE_MATCH: ETAG}, {}, False),
+        (
+            {hdrs.IF_MODIFIED_SINCE: "Wed, 21 Oct 2015 07:28:00 GMT"},
+            {hdrs.LAST_MODIFIED: "Wed, 21 Oct 2015 07:28:00 GMT"},
+            True,
+        ),
+        (
+            {hdrs.IF_MODIFIED_SINCE: "Wed, 21 Oct 2015 07:28:00 GMT"},
+            {hdrs.LAST_MODIFIED: "Wed, 21 Oct 2015 07:29:00 GMT"},
+            False,
+        ),
+        (
+            {hdrs.IF_MODIFIED_SINCE: "Wed, 21 Oct 2015 07:28:00 GMT"},
+            {},
+            False,
+        ),
+    ],
+)
+def test_is_not_modified(
+    *,
+    request_headers: dict[str, str],
+    response_headers: dict[str, str],
+    expected: bool,
+) -> None:
+    """Test matching conditional requests against a response."""
+    assert is_not_modified(request_headers, response_headers) == expected
+
+
+@pytest.mark.parametrize(
+    ("headers", "expected"),
+    [
+        ({}, {}),
+        ({hdrs.ETAG: ETAG}, {hdrs.IF_NONE_MATCH: ETAG}),
+        (
+            {hdrs.ETAG: ETAG, hdrs.LAST_MODIFIED: "Wed, 21 Oct 2015 07:28:00 GMT"},
+            {
+                hdrs.IF_NONE_MATCH: ETAG,
+                hdrs.IF_MODIFIED_SINCE: "Wed, 21 Oct 2015 07:28:00 GMT",
+            },
+        ),
+    ],
+)
+def test_get_validators(headers: dict[str, str], expected: dict[str, str]) -> None:
+    """Test getting the headers that revalidate a response."""
+    assert get_validators(headers) == expected
+
+
+def test_response_cache_lru_eviction() -> None:
+    """Test that the least recently used responses are evicted."""
+    cache = ResponseCache(max_size=10, max_entry_size=10)
+
+    assert cache.put("a", _create_response(b"aaaa"), 60)
+    assert cache.put("b", _create_response(b"bbbb"), 60)
+    assert cache.get("a")
+
+    assert cache.put("c", _create_response(b"cccc"), 60)
+    assert cache.get("a")
+    assert cache.get("b") is None
+    assert cache.get("c")
+    assert len(cache) == len(["a", "c"])
+
+    assert cache.get_stats() == {
+        "entries": 2,
+        "size": 8,
+        "max_size": 10,
+        "hits": 3,
+        "misses": 1,
+        "evictions": 1,
+        "revalidated": 0,
+        "stale_hits": 0,
+    }
+
+
+def test_response_cache_rejects_uncacheable() -> None:
+    """Test that oversized or already expired responses are not cached."""
+    cache = ResponseCache(max_size=100, max_entry_size=4)
+
+    assert not cache.put("large", _create_response(b"large"), 60)
+    assert not cache.put("expired", _create_response(), 0)
+    assert not len(cache)
+
+
+@pytest.mark.freeze_time
+def test_response_cache_expiry(freezer: Any) -> None:
+    """Test that expired responses are not returned."""
+    now = datetime.datetime.now(tz=datetime.UTC)
+    cache = ResponseCache(max_size=100, max_entry_size=100)
+    cache.put("key", _create_response(), 10)
+
+    freezer.move_to(now + datetime.timedelta(seconds=11))
+    assert cache.get("key") is None
+    assert not len(cache)
+
+
+def test_response_cache_update() -> None:
+    """Test that 304 responses refresh the cached response they revalidate."""
+    cache = ResponseCache(max_size=100, max_entry_size=40)
+    not_modified = _create_response(
+        b"",
+        {hdrs.CACHE_CONTROL: "max-age=60", hdrs.CONTENT_LENGTH: "0"},
+        HTTPStatus.NOT_MODIFIED,
+    )
+    assert cache.update("key", not_modified) is None
+
+    # Responses with validators are cached (to be revalidated) even once stale.
+    assert cache.update("key", _create_response(headers={hdrs.ETAG: ETAG}))
+    entry = cache.get("key")
+    assert entry is not None
+    assert not entry.is_fresh()
+    assert entry.validators == {hdrs.IF_NONE_MATCH: ETAG}
+
+    entry = cache.update("key", not_modified)
+    assert entry is not None
+    assert entry.is_fresh()
+    assert entry.response.body == b"body"
+    assert entry.response.headers[hdrs.ETAG] == ETAG
+    assert entry.response.headers[hdrs.CACHE_CONTROL] == "max-age=60"
+    assert hdrs.CONTENT_LENGTH not in entry.response.headers
+
+    assert cache.update("key", _create_response(b"x" * 40, {hdrs.ETAG: ETAG})) is None
+    assert cache.update("other", _create_response(headers={hdrs.ETAG: ETAG}))
+    not_found = _create_response(status=HTTPStatus.NOT_FOUND)
+    assert cache.update("other", not_found) is None
+    assert not len(cache)
+    assert cache.get_stats()["revalidated"] == 1
+
+
+@pytest.mark.freeze_time
+def test_response_cache_stale(freezer: Any) -> None:
+    """Test that stale responses are served within their stale window."""
+    now = datetime.datetime.now(tz=datetime.UTC)
+    cache = ResponseCache(max_size=100, max_entry_size=100, stale_ttl=10)
+    cache.update("key", _create_response(headers={hdrs.CACHE_CONTROL: "max-age=10"}))
+
+    freezer.move_to(now + datetime.timedelta(seconds=15))
+    entry = cache.get("key")
+    assert entry is not None
+    assert not entry.is_fresh()
+    assert entry.is_usable_stale()
+
+    freezer.move_to(now + datetime.timedelta(seconds=21))
+    assert cache.get("key") is None
+    assert cache.get_stats()["stale_hits"] == 1
+
+
+async def test_proxy_view_response_cache(
+    hass: HomeAssistant,
+    hass_client: Any,
+    upstream_server: UpstreamServer,
+) -> None:
+    """Test that cacheable responses are served from the cache."""
+
+    async def _snapshot(_request: web.Request) -> web.Response:
+        return web.Response(
+            body=b"snapshot",
+            content_type="image/jpeg",
+            headers={hdrs.CACHE_CONTROL: "max-age=60"},
+        )
+
+    async def _large(_request: web.Request) -> web.Response:
+        return web.Response(
+            body=b"x" * 2048, headers={hdrs.CACHE_CONTROL: "max-age=60"}
+        )
+
+    async def _chunked(request: web.Request) -> web.StreamResponse:
+        # Without a Content-Length, the body is only found to be too large to
+        # cache once read.
+        response = web.StreamResponse(headers={hdrs.CACHE_CONTROL: "max-age=60"})
+        response.enable_chunked_encoding()
+        await response.prepare(request)
+        await response.write(b"x" * 2048)
+        await response.write_eof()
+        return response
+
+    async def _override(_request: web.Request) -> web.Response:
+        return web.Response(body=b"override")
+
+    upstream_server.handlers["/snapshot.jpg"] = _snapshot
+    upstream_server.handlers["/large"] = _large
+    upstream_server.handlers["/chunked"] = _chunked
+    upstream_server.handlers["/override"] = _override
+
+    config_entry = create_mock_hass_web_proxy_config_entry(
+        hass,
+        MappingProxyType(
+            {
+                CONF_URL_PATTERNS: [
+                    upstream_server.make_url("/snapshot.jpg"),
+                    upstream_server.make_url("/large"),
+                    upstream_server.make_url("/chunked"),
+                    upstream_server.make_url("/override"),
+                ],
+                CONF_URL_PATTERN_OPTIONS: {
+                    upstream_server.make_url("/override"): {CONF_CACHE_TTL: 60},
+                },
+                CONF_RESPONSE_CACHE_SIZE: 1,
+                CONF_RESPONSE_CACHE_MAX_ENTRY_SIZE: 1,
+            }
+        ),
+    )
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+    authenticated_hass_client = await hass_client()
+
+    for path, body in (
+        ("/snapshot.jpg", b"snapshot"),
+        ("/large", b"x" * 2048),
+        ("/chunked", b"x" * 2048),
+        ("/override", b"override"),
+    ):
+        for _ in range(REQUEST_COUNT):
+            resp = await authenticated_hass_client.get(
+                "/api/hass_web_proxy/v0/"
+                f"?url={urllib.parse.quote_plus(upstream_server.make_url(path))}"
+            )
+            assert resp.status == HTTPStatus.OK
+            assert await resp.read() == body
+
+    assert upstream_server.get_request_count("/snapshot.jpg") == 1
+    assert upstream_server.get_request_count("/large") == REQUEST_COUNT
+    assert upstream_server.get_request_count("/chunked") == REQUEST_COUNT
+    assert upstream_server.get_request_count("/override") == 1
+
+    # Requests that refuse cached responses always go upstream.
+    request_count = upstream_server.get_request_count("/snapshot.jpg")
+    resp = await authenticated_hass_client.get(
+        "/api/hass_web_proxy/v0/"
+        f"?url={urllib.parse.quote_plus(upstream_server.make_url('/snapshot.jpg'))}",
+        headers={hdrs.CACHE_CONTROL: "no-cache"},
+    )
+    assert resp.status == HTTPStatus.OK
+    assert upstream_server.get_request_count("/snapshot.jpg") == request_count + 1
+
+
+async def test_proxy_view_response_cache_cors(
+    hass: HomeAssistant,
+    hass_client: Any,
+    upstream_server: UpstreamServer,
+) -> None:
+    """Test that upstream CORS headers are replaced by Home Assistant's."""
+    origin = "https://cast.home-assistant.io"
+
+    async def _cors(_request: web.Request) -> web.Response:
+        return web.Response(
+            body=b"body",
+            headers={
+                hdrs.ACCESS_CONTROL_ALLOW_ORIGIN: "*",
+                hdrs.ACCESS_CONTROL_ALLOW_CREDENTIALS: "true",
+                hdrs.ACCESS_CONTROL_EXPOSE_HEADERS: "X-Upstream",
+                hdrs.CACHE_CONTROL: "max-age=60",
+            },
+        )
+
+    upstream_server.handlers["/cors"] = _cors
+    url = upstream_server.make_url("/cors")
+    cache = await _setup_response_cache(hass, url)
+    authenticated_hass_client = await hass_client()
+
+    for _ in range(2):
+        resp = await authenticated_hass_client.get(
+            f"/api/hass_web_proxy/v0/?url={urllib.parse.quote_plus(url)}",
+            headers={hdrs.ORIGIN: origin},
+        )
+        assert resp.status == HTTPStatus.OK
+        assert await resp.read() == b"body"
+        assert resp.headers[hdrs.ACCESS_CONTROL_ALLOW_ORIGIN] == origin
+        assert hdrs.ACCESS_CONTROL_EXPOSE_HEADERS not in resp.headers
+    assert cache.get_stats()["hits"] == 1
+
+
+@pytest.mark.parametrize("response_cache_size", [0, 1])
+async def test_proxy_view_forwarded_headers(
+    hass: HomeAssistant,
+    hass_client: Any,
+    upstream_server: UpstreamServer,
+    response_cache_size: int,
+) -> None:
+    """Test that upstreams get the same X-Forwarded headers, cached or not."""
+    upstream_server.handlers["/ui.js"] = _make_etag_handler([b"v1"], "no-cache")
+    url = upstream_server.make_url("/ui.js")
+    config_entry = create_mock_hass_web_proxy_config_entry(
+        hass,
+        MappingProxyType(
+            {CONF_URL_PATTERNS: [url], CONF_RESPONSE_CACHE_SIZE: response_cache_size}
+        ),
+    )
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+    authenticated_hass_client = await hass_client()
+
+    for _ in range(REQUEST_COUNT):
+        resp = await authenticated_hass_client.get(
+            f"/api/hass_web_proxy/v0/?url={urllib.parse.quote_plus(url)}"
+        )
+        assert await resp.read() == b"v1"
+
+    # Cached responses are revalidated, so every request goes upstream.
+    assert len(upstream_server.requests) == REQUEST_COUNT
+    for request in upstream_server.requests:
+        assert request.headers[hdrs.X_FORWARDED_FOR] == "127.0.0.1"
+        assert request.headers[hdrs.X_FORWARDED_HOST] == resp.url.raw_authority
+        assert request.headers[hdrs.X_FORWARDED_PROTO] == "http"
+
+
+async def test_proxy_view_response_cache_upstream_error(
+    hass: HomeAssistant,
+    hass_client: Any,
+    unused_tcp_port_factory: Any,
+) -> None:
+    """Test that an unreachable upstream results in a bad gateway."""
+    url = f"http://127.0.0.1:{unused_tcp_port_factory()}/snapshot.jpg"
+    config_entry = create_mock_hass_web_proxy_config_entry(
+        hass,
+        MappingProxyType({CONF_URL_PATTERNS: [url], CONF_RESPONSE_CACHE_SIZE: 1}),
+    )
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+
+    authenticated_hass_client = await hass_client()
+    resp = await authenticated_hass_client.get(
+        f"/api/hass_web_proxy/v0/?url={urllib.parse.quote_plus(url)}"
+    )
+    assert resp.status == HTTPStatus.BAD_GATEWAY
+
+
+def _make_etag_handler(
+    bodies: list[bytes], cache_control: str
+) -> Callable[[web.Request], Awaitable[web.Response]]:
+    """Create an upstream handler that serves the last body, and honors ETags."""
+
+    async def _handler(request: web.Request) -> web.Response:
+        etag = f'"{len(bodies)}"'
+        headers = {hdrs.ETAG: etag, hdrs.CACHE_CONTROL: cache_control}
+        if request.headers.get(hdrs.IF_NONE_MATCH) == etag:
+            return web.Response(status=HTTPStatus.NOT_MODIFIED, headers=headers)
+        return web.Response(body=bodies[-1], headers=headers)
+
+    return _handler
+
+
+async def _setup_response_cache(
+    hass: HomeAssistant, url: str, **options: Any
+) -> ResponseCache:
+    """Set up the integration with the response cache enabled."""
+    config_entry = create_mock_hass_web_proxy_config_entry(
+        hass,
+        MappingProxyType(
+            {CONF_URL_PATTERNS: [url], CONF_RESPONSE_CACHE_SIZE: 1, **options}
+        ),
+    )
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+    cache = config_entry.runtime_data.response_cache
+    assert cache is not None
+    return cache
+
+
+async def test_proxy_view_response_cache_revalidation(
+    hass: HomeAssistant,
+    hass_client: Any,
+    upstream_server: UpstreamServer,
+) -> None:
+    """Test that stale responses are revalidated, and clients sent 304s."""
+    bodies = [b"v1"]
+    upstream_server.handlers["/ui.js"] = _make_etag_handler(bodies, "no-cache")
+    url = upstream_server.make_url("/ui.js")
+    cache = await _setup_response_cache(hass, url)
+    path = f"/api/hass_web_proxy/v0/?url={urllib.parse.quote_plus(url)}"
+    authenticated_hass_client = await hass_client()
+
+    # The client's own validators are replaced, so the response can be cached.
+    resp = await authenticated_hass_client.get(
+        path, headers={hdrs.IF_NONE_MATCH: '"0"'}
+    )
+    assert resp.status == HTTPStatus.OK
+    assert await resp.read() == b"v1"
+    assert hdrs.IF_NONE_MATCH not in upstream_server.requests[-1].headers
+
+    resp = await authenticated_hass_client.get(path)
+    assert resp.status == HTTPStatus.OK
+    assert await resp.read() == b"v1"
+    assert upstream_server.requests[-1].headers[hdrs.IF_NONE_MATCH] == '"1"'
+
+    resp = await authenticated_hass_client.get(
+        path, headers={hdrs.IF_NONE_MATCH: '"1"'}
+    )
+    assert resp.status == HTTPStatus.NOT_MODIFIED
+    assert resp.headers[hdrs.ETAG] == '"1"'
+    assert cache.get_stats()["revalidated"] == sum(
+        hdrs.IF_NONE_MATCH in request.headers for request in upstream_server.requests
+    )
+
+    bodies.append(b"v2")
+    request_count = upstream_server.get_request_count("/ui.js")
+    resp = await authenticated_hass_client.get(
+        path, headers={hdrs.IF_NONE_MATCH: '"1"'}
+    )
+    assert resp.status == HTTPStatus.OK
+    assert await resp.read() == b"v2"
+    assert upstream_server.get_request_count("/ui.js") == request_count + 1
+
+
+async def test_proxy_view_response_cache_stale_while_revalidate(
+    hass: HomeAssistant,
+    hass_client: Any,
+    upstream_server: UpstreamServer,
+) -> None:
+    """Test that stale responses are served while revalidated in the background."""
+    bodies = [b"v1"]
+    upstream_server.handlers["/ui.js"] = _make_etag_handler(bodies, "max-age=0")
+    url = upstream_server.make_url("/ui.js")
+    cache = await _setup_response_cache(
+        hass, url, **{CONF_RESPONSE_CACHE_STALE_WHILE_REVALIDATE: 60}
+    )
+    path = f"/api/hass_web_proxy/v0/?url={urllib.parse.quote_plus(url)}"
+    authenticated_hass_client = await hass_client()
+
+    async def _get(body: bytes, count: int) -> None:
+        resp = await authenticated_hass_client.get(path)
+        assert resp.status == HTTPStatus.OK
+        assert await resp.read() == body
+        await hass.async_block_till_done(wait_background_tasks=True)
+        assert upstream_server.get_request_count("/ui.js") == count
+
+    await _get(b"v1", 1)
+    await _get(b"v1", 2)
+    assert cache.get_stats()["revalidated"] == 1
+
+    bodies.append(b"v2")
+    await _get(b"v1", 3)
+    await _get(b"v2", 4)
+    # Every request after the first was served stale.
+    assert cache.get_stats()["stale_hits"] == len(upstream_server.requests) - 1
+
+    # Responses that can no longer be cached are forgotten.
+    bodies.append(b"x" * 2 * 1024 * 1024)
+    await _get(b"v2", 5)
+    assert not len(cache)
+
+    # Failed revalidations leave the stale response in place.
+    bodies[-1] = b"v3"
+    await _get(b"v3", 6)
+
+    async def _disconnect(request: web.Request) -> web.Response:
+        assert request.transport
+        request.transport.close()
+        return web.Response()
+
+    upstream_server.handlers["/ui.js"] = _disconnect
+    request_count = upstream_server.get_request_count("/ui.js")
+    resp = await authenticated_hass_client.get(path)
+    assert await resp.read() == b"v3"
+    await hass.async_block_till_done(wait_background_tasks=True)
+    # aiohttp may retry the request once, on a reused (disconnected) connection.
+    assert upstream_server.get_request_count("/ui.js") > request_count
+    assert len(cache) == 1
+
+    # Including those only found to be too large once read.
+    async def _chunked(request: web.Request) -> web.StreamResponse:
+        response = web.StreamResponse(headers={hdrs.CACHE_CONTROL: "max-age=0"})
+        response.enable_chunked_encoding()
+        await response.prepare(request)
+        await response.write(b"x" * 2 * 1024 * 1024)
+        await response.write_eof()
+        return response
+
+    upstream_server.handlers["/ui.js"] = _chunked
+    resp = await authenticated_hass_client.get(path)
+    assert await resp.read() == b"v3"
+    await hass.async_block_till_done(wait_background_tasks=True)
+    assert not len(cache)
+
+
+async def test_proxy_view_response_cache_revalidated_once(
+    hass: HomeAssistant,
+    hass_client: Any,
+    upstream_server: UpstreamServer,
+) -> None:
+    """Test that a stale response is only revalidated once at a time."""
+    release = asyncio.Event()
+    etag_handler = _make_etag_handler([b"v1"], "max-age=0")
+
+    async def _slow(request: web.Request) -> web.Response:
+        if request.headers.get(hdrs.IF_NONE_MATCH):
+            await release.wait()
+        return await etag_handler(request)
+
+    upstream_server.handlers["/ui.js"] = _slow
+    url = upstream_server.make_url("/ui.js")
+    await _setup_response_cache(
+        hass, url, **{CONF_RESPONSE_CACHE_STALE_WHILE_REVALIDATE: 60}
+    )
+    path = f"/api/hass_web_proxy/v0/?url={urllib.parse.quote_plus(url)}"
+    authenticated_hass_client = await hass_client()
+
+    for _ in range(REQUEST_COUNT):
+        resp = await authenticated_hass_client.get(path)
+        assert await resp.read() == b"v1"
+    release.set()
+    await hass.async_block_till_done(wait_background_tasks=True)
+    # One request filled the cache, and one revalidated it.
+    assert [
+        hdrs.IF_NONE_MATCH in request.headers for request in upstream_server.requests
+    ] == [False, True]
+
+
+async def test_proxy_view_response_cache_revalidation_request_limit(
+    hass: HomeAssistant,
+    hass_client: Any,
+    upstream_server: UpstreamServer,
+) -> None:
+    """Test that background revalidations count against the host's limit."""
+    started = asyncio.Event()
+    release = asyncio.Event()
+    etag_handler = _make_etag_handler([b"v1"], "max-age=0")
+
+    async def _slow(request: web.Request) -> web.Response:
+        if request.headers.get(hdrs.IF_NONE_MATCH):
+            started.set()
+            await release.wait()
+        return await etag_handler(request)
+
+    upstream_server.handlers["/ui.js"] = _slow
+    upstream_server.handlers["/other.js"] = etag_handler
+    url = upstream_server.make_url("/ui.js")
+    await _setup_response_cache(
+        hass,
+        upstream_server.make_url("/*"),
+        **{
+            CONF_RESPONSE_CACHE_STALE_WHILE_REVALIDATE: 60,
+            CONF_REQUEST_LIMIT_PER_HOST: 1,
+            CONF_REQUEST_QUEUE_SIZE: 0,
+        },
+    )
+    authenticated_hass_client = await hass_client()
+
+    def _path(url: str) -> str:
+        return f"/api/hass_web_proxy/v0/?url={urllib.parse.quote_plus(url)}"
+
+    for _ in range(2):
+        resp = await authenticated_hass_client.get(_path(url))
+        assert await resp.read() == b"v1"
+
+    # The revalidation holds the host's only slot.
+    await started.wait()
+    resp = await authenticated_hass_client.get(
+        _path(upstream_server.make_url("/other.js"))
+    )
+    assert resp.status == HTTPStatus.SERVICE_UNAVAILABLE
+
+    release.set()
+    await hass.async_block_till_done(wait_background_tasks=True)
+    resp = await authenticated_hass_client.get(
+        _path(upstream_server.make_url("/other.js"))
+    )
+    assert resp.status == HTTPStatus.OK
+
+
+async def test_proxy_view_response_cache_evicted_while_revalidating(
+    hass: HomeAssistant,
+    hass_client: Any,
+    upstream_server: UpstreamServer,
+) -> None:
+    """Test that responses evicted while revalidated are refetched, not sent 304s."""
+    bodies = [b"v1"]
+    handler = _make_etag_handler(bodies, "no-cache")
+    url = upstream_server.make_url("/ui.js")
+    cache = await _setup_response_cache(hass, url)
+
+    async def _evict(request: web.Request) -> web.StreamResponse:
+        if hdrs.IF_NONE_MATCH in request.headers:
+            cache.remove(normalize_url(url))
+        return await handler(request)
+
+    upstream_server.handlers["/ui.js"] = _evict
+    path = f"/api/hass_web_proxy/v0/?url={urllib.parse.quote_plus(url)}"
+    authenticated_hass_client = await hass_client()
+
+    for _ in range(REQUEST_COUNT):
+        resp = await authenticated_hass_client.get(path)
+        assert resp.status == HTTPStatus.OK
+        assert await resp.read() == b"v1"
+    assert len(cache) == 1
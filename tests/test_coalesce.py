@@ -0,0 +1,212 @@
+"""Test the HASS Web Proxy request coalescing."""
+
+from __future__ import annotations
+
+import asyncio
+import urllib.parse
+from http import HTTPStatus
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any
+from unittest.mock import Mock, patch
+
+import pytest
+from aiohttp import web
+
+from custom_components.hass_web_proxy.coalesce import RequestCoalescer
+from custom_components.hass_web_proxy.const import (
+    CONF_REQUEST_COALESCING_MAX_SIZE,
+    CONF_REQUEST_LIMIT_PER_HOST,
+    CONF_REQUEST_QUEUE_SIZE,
+    CONF_RESPONSE_CACHE_SIZE,
+    CONF_URL_PATTERNS,
+)
+from tests import (
+    UpstreamServer,
+    create_mock_hass_web_proxy_config_entry,
+    setup_mock_hass_web_proxy_config_entry,
+)
+
+if TYPE_CHECKING:
+    from homeassistant.core import HomeAssistant
+
+# The number of identical concurrent requests made.
+REQUEST_COUNT = 3
+
+
+async def _setup_coalescing(
+    hass: HomeAssistant, url: str, response_cache_size: int = 0, **options: Any
+) -> RequestCoalescer:
+    """Set up the integration with request coalescing enabled."""
+    config_entry = create_mock_hass_web_proxy_config_entry(
+        hass,
+        MappingProxyType(
+            {
+                CONF_URL_PATTERNS: [url],
+                CONF_REQUEST_COALESCING_MAX_SIZE: 1,
+                CONF_RESPONSE_CACHE_SIZE: response_cache_size,
+                **options,
+            }
+        ),
+    )
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+    coalescer = config_entry.runtime_data.request_coalescer
+    assert coalescer is not None
+    return coalescer
+
+
+async def _get_concurrently(
+    client: Any, url: str, coalescer: RequestCoalescer, release: asyncio.Event
+) -> list[tuple[int, bytes]]:
+    """Make identical concurrent requests, and get their statuses and bodies."""
+    async_fetch = coalescer.async_fetch
+    calls = 0
+
+    async def _async_fetch(*args: Any, **kwargs: Any) -> web.StreamResponse:
+        # Requests join a flight without awaiting anything, so the earlier
+        # requests are already waiting when the last one arrives.
+        nonlocal calls
+        calls += 1
+        if calls == REQUEST_COUNT:
+            release.set()
+        return await async_fetch(*args, **kwargs)
+
+    async def _get() -> tuple[int, bytes]:
+        resp = await client.get(
+            f"/api/hass_web_proxy/v0/?url={urllib.parse.quote_plus(url)}"
+        )
+        return resp.status, await resp.read()
+
+    with patch.object(coalescer, "async_fetch", _async_fetch):
+        return await asyncio.gather(*(_get() for _ in range(REQUEST_COUNT)))
+
+
+@pytest.mark.parametrize("response_cache_size", [0, 1])
+async def test_request_coalescing(
+    hass: HomeAssistant,
+    hass_client: Any,
+    upstream_server: UpstreamServer,
+    response_cache_size: int,
+) -> None:
+    """Test that identical concurrent requests share an upstream request."""
+    release = asyncio.Event()
+
+    async def _snapshot(_request: web.Request) -> web.Response:
+        await release.wait()
+        return web.Response(body=b"snapshot", content_type="image/jpeg")
+
+    upstream_server.handlers["/snapshot.jpg"] = _snapshot
+    url = upstream_server.make_url("/snapshot.jpg")
+    coalescer = await _setup_coalescing(hass, url, response_cache_size)
+
+    results = await _get_concurrently(await hass_client(), url, coalescer, release)
+
+    assert results == [(HTTPStatus.OK, b"snapshot")] * REQUEST_COUNT
+    assert upstream_server.get_request_count("/snapshot.jpg") == 1
+    assert coalescer.get_stats() == {"in_flight": 0, "requests": 1, "coalesced": 2}
+
+
+async def test_request_coalescing_request_limit(
+    hass: HomeAssistant,
+    hass_client: Any,
+    upstream_server: UpstreamServer,
+) -> None:
+    """Test that only the request that goes upstream counts against the limit."""
+    release = asyncio.Event()
+
+    async def _snapshot(_request: web.Request) -> web.Response:
+        await release.wait()
+        return web.Response(body=b"snapshot", content_type="image/jpeg")
+
+    upstream_server.handlers["/snapshot.jpg"] = _snapshot
+    url = upstream_server.make_url("/snapshot.jpg")
+    coalescer = await _setup_coalescing(
+        hass,
+        url,
+        **{CONF_REQUEST_LIMIT_PER_HOST: 1, CONF_REQUEST_QUEUE_SIZE: 0},
+    )
+
+    results = await _get_concurrently(await hass_client(), url, coalescer, release)
+
+    assert results == [(HTTPStatus.OK, b"snapshot")] * REQUEST_COUNT
+    assert upstream_server.get_request_count("/snapshot.jpg") == 1
+
+
+async def test_request_coalescing_large_response(
+    hass: HomeAssistant,
+    hass_client: Any,
+    upstream_server: UpstreamServer,
+) -> None:
+    """Test that responses too large to share are fetched by each request."""
+    release = asyncio.Event()
+
+    async def _large(_request: web.Request) -> web.Response:
+        await release.wait()
+        return web.Response(body=b"x" * 2048)
+
+    upstream_server.handlers["/large"] = _large
+    url = upstream_server.make_url("/large")
+    coalescer = await _setup_coalescing(hass, url)
+
+    results = await _get_concurrently(await hass_client(), url, coalescer, release)
+
+    assert results == [(HTTPStatus.OK, b"x" * 2048)] * REQUEST_COUNT
+    assert upstream_server.get_request_count("/large") == REQUEST_COUNT
+
+
+async def test_request_coalescing_upstream_error(
+    hass: HomeAssistant,
+    hass_client: Any,
+    upstream_server: UpstreamServer,
+) -> None:
+    """Test that an upstream failure is shared by all waiting requests."""
+    release = asyncio.Event()
+
+    async def _disconnect(request: web.Request) -> web.Response:
+        await release.wait()
+        assert request.transport
+        request.transport.close()
+        return web.Response()
+
+    upstream_server.handlers["/disconnect"] = _disconnect
+    url = upstream_server.make_url("/disconnect")
+    coalescer = await _setup_coalescing(hass, url)
+
+    results = await _get_concurrently(await hass_client(), url, coalescer, release)
+
+    assert [status for status, _ in results] == [HTTPStatus.BAD_GATEWAY] * REQUEST_COUNT
+    assert not len(coalescer)
+
+
+async def test_request_coalescing_cancelled() -> None:
+    """Test that waiting requests go upstream if the first is cancelled."""
+    coalescer = RequestCoalescer(max_body_size=1024)
+    request = Mock(headers={})
+    response = web.Response()
+    calls: list[str] = []
+
+    async def _fetch(*args: Any, **_kwargs: Any) -> web.StreamResponse:
+        calls.append(args[2])
+        if len(calls) == 1:
+            await asyncio.Event().wait()
+        return response
+
+    with patch("custom_components.hass_web_proxy.coalesce.async_fetch", _fetch):
+        first = asyncio.create_task(
+            coalescer.async_fetch(request, Mock(), "http://cam/snapshot.jpg", None)
+        )
+        # Each task runs until it waits, on the upstream or on the first task.
+        await asyncio.sleep(0)
+        assert len(coalescer) == 1
+        second = asyncio.create_task(
+            coalescer.async_fetch(request, Mock(), "http://cam/snapshot.jpg", None)
+        )
+        await asyncio.sleep(0)
+        assert coalescer.coalesced == 1
+
+        first.cancel()
+        assert await second is response
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+    assert calls == ["http://cam/snapshot.jpg"] * 2
+    assert not len(coalescer)
@@ -0,0 +1,132 @@
+"""Test the HASS Web Proxy data types."""
+
+from __future__ import annotations
+
+import datetime
+from collections import OrderedDict
+from typing import Any
+from unittest.mock import Mock
+
+import pytest
+
+from custom_components.hass_web_proxy.data import (
+    DynamicProxiedURL,
+    HASSWebProxyData,
+)
+
+
+def _create_dynamic_proxied_url(expiration: float = 0) -> DynamicProxiedURL:
+    """Create a dynamic proxied URL."""
+    return DynamicProxiedURL(
+        url_pattern="http://cam.example.com",
+        ssl_verification=True,
+        ssl_ciphers="default",
+        open_limit=0,
+        expiration=expiration,
+        allow_unauthenticated=False,
+    )
+
+
+def _create_data(**kwargs: Any) -> HASSWebProxyData:
+    """Create integration data."""
+    return HASSWebProxyData(
+        integration=Mock(),
+        dynamic_proxied_urls=OrderedDict(),
+        session=Mock(),
+        stream_fanout=Mock(),
+        websocket_fanout=Mock(),
+        **kwargs,
+    )
+
+
+@pytest.mark.freeze_time
+def test_remove_expired_dynamic_proxied_urls(freezer: Any) -> None:
+    """Test that only expired dynamic proxied URLs are removed."""
+    now = datetime.datetime.now(tz=datetime.UTC)
+    data = _create_data()
+    data.add_dynamic_proxied_url("forever", _create_dynamic_proxied_url())
+    data.add_dynamic_proxied_url(
+        "short", _create_dynamic_proxied_url(now.timestamp() + 10)
+    )
+    data.add_dynamic_proxied_url(
+        "long", _create_dynamic_proxied_url(now.timestamp() + 100)
+    )
+
+    data.remove_expired_dynamic_proxied_urls()
+    assert set(data.dynamic_proxied_urls) == {"forever", "short", "long"}
+
+    freezer.move_to(now + datetime.timedelta(seconds=11))
+    data.remove_expired_dynamic_proxied_urls()
+    assert set(data.dynamic_proxied_urls) == {"forever", "long"}
+    assert "short" not in data.dynamic_url_index
+
+    freezer.move_to(now + datetime.timedelta(seconds=101))
+    data.remove_expired_dynamic_proxied_urls()
+    assert set(data.dynamic_proxied_urls) == {"forever"}
+
+
+@pytest.mark.freeze_time
+def test_remove_expired_dynamic_proxied_urls_skips_stale(freezer: Any) -> None:
+    """Test that replaced or deleted URLs are not removed by stale expirations."""
+    now = datetime.datetime.now(tz=datetime.UTC)
+    data = _create_data()
+
+    data.add_dynamic_proxied_url(
+        "replaced", _create_dynamic_proxied_url(now.timestamp() + 10)
+    )
+    data.add_dynamic_proxied_url(
+        "replaced", _create_dynamic_proxied_url(now.timestamp() + 100)
+    )
+    data.add_dynamic_proxied_url(
+        "deleted", _create_dynamic_proxied_url(now.timestamp() + 10)
+    )
+    data.remove_dynamic_proxied_url("deleted")
+
+    freezer.move_to(now + datetime.timedelta(seconds=11))
+    data.remove_expired_dynamic_proxied_urls()
+    assert set(data.dynamic_proxied_urls) == {"replaced"}
+
+
+def test_expirations_are_compacted() -> None:
+    """Test that stale expirations do not accumulate without bound."""
+    data = _create_data()
+    expiration = datetime.datetime.now(tz=datetime.UTC).timestamp() + 100
+
+    for _ in range(100):
+        data.add_dynamic_proxied_url("id", _create_dynamic_proxied_url(expiration))
+
+    assert len(data._expirations) <= 2 * len(data.dynamic_proxied_urls) + 17  # noqa: SLF001
+
+
+def test_evict_least_recently_used() -> None:
+    """Test that the least recently used URLs are evicted beyond the maximum."""
+    data = _create_data(max_dynamic_proxied_urls=2)
+    data.add_dynamic_proxied_url("first", _create_dynamic_proxied_url())
+    data.add_dynamic_proxied_url("second", _create_dynamic_proxied_url())
+    data.open_dynamic_proxied_url("first", data.dynamic_proxied_urls["first"])
+
+    data.add_dynamic_proxied_url("third", _create_dynamic_proxied_url())
+
+    assert list(data.dynamic_proxied_urls) == ["first", "third"]
+    assert "second" not in data.dynamic_url_index
+    assert data.metrics.dynamic_url_evictions == 1
+
+
+def test_evict_oldest() -> None:
+    """Test that the oldest URLs are evicted beyond the maximum, however used."""
+    data = _create_data(max_dynamic_proxied_urls=2, evict_least_recently_used=False)
+    data.add_dynamic_proxied_url("first", _create_dynamic_proxied_url())
+    data.add_dynamic_proxied_url("second", _create_dynamic_proxied_url())
+    data.open_dynamic_proxied_url("first", data.dynamic_proxied_urls["first"])
+
+    data.add_dynamic_proxied_url("third", _create_dynamic_proxied_url())
+    assert list(data.dynamic_proxied_urls) == ["second", "third"]
+    evictions = data.metrics.dynamic_url_evictions
+
+    # Replacing a URL makes it the newest.
+    data.add_dynamic_proxied_url("second", _create_dynamic_proxied_url())
+    data.add_dynamic_proxied_url("fourth", _create_dynamic_proxied_url())
+
+    assert list(data.dynamic_proxied_urls) == ["second", "fourth"]
+    assert len(data.dynamic_url_index) == len(data.dynamic_proxied_urls)
+    assert data.metrics.dynamic_url_evictions == evictions + 1
@@ -0,0 +1,225 @@
+"""Test the HASS Web Proxy upstream DNS cache."""
+
+from __future__ import annotations
+
+import asyncio
+import datetime
+import socket
+import urllib.parse
+from http import HTTPStatus
+from types import MappingProxyType, SimpleNamespace
+from typing import TYPE_CHECKING, Any
+from unittest.mock import AsyncMock, patch
+
+import aiodns
+import pytest
+from aiohttp import web
+from aiohttp.resolver import ThreadedResolver
+
+from custom_components.hass_web_proxy.const import CONF_URL_PATTERNS
+from custom_components.hass_web_proxy.dns import CachingResolver
+from tests import (
+    UpstreamServer,
+    create_mock_hass_web_proxy_config_entry,
+    setup_mock_hass_web_proxy_config_entry,
+)
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+    from homeassistant.core import HomeAssistant
+
+PORT = 80
+
+
+def _create_result(*nodes: tuple[Any, int, int]) -> SimpleNamespace:
+    """Create a c-ares getaddrinfo result, from (address, family, ttl) tuples."""
+    return SimpleNamespace(
+        nodes=[
+            SimpleNamespace(addr=(address, PORT), family=family, ttl=ttl)
+            for address, family, ttl in nodes
+        ]
+    )
+
+
+@pytest.fixture
+def getaddrinfo() -> Iterator[AsyncMock]:
+    """Mock c-ares lookups."""
+    with patch(
+        "custom_components.hass_web_proxy.dns.aiodns.DNSResolver"
+    ) as mock_resolver:
+        mock_resolver.return_value.getaddrinfo = AsyncMock(
+            return_value=_create_result(
+                (b"192.0.2.1", socket.AF_INET, 30),
+                ("2001:db8::1", socket.AF_INET6, 60),
+            )
+        )
+        yield mock_resolver.return_value.getaddrinfo
+
+
+@pytest.mark.freeze_time
+async def test_resolver_caches_for_ttl(getaddrinfo: AsyncMock, freezer: Any) -> None:
+    """Test that lookups are cached for the shortest TTL of their records."""
+    resolver = CachingResolver(max_ttl=300, negative_ttl=5)
+
+    addresses = await resolver.resolve("camera", PORT, socket.AF_UNSPEC)
+    assert [address["host"] for address in addresses] == ["192.0.2.1", "2001:db8::1"]
+    assert addresses[0]["hostname"] == "camera"
+    assert addresses[0]["port"] == PORT
+    assert await resolver.resolve("camera", PORT, socket.AF_UNSPEC) == addresses
+    assert getaddrinfo.call_count == 1
+
+    freezer.tick(datetime.timedelta(seconds=30))
+    await resolver.resolve("camera", PORT, socket.AF_UNSPEC)
+    assert getaddrinfo.call_count == resolver.misses
+    assert resolver.get_stats() == {
+        "lookups": 1,
+        "hits": 1,
+        "negative_hits": 0,
+        "misses": 2,
+    }
+
+    # Lookups are cached for no longer than the maximum TTL.
+    resolver.max_ttl = 0
+    misses = resolver.misses
+    freezer.tick(datetime.timedelta(seconds=30))
+    await resolver.resolve("camera", PORT, socket.AF_UNSPEC)
+    await resolver.resolve("camera", PORT, socket.AF_UNSPEC)
+    assert resolver.misses == misses + 2
+
+    await resolver.close()
+
+
+@pytest.mark.freeze_time
+async def test_resolver_fallback_and_negative_cache(
+    getaddrinfo: AsyncMock, freezer: Any
+) -> None:
+    """Test that the system resolver is used as a fallback, and failures cached."""
+    getaddrinfo.side_effect = aiodns.error.DNSError(4, "Domain name not found")
+    resolver = CachingResolver(max_ttl=300, negative_ttl=5)
+
+    with patch.object(
+        ThreadedResolver, "resolve", return_value=[{"host": "192.0.2.2"}]
+    ) as resolve:
+        assert await resolver.resolve("camera.local") == [{"host": "192.0.2.2"}]
+        assert resolve.call_count == 1
+
+        # Only the first of repeated failed lookups is made.
+        resolve.side_effect = OSError("Name or service not known")
+        for _ in range(2):
+            with pytest.raises(OSError, match="DNS lookup of 'missing' failed"):
+                await resolver.resolve("missing")
+        calls = resolve.call_count
+
+        freezer.tick(datetime.timedelta(seconds=5))
+        with pytest.raises(OSError, match="DNS lookup of 'missing' failed"):
+            await resolver.resolve("missing")
+        assert resolve.call_count == calls + 1
+
+        # A lookup without addresses also falls back.
+        getaddrinfo.side_effect = None
+        getaddrinfo.return_value = _create_result()
+        with pytest.raises(OSError, match="DNS lookup of 'empty' failed"):
+            await resolver.resolve("empty")
+
+    assert resolver.negative_hits == 1
+
+
+async def test_resolver_concurrent_lookups(getaddrinfo: AsyncMock) -> None:
+    """Test that concurrent lookups of a host share a query."""
+    release = asyncio.Event()
+    result = getaddrinfo.return_value
+
+    async def _getaddrinfo(*_args: Any, **_kwargs: Any) -> SimpleNamespace:
+        await release.wait()
+        return result
+
+    getaddrinfo.side_effect = _getaddrinfo
+    resolver = CachingResolver(max_ttl=300, negative_ttl=5)
+
+    first = asyncio.create_task(resolver.resolve("camera"))
+    second = asyncio.create_task(resolver.resolve("camera"))
+    await asyncio.sleep(0)
+
+    # A cancelled lookup does not cancel the query.
+    first.cancel()
+    release.set()
+    assert len(await second) == len(result.nodes)
+    assert first.cancelled()
+    assert getaddrinfo.call_count == 1
+    assert resolver.get_stats()["lookups"] == 1
+
+    # A failed query is not cached.
+    getaddrinfo.side_effect = ValueError
+    with pytest.raises(ValueError):  # noqa: PT011
+        await resolver.resolve("invalid")
+    assert resolver.get_stats()["lookups"] == 1
+
+
+@pytest.mark.freeze_time
+async def test_resolver_lookups_bounded(getaddrinfo: AsyncMock, freezer: Any) -> None:
+    """Test that expired lookups, then the oldest, are forgotten first."""
+    resolver = CachingResolver(max_ttl=300, negative_ttl=5)
+    max_lookups = 2
+    with patch("custom_components.hass_web_proxy.dns.MAX_CACHED_LOOKUPS", max_lookups):
+        await resolver.resolve("first")
+        await resolver.resolve("second")
+        await resolver.resolve("third")
+        assert resolver.get_stats()["lookups"] == max_lookups
+
+        freezer.tick(datetime.timedelta(seconds=30))
+        await resolver.resolve("fourth")
+        assert resolver.get_stats()["lookups"] == 1
+
+    assert getaddrinfo.call_count == resolver.misses
+
+
+async def test_proxy_view_uses_dns_cache(
+    hass: HomeAssistant,
+    hass_client: Any,
+    upstream_server: UpstreamServer,
+    getaddrinfo: AsyncMock,
+) -> None:
+    """Test that upstream hosts are resolved by the DNS cache."""
+
+    async def _ok(_request: web.Request) -> web.Response:
+        return web.Response(body=b"ok")
+
+    upstream_server.handlers["/ok"] = _ok
+    port = urllib.parse.urlsplit(upstream_server.base_url).port
+    assert port is not None
+    getaddrinfo.return_value = SimpleNamespace(
+        nodes=[SimpleNamespace(addr=("127.0.0.1", port), family=socket.AF_INET, ttl=60)]
+    )
+    url = f"http://camera.test:{port}/ok"
+    config_entry = create_mock_hass_web_proxy_config_entry(
+        hass, MappingProxyType({CONF_URL_PATTERNS: [url]})
+    )
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+
+    client = await hass_client()
+    resp = await client.get(
+        f"/api/hass_web_proxy/v0/?url={urllib.parse.quote_plus(url)}"
+    )
+    assert resp.status == HTTPStatus.OK
+    assert await resp.read() == b"ok"
+
+    dns_resolver = config_entry.runtime_data.dns_resolver
+    assert dns_resolver is not None
+    assert dns_resolver.get_stats()["misses"] == 1
+    assert getaddrinfo.call_args.args == ("camera.test",)
+
+
+async def test_dns_cache_closed_on_unload(hass: HomeAssistant) -> None:
+    """Test that the DNS cache is closed (after the session) on unload."""
+    config_entry = create_mock_hass_web_proxy_config_entry(hass)
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+
+    data = config_entry.runtime_data
+    assert data.dns_resolver is not None
+    with patch.object(
+        data.dns_resolver, "close", wraps=data.dns_resolver.close
+    ) as mock_close:
+        assert await hass.config_entries.async_unload(config_entry.entry_id)
+    mock_close.assert_awaited_once()
+    assert data.session.closed
@@ -0,0 +1,359 @@
+"""Test the HASS Web Proxy stream fan-out."""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import urllib.parse
+from http import HTTPStatus
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any
+
+import pytest
+from aiohttp import hdrs, web
+from aiohttp.test_utils import TestServer
+from multidict import CIMultiDict
+
+from custom_components.hass_web_proxy.const import (
+    CONF_CIRCUIT_BREAKER_THRESHOLD,
+    CONF_READ_TIMEOUT,
+    CONF_REQUEST_LIMIT_PER_HOST,
+    CONF_STREAM_FANOUT,
+    CONF_URL_PATTERN_OPTIONS,
+    CONF_URL_PATTERNS,
+)
+from custom_components.hass_web_proxy.fanout import (
+    STREAM_FANOUT_QUEUE_SIZE,
+    MultipartSplitter,
+    _SharedStream,
+    _Subscriber,
+    get_multipart_boundary,
+)
+from tests import (
+    create_mock_hass_web_proxy_config_entry,
+    setup_mock_hass_web_proxy_config_entry,
+)
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncGenerator
+
+    from homeassistant.core import HomeAssistant
+
+FRAMES = [
+    b"--frame\r\nContent-Type: image/jpeg\r\n\r\n" + bytes([i]) * 100 + b"\r\n"
+    for i in range(3)
+]
+
+
+class _MJPEGServer:
+    """A local MJPEG server."""
+
+    def __init__(self) -> None:
+        """Initialize the server."""
+        self.requests = 0
+        self.request_headers: list[CIMultiDict[str]] = []
+        self.requested = asyncio.Event()
+        self.content_type = "multipart/x-mixed-replace; boundary=frame"
+        # Set once the response may be started, and then its frames sent.
+        self.ready = asyncio.Event()
+        self.ready.set()
+        self.release = asyncio.Event()
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        """Stream some frames."""
+        self.requests += 1
+        self.request_headers.append(CIMultiDict(request.headers))
+        self.requested.set()
+        await self.ready.wait()
+        response = web.StreamResponse(headers={hdrs.CONTENT_TYPE: self.content_type})
+        await response.prepare(request)
+        await self.release.wait()
+        for frame in FRAMES:
+            await response.write(frame)
+        await response.write_eof()
+        return response
+
+
+@pytest.fixture
+async def mjpeg_server() -> AsyncGenerator[tuple[_MJPEGServer, str]]:
+    """Run a local MJPEG server."""
+    mjpeg = _MJPEGServer()
+    app = web.Application()
+    app.router.add_get("/stream", mjpeg.handle)
+
+    async with TestServer(app) as server:
+        yield mjpeg, str(server.make_url("/stream"))
+
+
+@pytest.mark.parametrize(
+    ("content_type", "expected"),
+    [
+        (None, None),
+        ("image/jpeg", None),
+        ("multipart/x-mixed-replace; boundary=frame", b"--frame"),
+        ('multipart/x-mixed-replace; boundary="--frame"', b"--frame"),
+        ("multipart/x-mixed-replace", None),
+    ],
+)
+def test_get_multipart_boundary(content_type: str | None, expected: bytes) -> None:
+    """Test getting the boundary of a multipart content type."""
+    assert get_multipart_boundary(content_type) == expected
+
+
+def test_multipart_splitter() -> None:
+    """Test splitting a stream into whole parts."""
+    splitter = MultipartSplitter(b"--frame")
+    stream = b"preamble" + b"".join(FRAMES)
+
+    parts = []
+    for i in range(0, len(stream), 7):
+        parts.extend(splitter.feed(stream[i : i + 7]))
+    parts.append(splitter.flush())
+
+    assert parts == [b"preamble", *FRAMES]
+    assert splitter.flush() == b""
+
+
+def test_multipart_splitter_max_part_size() -> None:
+    """Test that oversized parts are flushed as-is."""
+    splitter = MultipartSplitter(b"--frame", max_part_size=10)
+
+    assert splitter.feed(b"--frame") == []
+    assert splitter.feed(b"0123456789") == [b"--frame0123456789"]
+
+
+async def test_shared_stream_slow_subscriber() -> None:
+    """Test that slow subscribers miss parts, or are disconnected."""
+    stream = _SharedStream("http://cam/stream", None, CIMultiDict())
+    subscriber = _Subscriber()
+    stream.subscribers.add(subscriber)
+
+    for _ in range(STREAM_FANOUT_QUEUE_SIZE + 1):
+        stream._publish(b"part", droppable=True)  # noqa: SLF001
+    assert subscriber.dropped == 1
+    assert subscriber in stream.subscribers
+
+    # Data that cannot be dropped ends the stream, in place of the oldest part.
+    stream._publish(b"data", droppable=False)  # noqa: SLF001
+    assert not stream.subscribers
+    queued = [subscriber.queue.get_nowait() for _ in range(subscriber.queue.qsize())]
+    assert queued == [b"part"] * (STREAM_FANOUT_QUEUE_SIZE - 1) + [None]
+
+
+@pytest.mark.parametrize(
+    "content_type",
+    ["multipart/x-mixed-replace; boundary=frame", "application/octet-stream"],
+)
+async def test_stream_fanout_shares_upstream(
+    hass: HomeAssistant,
+    hass_client: Any,
+    mjpeg_server: tuple[_MJPEGServer, str],
+    content_type: str,
+) -> None:
+    """Test that concurrent clients share a single upstream stream."""
+    mjpeg, url = mjpeg_server
+    mjpeg.content_type = content_type
+    config_entry = create_mock_hass_web_proxy_config_entry(
+        hass,
+        MappingProxyType(
+            {
+                CONF_URL_PATTERNS: [url],
+                CONF_URL_PATTERN_OPTIONS: {url: {CONF_STREAM_FANOUT: True}},
+            }
+        ),
+    )
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+    stream_fanout = config_entry.runtime_data.stream_fanout
+
+    authenticated_hass_client = await hass_client()
+
+    # Clients have joined once they get the (headers of the) shared response.
+    responses = [
+        await authenticated_hass_client.get(
+            f"/api/hass_web_proxy/v0/?url={urllib.parse.quote_plus(url)}"
+        )
+        for _ in range(3)
+    ]
+    assert all(resp.status == HTTPStatus.OK for resp in responses)
+    assert stream_fanout.get_stats()["clients"] == len(responses)
+    mjpeg.release.set()
+
+    for resp in responses:
+        assert await resp.read() == b"".join(FRAMES)
+    assert mjpeg.requests == 1
+    assert stream_fanout.get_stats() == {"streams": 0, "clients": 0, "dropped": 0}
+
+
+async def test_stream_fanout_client_specific_headers(
+    hass: HomeAssistant,
+    hass_client: Any,
+    mjpeg_server: tuple[_MJPEGServer, str],
+) -> None:
+    """Test that a shared stream is not opened for the first client's range."""
+    mjpeg, url = mjpeg_server
+    mjpeg.release.set()
+    config_entry = create_mock_hass_web_proxy_config_entry(
+        hass,
+        MappingProxyType(
+            {
+                CONF_URL_PATTERNS: [url],
+                CONF_URL_PATTERN_OPTIONS: {url: {CONF_STREAM_FANOUT: True}},
+            }
+        ),
+    )
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+
+    authenticated_hass_client = await hass_client()
+    resp = await authenticated_hass_client.get(
+        f"/api/hass_web_proxy/v0/?url={urllib.parse.quote_plus(url)}",
+        headers={
+            hdrs.RANGE: "bytes=0-9",
+            hdrs.IF_NONE_MATCH: '"v1"',
+            hdrs.IF_MODIFIED_SINCE: "Sat, 17 Oct 2026 00:00:00 GMT",
+        },
+    )
+    assert resp.status == HTTPStatus.OK
+    assert await resp.read() == b"".join(FRAMES)
+
+    (headers,) = mjpeg.request_headers
+    assert hdrs.RANGE not in headers
+    assert hdrs.IF_NONE_MATCH not in headers
+    assert hdrs.IF_MODIFIED_SINCE not in headers
+    assert headers.get(hdrs.ACCEPT_ENCODING) != "identity"
+
+
+async def test_stream_fanout_reserves_upstream(
+    hass: HomeAssistant,
+    hass_client: Any,
+    mjpeg_server: tuple[_MJPEGServer, str],
+) -> None:
+    """Test that a shared stream holds a single slot of its host's request limit."""
+    mjpeg, url = mjpeg_server
+    config_entry = create_mock_hass_web_proxy_config_entry(
+        hass,
+        MappingProxyType(
+            {
+                CONF_REQUEST_LIMIT_PER_HOST: 1,
+                CONF_URL_PATTERNS: [url],
+                CONF_URL_PATTERN_OPTIONS: {
+                    url: {CONF_STREAM_FANOUT: True, CONF_READ_TIMEOUT: 5}
+                },
+            }
+        ),
+    )
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+    limiter = config_entry.runtime_data.concurrency_limiter
+    assert limiter is not None
+
+    authenticated_hass_client = await hass_client()
+    responses = [
+        await authenticated_hass_client.get(
+            f"/api/hass_web_proxy/v0/?url={urllib.parse.quote_plus(url)}"
+        )
+        for _ in range(2)
+    ]
+    assert all(resp.status == HTTPStatus.OK for resp in responses)
+    assert limiter.get_stats()["active"] == 1
+    mjpeg.release.set()
+
+    for resp in responses:
+        assert await resp.read() == b"".join(FRAMES)
+    await hass.async_block_till_done(wait_background_tasks=True)
+    assert limiter.get_stats()["active"] == 0
+
+
+async def test_stream_fanout_client_cancelled(
+    hass: HomeAssistant,
+    hass_client: Any,
+    mjpeg_server: tuple[_MJPEGServer, str],
+) -> None:
+    """Test that a shared stream is closed once its only client goes away."""
+    mjpeg, url = mjpeg_server
+    mjpeg.ready.clear()
+    config_entry = create_mock_hass_web_proxy_config_entry(
+        hass,
+        MappingProxyType(
+            {
+                CONF_URL_PATTERNS: [url],
+                CONF_URL_PATTERN_OPTIONS: {url: {CONF_STREAM_FANOUT: True}},
+            }
+        ),
+    )
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+    stream_fanout = config_entry.runtime_data.stream_fanout
+
+    # The client goes away while the shared stream is still connecting.
+    authenticated_hass_client = await hass_client()
+    request = asyncio.create_task(
+        authenticated_hass_client.get(
+            f"/api/hass_web_proxy/v0/?url={urllib.parse.quote_plus(url)}"
+        )
+    )
+    await mjpeg.requested.wait()
+    request.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await request
+
+    await hass.async_block_till_done(wait_background_tasks=True)
+    assert stream_fanout.get_stats() == {"streams": 0, "clients": 0, "dropped": 0}
+
+
+async def test_stream_fanout_upstream_error(
+    hass: HomeAssistant,
+    hass_client: Any,
+    unused_tcp_port_factory: Any,
+) -> None:
+    """Test that an unreachable upstream results in a bad gateway."""
+    url = f"http://127.0.0.1:{unused_tcp_port_factory()}/stream"
+    config_entry = create_mock_hass_web_proxy_config_entry(
+        hass,
+        MappingProxyType(
+            {
+                CONF_CIRCUIT_BREAKER_THRESHOLD: 1,
+                CONF_URL_PATTERNS: [url],
+                CONF_URL_PATTERN_OPTIONS: {url: {CONF_STREAM_FANOUT: True}},
+            }
+        ),
+    )
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+    circuit_breaker = config_entry.runtime_data.circuit_breaker
+    assert circuit_breaker is not None
+
+    authenticated_hass_client = await hass_client()
+    resp = await authenticated_hass_client.get(
+        f"/api/hass_web_proxy/v0/?url={urllib.parse.quote_plus(url)}"
+    )
+    assert resp.status == HTTPStatus.BAD_GATEWAY
+    assert circuit_breaker.rejected == 0
+
+    # The host's circuit is now open, so the next stream is not even attempted.
+    resp = await authenticated_hass_client.get(
+        f"/api/hass_web_proxy/v0/?url={urllib.parse.quote_plus(url)}"
+    )
+    assert resp.status == HTTPStatus.BAD_GATEWAY
+    assert circuit_breaker.rejected == 1
+
+
+async def test_invalid_url_pattern_options_ignored(
+    hass: HomeAssistant,
+    local_server: Any,
+    hass_client: Any,
+) -> None:
+    """Test that invalid per-pattern options are ignored."""
+    url = str(local_server)
+    config_entry = create_mock_hass_web_proxy_config_entry(
+        hass,
+        MappingProxyType(
+            {
+                CONF_URL_PATTERNS: [url],
+                CONF_URL_PATTERN_OPTIONS: {url: {"not_an_option": True}},
+            }
+        ),
+    )
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+
+    authenticated_hass_client = await hass_client()
+    resp = await authenticated_hass_client.get(
+        f"/api/hass_web_proxy/v0/?url={urllib.parse.quote_plus(url)}"
+    )
+    assert resp.status == HTTPStatus.OK
@@ -0,0 +1,157 @@
+"""Test the HASS Web Proxy per-host concurrency limits."""
+
+from __future__ import annotations
+
+import asyncio
+import urllib.parse
+from http import HTTPStatus
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any
+
+import pytest
+from aiohttp import hdrs, web
+
+from custom_components.hass_web_proxy.const import (
+    CONF_REQUEST_LIMIT_PER_HOST,
+    CONF_REQUEST_QUEUE_SIZE,
+    CONF_REQUEST_QUEUE_TIMEOUT,
+    CONF_URL_PATTERNS,
+)
+from custom_components.hass_web_proxy.limiter import (
+    ConcurrencyLimiter,
+    ConcurrencyLimitError,
+)
+from tests import (
+    UpstreamServer,
+    create_mock_hass_web_proxy_config_entry,
+    setup_mock_hass_web_proxy_config_entry,
+)
+
+if TYPE_CHECKING:
+    from homeassistant.core import HomeAssistant
+
+
+async def test_limiter_queues_in_order() -> None:
+    """Test that requests beyond the limit are admitted in the order they queued."""
+    limiter = ConcurrencyLimiter(limit=1, queue_size=2, queue_timeout=10)
+    await limiter.async_acquire("camera")
+    # Other hosts are limited separately.
+    await limiter.async_acquire("other")
+
+    admitted: list[int] = []
+
+    async def _acquire(index: int) -> None:
+        await limiter.async_acquire("camera")
+        admitted.append(index)
+
+    tasks = [asyncio.create_task(_acquire(index)) for index in range(2)]
+    await asyncio.sleep(0)
+    assert limiter.get_stats()["hosts"] == {
+        "camera": {"active": 1, "queued": 2},
+        "other": {"active": 1, "queued": 0},
+    }
+
+    # The queue is full.
+    with pytest.raises(ConcurrencyLimitError):
+        await limiter.async_acquire("camera")
+
+    limiter.release("camera")
+    await tasks[0]
+    limiter.release("camera")
+    await tasks[1]
+    assert admitted == [0, 1]
+
+    limiter.release("camera")
+    limiter.release("other")
+    stats = limiter.get_stats()
+    assert stats["hosts"] == {}
+    assert stats["rejected"] == 1
+    # The wait of every admitted request is timed, whether it queued or not.
+    assert stats["wait_time"]["count"] == len(admitted) + len(("camera", "other"))
+
+
+async def test_limiter_queue_timeout() -> None:
+    """Test that requests that wait too long are not admitted."""
+    limiter = ConcurrencyLimiter(limit=1, queue_size=1, queue_timeout=0.01)
+    assert limiter.retry_after == 1
+    await limiter.async_acquire("camera")
+
+    with pytest.raises(ConcurrencyLimitError):
+        await limiter.async_acquire("camera")
+
+    limiter.release("camera")
+    assert limiter.get_stats()["hosts"] == {}
+    assert limiter.timeouts == 1
+
+
+async def test_limiter_cancelled() -> None:
+    """Test that cancelled requests leave the queue, and pass on a handed slot."""
+    limiter = ConcurrencyLimiter(limit=1, queue_size=2, queue_timeout=10)
+    await limiter.async_acquire("camera")
+
+    # A request cancelled while queued is skipped.
+    queued = asyncio.create_task(limiter.async_acquire("camera"))
+    await asyncio.sleep(0)
+    queued.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await queued
+    assert limiter.get_stats()["hosts"] == {"camera": {"active": 1, "queued": 0}}
+
+    # A request cancelled just after being handed the slot passes it on.
+    queued = asyncio.create_task(limiter.async_acquire("camera"))
+    await asyncio.sleep(0)
+    limiter.release("camera")
+    queued.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await queued
+    assert limiter.get_stats()["hosts"] == {}
+
+
+async def test_proxy_view_request_limit(
+    hass: HomeAssistant,
+    hass_client: Any,
+    upstream_server: UpstreamServer,
+) -> None:
+    """Test that requests beyond a host's limit and queue get a 503."""
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    async def _slow(_request: web.Request) -> web.Response:
+        started.set()
+        await release.wait()
+        return web.Response(body=b"ok")
+
+    upstream_server.handlers["/camera"] = _slow
+    config_entry = create_mock_hass_web_proxy_config_entry(
+        hass,
+        MappingProxyType(
+            {
+                CONF_URL_PATTERNS: [upstream_server.make_url("/*")],
+                CONF_REQUEST_LIMIT_PER_HOST: 1,
+                CONF_REQUEST_QUEUE_SIZE: 0,
+                CONF_REQUEST_QUEUE_TIMEOUT: 5,
+            }
+        ),
+    )
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+    limiter = config_entry.runtime_data.concurrency_limiter
+    assert limiter is not None
+
+    client = await hass_client()
+    url = (
+        "/api/hass_web_proxy/v0/"
+        f"?url={urllib.parse.quote_plus(upstream_server.make_url('/camera'))}"
+    )
+    first = asyncio.create_task(client.get(url))
+    await started.wait()
+
+    resp = await client.get(url)
+    assert resp.status == HTTPStatus.SERVICE_UNAVAILABLE
+    assert resp.headers[hdrs.RETRY_AFTER] == "5"
+
+    release.set()
+    resp = await first
+    assert resp.status == HTTPStatus.OK
+    assert await resp.read() == b"ok"
+    assert limiter.get_stats()["active"] == 0
+    assert limiter.rejected == 1
@@ -0,0 +1,192 @@
+"""Test the HASS Web Proxy URL pattern matcher."""
+
+from __future__ import annotations
+
+import pytest
+import urlmatch
+
+from custom_components.hass_web_proxy.matcher import (
+    URLPatternHost,
+    URLPatternIndex,
+    compile_url_pattern,
+)
+
+
+def test_compile_url_pattern_literal_host() -> None:
+    """Test compiling a pattern with a literal host."""
+    compiled = compile_url_pattern("https://Cam.Example.com/path/*")
+
+    assert compiled.hosts == (URLPatternHost(scheme="https", host="cam.example.com"),)
+    assert compiled.matches("https://Cam.Example.com/path/1")
+    assert not compiled.matches("https://cam.example.com/other")
+
+
+def test_compile_url_pattern_host_suffix() -> None:
+    """Test compiling a pattern with a subdomain wildcard."""
+    compiled = compile_url_pattern("*://*.example.com")
+
+    assert compiled.hosts == (
+        URLPatternHost(scheme=None, host="example.com", host_is_suffix=True),
+    )
+
+
+@pytest.mark.parametrize("pattern", ["http://*", "http://user@example.com"])
+def test_compile_url_pattern_unindexed_host(pattern: str) -> None:
+    """Test compiling a pattern whose host cannot be indexed."""
+    assert compile_url_pattern(pattern).hosts == (
+        URLPatternHost(scheme="http", host=None),
+    )
+
+
+def test_compile_url_pattern_alternatives() -> None:
+    """Test compiling a pattern with comma-separated alternatives."""
+    compiled = compile_url_pattern(
+        " http://a.example.com/*, https://b.example.com ,http://a.example.com/x"
+    )
+
+    assert compiled.hosts == (
+        URLPatternHost(scheme="http", host="a.example.com"),
+        URLPatternHost(scheme="https", host="b.example.com"),
+    )
+    assert compiled.matches("http://a.example.com/path")
+    assert compiled.matches("https://b.example.com")
+    assert not compiled.matches("http://b.example.com")
+
+
+def test_compile_url_pattern_invalid() -> None:
+    """Test compiling an invalid pattern."""
+    with pytest.raises(urlmatch.BadMatchPattern):
+        compile_url_pattern("not a pattern")
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "http://cam.example.com",
+        "http://cam.example.com/",
+        "https://cam.example.com/path/1",
+        "https://a.b.example.org/z",
+        "http://example.org",
+        "http://other.host/",
+        "http://cam.example.com:8080/q",
+        "http://user@creds.example.net/",
+        "http://a.example.io/x",
+        "https://b.example.io",
+        "http://b.example.io",
+        "http://c.example.io/y",
+        "ftp://cam.example.com",
+        "https://other.host",
+        "not-a-url",
+    ],
+)
+def test_index_matches_like_urlmatch(url: str) -> None:
+    """Test that the index returns the same first match as a linear scan."""
+    patterns = [
+        "http://a.example.io/*,https://b.example.io/*",
+        " http://c.example.io/* ",
+        "http://cam.example.com",
+        "https://cam.example.com/path/*",
+        "*://*.example.org",
+        "http://*",
+        "http://cam.example.com:8080/*",
+        "http://user@creds.example.net",
+    ]
+    index: URLPatternIndex[str] = URLPatternIndex()
+    for pattern in patterns:
+        index.add(pattern, pattern, pattern)
+
+    expected = next(
+        (
+            (pattern, pattern)
+            for pattern in patterns
+            if urlmatch.urlmatch(pattern, url, path_required=False)
+        ),
+        None,
+    )
+    assert index.match(url) == expected
+
+
+def test_index_add_remove() -> None:
+    """Test adding and removing patterns from the index."""
+    index: URLPatternIndex[int] = URLPatternIndex()
+    assert index.match("http://cam.example.com") is None
+
+    patterns = [
+        ("literal", "http://cam.example.com", 1),
+        ("suffix", "http://*.example.com", 2),
+        ("any", "http://*", 3),
+    ]
+    for key, url_pattern, value in patterns:
+        index.add(key, url_pattern, value)
+    assert len(index) == len(patterns)
+    assert "literal" in index
+
+    assert index.match("http://cam.example.com") == ("literal", 1)
+    index.remove("literal")
+    assert "literal" not in index
+    assert index.match("http://cam.example.com") == ("suffix", 2)
+    index.remove("suffix")
+    assert index.match("http://cam.example.com") == ("any", 3)
+    index.remove("any")
+    assert index.match("http://cam.example.com") is None
+
+    # Removing a missing key is a no-op.
+    index.remove("missing")
+    assert not len(index)
+
+
+def test_index_replace_keeps_position() -> None:
+    """Test that replacing a pattern keeps its original match priority."""
+    index: URLPatternIndex[int] = URLPatternIndex()
+    index.add("first", "http://*", 1)
+    index.add("second", "http://cam.example.com", 2)
+    index.add("first", "http://*.example.com", 3)
+
+    assert index.match("http://cam.example.com") == ("first", 3)
+    assert index.match("http://other.host") is None
+
+
+def test_index_invalid_pattern_leaves_index_unchanged() -> None:
+    """Test that adding an invalid pattern does not modify the index."""
+    index: URLPatternIndex[int] = URLPatternIndex()
+    index.add("id", "http://cam.example.com", 1)
+
+    with pytest.raises(urlmatch.BadMatchPattern):
+        index.add("id", "not a pattern", 2)
+
+    assert index.match("http://cam.example.com") == ("id", 1)
+
+
+def test_index_accepts_compiled_pattern() -> None:
+    """Test adding a pre-compiled pattern and clearing the index."""
+    index: URLPatternIndex[None] = URLPatternIndex()
+    index.add("id", compile_url_pattern("http://cam.example.com"), None)
+    assert index.match("http://cam.example.com") == ("id", None)
+
+    index.clear()
+    assert index.match("http://cam.example.com") is None
+
+
+def test_index_match_key() -> None:
+    """Test matching a URL against the pattern of a single key."""
+    index: URLPatternIndex[str] = URLPatternIndex()
+    index.add("any", "http://*", "any")
+    index.add("literal", "http://cam.example.com", "literal")
+
+    assert index.match_key("literal", "http://cam.example.com") == "literal"
+    assert index.match_key("literal", "http://other.host") is None
+    assert index.match_key("missing", "http://cam.example.com") is None
+
+
+def test_index_alternatives() -> None:
+    """Test indexing and removing a pattern with alternatives on one scheme."""
+    index: URLPatternIndex[int] = URLPatternIndex()
+    index.add("id", "http://a.example.com, http://*.b.example.com, http://*", 1)
+
+    assert index.match("http://a.example.com") == ("id", 1)
+    assert index.match("http://c.b.example.com") == ("id", 1)
+    assert index.match("http://other.host") == ("id", 1)
+    assert index.match("https://a.example.com") is None
+
+    index.remove("id")
+    assert index.match("http://a.example.com") is None
@@ -0,0 +1,156 @@
+"""Test the HASS Web Proxy metrics."""
+
+from __future__ import annotations
+
+import urllib.parse
+from http import HTTPStatus
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any
+from unittest.mock import Mock, patch
+
+from aiohttp import hdrs, web
+from homeassistant.helpers.entity_component import async_update_entity
+
+from custom_components.hass_web_proxy.const import (
+    CONF_DYNAMIC_URLS,
+    CONF_URL_ID,
+    CONF_URL_PATTERN,
+    CONF_URL_PATTERNS,
+    DOMAIN,
+    SERVICE_CREATE_PROXIED_URL,
+    SERVICE_GET_STATS,
+)
+from custom_components.hass_web_proxy.metrics import Histogram, ProxyMetrics
+from tests import (
+    UpstreamServer,
+    create_mock_hass_web_proxy_config_entry,
+    setup_mock_hass_web_proxy_config_entry,
+)
+
+if TYPE_CHECKING:
+    from homeassistant.core import HomeAssistant
+
+
+def test_histogram() -> None:
+    """Test estimating quantiles from a histogram."""
+    buckets = (0.1, 1.0)
+    histogram = Histogram(buckets=buckets)
+    assert histogram.quantile(0.5) is None
+
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value)
+
+    assert histogram.quantile(0.25) == buckets[0]
+    assert histogram.quantile(0.5) == buckets[1]
+    assert histogram.quantile(1) == buckets[1]
+    assert histogram.as_dict() == {
+        "count": 4,
+        "sum": 6.05,
+        "buckets": {"0.1": 1, "1.0": 3, "+Inf": 4},
+    }
+
+
+def test_metrics_bounded_counts() -> None:
+    """Test that counts are only kept for the most recently seen keys."""
+    metrics = ProxyMetrics()
+    with patch("custom_components.hass_web_proxy.metrics.MAX_TRACKED_KEYS", 2):
+        for url_pattern in ("a", "b", "a", "c"):
+            metrics.record_match(
+                Mock(target=Mock(url_pattern=url_pattern), url_id=None), 0
+            )
+
+    assert metrics.get_stats()["pattern_requests"] == {"a": 2, "c": 1}
+
+
+async def test_metrics(
+    hass: HomeAssistant,
+    hass_client: Any,
+    upstream_server: UpstreamServer,
+    unused_tcp_port_factory: Any,
+) -> None:
+    """Test that proxied requests are measured."""
+
+    async def _ok(_request: web.Request) -> web.Response:
+        return web.Response(body=b"ok")
+
+    upstream_server.handlers["/static"] = _ok
+    upstream_server.handlers["/dynamic"] = _ok
+    static_url = upstream_server.make_url("/static")
+    unreachable_url = f"http://127.0.0.1:{unused_tcp_port_factory()}/unreachable"
+    config_entry = create_mock_hass_web_proxy_config_entry(
+        hass,
+        MappingProxyType(
+            {
+                CONF_DYNAMIC_URLS: True,
+                CONF_URL_PATTERNS: [static_url, unreachable_url],
+            }
+        ),
+    )
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+    await hass.services.async_call(
+        DOMAIN,
+        SERVICE_CREATE_PROXIED_URL,
+        {
+            CONF_URL_PATTERN: upstream_server.make_url("/dynamic"),
+            CONF_URL_ID: "dynamic",
+        },
+        blocking=True,
+    )
+
+    authenticated_hass_client = await hass_client()
+    requests = [
+        (static_url, {}, HTTPStatus.OK),
+        (static_url, {hdrs.RANGE: "bytes=0-1"}, HTTPStatus.OK),
+        (upstream_server.make_url("/dynamic"), {}, HTTPStatus.OK),
+        (upstream_server.make_url("/unknown"), {}, HTTPStatus.NOT_FOUND),
+        (unreachable_url, {hdrs.RANGE: "bytes=0-1"}, HTTPStatus.BAD_GATEWAY),
+    ]
+    responses = [status for _, _, status in requests if status == HTTPStatus.OK]
+    for url, headers, status in requests:
+        resp = await authenticated_hass_client.get(
+            f"/api/hass_web_proxy/v0/?url={urllib.parse.quote_plus(url)}",
+            headers=headers,
+        )
+        assert resp.status == status
+        await resp.read()
+
+    stats = await hass.services.async_call(
+        DOMAIN, SERVICE_GET_STATS, blocking=True, return_response=True
+    )
+    assert stats is not None
+    assert stats["requests"] == len(requests)
+    assert stats["unmatched_requests"] == 1
+    assert stats["pattern_requests"] == {
+        static_url: 2,
+        upstream_server.make_url("/dynamic"): 1,
+        unreachable_url: 1,
+    }
+    assert stats["url_id_requests"] == {"dynamic": 1}
+    assert stats["match_latency"]["count"] == len(requests)
+    assert stats["upstream_ttfb"]["count"] == len(responses)
+    assert stats["total_latency"]["count"] == len(requests)
+    assert stats["bytes_in"] == len(b"ok") * len(responses)
+    assert stats["bytes_out"] >= len(b"ok")
+    assert stats["active_streams"] == 0
+    assert stats["errors"]["HTTPBadGateway"] == 1
+    assert stats["errors"]["ClientConnectorError"] == 1
+
+    entity_id = "sensor.home_assistant_web_proxy_requests"
+    await async_update_entity(hass, entity_id)
+    state = hass.states.get(entity_id)
+    assert state is not None
+    assert state.state == "5"
+    assert state.attributes["url_ids"] == {"dynamic": 1}
+
+    entity_id = "sensor.home_assistant_web_proxy_errors"
+    await async_update_entity(hass, entity_id)
+    state = hass.states.get(entity_id)
+    assert state is not None
+    assert state.state == "2"
+    assert state.attributes["classes"]["HTTPBadGateway"] == 1
+
+    entity_id = "sensor.home_assistant_web_proxy_active_streams"
+    await async_update_entity(hass, entity_id)
+    state = hass.states.get(entity_id)
+    assert state is not None
+    assert state.state == "0"
@@ -0,0 +1,245 @@
+"""Test the HASS Web Proxy upstream connection pre-warming."""
+
+from __future__ import annotations
+
+import datetime
+from types import MappingProxyType
+from typing import TYPE_CHECKING
+
+from aiohttp import hdrs, web
+from homeassistant.util import dt as dt_util
+from pytest_homeassistant_custom_component.common import async_fire_time_changed
+from yarl import URL
+
+from custom_components.hass_web_proxy.breaker import get_host_key
+from custom_components.hass_web_proxy.const import (
+    CONF_CIRCUIT_BREAKER_THRESHOLD,
+    CONF_DYNAMIC_URLS,
+    CONF_DYNAMIC_URLS_MAX,
+    CONF_KEEPALIVE_TIMEOUT,
+    CONF_PREWARM_CONNECTIONS,
+    CONF_REQUEST_LIMIT_PER_HOST,
+    CONF_URL_ID,
+    CONF_URL_PATTERN,
+    CONF_URL_PATTERNS,
+    DOMAIN,
+    SERVICE_CREATE_PROXIED_URL,
+    SERVICE_DELETE_PROXIED_URL,
+)
+from custom_components.hass_web_proxy.prewarm import get_prewarm_origin
+from custom_components.hass_web_proxy.session import get_connection_pool_usage
+from tests import (
+    UpstreamServer,
+    create_mock_hass_web_proxy_config_entry,
+    setup_mock_hass_web_proxy_config_entry,
+)
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from homeassistant.core import HomeAssistant
+
+
+async def _root(_request: web.Request) -> web.Response:
+    # aiohttp only keeps the connection of a HEAD response with a length.
+    return web.Response(headers={hdrs.CONTENT_LENGTH: "0"})
+
+
+def test_get_prewarm_origin() -> None:
+    """Test that only URL patterns with a literal origin are pre-warmed."""
+    assert str(get_prewarm_origin("https://camera:8443/snapshot/*")) == (
+        "https://camera:8443"
+    )
+    assert get_prewarm_origin("http://*.local/*") is None
+    assert get_prewarm_origin("*://camera/*") is None
+    assert get_prewarm_origin("ws://camera/ws") is None
+    assert get_prewarm_origin("http://camera:*/") is None
+
+
+async def test_prewarm_connections(
+    hass: HomeAssistant,
+    upstream_server: UpstreamServer,
+    unused_tcp_port_factory: Callable[[], int],
+) -> None:
+    """Test that connections are opened to hosts ahead of requests, and kept."""
+    upstream_server.handlers["/"] = _root
+    config_entry = create_mock_hass_web_proxy_config_entry(
+        hass,
+        MappingProxyType(
+            {
+                CONF_DYNAMIC_URLS: True,
+                CONF_URL_PATTERNS: [upstream_server.make_url("/*"), "http://*/*"],
+                CONF_PREWARM_CONNECTIONS: 1,
+                CONF_KEEPALIVE_TIMEOUT: 60,
+            }
+        ),
+    )
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+    await hass.async_block_till_done(wait_background_tasks=True)
+
+    data = config_entry.runtime_data
+    prewarmer = data.connection_prewarmer
+    assert prewarmer is not None
+    assert upstream_server.get_request_count("/") == 1
+    assert upstream_server.requests[-1].method == "HEAD"
+    assert get_connection_pool_usage(data.session)["idle"] == 1
+
+    # Warm connections are refreshed within the keep-alive timeout.
+    warmed = prewarmer.warmed
+    async_fire_time_changed(hass, dt_util.utcnow() + datetime.timedelta(seconds=30))
+    await hass.async_block_till_done(wait_background_tasks=True)
+    assert prewarmer.warmed == warmed + 1
+    assert upstream_server.get_request_count("/") == prewarmer.warmed
+    assert get_connection_pool_usage(data.session)["idle"] == 1
+
+    # Only the most recently added hosts are kept warm, and unreachable hosts are
+    # forgotten (without counting as upstream errors).
+    await hass.services.async_call(
+        DOMAIN,
+        SERVICE_CREATE_PROXIED_URL,
+        {
+            CONF_URL_PATTERN: (
+                f"http://127.0.0.1:{unused_tcp_port_factory()}/unreachable"
+            ),
+        },
+        blocking=True,
+    )
+    await hass.async_block_till_done(wait_background_tasks=True)
+    assert prewarmer.get_stats() == {"hosts": [], "warmed": 2, "failures": 1}
+    assert data.metrics.error_count == 0
+
+    await prewarmer.async_refresh()
+    assert upstream_server.get_request_count("/") == prewarmer.warmed
+
+
+async def test_prewarm_connections_evicted_before_warmed(
+    hass: HomeAssistant,
+    upstream_server: UpstreamServer,
+    unused_tcp_port_factory: Callable[[], int],
+) -> None:
+    """Test that hosts no longer kept warm by the time they would be are skipped."""
+    unreachable_url = f"http://127.0.0.1:{unused_tcp_port_factory()}/*"
+    config_entry = create_mock_hass_web_proxy_config_entry(
+        hass,
+        MappingProxyType(
+            {
+                CONF_URL_PATTERNS: [upstream_server.make_url("/*"), unreachable_url],
+                CONF_PREWARM_CONNECTIONS: 1,
+                CONF_KEEPALIVE_TIMEOUT: 0,
+            }
+        ),
+    )
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+    await hass.async_block_till_done(wait_background_tasks=True)
+
+    prewarmer = config_entry.runtime_data.connection_prewarmer
+    assert prewarmer is not None
+    assert prewarmer.get_stats() == {"hosts": [], "warmed": 0, "failures": 1}
+    assert upstream_server.get_request_count("/") == 0
+
+
+async def test_prewarm_connections_removed_with_urls(
+    hass: HomeAssistant,
+    upstream_server: UpstreamServer,
+    unused_tcp_port_factory: Callable[[], int],
+) -> None:
+    """Test that hosts are forgotten once no dynamic proxied URL uses them."""
+    upstream_server.handlers["/"] = _root
+    config_entry = create_mock_hass_web_proxy_config_entry(
+        hass,
+        MappingProxyType(
+            {
+                CONF_DYNAMIC_URLS: True,
+                CONF_DYNAMIC_URLS_MAX: 2,
+                CONF_PREWARM_CONNECTIONS: 2,
+                CONF_KEEPALIVE_TIMEOUT: 60,
+            }
+        ),
+    )
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+
+    async def _create(url_id: str, url_pattern: str) -> None:
+        await hass.services.async_call(
+            DOMAIN,
+            SERVICE_CREATE_PROXIED_URL,
+            {CONF_URL_ID: url_id, CONF_URL_PATTERN: url_pattern},
+            blocking=True,
+        )
+        await hass.async_block_till_done(wait_background_tasks=True)
+
+    prewarmer = config_entry.runtime_data.connection_prewarmer
+    assert prewarmer is not None
+    upstream_url = upstream_server.make_url("/*")
+    upstream_origin = str(get_prewarm_origin(upstream_url))
+    await _create("first", upstream_url)
+    await _create("second", upstream_url)
+    assert prewarmer.get_stats()["hosts"] == [upstream_origin]
+
+    # The host is kept while any URL (including a replaced one) still uses it.
+    await _create("first", upstream_server.make_url("/other/*"))
+    await hass.services.async_call(
+        DOMAIN, SERVICE_DELETE_PROXIED_URL, {CONF_URL_ID: "second"}, blocking=True
+    )
+    assert prewarmer.get_stats()["hosts"] == [upstream_origin]
+
+    # Evicted URLs release their hosts too (and unreachable hosts are forgotten).
+    unreachable_url = f"http://127.0.0.1:{unused_tcp_port_factory()}/*"
+    await _create("second", unreachable_url)
+    await _create("third", "http://*/*")
+    assert prewarmer.get_stats()["hosts"] == []
+    assert upstream_server.get_request_count("/") == 1
+
+    # Wildcard hosts are never kept warm, so removing them changes nothing.
+    await hass.services.async_call(
+        DOMAIN, SERVICE_DELETE_PROXIED_URL, {CONF_URL_ID: "third"}, blocking=True
+    )
+    assert prewarmer.get_stats()["hosts"] == []
+
+
+async def test_prewarm_connections_limited(
+    hass: HomeAssistant,
+    upstream_server: UpstreamServer,
+) -> None:
+    """Test that warm-ups respect the circuit breaker and per-host limit."""
+    upstream_server.handlers["/"] = _root
+    upstream_url = upstream_server.make_url("/*")
+    config_entry = create_mock_hass_web_proxy_config_entry(
+        hass,
+        MappingProxyType(
+            {
+                CONF_URL_PATTERNS: [upstream_url],
+                CONF_PREWARM_CONNECTIONS: 1,
+                CONF_KEEPALIVE_TIMEOUT: 60,
+                CONF_CIRCUIT_BREAKER_THRESHOLD: 1,
+                CONF_REQUEST_LIMIT_PER_HOST: 1,
+            }
+        ),
+    )
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+    await hass.async_block_till_done(wait_background_tasks=True)
+
+    data = config_entry.runtime_data
+    prewarmer = data.connection_prewarmer
+    assert prewarmer is not None
+    assert data.circuit_breaker is not None
+    assert data.concurrency_limiter is not None
+    warmed = prewarmer.warmed
+    assert warmed == 1
+    host = get_host_key(URL(upstream_url))
+
+    # Warm-ups never wait for a slot taken by a proxied request.
+    assert data.concurrency_limiter.try_acquire(host)
+    await prewarmer.async_refresh()
+    assert prewarmer.warmed == 1
+    data.concurrency_limiter.release(host)
+
+    # Nor are they made to a host with an open circuit.
+    data.circuit_breaker.record_failure(host)
+    await prewarmer.async_refresh()
+    assert prewarmer.warmed == 1
+    assert upstream_server.get_request_count("/") == 1
+
+    data.circuit_breaker.record_success(host)
+    await prewarmer.async_refresh()
+    assert prewarmer.warmed == warmed + 1
+    assert upstream_server.get_request_count("/") == prewarmer.warmed
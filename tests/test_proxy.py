@@ -9,38 +9,58 @@ import uuid
 from http import HTTPStatus
 from types import MappingProxyType
 from typing import TYPE_CHECKING, Any
+from unittest.mock import patch
 
 import aiohttp
 import pytest
+from aiohttp import hdrs, web
 from homeassistant.exceptions import ServiceValidationError
 
 from custom_components.hass_web_proxy.const import (
+    ATTR_TOKEN,
+    ATTR_TOKENS,
     CONF_ALLOW_UNAUTHENTICATED,
     CONF_DYNAMIC_URLS,
+    CONF_DYNAMIC_URLS_EVICTION,
+    CONF_DYNAMIC_URLS_EVICTION_OLDEST,
+    CONF_DYNAMIC_URLS_MAX,
     CONF_OPEN_LIMIT,
+    CONF_PROXIED_URLS,
+    CONF_SIGNED,
+    CONF_SIGNING_KEY,
     CONF_SSL_CIPHERS,
     CONF_SSL_CIPHERS_DEFAULT,
     CONF_SSL_CIPHERS_INSECURE,
     CONF_SSL_CIPHERS_INTERMEDIATE,
     CONF_SSL_CIPHERS_MODERN,
     CONF_SSL_VERIFICATION,
+    CONF_TAG,
     CONF_TTL,
     CONF_URL_ID,
+    CONF_URL_ID_PREFIX,
+    CONF_URL_IDS,
     CONF_URL_PATTERN,
     CONF_URL_PATTERNS,
     DOMAIN,
     SERVICE_CREATE_PROXIED_URL,
+    SERVICE_CREATE_PROXIED_URLS,
     SERVICE_DELETE_PROXIED_URL,
+    SERVICE_DELETE_PROXIED_URLS,
+    SERVICE_GET_STATS,
+    SERVICE_REVOKE_SIGNED_URLS,
 )
 from custom_components.hass_web_proxy.proxy import (
     async_setup_entry as async_proxy_setup_entry,
 )
 from tests import (
+    UpstreamServer,
     create_mock_hass_web_proxy_config_entry,
     setup_mock_hass_web_proxy_config_entry,
 )
 
 if TYPE_CHECKING:
+    from pathlib import Path
+
     from homeassistant.core import HomeAssistant
 
 TEST_OPTIONS = MappingProxyType(
@@ -311,6 +331,254 @@ async def test_proxy_view_dynamic_url_open_limit(
     assert resp.status == HTTPStatus.NOT_FOUND
 
 
+async def test_proxy_view_dynamic_url_by_id(
+    hass: HomeAssistant,
+    hass_client: Any,
+    upstream_server: UpstreamServer,
+) -> None:
+    """Test that a dynamic URL can be requested by its id."""
+
+    async def _ok(_request: web.Request) -> web.Response:
+        return web.Response(body=b"ok")
+
+    upstream_server.handlers["/camera"] = _ok
+    config_entry = create_mock_hass_web_proxy_config_entry(hass, TEST_OPTIONS)
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+
+    # Both patterns match, but the second is only matched when asked for by id.
+    for url_id, url_pattern in (
+        ("broad", upstream_server.make_url("/*")),
+        ("narrow", upstream_server.make_url("/camera")),
+    ):
+        await hass.services.async_call(
+            DOMAIN,
+            SERVICE_CREATE_PROXIED_URL,
+            {
+                **TEST_SERVICE_CALL_PARAMS,
+                CONF_URL_ID: url_id,
+                CONF_URL_PATTERN: url_pattern,
+            },
+            blocking=True,
+        )
+
+    url = urllib.parse.quote_plus(upstream_server.make_url("/camera"))
+    other_url = urllib.parse.quote_plus(upstream_server.make_url("/other"))
+    authenticated_hass_client = await hass_client()
+    for query, status in (
+        (f"url={url}&url_id=narrow", HTTPStatus.OK),
+        (f"url={url}", HTTPStatus.OK),
+        (f"url={other_url}&url_id=narrow", HTTPStatus.NOT_FOUND),
+        (f"url={url}&url_id=missing", HTTPStatus.NOT_FOUND),
+    ):
+        resp = await authenticated_hass_client.get(f"/api/hass_web_proxy/v0/?{query}")
+        assert resp.status == status
+
+    assert config_entry.runtime_data.metrics.url_id_requests == {
+        "narrow": 1,
+        "broad": 1,
+    }
+
+
+def _get_signed_path(
+    upstream_server: UpstreamServer, path: str, token: str | None
+) -> str:
+    """Get the proxy path of a signed URL (or of the URL alone, without a token)."""
+    url = urllib.parse.quote_plus(upstream_server.make_url(path))
+    token_param = f"&token={token}" if token is not None else ""
+    return f"/api/hass_web_proxy/v0/?url={url}{token_param}"
+
+
+async def _async_create_signed_url(
+    hass: HomeAssistant, url_pattern: str, **data: Any
+) -> str:
+    """Create a signed URL, getting its token."""
+    response = await hass.services.async_call(
+        DOMAIN,
+        SERVICE_CREATE_PROXIED_URL,
+        {
+            **TEST_SERVICE_CALL_PARAMS,
+            CONF_URL_PATTERN: url_pattern,
+            CONF_URL_ID: "signed",
+            CONF_SIGNED: True,
+            CONF_TTL: 60,
+            **data,
+        },
+        blocking=True,
+        return_response=True,
+    )
+    assert response is not None
+    return str(response[ATTR_TOKEN])
+
+
+async def test_proxy_view_signed_url(
+    hass: HomeAssistant,
+    hass_client: Any,
+    upstream_server: UpstreamServer,
+) -> None:
+    """Test that a signed URL is proxied by its token alone."""
+
+    async def _ok(_request: web.Request) -> web.Response:
+        return web.Response(body=b"ok")
+
+    upstream_server.handlers["/camera"] = _ok
+    upstream_server.handlers["/other"] = _ok
+    config_entry = create_mock_hass_web_proxy_config_entry(hass, TEST_OPTIONS)
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+
+    token = await _async_create_signed_url(hass, upstream_server.make_url("/camera"))
+    assert not config_entry.runtime_data.dynamic_proxied_urls
+
+    # The signing key is kept, so tokens remain valid when the entry is reloaded.
+    await hass.config_entries.async_reload(config_entry.entry_id)
+    await hass.async_block_till_done()
+
+    authenticated_hass_client = await hass_client()
+    for path, status in (
+        (_get_signed_path(upstream_server, "/camera", None), HTTPStatus.NOT_FOUND),
+        (_get_signed_path(upstream_server, "/camera", token), HTTPStatus.OK),
+        (_get_signed_path(upstream_server, "/other", token), HTTPStatus.NOT_FOUND),
+        (
+            _get_signed_path(upstream_server, "/camera", f"A{token}"),
+            HTTPStatus.NOT_FOUND,
+        ),
+    ):
+        resp = await authenticated_hass_client.get(path)
+        assert resp.status == status
+
+
+async def test_proxy_view_signed_url_requires_ttl(hass: HomeAssistant) -> None:
+    """Test that signed URLs must expire."""
+    config_entry = create_mock_hass_web_proxy_config_entry(hass, TEST_OPTIONS)
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+
+    with pytest.raises(ServiceValidationError) as service_validation_error:
+        await _async_create_signed_url(hass, "http://cam.local/*", **{CONF_TTL: 0})
+
+    assert str(service_validation_error.value) == (
+        "Signed URLs require a ttl, as they cannot be deleted"
+    )
+
+
+async def test_proxy_view_signed_url_revoked(
+    hass: HomeAssistant,
+    hass_client: Any,
+    upstream_server: UpstreamServer,
+) -> None:
+    """Test that all signed URLs are revoked by signing with a new key."""
+
+    async def _ok(_request: web.Request) -> web.Response:
+        return web.Response(body=b"ok")
+
+    upstream_server.handlers["/camera"] = _ok
+    url = upstream_server.make_url("/camera")
+    config_entry = create_mock_hass_web_proxy_config_entry(hass, TEST_OPTIONS)
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+    token = await _async_create_signed_url(hass, url)
+    await _async_create_signed_url(
+        hass, url, **{CONF_URL_ID: "limited", CONF_OPEN_LIMIT: 1}
+    )
+    assert list(config_entry.runtime_data.dynamic_proxied_urls) == ["limited"]
+    signing_key = config_entry.data[CONF_SIGNING_KEY]
+
+    await hass.services.async_call(DOMAIN, SERVICE_REVOKE_SIGNED_URLS, blocking=True)
+    await hass.async_block_till_done()
+    assert not config_entry.runtime_data.dynamic_proxied_urls
+    assert config_entry.data[CONF_SIGNING_KEY] != signing_key
+    new_token = await _async_create_signed_url(hass, url)
+
+    authenticated_hass_client = await hass_client()
+    resp = await authenticated_hass_client.get(
+        _get_signed_path(upstream_server, "/camera", token)
+    )
+    assert resp.status == HTTPStatus.NOT_FOUND
+    resp = await authenticated_hass_client.get(
+        _get_signed_path(upstream_server, "/camera", new_token)
+    )
+    assert resp.status == HTTPStatus.OK
+
+
+async def test_proxy_view_signed_url_dynamic_urls_disabled(
+    hass: HomeAssistant,
+    hass_client: Any,
+    upstream_server: UpstreamServer,
+) -> None:
+    """Test that tokens are only accepted while dynamic URLs are enabled."""
+
+    async def _ok(_request: web.Request) -> web.Response:
+        return web.Response(body=b"ok")
+
+    upstream_server.handlers["/camera"] = _ok
+    config_entry = create_mock_hass_web_proxy_config_entry(hass, TEST_OPTIONS)
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+    token = await _async_create_signed_url(hass, upstream_server.make_url("/camera"))
+
+    hass.config_entries.async_update_entry(
+        config_entry, options={**TEST_OPTIONS, CONF_DYNAMIC_URLS: False}
+    )
+    await hass.async_block_till_done()
+
+    authenticated_hass_client = await hass_client()
+    resp = await authenticated_hass_client.get(
+        _get_signed_path(upstream_server, "/camera", token)
+    )
+    assert resp.status == HTTPStatus.NOT_FOUND
+
+
+async def test_proxy_view_signed_url_open_limit(
+    hass: HomeAssistant,
+    hass_client: Any,
+    upstream_server: UpstreamServer,
+) -> None:
+    """Test that signed URLs with open limits are registered to count opens."""
+
+    async def _ok(_request: web.Request) -> web.Response:
+        return web.Response(body=b"ok")
+
+    upstream_server.handlers["/camera"] = _ok
+    config_entry = create_mock_hass_web_proxy_config_entry(hass, TEST_OPTIONS)
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+
+    response = await hass.services.async_call(
+        DOMAIN,
+        SERVICE_CREATE_PROXIED_URLS,
+        {
+            CONF_PROXIED_URLS: [
+                {
+                    CONF_URL_PATTERN: upstream_server.make_url("/camera"),
+                    CONF_URL_ID: "limited",
+                    CONF_OPEN_LIMIT: 1,
+                    CONF_SIGNED: True,
+                },
+                {
+                    CONF_URL_PATTERN: upstream_server.make_url("/camera"),
+                    CONF_URL_ID: "unsigned",
+                },
+            ]
+        },
+        blocking=True,
+        return_response=True,
+    )
+    assert response is not None
+    assert list(response[ATTR_TOKENS]) == ["limited"]
+    assert list(config_entry.runtime_data.dynamic_proxied_urls) == [
+        "limited",
+        "unsigned",
+    ]
+    path = (
+        "/api/hass_web_proxy/v0/"
+        f"?url={urllib.parse.quote_plus(upstream_server.make_url('/camera'))}"
+        f"&token={response[ATTR_TOKENS]['limited']}"
+    )
+
+    authenticated_hass_client = await hass_client()
+    resp = await authenticated_hass_client.get(path)
+    assert resp.status == HTTPStatus.OK
+    assert list(config_entry.runtime_data.dynamic_proxied_urls) == ["unsigned"]
+
+    resp = await authenticated_hass_client.get(path)
+    assert resp.status == HTTPStatus.NOT_FOUND
+
+
 @pytest.mark.freeze_time
 async def test_proxy_view_dynamic_url_ttl(
     hass: HomeAssistant,
@@ -439,6 +707,7 @@ async def test_proxy_websocket_view_success(
 
         request = await ws.receive_json()
         assert request["url"] == f"{local_server}ws"
+        assert config_entry.runtime_data.metrics.active_websockets == 1
 
         # Test sending text data.
         result = await asyncio.gather(
@@ -447,3 +716,296 @@ async def test_proxy_websocket_view_success(
         )
         assert result[1].type == aiohttp.WSMsgType.TEXT
         assert result[1].data == "hello!"
+
+
+async def test_proxy_view_invalid_static_url_pattern_ignored(
+    hass: HomeAssistant,
+    local_server: Any,
+    hass_client: Any,
+) -> None:
+    """Verify invalid static URL patterns are ignored."""
+    config_entry = create_mock_hass_web_proxy_config_entry(
+        hass,
+        MappingProxyType(
+            {
+                **TEST_OPTIONS,
+                CONF_URL_PATTERNS: ["not a pattern", str(local_server)],
+            }
+        ),
+    )
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+
+    authenticated_hass_client = await hass_client()
+    resp = await authenticated_hass_client.get(
+        f"/api/hass_web_proxy/v0/?url={urllib.parse.quote_plus(str(local_server))}"
+    )
+    assert resp.status == HTTPStatus.OK
+
+
+async def test_proxy_view_dynamic_url_invalid_pattern(hass: HomeAssistant) -> None:
+    """Test that a dynamic URL with an invalid pattern cannot be created."""
+    config_entry = create_mock_hass_web_proxy_config_entry(hass, TEST_OPTIONS)
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+
+    with pytest.raises(ServiceValidationError) as service_validation_error:
+        await hass.services.async_call(
+            DOMAIN,
+            SERVICE_CREATE_PROXIED_URL,
+            {
+                **TEST_SERVICE_CALL_PARAMS,
+                CONF_URL_PATTERN: "not a pattern",
+            },
+            blocking=True,
+        )
+
+    assert (
+        str(service_validation_error.value) == 'URL pattern "not a pattern" is invalid'
+    )
+    assert not config_entry.runtime_data.dynamic_proxied_urls
+
+
+async def test_proxy_view_dynamic_urls_bulk(hass: HomeAssistant) -> None:
+    """Test creating and deleting many dynamic URLs at once."""
+    config_entry = create_mock_hass_web_proxy_config_entry(hass, TEST_OPTIONS)
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+    data = config_entry.runtime_data
+
+    response = await hass.services.async_call(
+        DOMAIN,
+        SERVICE_CREATE_PROXIED_URLS,
+        {
+            CONF_PROXIED_URLS: [
+                {CONF_URL_PATTERN: "http://camera-1.local/*", CONF_URL_ID: "s1-cam1"},
+                {CONF_URL_PATTERN: "http://camera-2.local/*", CONF_URL_ID: "s1-cam2"},
+                {
+                    CONF_URL_PATTERN: "http://camera-3.local/*",
+                    CONF_URL_ID: "s1-cam3",
+                    CONF_TAG: "other",
+                },
+                {CONF_URL_PATTERN: "http://camera-4.local/*"},
+            ],
+            CONF_TAG: "session-1",
+        },
+        blocking=True,
+        return_response=True,
+    )
+    assert response is not None
+    url_ids = response[CONF_URL_IDS]
+    assert url_ids[:3] == ["s1-cam1", "s1-cam2", "s1-cam3"]
+    assert list(data.dynamic_proxied_urls) == url_ids
+    assert data.dynamic_url_index.match("http://camera-2.local/x") == (
+        "s1-cam2",
+        data.dynamic_proxied_urls["s1-cam2"],
+    )
+    assert data.dynamic_proxied_urls["s1-cam3"].tag == "other"
+
+    # Nothing is created if any URL pattern is invalid.
+    url_count = len(data.dynamic_proxied_urls)
+    with pytest.raises(ServiceValidationError):
+        await hass.services.async_call(
+            DOMAIN,
+            SERVICE_CREATE_PROXIED_URLS,
+            {
+                CONF_PROXIED_URLS: [
+                    {CONF_URL_PATTERN: "http://camera-5.local/*"},
+                    {CONF_URL_PATTERN: "not a pattern"},
+                ]
+            },
+            blocking=True,
+        )
+    assert len(data.dynamic_proxied_urls) == url_count
+
+    # Nothing is deleted if any URL ID does not exist.
+    with pytest.raises(ServiceValidationError):
+        await hass.services.async_call(
+            DOMAIN,
+            SERVICE_DELETE_PROXIED_URLS,
+            {CONF_URL_IDS: ["s1-cam1", "not-existant-id"]},
+            blocking=True,
+        )
+    assert len(data.dynamic_proxied_urls) == url_count
+
+    response = await hass.services.async_call(
+        DOMAIN,
+        SERVICE_DELETE_PROXIED_URLS,
+        {CONF_URL_ID_PREFIX: "s1-", CONF_TAG: "session-1"},
+        blocking=True,
+        return_response=True,
+    )
+    assert response == {CONF_URL_IDS: ["s1-cam1", "s1-cam2"]}
+
+    response = await hass.services.async_call(
+        DOMAIN,
+        SERVICE_DELETE_PROXIED_URLS,
+        {CONF_URL_IDS: ["s1-cam3"], CONF_TAG: "session-1"},
+        blocking=True,
+        return_response=True,
+    )
+    assert response == {CONF_URL_IDS: ["s1-cam3", url_ids[3]]}
+    assert not data.dynamic_proxied_urls
+    assert data.dynamic_url_index.match("http://camera-2.local/x") is None
+
+
+async def test_proxy_view_dynamic_urls_max(hass: HomeAssistant) -> None:
+    """Test that the oldest dynamic URLs are evicted beyond the maximum."""
+    config_entry = create_mock_hass_web_proxy_config_entry(
+        hass,
+        MappingProxyType(
+            {
+                **TEST_OPTIONS,
+                CONF_DYNAMIC_URLS_MAX: 2,
+                CONF_DYNAMIC_URLS_EVICTION: CONF_DYNAMIC_URLS_EVICTION_OLDEST,
+            }
+        ),
+    )
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+
+    for index in range(3):
+        await hass.services.async_call(
+            DOMAIN,
+            SERVICE_CREATE_PROXIED_URL,
+            {
+                **TEST_SERVICE_CALL_PARAMS,
+                CONF_URL_ID: f"camera-{index}",
+                CONF_URL_PATTERN: f"http://camera-{index}.local/*",
+            },
+            blocking=True,
+        )
+
+    assert list(config_entry.runtime_data.dynamic_proxied_urls) == [
+        "camera-1",
+        "camera-2",
+    ]
+    stats = await hass.services.async_call(
+        DOMAIN, SERVICE_GET_STATS, blocking=True, return_response=True
+    )
+    assert stats is not None
+    assert stats["dynamic_url_evictions"] == 1
+
+    # Batches beyond the maximum are rejected, rather than evicting themselves.
+    with pytest.raises(ServiceValidationError) as service_validation_error:
+        await hass.services.async_call(
+            DOMAIN,
+            SERVICE_CREATE_PROXIED_URLS,
+            {
+                CONF_PROXIED_URLS: [
+                    {CONF_URL_PATTERN: f"http://camera-{index}.local/*"}
+                    for index in range(3, 6)
+                ]
+            },
+            blocking=True,
+        )
+    assert str(service_validation_error.value) == (
+        "More proxied URLs than the maximum of 2 were created at once"
+    )
+    assert list(config_entry.runtime_data.dynamic_proxied_urls) == [
+        "camera-1",
+        "camera-2",
+    ]
+
+
+async def test_proxy_view_reuses_upstream_connections(
+    hass: HomeAssistant,
+    https_upstream_server: UpstreamServer,
+    hass_client: Any,
+) -> None:
+    """Verify repeated requests share an SSL context and a pooled TLS connection."""
+
+    async def _ok(_request: web.Request) -> web.Response:
+        return web.Response(text="ok")
+
+    https_upstream_server.handlers["/"] = _ok
+    url = https_upstream_server.make_url("/")
+    assert url.startswith("https://")
+    # The upstream certificate is self-signed.
+    config_entry = create_mock_hass_web_proxy_config_entry(
+        hass,
+        MappingProxyType(
+            {
+                **TEST_OPTIONS,
+                CONF_SSL_VERIFICATION: False,
+                CONF_URL_PATTERNS: [url],
+            }
+        ),
+    )
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+
+    await hass.services.async_call(
+        DOMAIN,
+        SERVICE_CREATE_PROXIED_URL,
+        {
+            **TEST_SERVICE_CALL_PARAMS,
+            CONF_SSL_VERIFICATION: False,
+            CONF_URL_PATTERN: url,
+        },
+        blocking=True,
+    )
+    dynamic_proxied_url = next(
+        iter(config_entry.runtime_data.dynamic_proxied_urls.values())
+    )
+    static_proxied_url = config_entry.runtime_data.static_url_index.match(url)
+    assert static_proxied_url
+    assert dynamic_proxied_url.ssl_context is static_proxied_url[1].ssl_context
+
+    upstream_connections: list[aiohttp.ClientRequest] = []
+    create_connection = aiohttp.TCPConnector._create_connection  # noqa: SLF001
+
+    async def _create_connection(
+        connector: aiohttp.TCPConnector,
+        req: aiohttp.ClientRequest,
+        *args: Any,
+        **kwargs: Any,
+    ) -> Any:
+        if str(req.url).startswith(https_upstream_server.base_url):
+            upstream_connections.append(req)
+        return await create_connection(connector, req, *args, **kwargs)
+
+    request_count = 5
+    authenticated_hass_client = await hass_client()
+    with patch.object(aiohttp.TCPConnector, "_create_connection", _create_connection):
+        for _ in range(request_count):
+            resp = await authenticated_hass_client.get(
+                f"/api/hass_web_proxy/v0/?url={urllib.parse.quote_plus(url)}"
+            )
+            assert resp.status == HTTPStatus.OK
+            assert await resp.text() == "ok"
+
+    # Every request is made over the single TLS connection opened by the first.
+    assert len(upstream_connections) == 1
+    assert upstream_connections[0].is_ssl()
+    assert https_upstream_server.get_request_count("/") == request_count
+
+
+async def test_proxy_view_range_passthrough(
+    hass: HomeAssistant,
+    hass_client: Any,
+    upstream_server: UpstreamServer,
+    tmp_path: Path,
+) -> None:
+    """Verify byte range requests are forwarded, and partial content returned."""
+    clip_path = tmp_path / "clip.mp4"
+    clip_path.write_bytes(bytes(range(256)) * 4)
+
+    async def _clip(_request: web.Request) -> web.FileResponse:
+        return web.FileResponse(clip_path)
+
+    upstream_server.handlers["/clip.mp4"] = _clip
+    url = upstream_server.make_url("/clip.mp4")
+    config_entry = create_mock_hass_web_proxy_config_entry(
+        hass, MappingProxyType({**TEST_OPTIONS, CONF_URL_PATTERNS: [url]})
+    )
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+
+    authenticated_hass_client = await hass_client()
+    resp = await authenticated_hass_client.get(
+        f"/api/hass_web_proxy/v0/?url={urllib.parse.quote_plus(url)}",
+        headers={hdrs.RANGE: "bytes=10-19", hdrs.ACCEPT_ENCODING: "gzip"},
+    )
+    assert resp.status == HTTPStatus.PARTIAL_CONTENT
+    assert resp.headers[hdrs.CONTENT_RANGE] == "bytes 10-19/1024"
+    assert resp.headers[hdrs.CONTENT_LENGTH] == "10"
+    assert await resp.read() == bytes(range(10, 20))
+
+    upstream_request = upstream_server.requests[-1]
+    assert upstream_request.headers[hdrs.RANGE] == "bytes=10-19"
+    assert upstream_request.headers[hdrs.ACCEPT_ENCODING] == "identity"
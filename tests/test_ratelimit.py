@@ -0,0 +1,153 @@
+"""Test the HASS Web Proxy rate limits."""
+
+from __future__ import annotations
+
+import datetime
+import urllib.parse
+from http import HTTPStatus
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any
+from unittest.mock import patch
+
+import pytest
+from aiohttp import hdrs, web
+
+from custom_components.hass_web_proxy.const import (
+    CONF_DYNAMIC_URLS,
+    CONF_OPEN_LIMIT,
+    CONF_RATE_LIMIT,
+    CONF_RATE_LIMIT_BURST,
+    CONF_URL_ID,
+    CONF_URL_PATTERN,
+    CONF_URL_PATTERN_OPTIONS,
+    CONF_URL_PATTERNS,
+    DOMAIN,
+    SERVICE_CREATE_PROXIED_URL,
+)
+from custom_components.hass_web_proxy.ratelimit import RateLimiter, create_rate_limiter
+from tests import (
+    UpstreamServer,
+    create_mock_hass_web_proxy_config_entry,
+    setup_mock_hass_web_proxy_config_entry,
+)
+
+if TYPE_CHECKING:
+    from homeassistant.core import HomeAssistant
+
+
+@pytest.mark.freeze_time
+def test_rate_limiter(freezer: Any) -> None:
+    """Test that each client may burst, then make requests at the rate."""
+    rate_limiter = RateLimiter(rate=1, burst=2)
+
+    allowed = [rate_limiter.allow("client") for _ in range(3)]
+    assert rate_limiter.allow("other")
+
+    freezer.tick(datetime.timedelta(seconds=1))
+    allowed += [rate_limiter.allow("client") for _ in range(2)]
+
+    # Tokens refill no further than the burst.
+    freezer.tick(datetime.timedelta(seconds=10))
+    allowed += [rate_limiter.allow("client") for _ in range(3)]
+
+    assert allowed == [True, True, False, True, False, True, True, False]
+    assert rate_limiter.rejected == allowed.count(False)
+    assert rate_limiter.retry_after == 1
+
+
+def test_create_rate_limiter_disabled() -> None:
+    """Test that no rate limiter is created without a rate."""
+    assert create_rate_limiter(None) is None
+
+
+@pytest.mark.parametrize(
+    ("rate", "burst", "expected_burst", "expected_retry_after"),
+    [(2.5, None, 3, 1), (0.5, 5, 5, 2)],
+)
+def test_create_rate_limiter(
+    rate: float, burst: int | None, expected_burst: int, expected_retry_after: int
+) -> None:
+    """Test creating rate limiters, with a burst of the rate by default."""
+    rate_limiter = create_rate_limiter(rate, burst)
+    assert rate_limiter is not None
+    assert rate_limiter.burst == expected_burst
+    assert rate_limiter.retry_after == expected_retry_after
+
+
+@pytest.mark.freeze_time
+def test_rate_limiter_clients_bounded(freezer: Any) -> None:
+    """Test that refilled buckets, then the oldest, are forgotten first."""
+    rate_limiter = RateLimiter(rate=1, burst=1)
+    max_clients = 2
+    with patch(
+        "custom_components.hass_web_proxy.ratelimit.MAX_TRACKED_CLIENTS", max_clients
+    ):
+        rate_limiter.allow("first")
+        rate_limiter.allow("second")
+        rate_limiter.allow("third")
+        assert len(rate_limiter) == max_clients
+        # The first client was forgotten, so has a full bucket again.
+        assert rate_limiter.allow("first")
+
+        freezer.tick(datetime.timedelta(seconds=1))
+        rate_limiter.allow("fourth")
+        assert len(rate_limiter) == 1
+
+
+async def test_proxy_view_rate_limit(
+    hass: HomeAssistant,
+    hass_client: Any,
+    upstream_server: UpstreamServer,
+) -> None:
+    """Test that requests beyond a rate limit get a 429, without using an open."""
+
+    async def _ok(_request: web.Request) -> web.Response:
+        return web.Response(body=b"ok")
+
+    upstream_server.handlers["/dynamic"] = _ok
+    upstream_server.handlers["/static"] = _ok
+    static_url = upstream_server.make_url("/static")
+    config_entry = create_mock_hass_web_proxy_config_entry(
+        hass,
+        MappingProxyType(
+            {
+                CONF_DYNAMIC_URLS: True,
+                CONF_URL_PATTERNS: [static_url],
+                CONF_URL_PATTERN_OPTIONS: {static_url: {CONF_RATE_LIMIT: 1}},
+            }
+        ),
+    )
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+    open_limit = 3
+    await hass.services.async_call(
+        DOMAIN,
+        SERVICE_CREATE_PROXIED_URL,
+        {
+            CONF_URL_PATTERN: upstream_server.make_url("/dynamic"),
+            CONF_URL_ID: "dynamic",
+            CONF_OPEN_LIMIT: open_limit,
+            CONF_RATE_LIMIT: 0.5,
+            CONF_RATE_LIMIT_BURST: 1,
+        },
+        blocking=True,
+    )
+
+    client = await hass_client()
+    retry_afters = {"/dynamic": "2", "/static": "1"}
+    for path, retry_after in retry_afters.items():
+        url = (
+            "/api/hass_web_proxy/v0/"
+            f"?url={urllib.parse.quote_plus(upstream_server.make_url(path))}"
+        )
+        resp = await client.get(url)
+        assert resp.status == HTTPStatus.OK
+
+        resp = await client.get(url)
+        assert resp.status == HTTPStatus.TOO_MANY_REQUESTS
+        assert resp.headers[hdrs.RETRY_AFTER] == retry_after
+
+    data = config_entry.runtime_data
+    # Only the allowed request used an open.
+    assert data.dynamic_proxied_urls["dynamic"].open_limit == open_limit - 1
+    assert data.metrics.rate_limited == len(retry_afters)
+    assert upstream_server.get_request_count("/dynamic") == 1
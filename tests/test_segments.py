@@ -0,0 +1,525 @@
+"""Test the HASS Web Proxy media segment cache."""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import os
+import threading
+import urllib.parse
+from http import HTTPStatus
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any
+from unittest.mock import Mock, patch
+
+import pytest
+from aiohttp import hdrs, web
+from aiohttp.test_utils import make_mocked_request
+
+from custom_components.hass_web_proxy.const import (
+    CONF_SEGMENT_CACHE_SIZE,
+    CONF_SEGMENT_CACHE_URL_PATTERNS,
+    CONF_URL_PATTERNS,
+)
+from custom_components.hass_web_proxy.segments import (
+    SegmentCache,
+    get_segment_key,
+    parse_content_range,
+    parse_range,
+)
+from tests import (
+    UpstreamServer,
+    create_mock_hass_web_proxy_config_entry,
+    setup_mock_hass_web_proxy_config_entry,
+)
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from pathlib import Path
+
+    from homeassistant.core import HomeAssistant
+
+SEGMENT_CONTENT_TYPE = "video/iso.segment"
+
+# The number of times each segment is requested.
+REQUEST_COUNT = 3
+
+
+def _write_segment(directory: Path, url: str, body: bytes, mtime: float) -> str:
+    """Write a cached segment to disk."""
+    key = get_segment_key(url)
+    path = directory / f"{key}.seg"
+    path.write_bytes(body)
+    (directory / f"{key}.json").write_text('{"headers": {}}')
+    os.utime(path, (mtime, mtime))
+    return key
+
+
+async def _setup_segment_cache(
+    hass: HomeAssistant, tmp_path: Path, upstream_server: UpstreamServer
+) -> SegmentCache:
+    """Set up the integration with the segment cache enabled."""
+    hass.config.config_dir = str(tmp_path)
+    config_entry = create_mock_hass_web_proxy_config_entry(
+        hass,
+        MappingProxyType(
+            {
+                CONF_URL_PATTERNS: [upstream_server.make_url("/*")],
+                CONF_SEGMENT_CACHE_SIZE: 1,
+                CONF_SEGMENT_CACHE_URL_PATTERNS: [
+                    upstream_server.make_url("/vod/*"),
+                    "not a pattern",
+                ],
+            }
+        ),
+    )
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+    segment_cache = config_entry.runtime_data.segment_cache
+    assert segment_cache is not None
+    return segment_cache
+
+
+def _get_proxy_path(url: str) -> str:
+    """Get the proxy path for a URL."""
+    return f"/api/hass_web_proxy/v0/?url={urllib.parse.quote_plus(url)}"
+
+
+@contextlib.contextmanager
+def _track_added_ranges(segment_cache: SegmentCache) -> Iterator[asyncio.Queue[None]]:
+    """Track the byte ranges added to the cache, once their response is sent."""
+    added: asyncio.Queue[None] = asyncio.Queue()
+    add_range = segment_cache._async_add_range  # noqa: SLF001
+
+    async def _async_add_range(*args: Any) -> None:
+        await add_range(*args)
+        added.put_nowait(None)
+
+    with patch.object(segment_cache, "_async_add_range", _async_add_range):
+        yield added
+
+
+@pytest.mark.parametrize(
+    ("value", "expected"),
+    [
+        ("bytes=0-99", (0, 100)),
+        ("bytes=900-", (900, 1000)),
+        ("bytes=900-1999", (900, 1000)),
+        ("bytes=-100", (900, 1000)),
+        ("bytes=-2000", (0, 1000)),
+        ("bytes=1000-", None),
+        ("bytes=-", None),
+        ("bytes=0-9,20-29", None),
+        ("items=0-9", None),
+    ],
+)
+def test_parse_range(value: str, expected: tuple[int, int] | None) -> None:
+    """Test parsing byte range requests."""
+    assert parse_range(value, 1000) == expected
+
+
+@pytest.mark.parametrize(
+    ("value", "expected"),
+    [
+        ("bytes 0-99/1000", (0, 100, 1000)),
+        ("bytes 0-999/1000", (0, 1000, 1000)),
+        ("bytes 0-1000/1000", None),
+        ("bytes 100-0/1000", None),
+        ("bytes */1000", None),
+        (None, None),
+    ],
+)
+def test_parse_content_range(
+    value: str | None, expected: tuple[int, int, int] | None
+) -> None:
+    """Test parsing Content-Range headers."""
+    assert parse_content_range(value) == expected
+
+
+def test_segment_cache_load(tmp_path: Path) -> None:
+    """Test that the index is rebuilt from disk, least recently written first."""
+    (tmp_path / "interrupted.tmp").write_bytes(b"partial")
+    (tmp_path / "orphan.seg").write_bytes(b"orphan")
+    (tmp_path / "orphan-headers.json").write_text("{}")
+    oldest = _write_segment(tmp_path, "http://cam/1.ts", b"1" * 40, 1000)
+    newest = _write_segment(tmp_path, "http://cam/2.ts", b"2" * 40, 3000)
+    middle = _write_segment(tmp_path, "http://cam/3.ts", b"3" * 40, 2000)
+    (tmp_path / f"{middle}.part").write_bytes(b"superseded")
+
+    # Partial content is sparse, so only the space it uses counts.
+    partial = get_segment_key("http://cam/4.mp4")
+    with (tmp_path / f"{partial}.part").open("wb") as partial_file:
+        partial_file.truncate(1024 * 1024)
+    (tmp_path / f"{partial}.json").write_text(
+        '{"headers": {}, "length": 1048576, "ranges": []}'
+    )
+    os.utime(tmp_path / f"{partial}.part", (4000, 4000))
+
+    segment_cache = SegmentCache(Mock(), tmp_path, max_size=100, url_patterns=[])
+    segment_cache.load()
+
+    assert len(segment_cache) == len([middle, newest, partial])
+    assert segment_cache.get_stats()["evictions"] == 1
+    assert segment_cache.get_stats()["partial_entries"] == 1
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted(
+        [
+            *(f"{key}.{ext}" for key in (middle, newest) for ext in ("seg", "json")),
+            f"{partial}.part",
+            f"{partial}.json",
+        ]
+    )
+    assert not (tmp_path / f"{oldest}.seg").exists()
+
+
+async def test_segment_cache(
+    hass: HomeAssistant,
+    hass_client: Any,
+    upstream_server: UpstreamServer,
+    tmp_path: Path,
+) -> None:
+    """Test that matching segments are served from the disk cache."""
+
+    async def _segment(_request: web.Request) -> web.Response:
+        return web.Response(body=b"segment", content_type=SEGMENT_CONTENT_TYPE)
+
+    upstream_server.handlers["/vod/1.m4s"] = _segment
+    upstream_server.handlers["/live/1.m4s"] = _segment
+    segment_cache = await _setup_segment_cache(hass, tmp_path, upstream_server)
+    authenticated_hass_client = await hass_client()
+
+    for path in ("/vod/1.m4s", "/live/1.m4s"):
+        for _ in range(REQUEST_COUNT):
+            resp = await authenticated_hass_client.get(
+                _get_proxy_path(upstream_server.make_url(path))
+            )
+            assert resp.status == HTTPStatus.OK
+            assert resp.headers[hdrs.CONTENT_TYPE] == SEGMENT_CONTENT_TYPE
+            assert await resp.read() == b"segment"
+
+    assert upstream_server.get_request_count("/vod/1.m4s") == 1
+    assert upstream_server.get_request_count("/live/1.m4s") == REQUEST_COUNT
+    assert segment_cache.get_stats()["hits"] == REQUEST_COUNT - 1
+
+    # Hits leave the cached file as it was, so its validators do not change.
+    validators = set()
+    for _ in range(REQUEST_COUNT):
+        resp = await authenticated_hass_client.get(
+            _get_proxy_path(upstream_server.make_url("/vod/1.m4s"))
+        )
+        validators.add((resp.headers[hdrs.ETAG], resp.headers[hdrs.LAST_MODIFIED]))
+    assert len(validators) == 1
+
+    # Byte ranges are served from cached segments.
+    resp = await authenticated_hass_client.get(
+        _get_proxy_path(upstream_server.make_url("/vod/1.m4s")),
+        headers={hdrs.RANGE: "bytes=0-2"},
+    )
+    assert resp.status == HTTPStatus.PARTIAL_CONTENT
+    assert await resp.read() == b"seg"
+    assert upstream_server.get_request_count("/vod/1.m4s") == 1
+
+
+async def test_segment_cache_compressed(
+    hass: HomeAssistant,
+    hass_client: Any,
+    upstream_server: UpstreamServer,
+    tmp_path: Path,
+) -> None:
+    """Test that compressed segments are sent and cached decompressed."""
+    body = b"x" * 1024
+
+    async def _compressed(_request: web.Request) -> web.Response:
+        response = web.Response(body=body)
+        response.enable_compression(web.ContentCoding.gzip)
+        return response
+
+    upstream_server.handlers["/vod/1.m4s"] = _compressed
+    await _setup_segment_cache(hass, tmp_path, upstream_server)
+    authenticated_hass_client = await hass_client()
+
+    for _ in range(REQUEST_COUNT):
+        resp = await authenticated_hass_client.get(
+            _get_proxy_path(upstream_server.make_url("/vod/1.m4s")),
+            headers={hdrs.ACCEPT_ENCODING: "identity"},
+        )
+        assert resp.status == HTTPStatus.OK
+        assert hdrs.CONTENT_ENCODING not in resp.headers
+        assert await resp.read() == body
+
+    assert upstream_server.get_request_count("/vod/1.m4s") == 1
+
+
+async def test_segment_cache_loaded(
+    hass: HomeAssistant,
+    hass_client: Any,
+    upstream_server: UpstreamServer,
+    tmp_path: Path,
+) -> None:
+    """Test that segments cached before the integration was set up are served."""
+    segment_url = upstream_server.make_url("/vod/1.m4s")
+    clip_url = upstream_server.make_url("/vod/clip.mp4")
+    directory = tmp_path / "hass_web_proxy" / "segments"
+    directory.mkdir(parents=True)
+    _write_segment(directory, segment_url, b"segment", 1000)
+    partial = get_segment_key(clip_url)
+    with (directory / f"{partial}.part").open("wb") as partial_file:
+        partial_file.write(b"x" * 100)
+        partial_file.truncate(1000)
+    (directory / f"{partial}.json").write_text(
+        '{"headers": {}, "length": 1000, "ranges": [[0, 100]]}'
+    )
+    segment_cache = await _setup_segment_cache(hass, tmp_path, upstream_server)
+    authenticated_hass_client = await hass_client()
+
+    resp = await authenticated_hass_client.get(_get_proxy_path(segment_url))
+    assert resp.status == HTTPStatus.OK
+    assert await resp.read() == b"segment"
+
+    resp = await authenticated_hass_client.get(
+        _get_proxy_path(clip_url), headers={hdrs.RANGE: "bytes=0-99"}
+    )
+    assert resp.status == HTTPStatus.PARTIAL_CONTENT
+    assert await resp.read() == b"x" * 100
+
+    assert not upstream_server.requests
+    assert segment_cache.get_stats()["hits"] == len([segment_url, clip_url])
+
+
+async def test_segment_cache_partial_content(
+    hass: HomeAssistant,
+    hass_client: Any,
+    upstream_server: UpstreamServer,
+    tmp_path: Path,
+) -> None:
+    """Test that byte ranges are cached until the whole segment is."""
+    clip = bytes(range(250)) * 4
+    clip_path = tmp_path / "clip.mp4"
+    clip_path.write_bytes(clip)
+
+    async def _clip(_request: web.Request) -> web.FileResponse:
+        return web.FileResponse(clip_path)
+
+    upstream_server.handlers["/vod/clip.mp4"] = _clip
+    segment_cache = await _setup_segment_cache(hass, tmp_path, upstream_server)
+    url = upstream_server.make_url("/vod/clip.mp4")
+    authenticated_hass_client = await hass_client()
+
+    # Ranges are added to the cache once their response is sent, so each fetched
+    # range is waited for.
+    async def _get_range(value: str, count: int, **headers: str) -> Any:
+        fetched = upstream_server.get_request_count("/vod/clip.mp4")
+        with _track_added_ranges(segment_cache) as added:
+            resp = await authenticated_hass_client.get(
+                _get_proxy_path(url), headers={hdrs.RANGE: value, **headers}
+            )
+            assert resp.status == HTTPStatus.PARTIAL_CONTENT
+            start, _, end = value.removeprefix("bytes=").partition("-")
+            assert await resp.read() == clip[int(start) : int(end or len(clip) - 1) + 1]
+            if upstream_server.get_request_count("/vod/clip.mp4") > fetched:
+                await added.get()
+        assert upstream_server.get_request_count("/vod/clip.mp4") == count
+        return resp
+
+    resp = await _get_range("bytes=0-99", 1)
+    assert resp.headers[hdrs.CONTENT_RANGE] == "bytes 0-99/1000"
+    assert segment_cache.get_stats()["partial_entries"] == 1
+
+    await _get_range("bytes=10-49", 1)
+    await _get_range("bytes=50-199", 2)
+    await _get_range("bytes=150-199", 2)
+
+    # Conditional ranges always go upstream.
+    await _get_range("bytes=0-9", 3, **{hdrs.IF_RANGE: resp.headers[hdrs.ETAG]})
+
+    # Once every byte has been fetched, the segment is complete.
+    await _get_range("bytes=200-", 4)
+    assert segment_cache.get_stats()["partial_entries"] == 0
+    request_count = upstream_server.get_request_count("/vod/clip.mp4")
+    resp = await authenticated_hass_client.get(_get_proxy_path(url))
+    assert resp.status == HTTPStatus.OK
+    assert await resp.read() == clip
+    assert upstream_server.get_request_count("/vod/clip.mp4") == request_count
+
+
+async def test_segment_cache_range_completed_meanwhile(
+    hass: HomeAssistant,
+    hass_client: Any,
+    upstream_server: UpstreamServer,
+    tmp_path: Path,
+) -> None:
+    """Test that ranges received once their segment is complete are not added."""
+    clip = bytes(range(250)) * 4
+    clip_path = tmp_path / "clip.mp4"
+    clip_path.write_bytes(clip)
+    release = asyncio.Event()
+
+    async def _clip(request: web.Request) -> web.StreamResponse:
+        if request.headers[hdrs.RANGE] != "bytes=0-99":
+            return web.FileResponse(clip_path)
+        response = web.StreamResponse(
+            status=HTTPStatus.PARTIAL_CONTENT,
+            headers={hdrs.CONTENT_RANGE: "bytes 0-99/1000"},
+        )
+        response.content_length = 100
+        await response.prepare(request)
+        await response.write(clip[:50])
+        await release.wait()
+        await response.write(clip[50:100])
+        return response
+
+    upstream_server.handlers["/vod/clip.mp4"] = _clip
+    segment_cache = await _setup_segment_cache(hass, tmp_path, upstream_server)
+    path = _get_proxy_path(upstream_server.make_url("/vod/clip.mp4"))
+    authenticated_hass_client = await hass_client()
+
+    with _track_added_ranges(segment_cache) as added:
+        slow = await authenticated_hass_client.get(
+            path, headers={hdrs.RANGE: "bytes=0-99"}
+        )
+        for value in ("bytes=0-499", "bytes=500-"):
+            resp = await authenticated_hass_client.get(
+                path, headers={hdrs.RANGE: value}
+            )
+            assert resp.status == HTTPStatus.PARTIAL_CONTENT
+            await resp.read()
+            await added.get()
+        assert segment_cache.get_stats()["partial_entries"] == 0
+
+        release.set()
+        assert slow.status == HTTPStatus.PARTIAL_CONTENT
+        assert await slow.read() == clip[:100]
+        await added.get()
+
+    assert segment_cache.get_stats()["partial_entries"] == 0
+    resp = await authenticated_hass_client.get(path)
+    assert await resp.read() == clip
+    assert upstream_server.get_request_count("/vod/clip.mp4") == len(
+        ["bytes=0-99", "bytes=0-499", "bytes=500-"]
+    )
+
+
+async def test_segment_cache_eviction(
+    hass: HomeAssistant,
+    hass_client: Any,
+    upstream_server: UpstreamServer,
+    tmp_path: Path,
+) -> None:
+    """Test that the least recently used segments are evicted."""
+
+    async def _segment(_request: web.Request) -> web.Response:
+        return web.Response(body=b"x" * 600 * 1024)
+
+    async def _oversized(request: web.Request) -> web.StreamResponse:
+        response = web.StreamResponse()
+        response.enable_chunked_encoding()
+        await response.prepare(request)
+        for _ in range(2):
+            await response.write(b"x" * 600 * 1024)
+        return response
+
+    clip_path = tmp_path / "clip.mp4"
+    clip_path.write_bytes(b"x" * 1000 * 1024)
+
+    async def _clip(_request: web.Request) -> web.FileResponse:
+        return web.FileResponse(clip_path)
+
+    upstream_server.handlers["/vod/1.m4s"] = _segment
+    upstream_server.handlers["/vod/2.m4s"] = _segment
+    upstream_server.handlers["/vod/oversized.m4s"] = _oversized
+    upstream_server.handlers["/vod/clip.mp4"] = _clip
+    segment_cache = await _setup_segment_cache(hass, tmp_path, upstream_server)
+
+    authenticated_hass_client = await hass_client()
+    for path in ("/vod/1.m4s", "/vod/2.m4s", "/vod/oversized.m4s"):
+        resp = await authenticated_hass_client.get(
+            _get_proxy_path(upstream_server.make_url(path))
+        )
+        assert resp.status == HTTPStatus.OK
+        await resp.read()
+
+    assert len(segment_cache) == 1
+    assert segment_cache.get_stats()["evictions"] == 1
+    await hass.async_block_till_done()
+    assert len(list(segment_cache.directory.glob("*.seg"))) == 1
+    assert not list(segment_cache.directory.glob("*.tmp"))
+
+    # Byte ranges of partial content evict segments too.
+    with _track_added_ranges(segment_cache) as added:
+        resp = await authenticated_hass_client.get(
+            _get_proxy_path(upstream_server.make_url("/vod/clip.mp4")),
+            headers={hdrs.RANGE: f"bytes=0-{600 * 1024 - 1}"},
+        )
+        assert resp.status == HTTPStatus.PARTIAL_CONTENT
+        await resp.read()
+        await added.get()
+
+    assert len(segment_cache) == 1
+    assert segment_cache.get_stats()["evictions"] == len(["1.m4s", "2.m4s"])
+    assert segment_cache.get_stats()["partial_entries"] == 1
+    assert not list(segment_cache.directory.glob("*.seg"))
+
+
+async def test_segment_cache_unreadable(
+    hass: HomeAssistant,
+    hass_client: Any,
+    upstream_server: UpstreamServer,
+    tmp_path: Path,
+) -> None:
+    """Test that cached segments with unreadable headers are discarded."""
+
+    async def _segment(_request: web.Request) -> web.Response:
+        return web.Response(body=b"segment")
+
+    upstream_server.handlers["/vod/1.m4s"] = _segment
+    url = upstream_server.make_url("/vod/1.m4s")
+    directory = tmp_path / "hass_web_proxy" / "segments"
+    directory.mkdir(parents=True)
+    _write_segment(directory, url, b"old", 1000)
+    segment_cache = await _setup_segment_cache(hass, tmp_path, upstream_server)
+    (segment_cache.directory / f"{get_segment_key(url)}.json").write_text("{")
+
+    # Concurrent requests that both read the headers only discard the segment once.
+    barrier = threading.Barrier(2, timeout=5)
+    read_metadata = segment_cache._read_metadata  # noqa: SLF001
+
+    def _read_metadata(key: str) -> Any:
+        barrier.wait()
+        return read_metadata(key)
+
+    request = make_mocked_request("GET", "/")
+    with patch.object(segment_cache, "_read_metadata", _read_metadata):
+        assert await asyncio.gather(
+            *(segment_cache.async_get(request, url) for _ in range(2))
+        ) == [None, None]
+    assert not len(segment_cache)
+
+    authenticated_hass_client = await hass_client()
+    resp = await authenticated_hass_client.get(_get_proxy_path(url))
+    assert resp.status == HTTPStatus.OK
+    assert await resp.read() == b"segment"
+    assert upstream_server.get_request_count("/vod/1.m4s") == 1
+
+
+async def test_segment_cache_upstream_error(
+    hass: HomeAssistant,
+    hass_client: Any,
+    tmp_path: Path,
+    unused_tcp_port_factory: Any,
+) -> None:
+    """Test that an unreachable upstream results in a bad gateway."""
+    url = f"http://127.0.0.1:{unused_tcp_port_factory()}/vod/1.m4s"
+    hass.config.config_dir = str(tmp_path)
+    config_entry = create_mock_hass_web_proxy_config_entry(
+        hass,
+        MappingProxyType(
+            {
+                CONF_URL_PATTERNS: [url],
+                CONF_SEGMENT_CACHE_SIZE: 1,
+                CONF_SEGMENT_CACHE_URL_PATTERNS: [url],
+            }
+        ),
+    )
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+
+    authenticated_hass_client = await hass_client()
+    resp = await authenticated_hass_client.get(_get_proxy_path(url))
+    assert resp.status == HTTPStatus.BAD_GATEWAY
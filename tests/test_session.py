@@ -0,0 +1,112 @@
+"""Test the HASS Web Proxy upstream session."""
+
+from __future__ import annotations
+
+import urllib.parse
+from http import HTTPStatus
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any
+from unittest.mock import Mock
+
+import aiohttp
+from homeassistant.const import EVENT_HOMEASSISTANT_CLOSE
+
+from custom_components.hass_web_proxy.const import (
+    CONF_CONNECTION_LIMIT,
+    CONF_CONNECTION_LIMIT_PER_HOST,
+    CONF_DNS_CACHE_TTL,
+    CONF_HAPPY_EYEBALLS_DELAY,
+    CONF_KEEPALIVE_TIMEOUT,
+    CONF_URL_PATTERNS,
+)
+from custom_components.hass_web_proxy.session import get_connection_pool_usage
+from tests import (
+    create_mock_hass_web_proxy_config_entry,
+    setup_mock_hass_web_proxy_config_entry,
+)
+
+if TYPE_CHECKING:
+    from homeassistant.core import HomeAssistant
+
+CONNECTION_LIMIT = 7
+CONNECTION_LIMIT_PER_HOST = 3
+
+
+async def test_session_options(hass: HomeAssistant) -> None:
+    """Test that the connector is created from the options."""
+    config_entry = create_mock_hass_web_proxy_config_entry(
+        hass,
+        MappingProxyType(
+            {
+                # Number selectors save floats.
+                CONF_CONNECTION_LIMIT: float(CONNECTION_LIMIT),
+                CONF_CONNECTION_LIMIT_PER_HOST: float(CONNECTION_LIMIT_PER_HOST),
+                CONF_KEEPALIVE_TIMEOUT: 60,
+                CONF_DNS_CACHE_TTL: 30,
+                CONF_HAPPY_EYEBALLS_DELAY: 0,
+            }
+        ),
+    )
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+
+    session = config_entry.runtime_data.session
+    connector = session.connector
+    assert isinstance(connector, aiohttp.TCPConnector)
+    assert connector.limit == CONNECTION_LIMIT
+    assert connector.limit_per_host == CONNECTION_LIMIT_PER_HOST
+
+    usage = get_connection_pool_usage(session)
+    assert usage["limit"] == CONNECTION_LIMIT
+    assert usage["limit_per_host"] == CONNECTION_LIMIT_PER_HOST
+    assert usage["active"] == 0
+
+
+async def test_session_closed_on_unload(hass: HomeAssistant) -> None:
+    """Test that the session is closed when the entry is unloaded."""
+    config_entry = await setup_mock_hass_web_proxy_config_entry(hass)
+    session = config_entry.runtime_data.session
+    assert not session.closed
+
+    await hass.config_entries.async_unload(config_entry.entry_id)
+    await hass.async_block_till_done()
+    assert session.closed
+
+
+async def test_session_closed_on_close(hass: HomeAssistant) -> None:
+    """Test that the session is closed when Home Assistant closes."""
+    config_entry = await setup_mock_hass_web_proxy_config_entry(hass)
+    session = config_entry.runtime_data.session
+
+    hass.bus.async_fire(EVENT_HOMEASSISTANT_CLOSE)
+    await hass.async_block_till_done()
+    assert session.closed
+
+
+async def test_session_used_after_reload(
+    hass: HomeAssistant,
+    local_server: Any,
+    hass_client: Any,
+) -> None:
+    """Test that views use the current session after the entry is reloaded."""
+    config_entry = create_mock_hass_web_proxy_config_entry(
+        hass, MappingProxyType({CONF_URL_PATTERNS: [str(local_server)]})
+    )
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+    await hass.config_entries.async_reload(config_entry.entry_id)
+    await hass.async_block_till_done()
+
+    authenticated_hass_client = await hass_client()
+    resp = await authenticated_hass_client.get(
+        f"/api/hass_web_proxy/v0/?url={urllib.parse.quote_plus(str(local_server))}"
+    )
+    assert resp.status == HTTPStatus.OK
+    await resp.read()
+
+    usage = get_connection_pool_usage(config_entry.runtime_data.session)
+    assert usage["active"] == 0
+    assert usage["idle"] == 1
+
+
+def test_connection_pool_usage_without_tcp_connector() -> None:
+    """Test pool usage for a session without a TCP connector."""
+    assert get_connection_pool_usage(Mock(connector=None)) == {}
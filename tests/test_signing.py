@@ -0,0 +1,127 @@
+"""Test the HASS Web Proxy signed URLs."""
+
+from __future__ import annotations
+
+import datetime
+import time
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+
+from custom_components.hass_web_proxy.data import DynamicProxiedURL
+from custom_components.hass_web_proxy.signing import URLSigner, create_signing_key
+
+# The lifetime of signed proxied URLs, in seconds.
+TTL = 60
+
+
+def _create_dynamic_proxied_url(expiration: float | None = None) -> DynamicProxiedURL:
+    """Create a signed dynamic proxied URL."""
+    return DynamicProxiedURL(
+        url_pattern="http://cam.example.com/*",
+        ssl_verification=False,
+        ssl_ciphers="modern",
+        open_limit=0,
+        expiration=time.time() + TTL if expiration is None else expiration,
+        allow_unauthenticated=True,
+        cache_ttl=10,
+        tag="session",
+        signed=True,
+    )
+
+
+def test_url_signer_sign_and_verify() -> None:
+    """Test that a signed proxied URL is verified, and decoded in full."""
+    signer = URLSigner(create_signing_key())
+    proxied_url = _create_dynamic_proxied_url()
+    token = signer.sign("id", proxied_url)
+
+    signed = signer.verify(token)
+    assert signed is not None
+    assert signed.url_id == "id"
+    assert signed.proxied_url == proxied_url
+    assert signed.compiled.matches("http://cam.example.com/stream")
+
+    # Verified tokens are remembered.
+    assert signer.verify(token) is signed
+    assert signer.get_stats() == {"verified_tokens": 1}
+
+
+@pytest.mark.parametrize(
+    "token",
+    [
+        "",
+        "no-signature",
+        "too.many.parts",
+        "!!!.!!!",
+        "e30.AAAA",
+    ],
+)
+def test_url_signer_verify_invalid(token: str) -> None:
+    """Test that invalid tokens are not verified."""
+    assert URLSigner(create_signing_key()).verify(token) is None
+
+
+def test_url_signer_verify_unknown_fields() -> None:
+    """Test that tokens with fields of another version are rejected."""
+    signer = URLSigner(create_signing_key())
+    proxied_url = _create_dynamic_proxied_url()
+    with patch.object(
+        DynamicProxiedURL,
+        "as_dict",
+        return_value={**proxied_url.as_dict(), "unknown": True},
+    ):
+        token = signer.sign("id", proxied_url)
+
+    assert signer.verify(token) is None
+
+
+def test_url_signer_verify_never_expiring() -> None:
+    """Test that tokens without an expiration are rejected."""
+    signer = URLSigner(create_signing_key())
+    token = signer.sign("id", _create_dynamic_proxied_url(expiration=0))
+
+    assert signer.verify(token) is None
+
+
+def test_url_signer_verify_other_key() -> None:
+    """Test that tokens signed with another key (or tampered with) are rejected."""
+    token = URLSigner(create_signing_key()).sign("id", _create_dynamic_proxied_url())
+    signer = URLSigner(create_signing_key())
+
+    assert signer.verify(token) is None
+    assert signer.verify(f"A{token}") is None
+    assert signer.get_stats() == {"verified_tokens": 0}
+
+
+@pytest.mark.freeze_time
+def test_url_signer_verify_expired(freezer: Any) -> None:
+    """Test that expired tokens are rejected, and forgotten."""
+    now = datetime.datetime.now(tz=datetime.UTC)
+    signer = URLSigner(create_signing_key())
+    token = signer.sign("id", _create_dynamic_proxied_url(now.timestamp() + 10))
+
+    assert signer.verify(token) is not None
+
+    freezer.tick(datetime.timedelta(seconds=11))
+    assert signer.verify(token) is None
+    assert signer.get_stats() == {"verified_tokens": 0}
+
+
+def test_url_signer_verified_tokens_bounded() -> None:
+    """Test that the least recently verified tokens are forgotten first."""
+    signer = URLSigner(create_signing_key(), max_verified=2)
+    tokens = [
+        signer.sign(str(index), _create_dynamic_proxied_url()) for index in range(3)
+    ]
+
+    first = signer.verify(tokens[0])
+    signer.verify(tokens[1])
+    assert signer.verify(tokens[0]) is first
+    signer.verify(tokens[2])
+
+    assert signer.get_stats() == {"verified_tokens": 2}
+    # The second token was forgotten, so is decoded again.
+    assert signer.verify(tokens[0]) is first
+    assert signer.verify(tokens[1]) is not None
@@ -0,0 +1,177 @@
+"""Test the HASS Web Proxy dynamic proxied URL persistence."""
+
+from __future__ import annotations
+
+import datetime
+import time
+import urllib.parse
+from http import HTTPStatus
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any
+
+from aiohttp import web
+from homeassistant.util import dt as dt_util
+from pytest_homeassistant_custom_component.common import async_fire_time_changed
+
+from custom_components.hass_web_proxy.const import (
+    CONF_DYNAMIC_URLS,
+    CONF_OPEN_LIMIT,
+    CONF_URL_ID,
+    CONF_URL_PATTERN,
+    DOMAIN,
+    SERVICE_CREATE_PROXIED_URL,
+)
+from custom_components.hass_web_proxy.store import SAVE_DELAY, STORAGE_VERSION
+from tests import (
+    TEST_CONFIG_ENTRY_ID,
+    UpstreamServer,
+    create_mock_hass_web_proxy_config_entry,
+    setup_mock_hass_web_proxy_config_entry,
+)
+
+if TYPE_CHECKING:
+    from homeassistant.core import HomeAssistant
+
+STORAGE_KEY = f"{DOMAIN}.{TEST_CONFIG_ENTRY_ID}"
+TEST_OPTIONS = MappingProxyType({CONF_DYNAMIC_URLS: True})
+
+
+def _create_stored_proxied_url(url_pattern: str, **kwargs: Any) -> dict[str, Any]:
+    """Create a stored dynamic proxied URL."""
+    return {
+        "url_pattern": url_pattern,
+        "ssl_verification": True,
+        "ssl_ciphers": "default",
+        "open_limit": 0,
+        "expiration": 0,
+        "allow_unauthenticated": False,
+        **kwargs,
+    }
+
+
+async def test_store_load(hass: HomeAssistant, hass_storage: dict[str, Any]) -> None:
+    """Test that stored dynamic proxied URLs are loaded, without expired ones."""
+    hass_storage[STORAGE_KEY] = {
+        "version": STORAGE_VERSION,
+        "key": STORAGE_KEY,
+        "data": {
+            "proxied_urls": {
+                "forever": _create_stored_proxied_url("http://forever.local/*"),
+                "later": _create_stored_proxied_url(
+                    "http://later.local/*", expiration=time.time() + 60
+                ),
+                "expired": _create_stored_proxied_url(
+                    "http://expired.local/*", expiration=time.time() - 1
+                ),
+                "signed": _create_stored_proxied_url(
+                    "http://signed.local/*", open_limit=1, signed=True
+                ),
+                "invalid_pattern": _create_stored_proxied_url("not a pattern"),
+                "invalid_fields": {"unknown": True},
+            }
+        },
+    }
+    config_entry = create_mock_hass_web_proxy_config_entry(hass, TEST_OPTIONS)
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+    data = config_entry.runtime_data
+
+    assert list(data.dynamic_proxied_urls) == ["forever", "later", "signed"]
+    assert data.dynamic_proxied_urls["forever"].ssl_context is not None
+    assert data.dynamic_url_index.match("http://later.local/") == (
+        "later",
+        data.dynamic_proxied_urls["later"],
+    )
+    # Signed URLs are never matched by their pattern.
+    assert data.dynamic_url_index.match("http://signed.local/") is None
+
+
+async def test_store_not_loaded_without_dynamic_urls(
+    hass: HomeAssistant, hass_storage: dict[str, Any]
+) -> None:
+    """Test that stored proxied URLs are ignored if dynamic URLs are disabled."""
+    hass_storage[STORAGE_KEY] = {
+        "version": STORAGE_VERSION,
+        "key": STORAGE_KEY,
+        "data": {
+            "proxied_urls": {
+                "forever": _create_stored_proxied_url("http://forever.local/*"),
+            }
+        },
+    }
+    config_entry = await setup_mock_hass_web_proxy_config_entry(hass)
+
+    assert not config_entry.runtime_data.dynamic_proxied_urls
+    assert config_entry.runtime_data.dynamic_url_store is None
+
+
+async def test_store_batched_save(
+    hass: HomeAssistant,
+    hass_client: Any,
+    hass_storage: dict[str, Any],
+    upstream_server: UpstreamServer,
+) -> None:
+    """Test that changes (including open counts) are saved together, later."""
+
+    async def _ok(_request: web.Request) -> web.Response:
+        return web.Response(body=b"ok")
+
+    upstream_server.handlers["/camera"] = _ok
+    config_entry = create_mock_hass_web_proxy_config_entry(hass, TEST_OPTIONS)
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+    store = config_entry.runtime_data.dynamic_url_store
+    assert store is not None
+
+    await hass.services.async_call(
+        DOMAIN,
+        SERVICE_CREATE_PROXIED_URL,
+        {
+            CONF_URL_PATTERN: upstream_server.make_url("/camera"),
+            CONF_URL_ID: "camera",
+            CONF_OPEN_LIMIT: 3,
+        },
+        blocking=True,
+    )
+    authenticated_hass_client = await hass_client()
+    for _ in range(2):
+        resp = await authenticated_hass_client.get(
+            "/api/hass_web_proxy/v0/"
+            f"?url={urllib.parse.quote_plus(upstream_server.make_url('/camera'))}"
+        )
+        assert resp.status == HTTPStatus.OK
+
+    assert STORAGE_KEY not in hass_storage
+    assert store.get_stats() == {"saves": 0, "save_pending": True}
+
+    async_fire_time_changed(
+        hass, dt_util.utcnow() + datetime.timedelta(seconds=SAVE_DELAY)
+    )
+    await hass.async_block_till_done()
+
+    assert store.get_stats() == {"saves": 1, "save_pending": False}
+    stored = hass_storage[STORAGE_KEY]["data"]["proxied_urls"]
+    assert list(stored) == ["camera"]
+    assert stored["camera"]["open_limit"] == 1
+
+
+async def test_store_saved_on_unload_and_removed_with_entry(
+    hass: HomeAssistant, hass_storage: dict[str, Any]
+) -> None:
+    """Test that pending changes are saved on unload, and removed with the entry."""
+    config_entry = create_mock_hass_web_proxy_config_entry(hass, TEST_OPTIONS)
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+
+    await hass.services.async_call(
+        DOMAIN,
+        SERVICE_CREATE_PROXIED_URL,
+        {CONF_URL_PATTERN: "http://camera.local/*", CONF_URL_ID: "camera"},
+        blocking=True,
+    )
+    await hass.config_entries.async_reload(config_entry.entry_id)
+    await hass.async_block_till_done()
+
+    assert list(hass_storage[STORAGE_KEY]["data"]["proxied_urls"]) == ["camera"]
+    assert list(config_entry.runtime_data.dynamic_proxied_urls) == ["camera"]
+
+    await hass.config_entries.async_remove(config_entry.entry_id)
+    await hass.async_block_till_done()
+    assert STORAGE_KEY not in hass_storage
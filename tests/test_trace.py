@@ -0,0 +1,185 @@
+"""Test the HASS Web Proxy request tracing."""
+
+from __future__ import annotations
+
+import logging
+import urllib.parse
+from http import HTTPStatus
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any
+
+from aiohttp import hdrs, web
+from pytest_homeassistant_custom_component.common import async_capture_events
+
+from custom_components.hass_web_proxy.const import (
+    CONF_DYNAMIC_URLS,
+    CONF_PROXIED_URLS,
+    CONF_SAMPLE_RATE,
+    CONF_URL_ID,
+    CONF_URL_PATTERN,
+    CONF_URL_PATTERNS,
+    DOMAIN,
+    EVENT_REQUEST_TRACE,
+    SERVICE_CREATE_PROXIED_URL,
+    SERVICE_CREATE_PROXIED_URLS,
+    SERVICE_SET_REQUEST_TRACING,
+)
+from tests import (
+    UpstreamServer,
+    create_mock_hass_web_proxy_config_entry,
+    setup_mock_hass_web_proxy_config_entry,
+)
+
+if TYPE_CHECKING:
+    import pytest
+    from homeassistant.core import HomeAssistant
+
+
+def _get_proxy_path(url: str) -> str:
+    """Get the proxy path for a URL."""
+    return f"/api/hass_web_proxy/v0/?url={urllib.parse.quote_plus(url)}"
+
+
+async def _set_sample_rate(hass: HomeAssistant, sample_rate: float) -> None:
+    """Set the fraction of requests that are traced."""
+    await hass.services.async_call(
+        DOMAIN,
+        SERVICE_SET_REQUEST_TRACING,
+        {CONF_SAMPLE_RATE: sample_rate},
+        blocking=True,
+    )
+
+
+async def test_request_tracing(
+    hass: HomeAssistant,
+    hass_client: Any,
+    upstream_server: UpstreamServer,
+    unused_tcp_port_factory: Any,
+) -> None:
+    """Test that sampled requests fire trace events."""
+
+    async def _ok(_request: web.Request) -> web.Response:
+        return web.Response(body=b"ok")
+
+    upstream_server.handlers["/static"] = _ok
+    upstream_server.handlers["/dynamic"] = _ok
+    unreachable_url = f"http://127.0.0.1:{unused_tcp_port_factory()}/unreachable"
+    config_entry = create_mock_hass_web_proxy_config_entry(
+        hass,
+        MappingProxyType(
+            {
+                CONF_DYNAMIC_URLS: True,
+                CONF_URL_PATTERNS: [
+                    upstream_server.make_url("/static"),
+                    unreachable_url,
+                ],
+            }
+        ),
+    )
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+    await hass.services.async_call(
+        DOMAIN,
+        SERVICE_CREATE_PROXIED_URL,
+        {
+            CONF_URL_PATTERN: upstream_server.make_url("/dynamic"),
+            CONF_URL_ID: "dynamic",
+        },
+        blocking=True,
+    )
+    events = async_capture_events(hass, EVENT_REQUEST_TRACE)
+    authenticated_hass_client = await hass_client()
+
+    # Tracing is disabled by default.
+    resp = await authenticated_hass_client.get(
+        _get_proxy_path(upstream_server.make_url("/static"))
+    )
+    assert resp.status == HTTPStatus.OK
+    await hass.async_block_till_done()
+    assert not events
+
+    await _set_sample_rate(hass, 1)
+    for url, status in (
+        (upstream_server.make_url("/static"), HTTPStatus.OK),
+        (upstream_server.make_url("/dynamic"), HTTPStatus.OK),
+        (upstream_server.make_url("/unknown"), HTTPStatus.NOT_FOUND),
+        (unreachable_url, HTTPStatus.BAD_GATEWAY),
+    ):
+        resp = await authenticated_hass_client.get(
+            _get_proxy_path(url), headers={hdrs.RANGE: "bytes=0-1"}
+        )
+        assert resp.status == status
+    await hass.async_block_till_done()
+
+    assert [
+        (event.data["match_source"], event.data["url_id"], event.data["status"])
+        for event in events
+    ] == [
+        ("static", None, HTTPStatus.OK),
+        ("dynamic", "dynamic", HTTPStatus.OK),
+        (None, None, HTTPStatus.NOT_FOUND),
+        ("static", None, HTTPStatus.BAD_GATEWAY),
+    ]
+    assert events[0].data["host"] == "127.0.0.1"
+    assert events[0].data["match_time"] >= 0
+    # Only the requests that went upstream are timed there.
+    assert [event.data["upstream_time"] is None for event in events] == [
+        False,
+        False,
+        True,
+        False,
+    ]
+    assert events[0].data["upstream_time"] >= 0
+    assert config_entry.runtime_data.request_tracer.get_stats() == {
+        "sample_rate": 1,
+        "traced": len(events),
+    }
+
+    traced = len(events)
+    await _set_sample_rate(hass, 0)
+    await authenticated_hass_client.get(
+        _get_proxy_path(upstream_server.make_url("/static"))
+    )
+    await hass.async_block_till_done()
+    assert len(events) == traced
+
+
+async def test_debug_logging(
+    hass: HomeAssistant,
+    hass_client: Any,
+    upstream_server: UpstreamServer,
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    """Test that the hot-path debug logs are built when debug logging is enabled."""
+
+    async def _ok(_request: web.Request) -> web.Response:
+        return web.Response(body=b"ok")
+
+    upstream_server.handlers["/ok"] = _ok
+    url = upstream_server.make_url("/ok")
+    config_entry = create_mock_hass_web_proxy_config_entry(
+        hass, MappingProxyType({CONF_DYNAMIC_URLS: True})
+    )
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+    caplog.set_level(logging.DEBUG, logger="custom_components.hass_web_proxy")
+
+    await hass.services.async_call(
+        DOMAIN,
+        SERVICE_CREATE_PROXIED_URL,
+        {CONF_URL_PATTERN: url, CONF_URL_ID: "ok"},
+        blocking=True,
+    )
+    await hass.services.async_call(
+        DOMAIN,
+        SERVICE_CREATE_PROXIED_URLS,
+        {CONF_PROXIED_URLS: [{CONF_URL_PATTERN: url}]},
+        blocking=True,
+    )
+    await _set_sample_rate(hass, 1)
+    resp = await (await hass_client()).get(_get_proxy_path(url))
+    assert resp.status == HTTPStatus.OK
+    await hass.async_block_till_done()
+
+    assert "Created dynamically proxied URL 'ok'" in caplog.text
+    assert "Created 1 dynamically proxied URLs" in caplog.text
+    assert "dynamic proxied URLs: 2" in caplog.text
+    assert "Proxy request trace:" in caplog.text
@@ -0,0 +1,504 @@
+"""Test the HASS Web Proxy websocket relay and fan-out."""
+
+from __future__ import annotations
+
+import asyncio
+import datetime
+import urllib.parse
+from http import HTTPStatus
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any
+from unittest.mock import AsyncMock, MagicMock, Mock, patch
+
+import aiohttp
+import pytest
+from aiohttp import WSMsgType, hdrs, web
+from aiohttp.test_utils import make_mocked_request
+from hass_web_proxy_lib import ProxiedURL
+from homeassistant.util import dt as dt_util
+from pytest_homeassistant_custom_component.common import async_fire_time_changed
+
+from custom_components.hass_web_proxy.const import (
+    CONF_DYNAMIC_URLS,
+    CONF_URL_PATTERN,
+    CONF_URL_PATTERN_OPTIONS,
+    CONF_URL_PATTERNS,
+    CONF_WEBSOCKET_COMPRESSION,
+    CONF_WEBSOCKET_FANOUT,
+    DOMAIN,
+    SERVICE_CREATE_PROXIED_URL,
+)
+from custom_components.hass_web_proxy.metrics import ProxyMetrics
+from custom_components.hass_web_proxy.websocket import (
+    UPSTREAM_COMPRESS_WBITS,
+    WEBSOCKET_FANOUT_GRACE_PERIOD,
+    WebSocketFanout,
+    async_relay_websocket,
+)
+from tests import (
+    UpstreamServer,
+    create_mock_hass_web_proxy_config_entry,
+    setup_mock_hass_web_proxy_config_entry,
+)
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from homeassistant.core import HomeAssistant
+
+# Application close codes, of the upstream and client.
+UPSTREAM_CLOSE_CODE = 4000
+CLIENT_CLOSE_CODE = 4001
+
+
+def _get_proxy_path(url: str) -> str:
+    """Get the websocket proxy path for a URL."""
+    return f"/api/hass_web_proxy/v0/ws?url={urllib.parse.quote_plus(url)}"
+
+
+class _EventsServer:
+    """A local read-only websocket server, of events."""
+
+    def __init__(self) -> None:
+        """Initialize the server."""
+        self.websockets: list[web.WebSocketResponse] = []
+        # Set once each websocket (by index) has closed.
+        self.closed: list[asyncio.Event] = []
+        self.received: list[str] = []
+
+    async def handle(self, request: web.Request) -> web.WebSocketResponse:
+        """Accept a websocket, until it closes."""
+        ws = web.WebSocketResponse(protocols=("events",))
+        await ws.prepare(request)
+        self.websockets.append(ws)
+        closed = asyncio.Event()
+        self.closed.append(closed)
+        async for message in ws:
+            self.received.append(message.data)
+        closed.set()
+        return ws
+
+
+async def _async_setup_fanout(
+    hass: HomeAssistant,
+    upstream_server: UpstreamServer,
+    pattern_options: dict[str, Any] | None = None,
+) -> tuple[_EventsServer, str, WebSocketFanout]:
+    """Set up an events server, with a pattern for it with websocket fan-out."""
+    events = _EventsServer()
+    upstream_server.handlers["/events"] = events.handle
+    url = upstream_server.make_url("/events")
+    config_entry = create_mock_hass_web_proxy_config_entry(
+        hass,
+        MappingProxyType(
+            {
+                CONF_URL_PATTERNS: [url],
+                CONF_URL_PATTERN_OPTIONS: {
+                    url: {CONF_WEBSOCKET_FANOUT: True, **(pattern_options or {})}
+                },
+            }
+        ),
+    )
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+    return events, url, config_entry.runtime_data.websocket_fanout
+
+
+async def test_relay_websocket(
+    hass: HomeAssistant, hass_client: Any, upstream_server: UpstreamServer
+) -> None:
+    """Test relaying a compressed websocket."""
+    extensions: list[str | None] = []
+
+    async def _echo(request: web.Request) -> web.WebSocketResponse:
+        extensions.append(request.headers.get(hdrs.SEC_WEBSOCKET_EXTENSIONS))
+        ws = web.WebSocketResponse(protocols=("camera",))
+        await ws.prepare(request)
+        async for message in ws:
+            if message.type is WSMsgType.BINARY:
+                await ws.send_bytes(message.data)
+            elif message.data == "close":
+                await ws.close(code=UPSTREAM_CLOSE_CODE)
+            else:
+                await ws.send_str(message.data)
+        return ws
+
+    upstream_server.handlers["/ws"] = _echo
+    url = upstream_server.make_url("/ws")
+    config_entry = create_mock_hass_web_proxy_config_entry(
+        hass,
+        MappingProxyType(
+            {
+                CONF_URL_PATTERNS: [url],
+                CONF_URL_PATTERN_OPTIONS: {url: {CONF_WEBSOCKET_COMPRESSION: True}},
+            }
+        ),
+    )
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+
+    client = await hass_client()
+    async with client.ws_connect(
+        _get_proxy_path(url),
+        protocols=("camera",),
+        autoping=False,
+        compress=UPSTREAM_COMPRESS_WBITS,
+    ) as ws:
+        assert ws.protocol == "camera"
+        assert ws.compress == UPSTREAM_COMPRESS_WBITS
+        assert extensions[0] is not None
+        assert "permessage-deflate" in extensions[0]
+        assert config_entry.runtime_data.metrics.active_websockets == 1
+
+        for text in ("hello!", "h\u00e9llo!"):
+            await ws.send_str(text)
+            message = await ws.receive()
+            assert message.type is WSMsgType.TEXT
+            assert message.data == text
+
+        payload = bytes(range(256)) * 257
+        await ws.send_bytes(payload)
+        message = await ws.receive()
+        assert message.type is WSMsgType.BINARY
+        assert message.data == payload
+
+        # The payloads relayed to the client are counted (in UTF-8, for text).
+        metrics = config_entry.runtime_data.metrics
+        assert metrics.bytes_in == metrics.bytes_out == 6 + 7 + len(payload)
+
+        # The upstream pong to the relayed ping is relayed back.
+        await ws.ping(b"ping")
+        message = await ws.receive()
+        assert message.type is WSMsgType.PONG
+        assert message.data == b"ping"
+
+        await ws.send_str("close")
+        message = await ws.receive()
+        assert message.type is WSMsgType.CLOSE
+        assert message.data == UPSTREAM_CLOSE_CODE
+
+
+async def test_relay_websocket_client_close(
+    hass: HomeAssistant, hass_client: Any, upstream_server: UpstreamServer
+) -> None:
+    """Test that the client closing a compressed websocket is relayed upstream."""
+    close_codes: asyncio.Queue[int | None] = asyncio.Queue()
+
+    async def _close(request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        await ws.send_str("ready")
+        async for _message in ws:
+            pass
+        close_codes.put_nowait(ws.close_code)
+        return ws
+
+    upstream_server.handlers["/ws"] = _close
+    url = upstream_server.make_url("/ws")
+    config_entry = create_mock_hass_web_proxy_config_entry(
+        hass, MappingProxyType({CONF_DYNAMIC_URLS: True})
+    )
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+    await hass.services.async_call(
+        DOMAIN,
+        SERVICE_CREATE_PROXIED_URL,
+        {CONF_URL_PATTERN: url, CONF_WEBSOCKET_COMPRESSION: True},
+        blocking=True,
+    )
+    proxied_url = next(iter(config_entry.runtime_data.dynamic_proxied_urls.values()))
+    assert proxied_url.websocket_compression
+
+    client = await hass_client()
+    async with client.ws_connect(_get_proxy_path(url)) as ws:
+        assert await ws.receive_str() == "ready"
+        await ws.close(code=CLIENT_CLOSE_CODE)
+
+    assert await asyncio.wait_for(close_codes.get(), 5) == CLIENT_CLOSE_CODE
+
+
+async def test_relay_websocket_returns_once_closed() -> None:
+    """Test that the relay returns the client websocket once either side closes."""
+    ws_to_user = AsyncMock(close_code=CLIENT_CLOSE_CODE)
+    ws_to_user.receive.return_value = aiohttp.WSMessage(
+        WSMsgType.CLOSE, CLIENT_CLOSE_CODE, None
+    )
+    ws_to_target = AsyncMock(protocol=None)
+    ws_to_target.receive.side_effect = asyncio.Event().wait
+    session = Mock(ws_connect=AsyncMock(return_value=ws_to_target))
+
+    # The client connection is otherwise closed (cancelling the handler) first.
+    with patch(
+        "custom_components.hass_web_proxy.websocket.web.WebSocketResponse",
+        return_value=ws_to_user,
+    ):
+        ws = await async_relay_websocket(
+            make_mocked_request("GET", "/"),
+            session,
+            ProxiedURL(url="http://camera/ws"),
+            compress=False,
+            metrics=ProxyMetrics(),
+        )
+    assert ws is ws_to_user
+    ws_to_target.close.assert_any_await(code=CLIENT_CLOSE_CODE)
+
+
+async def test_relay_websocket_upstream_unavailable(
+    hass: HomeAssistant,
+    hass_client: Any,
+    unused_tcp_port_factory: Callable[[], int],
+) -> None:
+    """Test that an unavailable upstream websocket responds 502 Bad Gateway."""
+    url = f"http://127.0.0.1:{unused_tcp_port_factory()}/ws"
+    config_entry = create_mock_hass_web_proxy_config_entry(
+        hass,
+        MappingProxyType(
+            {
+                CONF_URL_PATTERNS: [url],
+                CONF_URL_PATTERN_OPTIONS: {url: {CONF_WEBSOCKET_COMPRESSION: True}},
+            }
+        ),
+    )
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+
+    client = await hass_client()
+    with pytest.raises(aiohttp.WSServerHandshakeError) as exc_info:
+        await client.ws_connect(_get_proxy_path(url))
+    assert exc_info.value.status == HTTPStatus.BAD_GATEWAY
+
+
+async def test_relay_websocket_unauthenticated_or_not_found(
+    hass: HomeAssistant,
+    hass_client: Any,
+    hass_client_no_auth: Any,
+    upstream_server: UpstreamServer,
+) -> None:
+    """Test that unauthenticated or unmatched websockets are not relayed."""
+    url = upstream_server.make_url("/ws")
+    config_entry = create_mock_hass_web_proxy_config_entry(
+        hass,
+        MappingProxyType(
+            {
+                CONF_URL_PATTERNS: [url],
+                CONF_URL_PATTERN_OPTIONS: {url: {CONF_WEBSOCKET_COMPRESSION: True}},
+            }
+        ),
+    )
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+
+    client = await hass_client_no_auth()
+    with pytest.raises(aiohttp.WSServerHandshakeError) as exc_info:
+        await client.ws_connect(_get_proxy_path(url))
+    assert exc_info.value.status == HTTPStatus.UNAUTHORIZED
+
+    client = await hass_client()
+    with pytest.raises(aiohttp.WSServerHandshakeError) as exc_info:
+        await client.ws_connect(_get_proxy_path(upstream_server.make_url("/other")))
+    assert exc_info.value.status == HTTPStatus.NOT_FOUND
+    assert upstream_server.requests == []
+
+
+async def test_websocket_fanout_shares_upstream(
+    hass: HomeAssistant, hass_client: Any, upstream_server: UpstreamServer
+) -> None:
+    """Test that clients of a URL share a single upstream websocket."""
+    events, url, fanout = await _async_setup_fanout(
+        hass, upstream_server, {CONF_WEBSOCKET_COMPRESSION: True}
+    )
+
+    client = await hass_client()
+    first = await client.ws_connect(
+        _get_proxy_path(url), protocols=("events",), compress=UPSTREAM_COMPRESS_WBITS
+    )
+    second = await client.ws_connect(_get_proxy_path(url), protocols=("events",))
+    assert first.protocol == second.protocol == "events"
+    assert first.compress == UPSTREAM_COMPRESS_WBITS
+    assert len(events.websockets) == 1
+    assert fanout.get_stats() == {"websockets": 1, "clients": 2, "dropped": 0}
+
+    # Shared websockets are read-only.
+    await first.send_str("ignored")
+
+    upstream = events.websockets[0]
+    await upstream.send_str("motion")
+    await upstream.send_bytes(b"\x00\x01")
+    for ws in (first, second):
+        assert await ws.receive_str() == "motion"
+        assert await ws.receive_bytes() == b"\x00\x01"
+
+    # The payloads are received once, and sent to each client.
+    metrics = hass.config_entries.async_entries(DOMAIN)[0].runtime_data.metrics
+    assert metrics.bytes_in == len("motion") + 2
+    assert metrics.bytes_out == 2 * (len("motion") + 2)
+
+    # The upstream closing is relayed to all its clients.
+    await upstream.close(code=UPSTREAM_CLOSE_CODE)
+    for ws in (first, second):
+        message = await ws.receive()
+        assert message.type is WSMsgType.CLOSE
+        assert message.data == UPSTREAM_CLOSE_CODE
+        await ws.close()
+
+    await hass.async_block_till_done(wait_background_tasks=True)
+    assert events.received == []
+    assert fanout.get_stats() == {"websockets": 0, "clients": 0, "dropped": 0}
+
+
+async def test_websocket_fanout_drops_oldest(
+    hass: HomeAssistant, hass_client: Any, upstream_server: UpstreamServer
+) -> None:
+    """Test that the oldest messages are dropped for slow clients."""
+    events, url, fanout = await _async_setup_fanout(hass, upstream_server)
+
+    client = await hass_client()
+    with patch(
+        "custom_components.hass_web_proxy.websocket.WEBSOCKET_FANOUT_QUEUE_SIZE", 1
+    ):
+        ws = await client.ws_connect(_get_proxy_path(url))
+
+    # All the messages are received upstream before the client is written to.
+    messages = ["0", "1", "2"]
+    for message in messages:
+        await events.websockets[0].send_str(message)
+    assert await ws.receive_str() == messages[-1]
+    assert fanout.get_stats()["dropped"] == len(messages) - 1
+
+    # The end of the websocket is never dropped, even if the client is behind.
+    await events.websockets[0].send_str("dropped")
+    await events.websockets[0].close(code=UPSTREAM_CLOSE_CODE)
+    message = await ws.receive()
+    assert message.type is WSMsgType.CLOSE
+    assert message.data == UPSTREAM_CLOSE_CODE
+    await ws.close()
+
+
+async def test_websocket_fanout_grace_period(
+    hass: HomeAssistant, hass_client: Any, upstream_server: UpstreamServer
+) -> None:
+    """Test that shared websockets are closed a while after their last client."""
+    events, url, fanout = await _async_setup_fanout(hass, upstream_server)
+    client = await hass_client()
+
+    ws = await client.ws_connect(_get_proxy_path(url))
+    # The client is detached before its close is answered.
+    await ws.close()
+    assert fanout.get_stats()["clients"] == 0
+
+    # Clients that reconnect within the grace period share the same websocket.
+    ws = await client.ws_connect(_get_proxy_path(url))
+    assert len(events.websockets) == 1
+    await ws.close()
+    assert fanout.get_stats()["clients"] == 0
+
+    # A websocket that closes in its grace period is forgotten at once.
+    await events.websockets[0].close()
+    await hass.async_block_till_done(wait_background_tasks=True)
+    assert fanout.get_stats()["websockets"] == 0
+
+    websockets = len(events.websockets)
+    ws = await client.ws_connect(_get_proxy_path(url))
+    assert len(events.websockets) == websockets + 1
+    await ws.close()
+    assert fanout.get_stats()["clients"] == 0
+    assert fanout.get_stats()["websockets"] == 1
+
+    async_fire_time_changed(
+        hass,
+        dt_util.utcnow()
+        + datetime.timedelta(seconds=WEBSOCKET_FANOUT_GRACE_PERIOD + 1),
+    )
+    await hass.async_block_till_done(wait_background_tasks=True)
+    await asyncio.wait_for(events.closed[1].wait(), 5)
+    assert fanout.get_stats()["websockets"] == 0
+
+
+async def test_websocket_fanout_client_cancelled_while_connecting(
+    hass: HomeAssistant, upstream_server: UpstreamServer
+) -> None:
+    """Test that clients leaving before the upstream connects are detached."""
+    _events, url, fanout = await _async_setup_fanout(hass, upstream_server)
+    session = MagicMock()
+    session.ws_connect.return_value.__aenter__.side_effect = asyncio.Event().wait
+
+    task = asyncio.create_task(
+        fanout.async_handle(
+            make_mocked_request("GET", "/"),
+            session,
+            ProxiedURL(url=url),
+            compress=False,
+        )
+    )
+    await asyncio.sleep(0)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert fanout.get_stats() == {"websockets": 1, "clients": 0, "dropped": 0}
+
+    # The connection is abandoned after the grace period.
+    async_fire_time_changed(
+        hass,
+        dt_util.utcnow()
+        + datetime.timedelta(seconds=WEBSOCKET_FANOUT_GRACE_PERIOD + 1),
+    )
+    await hass.async_block_till_done(wait_background_tasks=True)
+    assert fanout.get_stats()["websockets"] == 0
+
+
+async def test_websocket_fanout_keyed_by_compression(
+    hass: HomeAssistant, upstream_server: UpstreamServer
+) -> None:
+    """Test that compressed and uncompressed clients never share a websocket."""
+    _events, url, fanout = await _async_setup_fanout(hass, upstream_server)
+    session = MagicMock()
+    session.ws_connect.return_value.__aenter__.side_effect = asyncio.Event().wait
+
+    tasks = [
+        asyncio.create_task(
+            fanout.async_handle(
+                make_mocked_request("GET", "/"),
+                session,
+                ProxiedURL(url=url),
+                compress=compress,
+            )
+        )
+        for compress in (True, False, True)
+    ]
+    await asyncio.sleep(0)
+    assert fanout.get_stats() == {"websockets": 2, "clients": 3, "dropped": 0}
+    assert [call.kwargs["compress"] for call in session.ws_connect.call_args_list] == [
+        UPSTREAM_COMPRESS_WBITS,
+        0,
+    ]
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    async_fire_time_changed(
+        hass,
+        dt_util.utcnow()
+        + datetime.timedelta(seconds=WEBSOCKET_FANOUT_GRACE_PERIOD + 1),
+    )
+    await hass.async_block_till_done(wait_background_tasks=True)
+    assert fanout.get_stats()["websockets"] == 0
+
+
+async def test_websocket_fanout_upstream_unavailable(
+    hass: HomeAssistant,
+    hass_client: Any,
+    unused_tcp_port_factory: Callable[[], int],
+) -> None:
+    """Test that an unavailable shared websocket responds 502 Bad Gateway."""
+    url = f"http://127.0.0.1:{unused_tcp_port_factory()}/events"
+    config_entry = create_mock_hass_web_proxy_config_entry(
+        hass,
+        MappingProxyType(
+            {
+                CONF_URL_PATTERNS: [url],
+                CONF_URL_PATTERN_OPTIONS: {url: {CONF_WEBSOCKET_FANOUT: True}},
+            }
+        ),
+    )
+    await setup_mock_hass_web_proxy_config_entry(hass, config_entry)
+
+    client = await hass_client()
+    with pytest.raises(aiohttp.WSServerHandshakeError) as exc_info:
+        await client.ws_connect(_get_proxy_path(url))
+    assert exc_info.value.status == HTTPStatus.BAD_GATEWAY
+    assert config_entry.runtime_data.websocket_fanout.get_stats()["websockets"] == 0